@@ -0,0 +1,47 @@
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List
+
+import numpy as np
+
+
+class BaseEmbeddingProvider(ABC):
+    """
+    Abstract base class for all embedding providers.
+    """
+
+    name = "base"
+    # Local providers are called inline; remote ones go through the
+    # embedding cache and the embedder's event loop.
+    local = False
+
+    def __init__(self, model: str, config: Dict[str, Any] | None = None):
+        self.model = model
+        self.config = config or {}
+
+    @property
+    def version(self) -> str:
+        """
+        Identifies the vector space; stores stamped with another version
+        are re-embedded.
+        """
+        return f"{self.name}:{self.model}"
+
+    @abstractmethod
+    async def embed_batch(self, texts: List[str]) -> np.ndarray:
+        """
+        Embed ``texts`` into a float32 ``(len(texts), dimension)`` array.
+        """
+        pass
+
+    @abstractmethod
+    async def health_check(self) -> bool:
+        """
+        Check if provider is reachable.
+        """
+        pass
+
+    async def close(self):
+        """
+        Release pooled connections.
+        """
+        pass
@@ -1,5 +1,5 @@
 from abc import ABC, abstractmethod
-from typing import List, Dict, Any
+from typing import AsyncIterator, List, Dict, Any
 
 
 class BaseAIProvider(ABC):
@@ -21,6 +21,17 @@ class BaseAIProvider(ABC):
         """
         pass
 
+    async def stream_response(
+        self,
+        messages: List[Dict[str, str]],
+        **kwargs,
+    ) -> AsyncIterator[str]:
+        """
+        Yield the response in pieces as they are generated. Providers
+        without streaming yield the whole response at once.
+        """
+        yield await self.generate_response(messages, **kwargs)
+
     @abstractmethod
     async def health_check(self) -> bool:
         """
@@ -34,3 +45,9 @@ class BaseAIProvider(ABC):
         List available models.
         """
         pass
+
+    async def close(self):
+        """
+        Release clients the provider holds. Called when it is evicted from
+        the provider registry or on shutdown.
+        """
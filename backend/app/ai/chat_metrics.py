@@ -0,0 +1,95 @@
+"""
+Latency metrics of chat completions.
+
+Every completion records its time to first token (TTFT) and total time
+per provider and mode: ``stream`` for the SSE/WebSocket endpoints and
+``complete`` for ``POST /api/ai/chat``, where the first token arrives
+with the whole reply. Replies built from a packed prompt also record
+its size in tokens (see ``app.ai.prompt_packer``). Only the most recent
+samples are kept.
+"""
+
+import threading
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+
+def _percentile(sorted_samples: List[float], fraction: float) -> float:
+    index = min(len(sorted_samples) - 1, int(round(fraction * (len(sorted_samples) - 1))))
+    return sorted_samples[index]
+
+
+class ChatMetrics:
+    """
+    Thread-safe rolling window of TTFT, total latency and prompt size
+    samples.
+    """
+
+    def __init__(self, window: int = 1000):
+        self.window = max(1, window)
+        self._samples: Dict[Tuple[str, str], Deque[Tuple[float, float, int, Optional[int]]]] = {}
+        self._counts: Dict[Tuple[str, str], Dict[str, int]] = {}
+        self._lock = threading.Lock()
+
+    def _counters(self, key: Tuple[str, str]) -> Dict[str, int]:
+        return self._counts.setdefault(key, {"completed": 0, "failed": 0})
+
+    def record(
+        self,
+        provider: str,
+        mode: str,
+        ttft: Optional[float],
+        total: float,
+        chunks: int = 1,
+        prompt_tokens: Optional[int] = None
+    ):
+        """
+        Record one completed reply; ``ttft`` and ``total`` are in seconds.
+        """
+        key = (provider, mode)
+        with self._lock:
+            samples = self._samples.setdefault(key, deque(maxlen=self.window))
+            samples.append((total if ttft is None else ttft, total, chunks, prompt_tokens))
+            counters = self._counters(key)
+            counters["completed"] += 1
+            if prompt_tokens is not None:
+                counters["prompt_tokens"] = counters.get("prompt_tokens", 0) + prompt_tokens
+
+    def record_failure(self, provider: str, mode: str):
+        with self._lock:
+            self._counters((provider, mode))["failed"] += 1
+
+    def stats(self) -> Dict[str, Dict[str, Dict]]:
+        with self._lock:
+            snapshot = {key: list(samples) for key, samples in self._samples.items()}
+            counts = {key: dict(counters) for key, counters in self._counts.items()}
+
+        report: Dict[str, Dict[str, Dict]] = {}
+        for key, counters in counts.items():
+            row = dict(counters)
+            samples = snapshot.get(key)
+            if samples:
+                ttfts = sorted(sample[0] for sample in samples)
+                totals = sorted(sample[1] for sample in samples)
+                row.update({
+                    "samples": len(samples),
+                    "ttft_p50_ms": round(_percentile(ttfts, 0.50) * 1000, 2),
+                    "ttft_p95_ms": round(_percentile(ttfts, 0.95) * 1000, 2),
+                    "total_p50_ms": round(_percentile(totals, 0.50) * 1000, 2),
+                    "total_p95_ms": round(_percentile(totals, 0.95) * 1000, 2),
+                    "chunks_per_reply": round(sum(sample[2] for sample in samples) / len(samples), 1),
+                })
+                prompts = sorted(sample[3] for sample in samples if sample[3] is not None)
+                if prompts:
+                    row.update({
+                        "prompt_tokens_p50": _percentile(prompts, 0.50),
+                        "prompt_tokens_p95": _percentile(prompts, 0.95),
+                        "prompt_tokens_max": prompts[-1],
+                    })
+            provider, mode = key
+            report.setdefault(provider, {})[mode] = row
+        return report
+
+
+# Singleton
+chat_metrics = ChatMetrics()
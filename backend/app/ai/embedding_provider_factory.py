@@ -0,0 +1,35 @@
+from typing import Optional
+
+from app.config.settings import settings
+from app.ai.base_embedding_provider import BaseEmbeddingProvider
+from app.ai.local_embedding_provider import LocalHashEmbedder
+from app.ai.ollama_embedding_provider import OllamaEmbeddingProvider
+
+
+class EmbeddingProviderFactory:
+    """
+    Factory class to create embedding provider instances.
+    """
+
+    def __init__(self):
+        self.default_provider = settings.EMBEDDING_PROVIDER
+
+    def get_provider(
+        self,
+        provider_name: Optional[str] = None,
+        model: Optional[str] = None,
+    ) -> BaseEmbeddingProvider:
+
+        provider_name = provider_name or self.default_provider
+
+        if provider_name.lower() == "local":
+            return LocalHashEmbedder()
+
+        elif provider_name.lower() == "ollama":
+            return OllamaEmbeddingProvider(model=model or settings.EMBEDDING_MODEL)
+
+        raise ValueError(f"Unsupported embedding provider: {provider_name}")
+
+
+# Singleton
+embedding_provider_factory = EmbeddingProviderFactory()
@@ -1,5 +1,8 @@
-from typing import List, Dict
+import asyncio
+from typing import AsyncIterator, List, Dict, Optional
+
 import google.generativeai as genai
+from google.ai import generativelanguage as glm
 
 from app.ai.base_provider import BaseAIProvider
 from app.security.key_manager import key_manager
@@ -8,38 +11,75 @@ from app.security.key_manager import key_manager
 class GeminiProvider(BaseAIProvider):
     """
     AI Provider for Google Gemini models.
+
+    The provider builds its own gRPC clients rather than the SDK's
+    process-wide defaults, so closing it cannot break another provider.
+    The async client is bound to the event loop it was made on and is
+    rebuilt for a request from another loop.
     """
 
     def __init__(self, model: str = "gemini-1.5-flash"):
         super().__init__()
         self.model_name = model
 
-        api_key = key_manager.get_key("gemini")
+        self.api_key = key_manager.get_key("gemini")
 
-        if not api_key:
+        if not self.api_key:
             raise ValueError("Gemini API key not configured")
 
-        genai.configure(api_key=api_key)
-
         self.client = genai.GenerativeModel(self.model_name)
+        self.client._client = glm.GenerativeServiceClient(client_options={"api_key": self.api_key})
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
 
-    async def generate_response(
-        self,
-        messages: List[Dict[str, str]],
-        **kwargs,
-    ) -> str:
+    def _async_model(self) -> genai.GenerativeModel:
+        """
+        The model with an async client of the running event loop.
+        """
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # A client of another loop cannot be closed from this one; its
+            # channel goes with that loop.
+            self.client._async_client = glm.GenerativeServiceAsyncClient(client_options={"api_key": self.api_key})
+            self._loop = loop
+        return self.client
 
+    @staticmethod
+    def _build_prompt(messages: List[Dict[str, str]]) -> str:
         # Convert messages → simple prompt
         prompt = ""
         for msg in messages:
             role = msg["role"]
             content = msg["content"]
             prompt += f"{role}: {content}\n"
+        return prompt
 
-        response = self.client.generate_content(prompt)
+    async def generate_response(
+        self,
+        messages: List[Dict[str, str]],
+        **kwargs,
+    ) -> str:
+
+        response = self.client.generate_content(self._build_prompt(messages))
 
         return response.text if response.text else ""
 
+    async def stream_response(
+        self,
+        messages: List[Dict[str, str]],
+        **kwargs,
+    ) -> AsyncIterator[str]:
+
+        response = await self._async_model().generate_content_async(self._build_prompt(messages), stream=True)
+
+        async for chunk in response:
+            try:
+                text = chunk.text
+            except ValueError:
+                # Chunks without text parts (e.g. only safety ratings).
+                continue
+            if text:
+                yield text
+
     async def health_check(self) -> bool:
         try:
             _ = self.client.generate_content("hello")
@@ -52,3 +92,10 @@ class GeminiProvider(BaseAIProvider):
             "gemini-1.5-flash",
             "gemini-1.5-pro",
         ]
+
+    async def close(self):
+        self.client._client.transport.close()
+        async_client, self.client._async_client = self.client._async_client, None
+        loop, self._loop = self._loop, None
+        if async_client is not None and loop is asyncio.get_running_loop():
+            await async_client.transport.close()
@@ -0,0 +1,73 @@
+"""
+Pooled HTTP client shared by the AI providers.
+
+One ``httpx.AsyncClient`` per event loop (asyncio connections cannot
+move between loops) keeps connections to Ollama and the OpenAI API
+alive across requests instead of opening a new one per call. The RAG
+embedder's private loop gets its own client, which the embedder closes. Limits come
+from ``HTTP_MAX_CONNECTIONS``, ``HTTP_MAX_KEEPALIVE`` and
+``HTTP_KEEPALIVE_EXPIRY``; the FastAPI lifespan closes it on shutdown.
+"""
+
+import asyncio
+import threading
+import weakref
+from typing import Optional
+
+import httpx
+
+from app.config.settings import settings
+
+
+class SharedHTTPClient:
+    """
+    Lazily created ``httpx.AsyncClient`` with keep-alive and connection
+    limits, one per running event loop.
+    """
+
+    def __init__(
+        self,
+        max_connections: Optional[int] = None,
+        max_keepalive: Optional[int] = None,
+        keepalive_expiry: Optional[float] = None,
+        timeout: float = 120.0
+    ):
+        self.limits = httpx.Limits(
+            max_connections=max_connections or settings.HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=max_keepalive or settings.HTTP_MAX_KEEPALIVE,
+            keepalive_expiry=keepalive_expiry if keepalive_expiry is not None else settings.HTTP_KEEPALIVE_EXPIRY,
+        )
+        self.timeout = timeout
+        self._clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = (
+            weakref.WeakKeyDictionary()
+        )
+        self._lock = threading.Lock()
+
+    def get(self) -> httpx.AsyncClient:
+        """
+        The client of the running event loop; call from a coroutine.
+        """
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            client = self._clients.get(loop)
+            if client is None or client.is_closed:
+                client = httpx.AsyncClient(limits=self.limits, timeout=self.timeout)
+                self._clients[loop] = client
+            return client
+
+    async def close(self):
+        """
+        Close the running loop's client; clients of loops that have
+        already been closed are dropped.
+        """
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            client = self._clients.pop(loop, None)
+            for stopped in [other for other in self._clients if other.is_closed()]:
+                del self._clients[stopped]
+        if client is not None:
+            await client.aclose()
+
+
+# Singleton
+http_client = SharedHTTPClient()
@@ -0,0 +1,106 @@
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Sequence
+
+import numpy as np
+
+from app.ai.base_embedding_provider import BaseEmbeddingProvider
+
+
+class LocalHashEmbedder(BaseEmbeddingProvider):
+    """
+    Lightweight local embedding model using hashed token frequencies.
+    Avoids external embedding API dependencies.
+
+    Token buckets are memoized, and embeddings of short texts are kept in
+    a bounded LRU so repeated chat messages ("ok", "thanks") are free.
+    """
+
+    name = "local"
+    local = True
+    # Long texts rarely repeat verbatim; caching them only costs memory.
+    cacheable_chars = 64
+
+    def __init__(self, dimension: int = 256, cache_size: int = 4096, max_tokens: int = 200_000):
+        super().__init__(model=f"hash-{dimension}")
+        self.dimension = dimension
+        self.cache_size = cache_size
+        self.max_tokens = max_tokens
+        self._token_pattern = re.compile(r"[a-zA-Z0-9_]+")
+        self._buckets: Dict[str, int] = {}
+        self._cache: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _tokenize(self, text: str) -> List[str]:
+        return self._token_pattern.findall((text or "").lower())
+
+    def _bucket(self, token: str) -> int:
+        # Stored vectors depend on this mapping, so it stays SHA-256; the
+        # memo means each distinct token is only hashed once.
+        bucket = self._buckets.get(token)
+        if bucket is None:
+            if len(self._buckets) >= self.max_tokens:
+                self._buckets.clear()
+            digest = hashlib.sha256(token.encode("utf-8")).digest()
+            bucket = int.from_bytes(digest[:4], "big") % self.dimension
+            self._buckets[token] = bucket
+        return bucket
+
+    def embed_many(self, texts: Sequence[str]) -> np.ndarray:
+        """
+        Embed ``texts`` into a float32 ``(len(texts), dimension)`` array of
+        unit rows; texts without tokens get a zero row.
+        """
+        matrix = np.zeros((len(texts), self.dimension), dtype=np.float32)
+        missing: Dict[str, List[int]] = {}
+        with self._lock:
+            for row, text in enumerate(texts):
+                text = text or ""
+                cached = self._cache.get(text) if len(text) <= self.cacheable_chars else None
+                if cached is not None:
+                    self._cache.move_to_end(text)
+                    matrix[row] = cached
+                else:
+                    missing.setdefault(text, []).append(row)
+
+        if not missing:
+            return matrix
+
+        rows = [positions[0] for positions in missing.values()]
+        flat: List[int] = []
+        for row in rows:
+            offset = row * self.dimension
+            flat.extend(offset + self._bucket(token) for token in self._tokenize(texts[row]))
+
+        if flat:
+            matrix += np.bincount(
+                np.asarray(flat, dtype=np.int64),
+                minlength=matrix.size
+            ).reshape(matrix.shape).astype(np.float32)
+
+        computed = matrix[rows]
+        norms = np.linalg.norm(computed, axis=1, keepdims=True)
+        computed = np.divide(computed, norms, out=np.zeros_like(computed), where=norms > 0)
+        matrix[rows] = computed
+
+        with self._lock:
+            for (text, positions), vector in zip(missing.items(), computed):
+                if len(positions) > 1:
+                    matrix[positions[1:]] = vector
+                if self.cache_size and len(text) <= self.cacheable_chars:
+                    self._cache[text] = vector.copy()
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+        return matrix
+
+    def embed(self, text: str) -> List[float]:
+        return self.embed_many([text])[0].tolist()
+
+    async def embed_batch(self, texts: List[str]) -> np.ndarray:
+        return self.embed_many(texts)
+
+    async def health_check(self) -> bool:
+        return True
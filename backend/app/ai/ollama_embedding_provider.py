@@ -0,0 +1,88 @@
+import asyncio
+from typing import List, Optional
+
+import httpx
+import numpy as np
+
+from app.ai.base_embedding_provider import BaseEmbeddingProvider
+from app.ai.http_client import SharedHTTPClient, http_client
+from app.config.settings import settings
+
+
+class OllamaEmbeddingProvider(BaseEmbeddingProvider):
+    """
+    Embeddings from a local Ollama server.
+
+    Texts are sent ``batch_size`` at a time to ``/api/embed`` over the
+    shared, pooled HTTP client of the calling event loop. Servers older than that endpoint get one
+    ``/api/embeddings`` call per text instead, run concurrently.
+
+    Ollama answers 404 both when ``/api/embed`` does not exist and when the
+    model is not pulled; only the first switches to the per-text endpoint.
+    """
+
+    name = "ollama"
+
+    def __init__(
+        self,
+        model: str = "nomic-embed-text",
+        base_url: Optional[str] = None,
+        batch_size: Optional[int] = None,
+        timeout: float = 60.0,
+        http: Optional[SharedHTTPClient] = None,
+    ):
+        super().__init__(model=model)
+        self.base_url = (base_url or settings.OLLAMA_BASE_URL).rstrip("/")
+        self.batch_size = max(1, batch_size or settings.EMBEDDING_BATCH_SIZE)
+        self.timeout = timeout
+        self.http = http or http_client
+        self._legacy = False
+
+    async def _post(self, path: str, payload: dict) -> httpx.Response:
+        return await self.http.get().post(f"{self.base_url}{path}", json=payload, timeout=self.timeout)
+
+    async def _embed_legacy(self, texts: List[str]) -> List[List[float]]:
+        async def one(text: str) -> List[float]:
+            response = await self._post("/api/embeddings", {"model": self.model, "prompt": text})
+            response.raise_for_status()
+            return response.json()["embedding"]
+
+        return await asyncio.gather(*[one(text) for text in texts])
+
+    @staticmethod
+    def _endpoint_missing(response: httpx.Response) -> bool:
+        """
+        Whether a 404 means the route is unknown (a plain-text "404 page
+        not found") rather than an API error such as a missing model.
+        """
+        try:
+            return not response.json().get("error")
+        except (ValueError, AttributeError):
+            return True
+
+    async def _embed_chunk(self, texts: List[str]) -> List[List[float]]:
+        if not self._legacy:
+            response = await self._post("/api/embed", {"model": self.model, "input": texts})
+            if response.status_code != 404 or not self._endpoint_missing(response):
+                response.raise_for_status()
+                embeddings = response.json()["embeddings"]
+                if len(embeddings) != len(texts):
+                    raise ValueError(f"Ollama returned {len(embeddings)} embeddings for {len(texts)} texts")
+                return embeddings
+            self._legacy = True
+        return await self._embed_legacy(texts)
+
+    async def embed_batch(self, texts: List[str]) -> np.ndarray:
+        rows: List[List[float]] = []
+        for start in range(0, len(texts), self.batch_size):
+            rows.extend(await self._embed_chunk(texts[start:start + self.batch_size]))
+        if not rows:
+            return np.zeros((0, 0), dtype=np.float32)
+        return np.asarray(rows, dtype=np.float32)
+
+    async def health_check(self) -> bool:
+        try:
+            response = await self.http.get().get(f"{self.base_url}/api/tags", timeout=self.timeout)
+            return response.status_code == 200
+        except Exception:
+            return False
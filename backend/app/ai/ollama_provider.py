@@ -1,19 +1,24 @@
-from typing import List, Dict
-import httpx
+import json
+from typing import AsyncIterator, List, Dict, Optional
 
 from app.ai.base_provider import BaseAIProvider
+from app.ai.http_client import SharedHTTPClient, http_client
 from app.config.settings import settings
 
 
 class OllamaProvider(BaseAIProvider):
     """
     AI Provider for local Ollama models.
+
+    Requests go through the shared, pooled HTTP client so connections to
+    Ollama are kept alive between chat requests.
     """
 
-    def __init__(self, model: str = "llama3"):
+    def __init__(self, model: str = "llama3", http: Optional[SharedHTTPClient] = None):
         super().__init__()
         self.base_url = settings.OLLAMA_BASE_URL
         self.model = model
+        self.http = http or http_client
 
     async def generate_response(
         self,
@@ -29,27 +34,55 @@ class OllamaProvider(BaseAIProvider):
             "stream": False,
         }
 
-        async with httpx.AsyncClient(timeout=120) as client:
-            response = await client.post(url, json=payload)
-            response.raise_for_status()
+        response = await self.http.get().post(url, json=payload, timeout=120)
+        response.raise_for_status()
 
         data = response.json()
 
         return data["message"]["content"]
 
+    async def stream_response(
+        self,
+        messages: List[Dict[str, str]],
+        **kwargs,
+    ) -> AsyncIterator[str]:
+        """
+        Yield content as Ollama streams it: one JSON object per line, the
+        last one with ``"done": true``.
+        """
+        url = f"{self.base_url}/api/chat"
+
+        payload = {
+            "model": self.model,
+            "messages": messages,
+            "stream": True,
+        }
+
+        async with self.http.get().stream("POST", url, json=payload, timeout=120) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if not line.strip():
+                    continue
+                data = json.loads(line)
+                if data.get("error"):
+                    raise RuntimeError(data["error"])
+                content = (data.get("message") or {}).get("content")
+                if content:
+                    yield content
+                if data.get("done"):
+                    break
+
     async def health_check(self) -> bool:
         try:
-            async with httpx.AsyncClient(timeout=5) as client:
-                r = await client.get(f"{self.base_url}/api/tags")
-                return r.status_code == 200
+            r = await self.http.get().get(f"{self.base_url}/api/tags", timeout=5)
+            return r.status_code == 200
         except Exception:
             return False
 
     async def list_models(self) -> List[str]:
 
-        async with httpx.AsyncClient(timeout=10) as client:
-            response = await client.get(f"{self.base_url}/api/tags")
-            response.raise_for_status()
+        response = await self.http.get().get(f"{self.base_url}/api/tags", timeout=10)
+        response.raise_for_status()
 
         data = response.json()
 
@@ -1,13 +1,20 @@
-from typing import List, Dict
+from typing import AsyncIterator, List, Dict, Optional
+
+import httpx
 from openai import AsyncOpenAI
 
 from app.ai.base_provider import BaseAIProvider
+from app.ai.http_client import http_client
 from app.security.key_manager import key_manager
 
 
 class OpenAIProvider(BaseAIProvider):
     """
     AI Provider for OpenAI models.
+
+    The SDK client sends its requests over the shared HTTP client of the
+    running event loop, so it is rebuilt (cheaply) whenever that changes:
+    a cached provider is never tied to the loop that created it.
     """
 
     def __init__(self, model: str = "gpt-4o-mini"):
@@ -15,12 +22,25 @@ class OpenAIProvider(BaseAIProvider):
         self.model = model
 
         # Load encrypted API key
-        api_key = key_manager.get_key("openai")
+        self.api_key = key_manager.get_key("openai")
 
-        if not api_key:
+        if not self.api_key:
             raise ValueError("OpenAI API key not configured")
 
-        self.client = AsyncOpenAI(api_key=api_key)
+        self._http: Optional[httpx.AsyncClient] = None
+        self._client: Optional[AsyncOpenAI] = None
+
+    @property
+    def client(self) -> AsyncOpenAI:
+        """
+        The SDK client over the running loop's shared HTTP client.
+        """
+        http = http_client.get()
+        client = self._client
+        if client is None or self._http is not http:
+            client = AsyncOpenAI(api_key=self.api_key, http_client=http)
+            self._http, self._client = http, client
+        return client
 
     async def generate_response(
         self,
@@ -35,6 +55,22 @@ class OpenAIProvider(BaseAIProvider):
 
         return response.choices[0].message.content
 
+    async def stream_response(
+        self,
+        messages: List[Dict[str, str]],
+        **kwargs,
+    ) -> AsyncIterator[str]:
+
+        stream = await self.client.chat.completions.create(
+            model=self.model,
+            messages=messages,
+            stream=True,
+        )
+
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
     async def health_check(self) -> bool:
         try:
             await self.client.models.list()
@@ -45,3 +81,9 @@ class OpenAIProvider(BaseAIProvider):
     async def list_models(self) -> List[str]:
         models = await self.client.models.list()
         return [m.id for m in models.data]
+
+    async def close(self):
+        # The HTTP connections belong to the shared client, which the
+        # factory closes on shutdown; closing the SDK client would close
+        # them for every other provider too.
+        self._http = self._client = None
@@ -0,0 +1,329 @@
+"""
+Token-budgeted packing of chat prompts.
+
+A chat prompt is the system prompt, the request's own messages and
+three kinds of context: the personalization profile, RAG hits and the
+recent conversation. ``PromptPacker.pack`` fits them into the model's
+window:
+
+- the budget is the provider/model context limit (``CHAT_CONTEXT_LIMITS``)
+  less the tokens kept free for the reply, capped at ``CHAT_PROMPT_TOKENS``,
+- the system prompt and the request's messages always go in; a request
+  that does not fit on its own is rejected,
+- what is left is shared between profile, RAG and history
+  (``CHAT_CONTEXT_SHARES``); a section that does not use its share leaves
+  it to the others in that order of priority,
+- within a section the least valuable items go first: the last profile
+  facts, the lowest-ranked RAG hits (the last one kept may be cut short)
+  and the oldest messages, which are replaced by a one-line-per-turn
+  summary when it fits.
+
+Token counts come from the same local word/punctuation estimate as RAG
+chunking, plus a few tokens of framing per message. Counts are cached
+per message (keyed by a digest of its role and content), so history
+that reappears in every request is only counted once.
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from app.config.settings import settings
+from app.rag.chunking import estimate_tokens, split_sentences, truncate_tokens
+
+
+# Role markers and separators a chat template adds around each message.
+MESSAGE_OVERHEAD = 4
+# A RAG hit or profile fact is cut short rather than dropped only when
+# at least this many of its tokens fit.
+MIN_TRUNCATED_TOKENS = 16
+# Tokens of each earlier user message kept in the history summary.
+SUMMARY_LINE_TOKENS = 24
+
+SECTIONS = ("profile", "rag", "history")
+
+PROFILE_HEADER = "Known user profile facts (use for personalization when relevant):"
+RAG_HEADER = "Relevant memory context (use when helpful, ignore if irrelevant):"
+SUMMARY_HEADER = "Summary of the earlier conversation (older messages were left out):"
+
+
+class PromptTooLong(ValueError):
+    """
+    The system prompt and the request's messages alone exceed the budget.
+    """
+
+
+class TokenCounter:
+    """
+    Local token estimate with an LRU cache of per-message counts.
+    """
+
+    def __init__(self, cache_size: int = 4096):
+        self.cache_size = max(0, cache_size)
+        self._cache: "OrderedDict[bytes, int]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    count = staticmethod(estimate_tokens)
+    truncate = staticmethod(truncate_tokens)
+
+    def message_tokens(self, message: Dict[str, str]) -> int:
+        """
+        Tokens of one chat message, including its framing.
+        """
+        role = message.get("role") or ""
+        content = message.get("content") or ""
+        key = hashlib.blake2b(f"{role}\0{content}".encode("utf-8"), digest_size=16).digest()
+        with self._lock:
+            tokens = self._cache.get(key)
+            if tokens is not None:
+                self._cache.move_to_end(key)
+                self._hits += 1
+                return tokens
+            self._misses += 1
+
+        tokens = MESSAGE_OVERHEAD + self.count(content)
+        if self.cache_size:
+            with self._lock:
+                self._cache[key] = tokens
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return tokens
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"cached": len(self._cache), "hits": self._hits, "misses": self._misses}
+
+
+class PromptPacker:
+    """
+    Fits the system prompt, request messages and chat context into the
+    token budget of a provider/model. Limits and shares default to the
+    settings at call time.
+    """
+
+    def __init__(
+        self,
+        counter: Optional[TokenCounter] = None,
+        limits: Optional[Dict[str, int]] = None,
+        reply_tokens: Optional[int] = None,
+        prompt_tokens: Optional[int] = None,
+        shares: Optional[Dict[str, float]] = None,
+    ):
+        self.counter = counter or TokenCounter()
+        self.limits = limits
+        self.reply_tokens = reply_tokens
+        self.prompt_tokens = prompt_tokens
+        self.shares = shares
+
+    # -------------------------
+    # Budget
+    # -------------------------
+
+    def context_limit(self, provider: str, model: Optional[str] = None) -> int:
+        """
+        Context window of ``provider:model``, else of the provider, else
+        the ``"*"`` default.
+        """
+        limits = {key.lower(): value for key, value in (self.limits or settings.CHAT_CONTEXT_LIMITS).items()}
+        provider = (provider or "").lower()
+        for key in (f"{provider}:{(model or '').lower()}", provider, "*"):
+            if key in limits:
+                return int(limits[key])
+        raise ValueError(f"No context limit configured for {provider}:{model}")
+
+    def budget(self, provider: str, model: Optional[str] = None) -> Tuple[int, int]:
+        """
+        ``(context limit, prompt token budget)`` of a provider/model.
+        """
+        limit = self.context_limit(provider, model)
+        reply = settings.CHAT_REPLY_TOKENS if self.reply_tokens is None else self.reply_tokens
+        cap = settings.CHAT_PROMPT_TOKENS if self.prompt_tokens is None else self.prompt_tokens
+        budget = max(0, limit - reply)
+        if cap > 0:
+            budget = min(budget, cap)
+        return limit, budget
+
+    def _allotments(self, available: int) -> Dict[str, int]:
+        shares = self.shares if self.shares is not None else settings.CHAT_CONTEXT_SHARES
+        weights = {section: max(0.0, float(shares.get(section, 0.0))) for section in SECTIONS}
+        total = sum(weights.values())
+        if total <= 0:
+            return {section: 0 for section in SECTIONS}
+        return {section: int(available * weights[section] / total) for section in SECTIONS}
+
+    # -------------------------
+    # Sections
+    # -------------------------
+
+    def _pack_list(self, header: str, items: List[str], allotment: int) -> Tuple[Optional[Dict], int, int]:
+        """
+        One system message of ``header`` and as many leading ``items`` as
+        fit; the first one that does not fit may be cut short. Returns the
+        message (or None), its tokens and how many items were left out or
+        cut short.
+        """
+        if not items:
+            return None, 0, 0
+        used = MESSAGE_OVERHEAD + self.counter.count(header)
+        lines: List[str] = []
+        for index, item in enumerate(items):
+            size = self.counter.count(item)
+            if used + size <= allotment:
+                lines.append(item)
+                used += size
+                continue
+            room = allotment - used
+            if room >= MIN_TRUNCATED_TOKENS:
+                # One token less, for the ellipsis.
+                lines.append(self.counter.truncate(item, room - 1))
+                used += room
+            if not lines:
+                return None, 0, len(items)
+            dropped = len(items) - index
+            break
+        else:
+            dropped = 0
+        message = {"role": "system", "content": header + "\n" + "\n".join(lines)}
+        return message, self.counter.message_tokens(message), dropped
+
+    def _pack_profile(self, profile: Dict[str, str], allotment: int):
+        return self._pack_list(PROFILE_HEADER, [f"{key}: {value}" for key, value in (profile or {}).items()], allotment)
+
+    def _pack_rag(self, hits: List[Dict], allotment: int):
+        snippets = [(hit.get("text") or "").strip() for hit in hits or []]
+        snippets = [snippet for snippet in snippets if snippet]
+        numbered = [f"{index}. {snippet}" for index, snippet in enumerate(snippets, start=1)]
+        return self._pack_list(RAG_HEADER, numbered, allotment)
+
+    def _summary(self, older: List[Dict], room: int) -> Tuple[Optional[Dict], int]:
+        """
+        A system message with the first sentence of the latest earlier
+        user messages that fit in ``room``.
+        """
+        header = MESSAGE_OVERHEAD + self.counter.count(SUMMARY_HEADER)
+        lines: List[str] = []
+        used = header
+        for message in reversed(older):
+            if message.get("role") != "user":
+                continue
+            sentences = split_sentences(message.get("content") or "")
+            if not sentences:
+                continue
+            line = "- user: " + self.counter.truncate(sentences[0], SUMMARY_LINE_TOKENS - 1)
+            size = self.counter.count(line)
+            if used + size > room:
+                break
+            lines.insert(0, line)
+            used += size
+        if not lines:
+            return None, 0
+        message = {"role": "system", "content": SUMMARY_HEADER + "\n" + "\n".join(lines)}
+        return message, self.counter.message_tokens(message)
+
+    def _newest(self, history: List[Dict], allotment: int) -> Tuple[List[Dict], int]:
+        kept: List[Dict] = []
+        used = 0
+        for message in reversed(history):
+            size = self.counter.message_tokens(message)
+            if used + size > allotment:
+                break
+            kept.insert(0, message)
+            used += size
+        return kept, used
+
+    def _pack_history(self, history: List[Dict], allotment: int) -> Tuple[List[Dict], int, int]:
+        """
+        The newest messages that fit, preceded by a summary of the older
+        ones. Room for a one-line summary is made by leaving out one more
+        message if needed.
+        """
+        history = list(history or [])
+        kept, used = self._newest(history, allotment)
+        older = history[:len(history) - len(kept)]
+        if not older:
+            return kept, used, 0
+
+        summary, size = self._summary(older, allotment - used)
+        if summary is None and any(message.get("role") == "user" for message in older):
+            reserve = MESSAGE_OVERHEAD + self.counter.count(SUMMARY_HEADER + "\n- user:") + SUMMARY_LINE_TOKENS
+            kept, used = self._newest(history, allotment - reserve)
+            older = history[:len(history) - len(kept)]
+            summary, size = self._summary(older, allotment - used)
+        if summary is not None:
+            kept.insert(0, summary)
+            used += size
+        return kept, used, len(older)
+
+    def _pack_section(self, section: str, context: Dict, allotment: int):
+        if section == "profile":
+            message, used, dropped = self._pack_profile(context["profile"], allotment)
+            return ([message] if message else []), used, dropped
+        if section == "rag":
+            message, used, dropped = self._pack_rag(context["rag"], allotment)
+            return ([message] if message else []), used, dropped
+        return self._pack_history(context["history"], allotment)
+
+    # -------------------------
+    # Packing
+    # -------------------------
+
+    def pack(
+        self,
+        provider: str,
+        model: Optional[str],
+        system: Dict[str, str],
+        messages: List[Dict[str, str]],
+        profile: Optional[Dict[str, str]] = None,
+        hits: Optional[List[Dict]] = None,
+        history: Optional[List[Dict]] = None,
+    ) -> Tuple[List[Dict[str, str]], Dict]:
+        """
+        The prompt for ``provider``/``model``: system prompt, profile, RAG
+        context, history, then the request's ``messages``. Returns it with
+        a report of the budget and the tokens of each section.
+        """
+        limit, budget = self.budget(provider, model)
+        fixed = self.counter.message_tokens(system) + sum(self.counter.message_tokens(m) for m in messages)
+        if fixed > budget:
+            raise PromptTooLong(
+                f"Prompt needs {fixed} tokens but {provider}:{model or 'default'} allows {budget}"
+            )
+
+        context = {"profile": profile or {}, "rag": hits or [], "history": history or []}
+        allotments = self._allotments(budget - fixed)
+        packed = {section: self._pack_section(section, context, allotments[section]) for section in SECTIONS}
+
+        # Hand unused tokens to sections that left something out, by priority.
+        spare = budget - fixed - sum(used for _, used, _ in packed.values())
+        for section in SECTIONS:
+            _, used, dropped = packed[section]
+            if dropped and spare > 0:
+                packed[section] = self._pack_section(section, context, used + spare)
+                spare -= packed[section][1] - used
+
+        prompt = [system]
+        for section in SECTIONS:
+            prompt += packed[section][0]
+        prompt += messages
+
+        sections = {"system": self.counter.message_tokens(system)}
+        sections.update({section: packed[section][1] for section in SECTIONS})
+        sections["messages"] = fixed - sections["system"]
+        report = {
+            "context_limit": limit,
+            "budget": budget,
+            "prompt_tokens": sum(sections.values()),
+            "sections": sections,
+            "dropped": {section: packed[section][2] for section in SECTIONS},
+        }
+        return prompt, report
+
+    def stats(self) -> Dict[str, int]:
+        return self.counter.stats()
+
+
+# Singleton
+prompt_packer = PromptPacker()
@@ -1,42 +1,134 @@
-from typing import Optional
+import asyncio
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Set, Tuple
 
 from app.config.settings import settings
 from app.ai.base_provider import BaseAIProvider
+from app.ai.http_client import http_client
 from app.ai.ollama_provider import OllamaProvider
 from app.ai.openai_provider import OpenAIProvider
 from app.ai.gemini_provider import GeminiProvider   # ✅ ADD THIS
+from app.security.key_manager import key_manager
+
+
+logger = logging.getLogger(__name__)
+
+# Providers whose constructor reads an API key from the key manager.
+KEYED_PROVIDERS = {"openai", "gemini"}
 
 
 class ProviderFactory:
     """
     Factory class to create AI provider instances.
+
+    Instances are cached per (provider, model, key version) and reused by
+    every request, so SDK clients and HTTP connections are built once.
+    Saving or deleting an API key changes the key version and the next
+    request builds a fresh provider with the new key; the providers built
+    with the old key are closed in the background. The model name comes
+    from the client, so the cache is bounded: beyond ``max_size`` the
+    least recently used provider is closed the same way.
     """
 
-    def __init__(self):
+    def __init__(self, max_size: Optional[int] = None):
         self.default_provider = settings.DEFAULT_PROVIDER
+        self.max_size = max(1, max_size or settings.PROVIDER_CACHE_SIZE)
+        self._providers: "OrderedDict[Tuple[str, str, Optional[tuple]], BaseAIProvider]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._closing: Set[asyncio.Task] = set()
+        self.created = 0
 
-    def get_provider(
-        self,
-        provider_name: Optional[str] = None,
-        model: Optional[str] = None,
-    ) -> BaseAIProvider:
-
-        provider_name = provider_name or self.default_provider
+    def _create(self, provider_name: str, model: Optional[str]) -> BaseAIProvider:
 
         # ✅ Ollama
-        if provider_name.lower() == "ollama":
+        if provider_name == "ollama":
             return OllamaProvider(model=model or "llama3")
 
         # ✅ OpenAI
-        elif provider_name.lower() == "openai":
+        elif provider_name == "openai":
             return OpenAIProvider(model=model or "gpt-4o-mini")
 
         # ✅ Gemini
-        elif provider_name.lower() == "gemini":
+        elif provider_name == "gemini":
             return GeminiProvider(model=model or "gemini-1.5-flash")
 
         raise ValueError(f"Unsupported provider: {provider_name}")
 
+    def get_provider(
+        self,
+        provider_name: Optional[str] = None,
+        model: Optional[str] = None,
+    ) -> BaseAIProvider:
+
+        provider_name = (provider_name or self.default_provider).lower()
+        key_version = key_manager.version() if provider_name in KEYED_PROVIDERS else None
+        key = (provider_name, model or "", key_version)
+
+        evicted: List[BaseAIProvider] = []
+        with self._lock:
+            provider = self._providers.get(key)
+            if provider is not None:
+                self._providers.move_to_end(key)
+                return provider
+            # Entries built with an older key are dead weight now.
+            for cached in [cached for cached in self._providers if cached[0] == provider_name]:
+                if cached[2] != key_version:
+                    evicted.append(self._providers.pop(cached))
+            provider = self._create(provider_name, model)
+            self._providers[key] = provider
+            self.created += 1
+            while len(self._providers) > self.max_size:
+                evicted.append(self._providers.popitem(last=False)[1])
+
+        for stale in evicted:
+            self._close_later(stale)
+        return provider
+
+    def _close_later(self, provider: BaseAIProvider):
+        """
+        Close an evicted provider without blocking the request that
+        evicted it: as a task on the running event loop, or right away
+        when there is none.
+        """
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            asyncio.run(self._close_quietly(provider))
+            return
+        task = loop.create_task(self._close_quietly(provider))
+        self._closing.add(task)
+        task.add_done_callback(self._closing.discard)
+
+    @staticmethod
+    async def _close_quietly(provider: BaseAIProvider):
+        try:
+            await provider.close()
+        except Exception as e:
+            logger.warning(f"Closing evicted provider {type(provider).__name__} failed: {e}")
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "cached": sorted(f"{name}:{model or 'default'}" for name, model, _ in self._providers),
+                "created": self.created,
+            }
+
+    async def close(self):
+        """
+        Drop every cached provider and close the shared HTTP client.
+        """
+        with self._lock:
+            providers = list(self._providers.values())
+            self._providers.clear()
+        loop = asyncio.get_running_loop()
+        closing = [task for task in self._closing if task.get_loop() is loop]
+        await asyncio.gather(*closing, return_exceptions=True)
+        for provider in providers:
+            await provider.close()
+        await http_client.close()
+
 
 # Singleton
 provider_factory = ProviderFactory()
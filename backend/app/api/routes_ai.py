@@ -1,23 +1,27 @@
-from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel
-from typing import List, Dict, Optional, Any
+from fastapi import APIRouter, HTTPException, Response, WebSocket, WebSocketDisconnect, status
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, ValidationError
+from typing import AsyncIterator, List, Dict, Optional, Any
 from datetime import datetime
 from urllib.parse import quote_plus
+import json
 import re
+import time
+from app.ai.chat_metrics import chat_metrics
+from app.ai.prompt_packer import PromptTooLong, prompt_packer
 from app.ai.provider_factory import provider_factory
 from sqlalchemy.orm import Session
 from fastapi import Depends
-from app.database.db import get_db
+from app.database.db import SessionLocal, get_db
 from app.automation.task_agent import TaskAgent
 from app.automation.system_agent import SystemAgent
-from app.memory.memory_service import MemoryService
-from app.memory.personalization import PersonalizationEngine
-from app.rag.retriever import retriever
+from app.memory.chat_context import gather_context, server_timing
+from app.memory.persistence_queue import chat_persistence
 from app.agents.gmail_agent import GmailAgent
 from app.agents.calendar_agent import CalendarAgent
 from app.agents.chrome_agent import ChromeAgent
 from app.agents.file_agent import FileAgent
-from app.core.auth import get_optional_current_user
+from app.core.auth import get_optional_current_user, get_user_from_token
 from app.database.models import User
 
 
@@ -371,43 +375,156 @@ def _execute_command_schema(command_schema: Dict[str, Any], user_id: str, db: Se
     return "\n".join([f"{idx + 1}. {reply}" for idx, reply in enumerate(replies)])
 
 
-def _build_profile_prompt(profile: Dict[str, str]) -> Optional[Dict[str, str]]:
-    if not profile:
-        return None
+def _save_exchange(user_id: str, user_text: str, reply: str, personalize: bool = True):
+    """
+    Hand a finished exchange to the write-behind queue, which stores the
+    conversation memory, RAG chunks and personalization after the
+    response has gone out.
+    """
+    chat_persistence.record(user_id, user_text, reply, personalize=personalize)
 
-    lines = [f"{key}: {value}" for key, value in profile.items()]
-    return {
+
+async def _prepare_chat(request: ChatRequest, db: Session, request_user_id: str) -> Dict[str, Any]:
+    """
+    Validate a chat request and either answer it directly (time and
+    device commands, saved here) or build the prompt for the LLM.
+    Returns ``{"user_text", "reply"}`` or ``{"user_text", "provider",
+    "provider_name", "messages", "timings", "prompt"}``, where ``prompt``
+    reports the token budget the messages were packed into.
+    """
+    if not request.messages:
+        raise HTTPException(status_code=400, detail="messages cannot be empty")
+    if not any((msg.content or "").strip() for msg in request.messages if msg.role == "user"):
+        raise HTTPException(status_code=400, detail="user message cannot be empty")
+
+    provider = provider_factory.get_provider(
+        provider_name=request.provider,
+        model=request.model,
+    )
+
+    new_messages = [
+        {"role": msg.role, "content": msg.content}
+        for msg in request.messages
+    ]
+
+    latest_user_message = next(
+        (msg.content for msg in reversed(request.messages) if msg.role == "user"),
+        request.messages[-1].content
+    )
+    latest_user_message = (latest_user_message or "").strip()
+    if not latest_user_message:
+        raise HTTPException(status_code=400, detail="user message cannot be empty")
+
+    time_reply = _handle_time_command(latest_user_message)
+    if time_reply:
+        _save_exchange(request_user_id, latest_user_message, time_reply, personalize=False)
+        return {"user_text": latest_user_message, "reply": time_reply}
+
+    command = _parse_command_schema(latest_user_message)
+    if command:
+        command_reply = _execute_command_schema(command, request_user_id, db)
+        if command_reply:
+            _save_exchange(request_user_id, latest_user_message, command_reply)
+            return {"user_text": latest_user_message, "reply": command_reply}
+
+    # -------------------------
+    # 1-3) Recent messages, RAG hits and personalization profile
+    # -------------------------
+    past_messages, rag_hits, profile, timings = await gather_context(request_user_id, latest_user_message)
+
+    # -------------------------
+    # 4) Build system prompt and pack the context into the token budget
+    # -------------------------
+    system_prompt = {
         "role": "system",
         "content": (
-            "Known user profile facts (use for personalization when relevant):\n"
-            + "\n".join(lines)
+            "You are Jarvis, a highly intelligent personal AI assistant. "
+            "You are helpful, concise, polite, and slightly witty. "
+            "You remember user preferences and personalize responses. "
+            "Always aim to assist efficiently."
         )
     }
 
+    provider_name = (request.provider or provider_factory.default_provider).lower()
+    model = request.model or getattr(provider, "model", None) or getattr(provider, "model_name", None)
+    try:
+        messages, prompt = prompt_packer.pack(
+            provider_name,
+            model,
+            system_prompt,
+            new_messages,
+            profile=profile,
+            hits=rag_hits,
+            history=past_messages,
+        )
+    except PromptTooLong as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-def _build_rag_prompt(hits: List[Dict]) -> Optional[Dict[str, str]]:
-    if not hits:
-        return None
-
-    context_lines = []
-    for idx, hit in enumerate(hits, start=1):
-        snippet = hit.get("text", "").strip()
-        if not snippet:
-            continue
-        context_lines.append(f"{idx}. {snippet}")
+    return {
+        "user_text": latest_user_message,
+        "provider": provider,
+        "provider_name": provider_name,
+        "messages": messages,
+        "timings": timings,
+        "prompt": prompt,
+    }
 
-    if not context_lines:
-        return None
 
-    return {
-        "role": "system",
-        "content": (
-            "Relevant memory context (use when helpful, ignore if irrelevant):\n"
-            + "\n".join(context_lines)
-        )
+async def _stream_chat(turn: Dict[str, Any], user_id: str) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Events of one streamed reply: ``token`` events as the provider
+    yields them, then ``done`` with the full reply once it has been
+    handed to the persistence queue, or ``error``. A client that goes
+    away mid-stream leaves nothing saved.
+    """
+    if turn.get("reply") is not None:
+        yield {"type": "token", "token": turn["reply"]}
+        yield {"type": "done", "response": turn["reply"]}
+        return
+
+    started = time.perf_counter()
+    first_token: Optional[float] = None
+    pieces: List[str] = []
+    try:
+        async for piece in turn["provider"].stream_response(turn["messages"]):
+            if first_token is None:
+                first_token = time.perf_counter() - started
+            pieces.append(piece)
+            yield {"type": "token", "token": piece}
+    except Exception as e:
+        chat_metrics.record_failure(turn["provider_name"], "stream")
+        yield {"type": "error", "detail": str(e)}
+        return
+    total = time.perf_counter() - started
+    chat_metrics.record(
+        turn["provider_name"], "stream", first_token, total, len(pieces), turn["prompt"]["prompt_tokens"]
+    )
+
+    response = "".join(pieces)
+    try:
+        _save_exchange(user_id, turn["user_text"], response)
+    except Exception as e:
+        yield {"type": "error", "detail": f"reply not saved: {e}"}
+        return
+
+    yield {
+        "type": "done",
+        "response": response,
+        "ttft_ms": round((first_token if first_token is not None else total) * 1000, 2),
+        "total_ms": round(total * 1000, 2),
+        "context": turn["timings"],
+        "prompt": turn["prompt"],
     }
 
 
+def _sse_event(event: Dict[str, Any]) -> str:
+    return f"event: {event['type']}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+
+
+def _request_user_id(request: ChatRequest, current_user: User | None) -> str:
+    return str(current_user.id) if current_user else ((request.user_id or "default").strip() or "default")
+
+
 # -------------------------
 # Routes
 # -------------------------
@@ -415,137 +532,36 @@ def _build_rag_prompt(hits: List[Dict]) -> Optional[Dict[str, str]]:
 @router.post("/chat", response_model=ChatResponse)
 async def chat_endpoint(
     request: ChatRequest,
+    http_response: Response,
     db: Session = Depends(get_db),
     current_user: User | None = Depends(get_optional_current_user),
 ):
     try:
-        if not request.messages:
-            raise HTTPException(status_code=400, detail="messages cannot be empty")
-        if not any((msg.content or "").strip() for msg in request.messages if msg.role == "user"):
-            raise HTTPException(status_code=400, detail="user message cannot be empty")
-        request_user_id = str(current_user.id) if current_user else ((request.user_id or "default").strip() or "default")
-
-        provider = provider_factory.get_provider(
-            provider_name=request.provider,
-            model=request.model,
-        )
-
-        memory = MemoryService(db)
-        engine = PersonalizationEngine(db)
-
-        # -------------------------
-        # 1) Get recent messages
-        # -------------------------
-        past_messages = memory.get_recent_messages(user_id=request_user_id, limit=10)
-
-        new_messages = [
-            {"role": msg.role, "content": msg.content}
-            for msg in request.messages
-        ]
-
-        latest_user_message = next(
-            (msg.content for msg in reversed(request.messages) if msg.role == "user"),
-            request.messages[-1].content
-        )
-        latest_user_message = (latest_user_message or "").strip()
-        if not latest_user_message:
-            raise HTTPException(status_code=400, detail="user message cannot be empty")
-
-        time_reply = _handle_time_command(latest_user_message)
-        if time_reply:
-            memory.save_message(request_user_id, "user", latest_user_message)
-            memory.save_message(request_user_id, "assistant", time_reply)
-            retriever.add_text(
-                latest_user_message,
-                metadata={"user_id": request_user_id, "role": "user", "kind": "chat"}
-            )
-            retriever.add_text(
-                time_reply,
-                metadata={"user_id": request_user_id, "role": "assistant", "kind": "chat"}
-            )
-            return ChatResponse(response=time_reply)
-
-        command = _parse_command_schema(latest_user_message)
-        if command:
-            command_reply = _execute_command_schema(command, request_user_id, db)
-            if command_reply:
-                memory.save_message(request_user_id, "user", latest_user_message)
-                memory.save_message(request_user_id, "assistant", command_reply)
-                retriever.add_text(
-                    latest_user_message,
-                    metadata={"user_id": request_user_id, "role": "user", "kind": "chat"}
-                )
-                retriever.add_text(
-                    command_reply,
-                    metadata={"user_id": request_user_id, "role": "assistant", "kind": "chat"}
-                )
-                engine.process_user_text(request_user_id, latest_user_message)
-                return ChatResponse(response=command_reply)
-
-        # -------------------------
-        # 2) Get RAG hits
-        # -------------------------
-        rag_hits = retriever.search(
-            query=latest_user_message,
-            top_k=3,
-            filters={"user_id": request_user_id}
-        )
-        rag_prompt = _build_rag_prompt(rag_hits)
-
-        # -------------------------
-        # 3) Get personalization profile
-        # -------------------------
-        profile = engine.get_profile(request_user_id)
-        profile_prompt = _build_profile_prompt(profile)
-
-        # -------------------------
-        # 4) Build system prompt
-        # -------------------------
-        system_prompt = {
-            "role": "system",
-            "content": (
-                "You are Jarvis, a highly intelligent personal AI assistant. "
-                "You are helpful, concise, polite, and slightly witty. "
-                "You remember user preferences and personalize responses. "
-                "Always aim to assist efficiently."
-            )
-        }
-
-        messages = [system_prompt]
-        if profile_prompt:
-            messages.append(profile_prompt)
-        if rag_prompt:
-            messages.append(rag_prompt)
-        messages += past_messages + new_messages
+        request_user_id = _request_user_id(request, current_user)
+        turn = await _prepare_chat(request, db, request_user_id)
+        if turn.get("reply") is not None:
+            return ChatResponse(response=turn["reply"])
+        http_response.headers["Server-Timing"] = server_timing(turn["timings"])
+        http_response.headers["X-Prompt-Tokens"] = str(turn["prompt"]["prompt_tokens"])
 
         # -------------------------
         # 5) Call LLM
         # -------------------------
-        response = await provider.generate_response(messages)
-
-        # -------------------------
-        # 6) Save conversation
-        # -------------------------
-        user_text = latest_user_message
-        memory.save_message(request_user_id, "user", user_text)
-        memory.save_message(request_user_id, "assistant", response)
-
-        # -------------------------
-        # 7) Update RAG
-        # -------------------------
-        retriever.add_text(
-            user_text,
-            metadata={"user_id": request_user_id, "role": "user", "kind": "chat"}
-        )
-        retriever.add_text(
-            response,
-            metadata={"user_id": request_user_id, "role": "assistant", "kind": "chat"}
+        started = time.perf_counter()
+        try:
+            response = await turn["provider"].generate_response(turn["messages"])
+        except Exception:
+            chat_metrics.record_failure(turn["provider_name"], "complete")
+            raise
+        chat_metrics.record(
+            turn["provider_name"], "complete", None, time.perf_counter() - started,
+            prompt_tokens=turn["prompt"]["prompt_tokens"]
         )
 
         # -------------------------
-        # 8) Update personalization
+        # 6) Queue conversation, RAG and personalization updates
         # -------------------------
-        engine.process_user_text(request_user_id, user_text)
+        _save_exchange(request_user_id, turn["user_text"], response)
 
         return ChatResponse(response=response)
 
@@ -555,8 +571,98 @@ async def chat_endpoint(
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.post("/chat/stream")
+async def chat_stream_endpoint(
+    request: ChatRequest,
+    db: Session = Depends(get_db),
+    current_user: User | None = Depends(get_optional_current_user),
+):
+    """
+    Same as ``/chat`` but streams the reply as Server-Sent Events:
+    ``token`` events, then ``done`` (or ``error``).
+    """
+    try:
+        request_user_id = _request_user_id(request, current_user)
+        turn = await _prepare_chat(request, db, request_user_id)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    async def events():
+        async for event in _stream_chat(turn, request_user_id):
+            yield _sse_event(event)
+
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    if turn.get("timings"):
+        headers["Server-Timing"] = server_timing(turn["timings"])
+        headers["X-Prompt-Tokens"] = str(turn["prompt"]["prompt_tokens"])
+    return StreamingResponse(events(), media_type="text/event-stream", headers=headers)
 
 
+@router.websocket("/chat/ws")
+async def chat_websocket(
+    websocket: WebSocket,
+    token: Optional[str] = None,
+):
+    """
+    Streaming chat over a WebSocket: send a ``ChatRequest`` as JSON, get
+    ``token`` messages and then ``done`` or ``error``; repeat on the same
+    connection. Authenticate with ``?token=<jwt>``; a token that does not
+    belong to a user closes the connection before it is accepted.
+
+    The connection can stay open for hours, so it holds no database
+    session: one is opened for the token check and one per message.
+    """
+    db = SessionLocal()
+    try:
+        current_user = get_user_from_token(token, db)
+    finally:
+        db.close()
+    if token and current_user is None:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    await websocket.accept()
+    try:
+        while True:
+            data = await websocket.receive_json()
+            db = SessionLocal()
+            try:
+                request = ChatRequest(**data)
+                request_user_id = _request_user_id(request, current_user)
+                turn = await _prepare_chat(request, db, request_user_id)
+            except ValidationError as e:
+                await websocket.send_json({"type": "error", "detail": e.errors()})
+                continue
+            except HTTPException as e:
+                await websocket.send_json({"type": "error", "detail": e.detail})
+                continue
+            except Exception as e:
+                await websocket.send_json({"type": "error", "detail": str(e)})
+                continue
+            finally:
+                db.close()
+
+            async for event in _stream_chat(turn, request_user_id):
+                await websocket.send_json(event)
+    except WebSocketDisconnect:
+        return
+
+
+@router.get("/metrics")
+async def chat_metrics_endpoint():
+    """
+    Time-to-first-token, total latency and prompt tokens per provider and
+    mode, the token count cache, the cached provider instances and the
+    chat persistence backlog.
+    """
+    return {
+        "chat": chat_metrics.stats(),
+        "tokens": prompt_packer.stats(),
+        "providers": provider_factory.stats(),
+        "persistence": chat_persistence.stats(),
+    }
+
 
 @router.get("/models")
 async def list_models(provider: Optional[str] = None):
@@ -1,60 +1,400 @@
-from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel, Field
+import json
+import logging
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field, ValidationError
 from typing import Dict, List, Optional
 
+from app.config.paths import RAG_BACKUP_DIR
+from app.core.auth import get_current_user, get_optional_current_user
+from app.database.models import User
+from app.rag.backup import create_backup, list_backups
+from app.rag.documents import REPORTS_DIR, document_ingestor, ingest_roots, resolve_ingest_path
+from app.rag.export import ExportReader, export_stream, import_batch
+from app.rag.rerank import RerankOptions
 from app.rag.retriever import retriever
 from app.rag.vector_store import vector_store
+from app.scheduler.compaction_scheduler import compaction_scheduler
 
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
+
+# Items embedded and committed together by the streaming ingest endpoint.
+STREAM_BATCH_SIZE = 256
+# Results beyond this size are spooled to disk instead of kept in memory.
+STREAM_SPOOL_BYTES = 1024 * 1024
+# Longest NDJSON line the streaming ingest endpoint accepts (bytes).
+STREAM_MAX_LINE_BYTES = 8 * 1024 * 1024
+# Finished uploads whose progress is still kept for polling.
+STREAM_PROGRESS_HISTORY = 100
+
+_progress_lock = threading.Lock()
+_upload_progress: "OrderedDict[str, Dict]" = OrderedDict()
 
 
 class IngestItem(BaseModel):
     text: str = Field(min_length=1)
     metadata: Optional[Dict] = None
+    # Delete the item (all of its chunks) this many seconds after ingest.
+    ttl_seconds: Optional[int] = Field(default=None, gt=0)
 
 
 class IngestRequest(BaseModel):
     user_id: Optional[str] = None
     items: List[IngestItem]
+    # Split long texts into overlapping chunks; ids then cover every chunk.
+    chunk: bool = False
+
+
+class IngestFilesRequest(BaseModel):
+    user_id: Optional[str] = None
+    # Files or directories under RAG_INGEST_ROOTS (default: the reports
+    # folder); relative paths are taken from the first of them.
+    paths: List[str] = Field(default_factory=list)
+    metadata: Optional[Dict] = None
 
 
 class SearchRequest(BaseModel):
     query: str = Field(min_length=1)
     top_k: int = 5
     user_id: Optional[str] = None
+    # Fuse BM25 keyword ranking with the vector ranking.
+    hybrid: bool = False
+    # Return one hit per group of near-duplicate chunks.
+    collapse_duplicates: bool = True
+    # Re-ranking (see app.rag.rerank); each stage is off when unset.
+    mmr_lambda: Optional[float] = Field(default=None, ge=0.0, le=1.0)
+    recency_half_life_days: Optional[float] = Field(default=None, gt=0)
+    role_weights: Optional[Dict[str, float]] = None
+    # Cutoff on the hits' cosine similarity to the query (after the
+    # recency and role weights), also with hybrid=true, whose fused
+    # scores are on a different scale.
+    min_score: Optional[float] = None
+
+
+class DeleteRequest(BaseModel):
+    ids: List[str] = Field(min_length=1)
+    user_id: Optional[str] = None
+
+
+def _item_metadata(item: IngestItem, user_id: Optional[str]) -> Dict:
+    metadata = dict(item.metadata or {})
+    if user_id:
+        metadata["user_id"] = user_id
+    if item.ttl_seconds:
+        metadata["expires_at"] = int(time.time()) + item.ttl_seconds
+    return metadata
 
 
 @router.post("/ingest")
 def ingest_documents(request: IngestRequest):
     try:
-        ids = []
+        texts = []
+        metadatas = []
         for item in request.items:
-            metadata = dict(item.metadata or {})
-            if request.user_id:
-                metadata["user_id"] = request.user_id
-            doc_id = retriever.add_text(item.text, metadata=metadata)
-            ids.append(doc_id)
+            metadata = _item_metadata(item, request.user_id)
+            chunks = document_ingestor.chunk_text(item.text) if request.chunk else [item.text]
+            for index, chunk in enumerate(chunks):
+                texts.append(chunk)
+                metadatas.append(dict(metadata, chunk=index) if request.chunk else metadata)
 
+        ids = retriever.add_texts(texts, metadatas)
         return {"status": "ok", "count": len(ids), "ids": ids}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+def _set_progress(upload_id: str, **values):
+    with _progress_lock:
+        progress = _upload_progress.setdefault(upload_id, {"upload_id": upload_id})
+        progress.update(values)
+        _upload_progress.move_to_end(upload_id)
+        while len(_upload_progress) > STREAM_PROGRESS_HISTORY:
+            _upload_progress.popitem(last=False)
+
+
+async def _ndjson_lines(request: Request):
+    """
+    Yield the request body line by line without buffering all of it;
+    a line longer than ``STREAM_MAX_LINE_BYTES`` is rejected with 413.
+    """
+    too_long = HTTPException(status_code=413, detail=f"NDJSON lines are limited to {STREAM_MAX_LINE_BYTES} bytes")
+    pending = b""
+    async for chunk in request.stream():
+        pending += chunk
+        *lines, pending = pending.split(b"\n")
+        for line in lines:
+            if len(line) > STREAM_MAX_LINE_BYTES:
+                raise too_long
+            yield line
+        if len(pending) > STREAM_MAX_LINE_BYTES:
+            raise too_long
+    yield pending
+
+
+@router.post("/ingest/stream")
+async def ingest_stream(request: Request, user_id: Optional[str] = None, upload_id: Optional[str] = None):
+    """
+    Ingest an NDJSON body of ``{"text": ..., "metadata": {...}}`` lines in
+    batches, so corpora of any size are ingested in bounded memory.
+
+    Progress can be polled at ``/ingest/stream/{upload_id}`` while the
+    upload runs. The response is NDJSON: one ``{"line", "id"}`` or
+    ``{"line", "error"}`` record per input line, then a summary record.
+    """
+    upload_id = upload_id or str(uuid.uuid4())
+    results = tempfile.SpooledTemporaryFile(max_size=STREAM_SPOOL_BYTES, mode="w+", encoding="utf-8")
+    line_number = 0
+    ingested = 0
+    errors = 0
+    batch_lines: List[int] = []
+    batch_items: List[IngestItem] = []
+
+    async def _flush():
+        nonlocal ingested, errors
+        try:
+            ids = await run_in_threadpool(
+                retriever.add_texts,
+                [item.text for item in batch_items],
+                [_item_metadata(item, user_id) for item in batch_items]
+            )
+        except Exception as e:
+            logger.warning(f"RAG stream {upload_id}: batch ending at line {batch_lines[-1]} failed: {e}")
+            for number in batch_lines:
+                results.write(json.dumps({"line": number, "error": str(e)}) + "\n")
+            errors += len(batch_lines)
+        else:
+            for number, doc_id in zip(batch_lines, ids):
+                results.write(json.dumps({"line": number, "id": doc_id}) + "\n")
+            ingested += len(ids)
+        batch_lines.clear()
+        batch_items.clear()
+        _set_progress(upload_id, lines=line_number, ingested=ingested, errors=errors)
+
+    _set_progress(upload_id, status="running", lines=0, ingested=0, errors=0)
+    try:
+        async for raw in _ndjson_lines(request):
+            if not raw.strip():
+                continue
+            line_number += 1
+            try:
+                item = IngestItem.model_validate_json(raw)
+            except ValidationError as e:
+                results.write(json.dumps({"line": line_number, "error": e.errors()[0]["msg"]}) + "\n")
+                errors += 1
+                continue
+
+            batch_lines.append(line_number)
+            batch_items.append(item)
+            if len(batch_items) >= STREAM_BATCH_SIZE:
+                await _flush()
+
+        if batch_items:
+            await _flush()
+    except HTTPException as e:
+        results.close()
+        _set_progress(upload_id, status="failed", error=e.detail)
+        raise
+    except Exception as e:
+        results.close()
+        _set_progress(upload_id, status="failed", error=str(e))
+        raise HTTPException(status_code=500, detail=str(e))
+
+    summary = {"status": "ok", "upload_id": upload_id, "lines": line_number, "count": ingested, "errors": errors}
+    _set_progress(upload_id, status="done", lines=line_number, ingested=ingested, errors=errors)
+    results.write(json.dumps(summary) + "\n")
+    results.seek(0)
+
+    def _replay():
+        try:
+            yield from results
+        finally:
+            results.close()
+
+    return StreamingResponse(_replay(), media_type="application/x-ndjson")
+
+
+@router.get("/ingest/stream/{upload_id}")
+def ingest_stream_progress(upload_id: str):
+    with _progress_lock:
+        progress = _upload_progress.get(upload_id)
+        if progress is None:
+            raise HTTPException(status_code=404, detail="Unknown upload id")
+        return dict(progress)
+
+
+@router.post("/ingest/files")
+def ingest_files(request: IngestFilesRequest):
+    """
+    Chunk and ingest local .txt/.md/.pdf/.docx files. Only paths under
+    the allowed ingest folders are read; anything else is refused with 403,
+    since ingested text becomes searchable.
+    """
+    metadata = dict(request.metadata or {})
+    if request.user_id:
+        metadata["user_id"] = request.user_id
+    roots = ingest_roots()
+    try:
+        paths = [resolve_ingest_path(path, roots) for path in request.paths or [str(REPORTS_DIR)]]
+    except PermissionError as e:
+        raise HTTPException(status_code=403, detail=str(e))
+    missing = [str(path) for path in paths if not path.exists()]
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Not found: {', '.join(missing)}")
+
+    try:
+        files = document_ingestor.ingest_paths(paths, metadata, roots=roots)
+        return {
+            "status": "ok",
+            "files": len(files),
+            "chunks": sum(result["chunks"] for result in files),
+            "results": files,
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @router.post("/search")
 def search_documents(request: SearchRequest):
     try:
         filters = {"user_id": request.user_id} if request.user_id else None
-        results = retriever.search(query=request.query, top_k=request.top_k, filters=filters)
+        results = retriever.search(
+            query=request.query,
+            top_k=request.top_k,
+            filters=filters,
+            hybrid=request.hybrid,
+            collapse_duplicates=request.collapse_duplicates,
+            rerank=RerankOptions(
+                mmr_lambda=request.mmr_lambda,
+                recency_half_life_days=request.recency_half_life_days,
+                role_weights=request.role_weights,
+                min_score=request.min_score
+            )
+        )
         return {"status": "ok", "results": results}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @router.delete("/clear")
-def clear_documents():
+def clear_documents(user_id: Optional[str] = None):
+    """
+    Clear one user's RAG shard, or the whole store when no user_id is given.
+    """
     try:
-        vector_store.clear()
+        vector_store.clear(user_id=user_id)
         return {"status": "ok"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.delete("/documents")
+def delete_documents(request: DeleteRequest):
+    """
+    Delete documents by id; they stop matching searches immediately and
+    their space is reclaimed by the next compaction.
+    """
+    try:
+        deleted = vector_store.delete(request.ids, user_id=request.user_id)
+        return {"status": "ok", "deleted": deleted}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/export")
+def export_documents(user_id: Optional[str] = None, current_user: User | None = Depends(get_optional_current_user)):
+    """
+    Stream one user's documents, or the whole store, in the compact
+    export format (see ``app.rag.export``). Exporting the whole store
+    needs a signed-in user.
+    """
+    if user_id is None and current_user is None:
+        raise HTTPException(status_code=401, detail="unauthorized")
+    return StreamingResponse(
+        export_stream(vector_store, user_id),
+        media_type="application/octet-stream",
+        headers={"Content-Disposition": 'attachment; filename="rag-export.bin"'}
+    )
+
+
+@router.post("/import")
+async def import_documents(request: Request, user_id: Optional[str] = None):
+    """
+    Import a body in the export format batch by batch as it arrives. With
+    ``user_id`` every document is filed under that user.
+    """
+    reader = ExportReader()
+    imported = reembedded = 0
+    try:
+        async for chunk in request.stream():
+            for batch in reader.feed(chunk):
+                ids, reembed = await run_in_threadpool(import_batch, vector_store, batch, user_id)
+                imported += len(ids)
+                reembedded += len(ids) if reembed else 0
+        reader.close()
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"{e} (imported {imported} rows before the error)")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return {"status": "ok", "rows": reader.rows, "imported": imported, "reembedded": reembedded}
+
+
+@router.get("/admin/stats", dependencies=[Depends(get_current_user)])
+def store_stats(user_id: Optional[str] = None):
+    """
+    Per-shard row, tombstone and disk usage, compaction history and
+    query cache hit rates.
+    """
+    try:
+        return {
+            "status": "ok",
+            "shards": vector_store.stats(user_id),
+            "compaction": compaction_scheduler.stats(),
+            "query_cache": retriever.cache_stats(),
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/admin/backup", dependencies=[Depends(get_current_user)])
+async def backup_store(incremental: bool = True):
+    """
+    Take a consistent online backup of every shard into ``RAG_BACKUP_DIR``;
+    incremental backups only copy segments new since the last one.
+    """
+    try:
+        backup = await run_in_threadpool(create_backup, vector_store, str(RAG_BACKUP_DIR), incremental)
+        return {"status": "ok", "backup": backup}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/admin/backups", dependencies=[Depends(get_current_user)])
+def backups():
+    try:
+        return {"status": "ok", "backups": list_backups(str(RAG_BACKUP_DIR))}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/admin/compact", dependencies=[Depends(get_current_user)])
+async def compact_store():
+    """
+    Apply retention and compact every shard now instead of waiting for
+    the next scheduled run.
+    """
+    try:
+        run = await run_in_threadpool(compaction_scheduler.run_once)
+        return {"status": "ok", "run": run}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
@@ -24,4 +24,7 @@ AI_CONFIG_PATH = DATA_DIR / "ai_config.json"
 USER_CONFIG_PATH = DATA_DIR / "user.json"
 CONTACTS_FILE = DATA_DIR / "contacts.json"
 RAG_STORE_FILE = DATA_DIR / "rag_store.json"
-
+RAG_STORE_DIR = DATA_DIR / "rag_store"
+RAG_BACKUP_DIR = DATA_DIR / "rag_backups"
+CHAT_JOURNAL_DIR = DATA_DIR / "chat_journal"
+EMBEDDING_CACHE_FILE = DATA_DIR / "embedding_cache.sqlite3"
@@ -1,5 +1,6 @@
 import os
 import secrets
+from typing import Dict, List, Optional
 from pydantic import field_validator
 from pydantic_settings import BaseSettings
 from app.config.paths import DATA_DIR, DB_DIR, LOG_DIR, KEYS_DIR_PATH
@@ -62,11 +63,97 @@ class Settings(BaseSettings):
     DEFAULT_PROVIDER: str = "ollama"
     OLLAMA_BASE_URL: str = "http://localhost:11434"
 
+    # Pooled HTTP client shared by the chat providers: connection limits
+    # and how long idle keep-alive connections are kept (seconds)
+    HTTP_MAX_CONNECTIONS: int = 100
+    HTTP_MAX_KEEPALIVE: int = 20
+    HTTP_KEEPALIVE_EXPIRY: float = 30.0
+
+    # Chat providers kept built, per (provider, model); the least recently
+    # used one is closed beyond this
+    PROVIDER_CACHE_SIZE: int = 16
+
+    # Latency budgets (ms) of the chat context lookups, run concurrently;
+    # a lookup that misses its budget is skipped and the reply is built
+    # without it
+    CHAT_RAG_TIMEOUT_MS: int = 300
+    CHAT_HISTORY_TIMEOUT_MS: int = 2000
+    CHAT_PROFILE_TIMEOUT_MS: int = 2000
+
+    # Chat prompt token budget (see app.ai.prompt_packer): context window
+    # per "provider:model" or provider ("*" for the rest), tokens kept free
+    # for the reply, a cap on prompt tokens (0 = the whole window), and how
+    # what the system prompt and request leave is shared out
+    CHAT_CONTEXT_LIMITS: Dict[str, int] = {"*": 4096, "ollama": 4096, "openai": 128000, "gemini": 1000000}
+    CHAT_REPLY_TOKENS: int = 1024
+    CHAT_PROMPT_TOKENS: int = 0
+    CHAT_CONTEXT_SHARES: Dict[str, float] = {"profile": 0.15, "rag": 0.35, "history": 0.5}
+
+    # Embeddings for RAG: "local" (hashed tokens, no model) or "ollama";
+    # remote embeddings are cached on disk, keyed by model and text
+    EMBEDDING_PROVIDER: str = "local"
+    EMBEDDING_MODEL: str = "nomic-embed-text"
+    EMBEDDING_BATCH_SIZE: int = 32
+    EMBEDDING_CACHE: bool = True
+
     KEYS_DIR: str = str(KEYS_DIR_PATH)
     ENCRYPTION_KEY_PATH: str = str(KEYS_DIR_PATH / "secret.key")
     JWT_SECRET_KEY: str = os.getenv("JWT_SECRET_KEY", "") or _init_jwt_secret()
     JWT_EXPIRE_MINUTES: int = 10080
 
+    # RAG vector index: "ivf" (approximate) or "flat" (exact scan)
+    RAG_INDEX: str = "ivf"
+    RAG_IVF_NPROBE: int = 16
+    RAG_IVF_MIN_TRAIN_SIZE: int = 4096
+
+    # RAG embedding quantization: "int8" (scan int8 codes, re-rank exactly) or "none"
+    RAG_QUANTIZATION: str = "int8"
+
+    # Per-user RAG shards kept open at once, and their memory budget
+    RAG_SHARD_CACHE_SIZE: int = 64
+    RAG_SHARD_MEMORY_MB: int = 512
+
+    # RAG document chunk size and overlap between chunks, in estimated tokens
+    RAG_CHUNK_TOKENS: int = 200
+    RAG_CHUNK_OVERLAP: int = 40
+
+    # Folders /api/rag/ingest/files may read from; empty allows only the
+    # browser agent's reports folder
+    RAG_INGEST_ROOTS: List[str] = []
+
+    # Duplicate RAG ingests: "refcount", "drop" or "off"; near duplicates
+    # (SimHash within this many bits) are collapsed in search results
+    RAG_DEDUP: str = "refcount"
+    RAG_NEAR_DUP_BITS: int = 10
+
+    # RAG retention per chunk kind ("*" = every other kind), e.g.
+    # {"chat": {"max_age_days": 180, "max_chunks": 20000}}; empty keeps everything
+    RAG_RETENTION: Dict[str, Dict[str, float]] = {}
+    # Seconds between background retention/compaction runs, and the share of
+    # deleted rows in a shard's segments that makes a run rewrite them
+    RAG_COMPACTION_INTERVAL: int = 600
+    RAG_COMPACTION_DEAD_RATIO: float = 0.2
+
+    # Threads scoring async RAG searches, and pending background ingest
+    # batches before chat handlers wait for the writer to catch up
+    RAG_SEARCH_WORKERS: int = 4
+    RAG_INGEST_QUEUE_SIZE: int = 1024
+
+    # Search results cached per user and query until that user's shard
+    # changes (0 disables the cache)
+    RAG_QUERY_CACHE_SIZE: int = 1024
+
+    # Re-ranking of chat RAG context (see app.rag.rerank); unset turns a stage off.
+    # The minimum score is a cosine similarity, also for hybrid searches
+    RAG_RERANK_MMR_LAMBDA: Optional[float] = 0.7
+    RAG_RERANK_HALF_LIFE_DAYS: Optional[float] = 30.0
+    RAG_RERANK_ROLE_WEIGHTS: Dict[str, float] = {"user": 1.0, "assistant": 0.8}
+    RAG_RERANK_MIN_SCORE: Optional[float] = 0.1
+
+    # Share RAG stores between worker processes (uvicorn --workers N):
+    # file-locked writes, and each worker catches up with the others'
+    RAG_MULTIPROCESS: bool = False
+
     @field_validator("DEBUG", mode="before")
     @classmethod
     def _coerce_debug(cls, value):
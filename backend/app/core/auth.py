@@ -66,8 +66,18 @@ def get_optional_current_user(
 ) -> User | None:
     if not credentials or credentials.scheme.lower() != "bearer":
         return None
+    return get_user_from_token(credentials.credentials, db)
+
+
+def get_user_from_token(token: str | None, db: Session) -> User | None:
+    """
+    The user a bearer token belongs to, or None. Used directly where no
+    Authorization header is available (WebSocket query parameters).
+    """
+    if not token:
+        return None
     try:
-        payload = decode_token(credentials.credentials)
+        payload = decode_token(token)
     except ValueError:
         return None
 
@@ -15,8 +15,15 @@ from app.api.routes_settings import router as settings_router
 from app.api.routes_setup import router as setup_router
 
 # CORE
+from app.ai.provider_factory import provider_factory
 from app.database.init_db import init_db
 from app.scheduler.reminder_scheduler import ReminderScheduler
+from app.scheduler.compaction_scheduler import compaction_scheduler
+from app.memory.persistence_queue import chat_persistence
+from app.rag.embeddings import embedder
+from app.rag.ingest_queue import ingest_queue
+from app.rag.retriever import retriever
+from app.rag.vector_store import vector_store
 
 # SERVICES
 from app.agents.gmail_agent import GmailAgent
@@ -61,10 +68,25 @@ async def lifespan(app: FastAPI):
     # Start background scheduler
     scheduler = ReminderScheduler()
     threading.Thread(target=scheduler.start, daemon=True).start()
+    threading.Thread(target=compaction_scheduler.start, daemon=True).start()
+    # Replays chat turns a crashed run journaled but never stored.
+    chat_persistence.start()
 
     yield
 
     print("AI Life Assistant Backend Shutting Down...")
+    compaction_scheduler.stop()
+    # Store journaled chat turns, then write what they queued for RAG.
+    chat_persistence.close(timeout=30)
+    # Write chat turns still queued for RAG before the process exits.
+    ingest_queue.close(timeout=30)
+    retriever.close()
+    # Persist the open shards' indexes and close their logs, so the next
+    # start loads them instead of rebuilding from segments.
+    vector_store.close()
+    embedder.close()
+    # Cached providers and their pooled HTTP connections.
+    await provider_factory.close()
 
 
 # -------------------------
@@ -0,0 +1,131 @@
+"""
+Concurrent assembly of the context a chat reply is built from.
+
+Recent messages, RAG hits and the personalization profile are
+independent lookups: the DB reads run in worker threads (each with its
+own session) and the RAG search on the retriever's pool, all at once.
+Each has a latency budget (``CHAT_*_TIMEOUT_MS``); a lookup that misses
+it or fails is skipped and logged, so a slow RAG search delays a reply
+by at most its budget instead of failing it.
+"""
+
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Dict, List, Tuple
+
+from fastapi.concurrency import run_in_threadpool
+
+from app.config.settings import settings
+from app.database.db import SessionLocal
+from app.memory.memory_service import MemoryService
+from app.memory.persistence_queue import chat_persistence
+from app.memory.personalization import PersonalizationEngine
+from app.rag.rerank import RerankOptions
+from app.rag.retriever import retriever
+
+
+logger = logging.getLogger(__name__)
+
+
+def load_history(user_id: str) -> List[Dict]:
+    # Each lookup runs in its own thread, so each needs its own session.
+    db = SessionLocal()
+    try:
+        # Turns still in the write-behind queue count as history too.
+        return chat_persistence.merged_history(
+            user_id,
+            lambda: MemoryService(db).get_recent_messages(user_id=user_id, limit=10),
+            limit=10
+        )
+    finally:
+        db.close()
+
+
+def load_profile(user_id: str) -> Dict[str, str]:
+    db = SessionLocal()
+    try:
+        return PersonalizationEngine(db).get_profile(user_id)
+    finally:
+        db.close()
+
+
+async def context_stage(
+    name: str,
+    lookup: Awaitable,
+    timeout_ms: int,
+    default: Any,
+    timings: Dict[str, Dict[str, Any]],
+) -> Any:
+    """
+    Await one context lookup within its budget. A lookup that times out or
+    fails is logged and replaced by ``default`` so the reply still goes out.
+    """
+    started = time.perf_counter()
+    status = "ok"
+    try:
+        return await asyncio.wait_for(lookup, timeout_ms / 1000)
+    except asyncio.TimeoutError:
+        status = "timeout"
+        logger.warning("Chat context stage %s missed its %d ms budget; skipped", name, timeout_ms)
+        return default
+    except Exception as e:
+        status = "error"
+        logger.warning("Chat context stage %s failed; skipped: %s", name, e)
+        return default
+    finally:
+        timings[name] = {"ms": round((time.perf_counter() - started) * 1000, 2), "status": status}
+
+
+async def gather_context(user_id: str, user_text: str) -> Tuple[List[Dict], List[Dict], Dict[str, str], Dict]:
+    """
+    Recent messages, RAG hits and the personalization profile, looked up
+    concurrently: the DB reads in worker threads and the RAG search on the
+    retriever's pool. Returns them with per-stage timings.
+    """
+    timings: Dict[str, Dict[str, Any]] = {}
+    started = time.perf_counter()
+    history, rag_hits, profile = await asyncio.gather(
+        context_stage(
+            "history",
+            run_in_threadpool(load_history, user_id),
+            settings.CHAT_HISTORY_TIMEOUT_MS,
+            [],
+            timings,
+        ),
+        context_stage(
+            "rag",
+            retriever.asearch(
+                user_text,
+                top_k=3,
+                filters={"user_id": user_id},
+                rerank=RerankOptions.from_settings()
+            ),
+            settings.CHAT_RAG_TIMEOUT_MS,
+            [],
+            timings,
+        ),
+        context_stage(
+            "profile",
+            run_in_threadpool(load_profile, user_id),
+            settings.CHAT_PROFILE_TIMEOUT_MS,
+            {},
+            timings,
+        ),
+    )
+    timings["context"] = {"ms": round((time.perf_counter() - started) * 1000, 2), "status": "ok"}
+    logger.debug("Chat context for %s: %s", user_id, timings)
+    return history, rag_hits, profile, timings
+
+
+def server_timing(timings: Dict[str, Dict[str, Any]]) -> str:
+    """
+    ``Server-Timing`` header value of the context stages.
+    """
+    parts = []
+    for name, timing in timings.items():
+        part = f"{name};dur={timing['ms']}"
+        if timing["status"] != "ok":
+            part += f';desc="{timing["status"]}"'
+        parts.append(part)
+    return ", ".join(parts)
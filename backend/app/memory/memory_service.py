@@ -1,5 +1,5 @@
 from sqlalchemy.orm import Session
-from typing import List, Dict
+from typing import List, Dict, Sequence
 
 from app.database.models import ConversationMemory
 
@@ -24,6 +24,22 @@ class MemoryService:
         self.db.add(msg)
         self.db.commit()
 
+    def save_messages(self, messages: Sequence[Dict]):
+        """
+        Save several messages (``user_id``, ``role``, ``content`` and an
+        optional ``timestamp``) in one transaction.
+        """
+        self.db.add_all([
+            ConversationMemory(
+                user_id=message["user_id"],
+                role=message["role"],
+                content=message["content"],
+                **({"timestamp": message["timestamp"]} if message.get("timestamp") else {})
+            )
+            for message in messages
+        ])
+        self.db.commit()
+
     # -------------------------
     # Get recent messages
     # -------------------------
@@ -0,0 +1,512 @@
+"""
+Write-behind persistence of chat turns.
+
+The chat endpoints hand a finished turn (user text and reply) to
+``chat_persistence`` and respond without waiting for the writes. One
+writer thread stores the turns behind them:
+
+- the conversation rows of a whole batch of turns in one transaction,
+- both texts of every turn to the RAG ingest queue, which coalesces them
+  further,
+- the personalization update of the user's text.
+
+``record`` appends each turn to an on-disk journal before it returns, and
+the writer reads its work back from that journal. A backlog (a slow or
+locked database) therefore waits on disk rather than in memory, and turns
+not yet stored survive a crash of the process: the next start replays
+journals left behind. A batch the database refuses is retried, with a
+growing delay, and the journal is not checkpointed past it until it is
+stored; if the writer is stopped first, it stays journaled for the next
+start. The checkpoint keeps two offsets: turns whose rows are stored and
+turns whose RAG ingest has also completed, so a crash before the ingest
+queue has written them replays only their RAG texts. Delivery is
+at-least-once; a crash between a commit and the journal checkpoint
+replays that one batch.
+
+Every process writes its own ``<pid>-<id>.jsonl`` journal and holds its
+lock file, so several uvicorn workers never replay each other's live
+journals.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from datetime import datetime, timezone
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+
+from app.config.paths import CHAT_JOURNAL_DIR
+from app.database.db import SessionLocal
+from app.memory.memory_service import MemoryService
+from app.memory.personalization import PersonalizationEngine
+from app.rag.ingest_queue import ingest_queue
+from app.rag.locking import StoreFileLock
+
+
+logger = logging.getLogger(__name__)
+
+JOURNAL_SUFFIX = ".jsonl"
+OFFSET_SUFFIX = ".offset"
+LOCK_SUFFIX = ".lock"
+
+# Delay before retrying a batch that failed to commit, growing with each
+# attempt up to the cap.
+RETRY_SECONDS = 1.0
+MAX_RETRY_SECONDS = 30.0
+
+
+def _read_turns(handle, limit: int, max_bytes: Optional[int] = None) -> Tuple[List[Dict], int]:
+    """
+    Up to ``limit`` complete journal lines (and ``max_bytes``) from the
+    handle's position, and the bytes consumed. A torn last line (crash
+    mid-write) is left.
+    """
+    turns: List[Dict] = []
+    consumed = 0
+    while len(turns) < limit and (max_bytes is None or consumed < max_bytes):
+        line = handle.readline()
+        if not line or not line.endswith(b"\n"):
+            break
+        consumed += len(line)
+        try:
+            turns.append(json.loads(line))
+        except ValueError:
+            logger.warning("Skipping an unreadable chat journal line")
+    return turns, consumed
+
+
+class ChatPersistenceQueue:
+    """
+    Journaled queue of chat turns stored by one writer thread. Failures
+    are retried until the turns are stored, logged and counted in
+    ``stats()``; they never reach the request that recorded the turn.
+    """
+
+    def __init__(
+        self,
+        directory: Optional[str] = None,
+        batch_size: int = 64,
+        session_factory: Optional[Callable] = None,
+        rag_queue=None
+    ):
+        self.directory = str(directory or CHAT_JOURNAL_DIR)
+        self.batch_size = max(1, batch_size)
+        self.session_factory = session_factory or SessionLocal
+        self.rag_queue = rag_queue or ingest_queue
+
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        # Held while a batch commits and leaves ``_pending``, so history
+        # reads see each turn exactly once.
+        self._commit_lock = threading.Lock()
+        # Serializes journal appends with the writer truncating it; the
+        # file I/O itself stays out of ``_lock``.
+        self._append_lock = threading.Lock()
+
+        self.journal_path: Optional[str] = None
+        self._journal = None
+        self._journal_lock: Optional[StoreFileLock] = None
+        # Journal offsets: appended, rows stored, and RAG ingest completed;
+        # the batches still being ingested end at the offsets in
+        # ``_ingesting``.
+        self._appended = 0
+        self._stored = 0
+        self._ingested = 0
+        self._ingesting: Deque[Tuple[int, threading.Event]] = deque()
+        self._pending: Dict[str, Deque[Dict]] = {}
+
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = False
+        self._stats = {"recorded": 0, "stored": 0, "batches": 0, "recovered": 0, "retries": 0}
+
+    # -------------------------
+    # Journal
+    # -------------------------
+
+    def _open_journal_locked(self):
+        if self._journal is not None:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"{os.getpid()}-{uuid.uuid4().hex[:8]}{JOURNAL_SUFFIX}")
+        lock = StoreFileLock(path + LOCK_SUFFIX)
+        lock.acquire()
+        self._journal_lock = lock
+        self._journal = open(path, "ab")
+        self.journal_path = path
+        self._appended = self._stored = self._ingested = 0
+
+    def _checkpoint(self, path: str, offset: int, ingested: int):
+        # Replaced atomically but not fsynced: the journal itself only
+        # survives a process crash too.
+        temp = path + OFFSET_SUFFIX + ".tmp"
+        with open(temp, "w", encoding="utf-8") as f:
+            json.dump({"offset": offset, "ingested": ingested}, f)
+        os.replace(temp, path + OFFSET_SUFFIX)
+
+    def _read_checkpoint(self, path: str) -> Tuple[int, int]:
+        try:
+            with open(path + OFFSET_SUFFIX, "r", encoding="utf-8") as f:
+                checkpoint = json.load(f)
+            offset = int(checkpoint["offset"])
+            return offset, min(offset, int(checkpoint.get("ingested", offset)))
+        except (OSError, ValueError, KeyError, TypeError):
+            return 0, 0
+
+    def _remove_journal(self, path: str):
+        for name in (path, path + OFFSET_SUFFIX, path + OFFSET_SUFFIX + ".tmp", path + LOCK_SUFFIX):
+            try:
+                os.remove(name)
+            except OSError:
+                pass
+
+    # -------------------------
+    # Producers
+    # -------------------------
+
+    def start(self):
+        """
+        Start the writer, which first replays journals left by processes
+        that stopped before storing them.
+        """
+        with self._lock:
+            self._open_journal_locked()
+            if self._thread is None or not self._thread.is_alive():
+                self._stopping = False
+                self._thread = threading.Thread(target=self._run, name="chat-persistence", daemon=True)
+                self._thread.start()
+
+    def record(self, user_id: str, user_text: str, reply: str, personalize: bool = True):
+        """
+        Journal one exchange for storage and return; the turn is durable
+        (against a process crash) once this returns.
+        """
+        turn = {
+            "user_id": user_id,
+            "user_text": user_text,
+            "reply": reply,
+            "personalize": personalize,
+            "at": time.time(),
+        }
+        line = (json.dumps(turn, ensure_ascii=False) + "\n").encode("utf-8")
+        self.start()
+        with self._append_lock:
+            self._journal.write(line)
+            self._journal.flush()
+            with self._lock:
+                self._appended += len(line)
+                self._pending.setdefault(user_id, deque()).append(turn)
+                self._stats["recorded"] += 1
+                self._changed.notify_all()
+
+    def merged_history(self, user_id: str, stored: Callable[[], List[Dict]], limit: int = 10) -> List[Dict]:
+        """
+        ``stored()`` messages followed by the user's turns this process has
+        recorded but not stored yet, the last ``limit`` of them.
+        """
+        with self._commit_lock:
+            messages = list(stored())
+            with self._lock:
+                pending = list(self._pending.get(user_id, ()))
+        for turn in pending:
+            messages.append({"role": "user", "content": turn["user_text"]})
+            messages.append({"role": "assistant", "content": turn["reply"]})
+        return messages[-limit:]
+
+    # -------------------------
+    # Writer
+    # -------------------------
+
+    def _release_pending(self, turns: List[Dict]):
+        with self._lock:
+            for turn in turns:
+                pending = self._pending.get(turn["user_id"])
+                if pending:
+                    pending.popleft()
+                    if not pending:
+                        del self._pending[turn["user_id"]]
+
+    def _commit_rows(self, db, turns: List[Dict], own: bool):
+        rows = []
+        for turn in turns:
+            # Naive UTC, like the models' datetime.utcnow defaults.
+            at = datetime.fromtimestamp(turn["at"], timezone.utc).replace(tzinfo=None) if turn.get("at") else None
+            rows.append({"user_id": turn["user_id"], "role": "user", "content": turn["user_text"], "timestamp": at})
+            rows.append({"user_id": turn["user_id"], "role": "assistant", "content": turn["reply"], "timestamp": at})
+        with self._commit_lock:
+            MemoryService(db).save_messages(rows)
+            if own:
+                self._release_pending(turns)
+
+    def _wait_to_retry(self, delay: float) -> bool:
+        """
+        Sleep ``delay`` seconds unless the writer is stopped meanwhile.
+        """
+        deadline = time.monotonic() + delay
+        with self._lock:
+            while not self._stopping:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return True
+                self._changed.wait(remaining)
+        return False
+
+    def _store(self, turns: List[Dict], own: bool = True) -> bool:
+        """
+        Store a batch: conversation rows in one transaction, then the
+        personalization updates. ``own`` turns come from this process's
+        journal and leave ``_pending`` once committed.
+
+        The transaction is retried until it commits. Returns False, with
+        nothing stored, if the writer is stopped while it keeps failing.
+        """
+        attempt = 0
+        while True:
+            attempt += 1
+            db = None
+            try:
+                db = self.session_factory()
+                self._commit_rows(db, turns, own)
+                break
+            except Exception as e:
+                self._count(retries=1)
+                logger.warning(f"Storing {len(turns)} chat turns failed (attempt {attempt}): {e}")
+            finally:
+                if db is not None:
+                    db.close()
+            if not self._wait_to_retry(min(RETRY_SECONDS * attempt, MAX_RETRY_SECONDS)):
+                logger.error(f"Stopped before storing {len(turns)} chat turns; they stay in the journal")
+                return False
+        self._count(stored=len(turns), batches=1)
+
+        # Best effort from here on: the turns themselves are stored.
+        db = self.session_factory()
+        try:
+            engine = PersonalizationEngine(db)
+            for turn in turns:
+                if turn.get("personalize"):
+                    engine.process_user_text(turn["user_id"], turn["user_text"])
+        except Exception as e:
+            logger.warning(f"Personalization update of {len(turns)} chat turns failed: {e}")
+        finally:
+            db.close()
+        return True
+
+    def _ingest(self, turns: List[Dict]) -> threading.Event:
+        """
+        Hand both texts of every turn to the RAG ingest queue. The event is
+        set once the queue has written them (or given up on them).
+        """
+        written = threading.Event()
+
+        def done(ok: bool):
+            written.set()
+            with self._lock:
+                self._changed.notify_all()
+
+        texts, metadatas = [], []
+        for turn in turns:
+            texts += [turn["user_text"], turn["reply"]]
+            metadatas += [
+                {"user_id": turn["user_id"], "role": "user", "kind": "chat"},
+                {"user_id": turn["user_id"], "role": "assistant", "kind": "chat"},
+            ]
+        try:
+            self.rag_queue.submit(texts, metadatas, done=done)
+        except Exception as e:
+            logger.warning(f"RAG ingest of {len(turns)} chat turns failed: {e}")
+            written.set()
+        return written
+
+    def _wait_ingested(self, written: threading.Event) -> bool:
+        """
+        Wait for a RAG ingest unless the writer is stopped meanwhile.
+        """
+        with self._lock:
+            while not written.is_set():
+                if self._stopping:
+                    return False
+                self._changed.wait()
+        return True
+
+    def _count(self, **increments):
+        with self._lock:
+            for key, value in increments.items():
+                self._stats[key] += value
+
+    def _replay(self, path: str) -> bool:
+        """
+        Replay one journal from its checkpoint: RAG texts only for turns
+        whose rows were stored, everything for the rest. Returns False if
+        the writer was stopped first.
+        """
+        offset, ingested = self._read_checkpoint(path)
+        with open(path, "rb") as reader:
+            reader.seek(ingested)
+            while True:
+                rag_only = ingested < offset
+                turns, consumed = _read_turns(reader, self.batch_size, offset - ingested if rag_only else None)
+                if not consumed:
+                    return True
+                if not rag_only:
+                    if turns and not self._store(turns, own=False):
+                        return False
+                    offset = ingested + consumed
+                    self._checkpoint(path, offset, ingested)
+                if turns and not self._wait_ingested(self._ingest(turns)):
+                    return False
+                ingested += consumed
+                self._checkpoint(path, offset, ingested)
+                self._count(recovered=len(turns))
+
+    def _recover(self) -> bool:
+        """
+        Replay the journals of processes that stopped, from their last
+        checkpoint. A journal whose lock is held belongs to a live process.
+        Returns False if the writer was stopped before they were stored.
+        """
+        try:
+            names = sorted(os.listdir(self.directory))
+        except FileNotFoundError:
+            return True
+        for name in names:
+            path = os.path.join(self.directory, name)
+            if not name.endswith(JOURNAL_SUFFIX) or path == self.journal_path:
+                continue
+            lock = StoreFileLock(path + LOCK_SUFFIX)
+            if not lock.acquire(blocking=False):
+                continue
+            try:
+                if not self._replay(path):
+                    return False
+                logger.info(f"Replayed chat journal {name}")
+            finally:
+                lock.release()
+            self._remove_journal(path)
+        return True
+
+    def _advance_ingested_locked(self):
+        while self._ingesting and self._ingesting[0][1].is_set():
+            self._ingested = self._ingesting.popleft()[0]
+
+    def _sync_journal(self, path: str):
+        """
+        Checkpoint the journal, or start it over once every turn in it is
+        stored and ingested. The files are written outside ``_lock``; the
+        checkpoint is only ever behind the true offsets, so a crash in
+        between replays turns rather than losing them.
+        """
+        with self._lock:
+            offset, ingested = self._stored, self._ingested
+            caught_up = 0 < self._appended == ingested
+        if not caught_up:
+            self._checkpoint(path, offset, ingested)
+            return
+
+        self._checkpoint(path, 0, 0)
+        with self._append_lock:
+            with self._lock:
+                if self._ingested == self._appended:
+                    self._journal.truncate(0)
+                    self._appended = self._stored = self._ingested = 0
+                    self._changed.notify_all()
+                    return
+        # Turns were recorded meanwhile: keep the journal.
+        self._checkpoint(path, offset, ingested)
+
+    def _run(self):
+        if not self._recover():
+            return
+        with self._lock:
+            path = self.journal_path
+        with open(path, "rb") as reader:
+            while True:
+                with self._lock:
+                    while True:
+                        before = self._ingested
+                        self._advance_ingested_locked()
+                        if self._stored < self._appended or self._ingested != before:
+                            break
+                        if self._stopping and not self._ingesting:
+                            break
+                        self._changed.wait()
+                    start = self._stored
+                    work = start < self._appended
+                    finished = self._stopping and not work and not self._ingesting
+
+                if work:
+                    reader.seek(start)
+                    turns, consumed = _read_turns(reader, self.batch_size)
+                    if not consumed:
+                        # Only a partial line so far; wait for the rest.
+                        time.sleep(0.01)
+                        continue
+                    if turns and not self._store(turns):
+                        # Stopped: the batch stays journaled for the next start.
+                        break
+                    written = self._ingest(turns) if turns else None
+                    with self._lock:
+                        self._stored += consumed
+                        if written is not None:
+                            self._ingesting.append((self._stored, written))
+                        elif not self._ingesting:
+                            self._ingested = self._stored
+                        self._changed.notify_all()
+
+                self._sync_journal(path)
+                if finished:
+                    break
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """
+        Wait until every turn recorded so far is stored and ingested.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._lock:
+            while self._ingested < self._appended:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._changed.wait(remaining)
+        return True
+
+    def close(self, timeout: Optional[float] = None) -> bool:
+        """
+        Store what is journaled and stop the writer. A journal left
+        unfinished at the timeout, or behind a batch the database still
+        refuses, is replayed on the next start.
+        """
+        with self._lock:
+            thread = self._thread
+            self._thread = None
+            self._stopping = True
+            self._changed.notify_all()
+        if thread is not None:
+            thread.join(timeout)
+            if thread.is_alive():
+                return False
+
+        with self._lock:
+            journal, lock, path = self._journal, self._journal_lock, self.journal_path
+            drained = self._ingested >= self._appended
+            self._journal = self._journal_lock = self.journal_path = None
+        if journal is not None:
+            journal.close()
+            lock.release()
+            if drained:
+                self._remove_journal(path)
+        return drained
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return dict(
+                self._stats,
+                backlog_bytes=self._appended - self._stored,
+                ingest_backlog_bytes=self._stored - self._ingested,
+                pending_turns=sum(len(turns) for turns in self._pending.values()),
+            )
+
+
+chat_persistence = ChatPersistenceQueue()
@@ -0,0 +1,293 @@
+"""
+Approximate nearest-neighbour indexes for the local RAG store.
+
+Indexes address rows by ordinal, i.e. their position in the store's
+``blocks()`` order. They only generate candidates; the retriever still
+scores every candidate exactly, so metadata filters and re-ranking work
+the same way for every index.
+"""
+
+import os
+from abc import ABC, abstractmethod
+from typing import Dict, Optional, Type
+
+import numpy as np
+
+from app.rag.arrays import grow
+
+
+class VectorIndex(ABC):
+    """
+    Abstract base class for candidate-generating vector indexes.
+    """
+
+    kind = "base"
+
+    def __init__(self, dimension: int):
+        self.dimension = dimension
+        self._count = 0
+        self._dead = np.zeros(0, dtype=bool)
+
+    def __len__(self) -> int:
+        return self._count
+
+    def add(self, vectors: np.ndarray):
+        """
+        Append rows; they receive ordinals ``len(self)`` onwards.
+        """
+        new_count = self._count + vectors.shape[0]
+        self._dead = grow(self._dead, new_count, False)
+        self._count = new_count
+
+    def remove(self, ordinals):
+        """
+        Tombstone rows so they are never returned as candidates.
+        """
+        ordinals = np.asarray(ordinals, dtype=np.int64)
+        self._dead[ordinals[ordinals < self._count]] = True
+
+    def alive_mask(self, count: int) -> np.ndarray:
+        return ~self._dead[:count]
+
+    @abstractmethod
+    def candidates(self, query: np.ndarray, count: int, **knobs) -> Optional[np.ndarray]:
+        """
+        Return candidate ordinals below ``count``, or None to scan every row.
+        """
+        pass
+
+    def needs_training(self) -> bool:
+        return False
+
+    def train(self, sample: np.ndarray, rows: Optional[int] = None):
+        pass
+
+    def spawn(self, keep_training: bool = False) -> "VectorIndex":
+        """
+        Return an empty index with the same configuration, and with the
+        same training if ``keep_training`` is set.
+        """
+        return type(self)(self.dimension)
+
+    def _state(self) -> Dict[str, np.ndarray]:
+        return {}
+
+    def _restore(self, state):
+        pass
+
+    def save(self, path: str):
+        temp_path = path + ".tmp"
+        with open(temp_path, "wb") as f:
+            np.savez(
+                f,
+                kind=np.array(self.kind),
+                dimension=np.array(self.dimension),
+                count=np.array(self._count),
+                dead=self._dead[:self._count],
+                **self._state()
+            )
+        os.replace(temp_path, path)
+
+    def load(self, path: str) -> bool:
+        """
+        Restore state saved by ``save``. Returns False if the file does
+        not belong to this kind of index.
+        """
+        with np.load(path, allow_pickle=False) as state:
+            if str(state["kind"]) != self.kind or int(state["dimension"]) != self.dimension:
+                return False
+            self._count = int(state["count"])
+            self._dead = state["dead"].astype(bool)
+            self._restore(state)
+        return True
+
+
+class FlatIndex(VectorIndex):
+    """
+    Exact search: every live row is a candidate.
+    """
+
+    kind = "flat"
+
+    def candidates(self, query: np.ndarray, count: int, **knobs) -> Optional[np.ndarray]:
+        if not self._dead[:count].any():
+            return None
+        return np.flatnonzero(self.alive_mask(count))
+
+
+class IVFIndex(VectorIndex):
+    """
+    Inverted-file index over spherical k-means centroids.
+
+    Each row is assigned to its nearest centroid; a query scans only the
+    ``nprobe`` lists whose centroids are closest to it. More lists or a
+    smaller ``nprobe`` is faster, a larger ``nprobe`` recalls more.
+    The index stays untrained (and defers to exact search) until it has
+    ``min_train_size`` rows, and asks to be retrained once it has grown
+    ``retrain_factor`` times past its training size.
+    """
+
+    kind = "ivf"
+
+    def __init__(
+        self,
+        dimension: int,
+        n_lists: Optional[int] = None,
+        nprobe: int = 16,
+        min_train_size: int = 4096,
+        retrain_factor: float = 4.0,
+        kmeans_iterations: int = 10,
+        seed: int = 0,
+    ):
+        super().__init__(dimension)
+        self.n_lists = n_lists
+        self.nprobe = nprobe
+        self.min_train_size = min_train_size
+        self.retrain_factor = retrain_factor
+        self.kmeans_iterations = kmeans_iterations
+        self.seed = seed
+
+        self.centroids: Optional[np.ndarray] = None
+        self.trained_size = 0
+        self._assign = np.zeros(0, dtype=np.int32)
+        # (order, offsets, sorted_count): rows below sorted_count are grouped
+        # by list, rows added since are scanned linearly until the next
+        # regroup. Replaced as one tuple so readers never see a mix.
+        self._groups = (np.zeros(0, dtype=np.int64), np.zeros(1, dtype=np.int64), 0)
+
+    def spawn(self, keep_training: bool = False) -> "IVFIndex":
+        index = IVFIndex(
+            self.dimension,
+            n_lists=self.n_lists,
+            nprobe=self.nprobe,
+            min_train_size=self.min_train_size,
+            retrain_factor=self.retrain_factor,
+            kmeans_iterations=self.kmeans_iterations,
+            seed=self.seed,
+        )
+        if keep_training and self.trained:
+            index.centroids = self.centroids
+            index.trained_size = self.trained_size
+            index._regroup()
+        return index
+
+    @property
+    def trained(self) -> bool:
+        return self.centroids is not None
+
+    def needs_training(self) -> bool:
+        if not self.trained:
+            return self._count >= self.min_train_size
+        return self._count >= self.trained_size * self.retrain_factor
+
+    def _list_count(self, rows: int) -> int:
+        if self.n_lists:
+            return min(self.n_lists, rows)
+        return int(np.clip(np.sqrt(rows), 8, 4096))
+
+    def _nearest(self, vectors: np.ndarray, chunk: int = 65536) -> np.ndarray:
+        assign = np.empty(vectors.shape[0], dtype=np.int32)
+        for start in range(0, vectors.shape[0], chunk):
+            scores = np.asarray(vectors[start:start + chunk], dtype=np.float32) @ self.centroids.T
+            assign[start:start + chunk] = np.argmax(scores, axis=1)
+        return assign
+
+    def train(self, sample: np.ndarray, rows: Optional[int] = None):
+        """
+        Fit centroids on ``sample`` drawn from ``rows`` total rows.
+        Call ``add`` afterwards to assign rows to lists.
+        """
+        rng = np.random.default_rng(self.seed)
+        sample = np.asarray(sample, dtype=np.float32)
+        rows = rows or sample.shape[0]
+        n_lists = min(self._list_count(rows), sample.shape[0])
+        centroids = sample[rng.choice(sample.shape[0], size=n_lists, replace=False)].copy()
+
+        for _ in range(self.kmeans_iterations):
+            self.centroids = centroids
+            assign = self._nearest(sample)
+            sizes = np.bincount(assign, minlength=n_lists)
+            starts = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+            empty = sizes == 0
+            sums = np.zeros_like(centroids)
+            sums[~empty] = np.add.reduceat(sample[np.argsort(assign, kind="stable")], starts[~empty], axis=0)
+            if empty.any():
+                sums[empty] = sample[rng.choice(sample.shape[0], size=int(empty.sum()))]
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            centroids = np.divide(sums, norms, out=np.zeros_like(sums), where=norms > 0)
+
+        self.centroids = centroids.astype(np.float32)
+        self.trained_size = rows
+        # Lists of the old centroids (or none) no longer apply.
+        self._regroup()
+
+    def add(self, vectors: np.ndarray):
+        start = self._count
+        super().add(vectors)
+        self._assign = grow(self._assign, self._count, -1)
+        if self.trained and vectors.shape[0]:
+            self._assign[start:self._count] = self._nearest(vectors)
+            sorted_count = self._groups[2]
+            if self._count - sorted_count > max(1024, sorted_count // 8):
+                self._regroup()
+
+    def _regroup(self):
+        assign = self._assign[:self._count]
+        order = np.argsort(assign, kind="stable").astype(np.int64)
+        offsets = np.searchsorted(
+            assign[order],
+            np.arange(len(self.centroids) + 1),
+            side="left"
+        ).astype(np.int64)
+        self._groups = (order, offsets, self._count)
+
+    def candidates(self, query: np.ndarray, count: int, nprobe: Optional[int] = None, **knobs) -> Optional[np.ndarray]:
+        if not self.trained:
+            return None
+
+        nprobe = max(1, min(nprobe or self.nprobe, len(self.centroids)))
+        centroid_scores = self.centroids @ query
+        probe = np.argpartition(-centroid_scores, nprobe - 1)[:nprobe]
+
+        order, offsets, sorted_count = self._groups
+        sorted_count = min(sorted_count, count)
+        parts = [order[offsets[lst]:offsets[lst + 1]] for lst in probe]
+        grouped = np.concatenate(parts) if parts else np.zeros(0, dtype=np.int64)
+        grouped = grouped[grouped < sorted_count]
+
+        recent = np.arange(sorted_count, count, dtype=np.int64)
+        recent = recent[np.isin(self._assign[sorted_count:count], probe)]
+
+        ordinals = np.concatenate([grouped, recent])
+        return ordinals[~self._dead[ordinals]]
+
+    def _state(self) -> Dict[str, np.ndarray]:
+        return {
+            "centroids": self.centroids if self.trained else np.zeros((0, self.dimension), dtype=np.float32),
+            "assign": self._assign[:self._count],
+            "trained_size": np.array(self.trained_size),
+        }
+
+    def _restore(self, state):
+        centroids = state["centroids"]
+        self.centroids = centroids.astype(np.float32) if centroids.shape[0] else None
+        self._assign = state["assign"].astype(np.int32)
+        self.trained_size = int(state["trained_size"])
+        if self.trained:
+            self._regroup()
+
+
+INDEX_TYPES: Dict[str, Type[VectorIndex]] = {
+    FlatIndex.kind: FlatIndex,
+    IVFIndex.kind: IVFIndex,
+}
+
+
+def create_index(kind: str, dimension: int, **options) -> VectorIndex:
+    index_type = INDEX_TYPES.get((kind or "").lower())
+    if index_type is None:
+        raise ValueError(f"Unsupported vector index: {kind}")
+    if index_type is FlatIndex:
+        return FlatIndex(dimension)
+    return index_type(dimension, **options)
+
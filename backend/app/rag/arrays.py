@@ -0,0 +1,18 @@
+"""
+Array helpers shared by the RAG store's row-addressed indexes.
+"""
+
+import numpy as np
+
+
+def grow(array: np.ndarray, size: int, fill=0) -> np.ndarray:
+    """
+    ``array`` with room for at least ``size`` entries, new ones set to
+    ``fill``. Capacity at least doubles, and readers may hold the old
+    array, so it grows into a new one instead of resizing in place.
+    """
+    if size <= array.shape[0]:
+        return array
+    grown = np.full(max(size, array.shape[0] * 2, 1024), fill, dtype=array.dtype)
+    grown[:array.shape[0]] = array
+    return grown
@@ -0,0 +1,231 @@
+"""
+Online and incremental backups of the RAG store, and restores.
+
+A backup is a directory ``<destination>/<backup id>/`` holding, per
+shard, the manifest, the logs and the sealed segments, written from a
+consistent ``checkpoint`` of the running store. Sealed segments never
+change, so an incremental backup only copies the segments its parent
+does not already hold and records, for every segment, which backup in
+the chain has its files. ``backup.json`` is written last and marks the
+backup complete. Indexes are not backed up; they are rebuilt on load.
+
+Usage:
+    python -m app.rag.backup create [--destination DIR] [--incremental]
+    python -m app.rag.backup list [--destination DIR]
+    python -m app.rag.backup restore BACKUP_DIR [--target DIR] [--force]
+
+``create`` from the command line opens the store in its own process, so
+it needs the server stopped or ``RAG_MULTIPROCESS=true``; a running
+server takes backups through ``POST /api/rag/admin/backup``. Restores
+need the server stopped.
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import time
+import uuid
+from typing import Dict, List, Optional
+
+from app.config.paths import RAG_BACKUP_DIR, RAG_STORE_DIR
+from app.rag.segments import SEGMENT_PREFIX, SHARDS_DIR, Segment, write_json_atomic
+from app.rag.vector_store import ShardedVectorStore
+
+
+BACKUP_MANIFEST = "backup.json"
+BACKUP_FORMAT = 1
+
+
+def _read_backup(path: str) -> Optional[Dict]:
+    try:
+        with open(os.path.join(path, BACKUP_MANIFEST), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def list_backups(destination: str) -> List[Dict]:
+    """
+    Complete backups in ``destination``, oldest first.
+    """
+    if not os.path.isdir(destination):
+        return []
+    backups = []
+    for name in sorted(os.listdir(destination)):
+        backup = _read_backup(os.path.join(destination, name))
+        if backup is not None:
+            backups.append(backup)
+    return sorted(backups, key=lambda backup: backup["created_at"])
+
+
+def _segment_files(directory: str, name: str) -> List[str]:
+    return Segment(directory, name, 0).files()
+
+
+def create_backup(
+    store: ShardedVectorStore,
+    destination: str,
+    incremental: bool = False
+) -> Dict:
+    """
+    Back up every shard of ``store`` into a new directory under
+    ``destination``. With ``incremental`` the latest backup there is the
+    parent, and segments it already holds are not copied again.
+    """
+    started = time.perf_counter()
+    parent = None
+    if incremental:
+        backups = list_backups(destination)
+        parent = backups[-1] if backups else None
+
+    backup_id = time.strftime("%Y%m%dT%H%M%SZ", time.gmtime()) + "-" + uuid.uuid4().hex[:8]
+    target = os.path.join(destination, backup_id)
+    staging = os.path.join(store.checkpoints_path, backup_id)
+    shards: Dict[str, Dict] = {}
+    copied = reused = copied_bytes = 0
+    try:
+        manifests = store.checkpoint(staging)
+        for key, manifest in manifests.items():
+            source = os.path.join(staging, SHARDS_DIR, key)
+            shard_target = os.path.join(target, SHARDS_DIR, key)
+            os.makedirs(shard_target, exist_ok=True)
+
+            known = parent["shards"].get(key, {}).get("segments", {}) if parent else {}
+            holders = {}
+            for entry in manifest["segments"]:
+                holder = known.get(entry["name"])
+                if holder is not None and os.path.isdir(os.path.join(destination, holder)):
+                    holders[entry["name"]] = holder
+                    reused += 1
+                    continue
+                for path in _segment_files(source, entry["name"]):
+                    shutil.copy2(path, os.path.join(shard_target, os.path.basename(path)))
+                    copied_bytes += os.path.getsize(path)
+                holders[entry["name"]] = backup_id
+                copied += 1
+
+            for name in os.listdir(source):
+                if not name.startswith(SEGMENT_PREFIX):
+                    path = os.path.join(source, name)
+                    shutil.copy2(path, os.path.join(shard_target, name))
+                    copied_bytes += os.path.getsize(path)
+            shards[key] = {"segments": holders, "embedding_version": manifest["embedding_version"]}
+    except BaseException:
+        shutil.rmtree(target, ignore_errors=True)
+        raise
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+
+    backup = {
+        "format": BACKUP_FORMAT,
+        "id": backup_id,
+        "parent": parent["id"] if parent else None,
+        "created_at": time.time(),
+        "shards": shards,
+        "segments_copied": copied,
+        "segments_reused": reused,
+        "bytes_copied": copied_bytes,
+        "duration_ms": round((time.perf_counter() - started) * 1000, 3),
+    }
+    os.makedirs(target, exist_ok=True)
+    write_json_atomic(os.path.join(target, BACKUP_MANIFEST), backup)
+    return backup
+
+
+def restore_backup(backup_path: str, target: str, force: bool = False) -> Dict:
+    """
+    Rebuild a store root at ``target`` from a backup directory, pulling
+    segments from the backups of its chain next to it. An existing
+    ``target`` is only replaced with ``force``, and is then kept as
+    ``<target>.before-restore-<time>``.
+    """
+    backup_path = os.path.abspath(backup_path)
+    backup = _read_backup(backup_path)
+    if backup is None:
+        raise ValueError(f"{backup_path} is not a complete backup")
+    if backup.get("format") != BACKUP_FORMAT:
+        raise ValueError(f"Unsupported backup format: {backup.get('format')}")
+    if os.path.exists(target) and os.listdir(target) and not force:
+        raise ValueError(f"{target} is not empty; pass force to replace it")
+
+    destination = os.path.dirname(backup_path)
+    staging = f"{target.rstrip(os.sep)}.restoring-{uuid.uuid4().hex[:8]}"
+    rows = 0
+    try:
+        for key, shard in backup["shards"].items():
+            shard_source = os.path.join(backup_path, SHARDS_DIR, key)
+            shard_target = os.path.join(staging, SHARDS_DIR, key)
+            os.makedirs(shard_target)
+            for name in os.listdir(shard_source):
+                if not name.startswith(SEGMENT_PREFIX):
+                    shutil.copy2(os.path.join(shard_source, name), os.path.join(shard_target, name))
+            for name, holder in shard["segments"].items():
+                files = _segment_files(os.path.join(destination, holder, SHARDS_DIR, key), name)
+                if not files:
+                    raise ValueError(f"Segment {name} of shard {key} is missing from backup {holder}")
+                for path in files:
+                    shutil.copy2(path, os.path.join(shard_target, os.path.basename(path)))
+
+        # Open the result once: proves it loads and rebuilds the indexes.
+        restored = ShardedVectorStore(root=staging, multiprocess=False)
+        rows = restored.count()
+        restored.close()
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+
+    if os.path.exists(target):
+        if os.listdir(target):
+            os.replace(target, f"{target.rstrip(os.sep)}.before-restore-{int(time.time())}")
+        else:
+            os.rmdir(target)
+    os.replace(staging, target)
+    return {"backup": backup["id"], "target": target, "shards": len(backup["shards"]), "rows": rows}
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Back up and restore the RAG store")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    create = commands.add_parser("create", help="Back up the store")
+    create.add_argument("--root", default=str(RAG_STORE_DIR), help="RAG store root directory")
+    create.add_argument("--destination", default=str(RAG_BACKUP_DIR))
+    create.add_argument("--incremental", action="store_true", help="Only copy segments new since the last backup")
+
+    listing = commands.add_parser("list", help="List complete backups")
+    listing.add_argument("--destination", default=str(RAG_BACKUP_DIR))
+
+    restore = commands.add_parser("restore", help="Restore a backup (server stopped)")
+    restore.add_argument("backup", help="Backup directory")
+    restore.add_argument("--target", default=str(RAG_STORE_DIR), help="RAG store root directory")
+    restore.add_argument("--force", action="store_true", help="Replace a non-empty target")
+    args = parser.parse_args()
+
+    try:
+        if args.command == "create":
+            store = ShardedVectorStore(root=args.root)
+            try:
+                backup = create_backup(store, args.destination, incremental=args.incremental)
+            finally:
+                store.close()
+            print(
+                f"Backup {backup['id']}: {backup['segments_copied']} segments copied, "
+                f"{backup['segments_reused']} reused, {backup['bytes_copied']} bytes"
+            )
+        elif args.command == "list":
+            for backup in list_backups(args.destination):
+                kind = f"incremental on {backup['parent']}" if backup["parent"] else "full"
+                print(f"{backup['id']}  {len(backup['shards'])} shards  {kind}")
+        else:
+            result = restore_backup(args.backup, args.target, force=args.force)
+            print(f"Restored {result['rows']} documents in {result['shards']} shards into {result['target']}")
+    except (OSError, ValueError) as exc:
+        print(f"{args.command} failed: {exc}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
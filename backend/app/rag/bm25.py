@@ -0,0 +1,210 @@
+"""
+Incremental BM25 keyword index for the local RAG store.
+
+Like the vector indexes, it addresses rows by ordinal and is maintained
+per shard. Postings are kept in flat parallel arrays (term, row, term
+frequency) instead of per-term containers: the bulk is grouped by term
+through an ``order``/``offsets`` pair, and postings appended since the
+last regroup are scanned linearly until the next one.
+"""
+
+import os
+import re
+from collections import Counter
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+
+from app.rag.arrays import grow
+
+
+_TOKEN_PATTERN = re.compile(r"[a-zA-Z0-9_]+")
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN_PATTERN.findall((text or "").lower())
+
+
+class BM25Index:
+    """
+    Okapi BM25 over the rows' texts with document frequencies, lengths and
+    the live-row count updated on every add and remove.
+    """
+
+    kind = "bm25"
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._terms: Dict[str, int] = {}
+        self._df = np.zeros(0, dtype=np.int64)
+        self._doc_len = np.zeros(0, dtype=np.float32)
+        self._dead = np.zeros(0, dtype=bool)
+        self._count = 0
+        self._live = 0
+        self._total_len = 0
+        self._post_term = np.zeros(0, dtype=np.int32)
+        self._post_row = np.zeros(0, dtype=np.int64)
+        self._post_tf = np.zeros(0, dtype=np.float32)
+        self._postings = 0
+        # (order, offsets, sorted_count): postings below sorted_count grouped
+        # by term. Replaced as one tuple so readers never see a mix.
+        self._groups = (np.zeros(0, dtype=np.int64), np.zeros(1, dtype=np.int64), 0)
+
+    def __len__(self) -> int:
+        return self._count
+
+    def add(self, texts: Sequence[str]):
+        """
+        Append rows; they receive ordinals ``len(self)`` onwards.
+        """
+        terms: List[int] = []
+        rows: List[int] = []
+        freqs: List[int] = []
+        lengths = np.zeros(len(texts), dtype=np.float32)
+        for offset, text in enumerate(texts):
+            tokens = tokenize(text)
+            lengths[offset] = len(tokens)
+            for token, tf in Counter(tokens).items():
+                term = self._terms.get(token)
+                if term is None:
+                    term = self._terms[token] = len(self._terms)
+                terms.append(term)
+                rows.append(self._count + offset)
+                freqs.append(tf)
+
+        start = self._postings
+        end = start + len(terms)
+        self._post_term = grow(self._post_term, end)
+        self._post_row = grow(self._post_row, end)
+        self._post_tf = grow(self._post_tf, end)
+        self._post_term[start:end] = terms
+        self._post_row[start:end] = rows
+        self._post_tf[start:end] = freqs
+
+        self._df = grow(self._df, len(self._terms))
+        if terms:
+            self._df[:len(self._terms)] += np.bincount(terms, minlength=len(self._terms))
+
+        new_count = self._count + len(texts)
+        self._doc_len = grow(self._doc_len, new_count)
+        self._dead = grow(self._dead, new_count, False)
+        self._doc_len[self._count:new_count] = lengths
+        self._total_len += int(lengths.sum())
+        self._live += len(texts)
+
+        # Publish the postings before the counts that make them visible.
+        self._postings = end
+        self._count = new_count
+
+        sorted_count = self._groups[2]
+        if self._postings - sorted_count > max(4096, sorted_count // 8):
+            self._regroup()
+
+    def remove(self, ordinals):
+        """
+        Tombstone rows and take them out of the collection statistics.
+        """
+        ordinals = np.unique(np.asarray(ordinals, dtype=np.int64))
+        ordinals = ordinals[(ordinals < self._count)]
+        ordinals = ordinals[~self._dead[ordinals]]
+        if not ordinals.shape[0]:
+            return
+
+        postings = np.flatnonzero(np.isin(self._post_row[:self._postings], ordinals))
+        self._df[:len(self._terms)] -= np.bincount(
+            self._post_term[postings],
+            minlength=len(self._terms)
+        )
+        self._dead[ordinals] = True
+        self._total_len -= int(self._doc_len[ordinals].sum())
+        self._live -= ordinals.shape[0]
+
+    def _regroup(self):
+        terms = self._post_term[:self._postings]
+        order = np.argsort(terms, kind="stable").astype(np.int64)
+        offsets = np.searchsorted(terms[order], np.arange(len(self._terms) + 1), side="left").astype(np.int64)
+        self._groups = (order, offsets, self._postings)
+
+    def _term_postings(self, term: int, postings: int) -> np.ndarray:
+        order, offsets, sorted_count = self._groups
+        grouped = order[offsets[term]:offsets[term + 1]] if term + 1 < offsets.shape[0] else order[:0]
+        recent = np.flatnonzero(self._post_term[sorted_count:postings] == term) + sorted_count
+        return np.concatenate([grouped, recent])
+
+    def scores(self, query: str, count: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        BM25 scores of the live rows below ``count`` that share a term
+        with ``query``, as ``(ordinals, scores)`` in ordinal order.
+        """
+        postings = self._postings
+        terms = [self._terms[token] for token in set(tokenize(query)) if token in self._terms]
+        if not terms or not self._live:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+
+        average_length = max(self._total_len / self._live, 1e-9)
+        parts_rows = []
+        parts_scores = []
+        for term in terms:
+            indexes = self._term_postings(term, postings)
+            rows = self._post_row[indexes]
+            keep = rows < count
+            indexes, rows = indexes[keep], rows[keep]
+            keep = ~self._dead[rows]
+            indexes, rows = indexes[keep], rows[keep]
+            if not rows.shape[0]:
+                continue
+
+            df = max(int(self._df[term]), 1)
+            idf = np.log(1.0 + (self._live - df + 0.5) / (df + 0.5))
+            tf = self._post_tf[indexes]
+            norm = self.k1 * (1.0 - self.b + self.b * self._doc_len[rows] / average_length)
+            parts_rows.append(rows)
+            parts_scores.append(idf * tf * (self.k1 + 1.0) / (tf + norm))
+
+        if not parts_rows:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+
+        ordinals, inverse = np.unique(np.concatenate(parts_rows), return_inverse=True)
+        totals = np.bincount(inverse, weights=np.concatenate(parts_scores)).astype(np.float32)
+        return ordinals, totals
+
+    def save(self, path: str):
+        temp_path = path + ".tmp"
+        with open(temp_path, "wb") as f:
+            np.savez(
+                f,
+                kind=np.array(self.kind),
+                terms=np.array(list(self._terms), dtype=str),
+                df=self._df[:len(self._terms)],
+                doc_len=self._doc_len[:self._count],
+                dead=self._dead[:self._count],
+                post_term=self._post_term[:self._postings],
+                post_row=self._post_row[:self._postings],
+                post_tf=self._post_tf[:self._postings],
+            )
+        os.replace(temp_path, path)
+
+    def load(self, path: str) -> bool:
+        """
+        Restore state saved by ``save``. Returns False if the file is not a
+        BM25 index.
+        """
+        with np.load(path, allow_pickle=False) as state:
+            if str(state["kind"]) != self.kind:
+                return False
+            self._terms = {str(term): i for i, term in enumerate(state["terms"].tolist())}
+            self._df = state["df"].astype(np.int64)
+            self._doc_len = state["doc_len"].astype(np.float32)
+            self._dead = state["dead"].astype(bool)
+            self._post_term = state["post_term"].astype(np.int32)
+            self._post_row = state["post_row"].astype(np.int64)
+            self._post_tf = state["post_tf"].astype(np.float32)
+
+        self._count = self._doc_len.shape[0]
+        self._postings = self._post_term.shape[0]
+        live = ~self._dead
+        self._live = int(live.sum())
+        self._total_len = int(self._doc_len[live].sum())
+        self._regroup()
+        return True
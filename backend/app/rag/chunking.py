@@ -0,0 +1,125 @@
+"""
+Sentence- and paragraph-aware chunking for RAG ingestion.
+
+Chunks are packed from whole sentences up to a token budget, and
+consecutive chunks share a few trailing sentences of overlap so a fact
+that straddles a boundary is still retrievable from either side. Token
+counts are a word/punctuation estimate; they only need to be close
+enough to keep chunks comparable in size and prompts within budget.
+"""
+
+import re
+from typing import Iterable, Iterator, List
+
+
+_TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+_SENTENCE_END = re.compile(r"(?<=[.!?])[\"')\]]*\s+(?=[\"'(\[]?[A-Z0-9])")
+
+
+def estimate_tokens(text: str) -> int:
+    return len(_TOKEN_PATTERN.findall(text or ""))
+
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    """
+    The beginning of ``text`` up to ``max_tokens`` estimated tokens,
+    followed by an ellipsis (one more token) when it was cut.
+    """
+    if max_tokens <= 0:
+        return ""
+    for index, match in enumerate(_TOKEN_PATTERN.finditer(text or "")):
+        if index == max_tokens - 1:
+            end = match.end()
+            return text[:end] + ("…" if text[end:].strip() else "")
+    return text or ""
+
+
+def split_sentences(paragraph: str) -> List[str]:
+    paragraph = " ".join((paragraph or "").split())
+    if not paragraph:
+        return []
+    return [sentence for sentence in _SENTENCE_END.split(paragraph) if sentence]
+
+
+class TextChunker:
+    """
+    Packs sentences into chunks of at most ``max_tokens`` with about
+    ``overlap_tokens`` carried over between consecutive chunks of the same
+    document. Paragraph breaks are preferred as chunk boundaries.
+    """
+
+    def __init__(self, max_tokens: int = 200, overlap_tokens: int = 40):
+        if max_tokens < 1:
+            raise ValueError("max_tokens must be positive")
+        self.max_tokens = max_tokens
+        self.overlap_tokens = max(0, min(overlap_tokens, max_tokens // 2))
+
+    def _pieces(self, sentence: str) -> Iterator[str]:
+        """
+        Split a sentence longer than the budget at word boundaries.
+        """
+        if estimate_tokens(sentence) <= self.max_tokens:
+            yield sentence
+            return
+
+        words: List[str] = []
+        tokens = 0
+        for word in sentence.split():
+            size = estimate_tokens(word)
+            if words and tokens + size > self.max_tokens:
+                yield " ".join(words)
+                words, tokens = [], 0
+            words.append(word)
+            tokens += size
+        if words:
+            yield " ".join(words)
+
+    def _overlap(self, sentences: List[str], sizes: List[int]):
+        carried: List[str] = []
+        carried_sizes: List[int] = []
+        total = 0
+        for sentence, size in zip(reversed(sentences), reversed(sizes)):
+            if total + size > self.overlap_tokens:
+                break
+            carried.insert(0, sentence)
+            carried_sizes.insert(0, size)
+            total += size
+        return carried, carried_sizes, total
+
+    def chunk_paragraphs(self, paragraphs: Iterable[str]) -> Iterator[str]:
+        """
+        Stream chunks from an iterable of paragraphs; only the chunk being
+        built is held in memory.
+        """
+        sentences: List[str] = []
+        sizes: List[int] = []
+        tokens = 0
+        fresh = 0
+
+        for paragraph in paragraphs:
+            for sentence in split_sentences(paragraph):
+                for piece in self._pieces(sentence):
+                    size = estimate_tokens(piece)
+                    if fresh and tokens + size > self.max_tokens:
+                        yield " ".join(sentences)
+                        sentences, sizes, tokens = self._overlap(sentences, sizes)
+                        fresh = 0
+                        while sentences and tokens + size > self.max_tokens:
+                            tokens -= sizes.pop(0)
+                            sentences.pop(0)
+                    sentences.append(piece)
+                    sizes.append(size)
+                    tokens += size
+                    fresh += 1
+
+            # Close the chunk at a paragraph break once it is mostly full.
+            if fresh and tokens >= self.max_tokens * 0.75:
+                yield " ".join(sentences)
+                sentences, sizes, tokens = self._overlap(sentences, sizes)
+                fresh = 0
+
+        if fresh:
+            yield " ".join(sentences)
+
+    def chunk(self, text: str) -> List[str]:
+        return list(self.chunk_paragraphs(re.split(r"\n\s*\n", text or "")))
@@ -0,0 +1,266 @@
+"""
+Duplicate detection for RAG ingestion.
+
+Exact duplicates are found by a content key (normalized text plus the
+metadata that distinguishes otherwise equal chunks). Near duplicates are
+found by 64-bit SimHash fingerprints: rows within ``max_distance``
+differing bits join the group of the earliest such row, and searches
+return one hit per group.
+
+Past ``INDEX_MIN_ROWS`` rows, fingerprints are looked up by multi-index
+hashing. Each fingerprint is split into four 16-bit bands, and every
+band value chains the rows that have it. Two fingerprints within
+``max_distance`` bits differ in at most ``max_distance // 4`` bits in at
+least one band, so probing each band's values within that radius finds
+every near duplicate. Only those candidates are compared bit by bit.
+Smaller shards are scanned, which is cheaper than probing.
+"""
+
+import hashlib
+import itertools
+import os
+import re
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+
+from app.rag.arrays import grow
+
+
+_TOKEN_PATTERN = re.compile(r"[a-zA-Z0-9_]+")
+_BIT_POSITIONS = np.arange(64, dtype=np.uint64)
+
+# Chunks with the same text but a different value for one of these keys
+# are kept apart, e.g. the same sentence said by the user and the assistant.
+DEDUP_METADATA_KEYS = ("user_id", "kind", "role", "source")
+
+POLICIES = ("refcount", "drop", "off")
+
+BANDS = 4
+BAND_BITS = 64 // BANDS
+_BAND_MASK = (1 << BAND_BITS) - 1
+# Past this many probes per fingerprint a plain scan is cheaper.
+MAX_PROBES = 4096
+# Shards with fewer fingerprints are scanned instead of band-indexed.
+INDEX_MIN_ROWS = 4096
+
+
+def _hash64(value: str) -> int:
+    return int.from_bytes(hashlib.blake2b(value.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def content_key(text: str, metadata: Optional[Dict] = None) -> int:
+    metadata = metadata or {}
+    normalized = " ".join((text or "").lower().split())
+    extra = "\x1f".join(f"{key}={metadata.get(key)}" for key in DEDUP_METADATA_KEYS if key in metadata)
+    # Signed so the keys fit an int64 array.
+    return _hash64(normalized + "\x1e" + extra) - (1 << 63)
+
+
+def simhash(text: str) -> int:
+    """
+    64-bit SimHash over the text's lowercase word tokens.
+    """
+    tokens = _TOKEN_PATTERN.findall((text or "").lower())
+    if not tokens:
+        return 0
+    hashes = np.array([_hash64(token) for token in tokens], dtype=np.uint64)
+    bits = ((hashes[:, np.newaxis] >> _BIT_POSITIONS) & np.uint64(1)).astype(np.int32)
+    weights = bits.sum(axis=0) * 2 - len(tokens)
+    return int(np.sum(np.left_shift(np.uint64(1), _BIT_POSITIONS[weights > 0])))
+
+
+@lru_cache(maxsize=8)
+def _probe_masks(radius: int) -> np.ndarray:
+    """
+    Every band value XOR mask with at most ``radius`` bits set.
+    """
+    masks = []
+    for bits in range(radius + 1):
+        for positions in itertools.combinations(range(BAND_BITS), bits):
+            masks.append(sum(1 << position for position in positions))
+    return np.array(masks, dtype=np.int64)
+
+
+def _band_slots(fingerprint: int) -> List[int]:
+    # Band b's values occupy slots [b << BAND_BITS, (b + 1) << BAND_BITS).
+    return [
+        (band << BAND_BITS) | ((fingerprint >> (band * BAND_BITS)) & _BAND_MASK)
+        for band in range(BANDS)
+    ]
+
+
+class DedupIndex:
+    """
+    Per-shard duplicate index, addressed by row ordinal like the other
+    indexes. Fingerprints live in one uint64 array; band buckets narrow a
+    lookup to candidate rows, which are compared with a vectorized popcount.
+    """
+
+    kind = "dedup"
+
+    def __init__(self, max_distance: int = 10):
+        self.max_distance = max_distance
+        self._exact: Dict[int, int] = {}
+        self._keys = np.zeros(0, dtype=np.int64)
+        self._fingerprints = np.zeros(0, dtype=np.uint64)
+        self._groups = np.zeros(0, dtype=np.int64)
+        self._dead = np.zeros(0, dtype=bool)
+        self._count = 0
+        # Bucket chains over links ``ordinal * BANDS + band``: the last link
+        # in each band slot, and per link the previous one in the same slot
+        # (-1 ends a chain). Built once the shard reaches INDEX_MIN_ROWS.
+        self._heads: Optional[np.ndarray] = None
+        self._links = np.zeros(0, dtype=np.int32)
+        radius = max(0, max_distance) // BANDS
+        masks = _probe_masks(min(radius, BAND_BITS))
+        self._masks = masks if masks.size * BANDS <= MAX_PROBES else None
+
+    def __len__(self) -> int:
+        return self._count
+
+    def find(self, key: int) -> Optional[int]:
+        """
+        Ordinal of the live row with content ``key``, if any.
+        """
+        return self._exact.get(key)
+
+    def _index(self, ordinal: int, fingerprint: int):
+        if self._heads is None:
+            if self._masks is None or ordinal + 1 < INDEX_MIN_ROWS:
+                return
+            self._heads = np.full(BANDS << BAND_BITS, -1, dtype=np.int32)
+            for earlier in range(ordinal):
+                self._index(earlier, int(self._fingerprints[earlier]))
+        if fingerprint == 0:
+            return
+        self._links = grow(self._links, (ordinal + 1) * BANDS, -1)
+        for band, slot in enumerate(_band_slots(fingerprint)):
+            link = ordinal * BANDS + band
+            self._links[link] = self._heads[slot]
+            self._heads[slot] = link
+
+    def _candidates(self, fingerprint: int) -> np.ndarray:
+        """
+        Ordinals that may be within ``max_distance`` of the fingerprint.
+        """
+        if self._heads is None:
+            return np.arange(self._count)
+        slots = (np.array(_band_slots(fingerprint), dtype=np.int64)[:, np.newaxis] ^ self._masks).ravel()
+        links = self._heads[slots]
+        links = links[links >= 0]
+        found = []
+        # Follow all the probed chains at once.
+        while links.size:
+            found.append(links)
+            links = self._links[links]
+            links = links[links >= 0]
+        if not found:
+            return np.zeros(0, dtype=np.int64)
+        return np.unique(np.concatenate(found) // BANDS).astype(np.int64)
+
+    def _nearest_group(self, fingerprint: int) -> Optional[int]:
+        if not self._count or fingerprint == 0:
+            return None
+        candidates = self._candidates(fingerprint)
+        if not candidates.size:
+            return None
+        distances = np.bitwise_count(self._fingerprints[candidates] ^ np.uint64(fingerprint))
+        distances[self._dead[candidates]] = 64
+        distances[self._fingerprints[candidates] == 0] = 64
+        best = int(np.argmin(distances))
+        if distances[best] > self.max_distance:
+            return None
+        return int(self._groups[candidates[best]])
+
+    def add(self, texts: Sequence[str], metadatas: Sequence[Optional[Dict]]):
+        """
+        Append rows; they receive ordinals ``len(self)`` onwards.
+        """
+        new_count = self._count + len(texts)
+        self._keys = grow(self._keys, new_count)
+        self._fingerprints = grow(self._fingerprints, new_count)
+        self._groups = grow(self._groups, new_count)
+        self._dead = grow(self._dead, new_count, False)
+
+        for text, metadata in zip(texts, metadatas):
+            ordinal = self._count
+            key = content_key(text, metadata)
+            fingerprint = simhash(text)
+            group = self._nearest_group(fingerprint)
+            self._keys[ordinal] = key
+            self._fingerprints[ordinal] = fingerprint
+            self._groups[ordinal] = ordinal if group is None else group
+            self._exact.setdefault(key, ordinal)
+            self._index(ordinal, fingerprint)
+            self._count += 1
+
+    def groups(self, ordinals: np.ndarray) -> np.ndarray:
+        """
+        Near-duplicate group of each row; a group is named by its first row.
+        """
+        return self._groups[ordinals]
+
+    def remove(self, ordinals: Iterable[int]):
+        for ordinal in ordinals:
+            ordinal = int(ordinal)
+            if ordinal >= self._count or self._dead[ordinal]:
+                continue
+            self._dead[ordinal] = True
+            key = int(self._keys[ordinal])
+            if self._exact.get(key) == ordinal:
+                del self._exact[key]
+
+    def save(self, path: str):
+        temp_path = path + ".tmp"
+        with open(temp_path, "wb") as f:
+            np.savez(
+                f,
+                kind=np.array(self.kind),
+                max_distance=np.array(self.max_distance),
+                keys=self._keys[:self._count],
+                fingerprints=self._fingerprints[:self._count],
+                groups=self._groups[:self._count],
+                dead=self._dead[:self._count],
+            )
+        os.replace(temp_path, path)
+
+    def load(self, path: str) -> bool:
+        """
+        Restore state saved by ``save``. Returns False if the file is not a
+        dedup index built with the same distance.
+        """
+        with np.load(path, allow_pickle=False) as state:
+            if str(state["kind"]) != self.kind or int(state["max_distance"]) != self.max_distance:
+                return False
+            self._keys = state["keys"].astype(np.int64)
+            self._fingerprints = state["fingerprints"].astype(np.uint64)
+            self._groups = state["groups"].astype(np.int64)
+            self._dead = state["dead"].astype(bool)
+
+        self._count = self._keys.shape[0]
+        self._exact = {}
+        for ordinal in np.flatnonzero(~self._dead).tolist():
+            self._exact.setdefault(int(self._keys[ordinal]), ordinal)
+        self._heads = None
+        self._links = np.zeros(0, dtype=np.int32)
+        if self._count:
+            self._index(self._count - 1, int(self._fingerprints[self._count - 1]))
+        return True
+
+
+def collapse(groups: Iterable[int], limit: int) -> List[int]:
+    """
+    Positions of the first ``limit`` entries with distinct groups.
+    """
+    seen = set()
+    keep = []
+    for position, group in enumerate(groups):
+        if group in seen:
+            continue
+        seen.add(group)
+        keep.append(position)
+        if len(keep) >= limit:
+            break
+    return keep
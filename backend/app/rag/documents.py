@@ -0,0 +1,109 @@
+"""
+File ingestion for RAG: stream a document's paragraphs through the
+chunker and store the chunks in batches.
+"""
+
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from app.config.settings import settings
+from app.rag.chunking import TextChunker
+from app.rag.loaders import is_supported, iter_paragraphs
+from app.rag.retriever import retriever
+
+
+# Reports written by the browser agent.
+REPORTS_DIR = Path.home() / "Documents" / "Jarvis" / "Reports"
+
+
+def ingest_roots() -> List[Path]:
+    """
+    Resolved folders files may be ingested from (``RAG_INGEST_ROOTS``,
+    else the reports folder).
+    """
+    return [Path(root).expanduser().resolve() for root in (settings.RAG_INGEST_ROOTS or [REPORTS_DIR])]
+
+
+def resolve_ingest_path(path, roots: Optional[List[Path]] = None) -> Path:
+    """
+    ``path`` resolved (symlinks included; relative to the first root),
+    or PermissionError when it lies outside every ingest root.
+    """
+    roots = roots if roots is not None else ingest_roots()
+    path = Path(path).expanduser()
+    if not path.is_absolute() and roots:
+        path = roots[0] / path
+    resolved = path.resolve()
+    if not any(resolved == root or resolved.is_relative_to(root) for root in roots):
+        raise PermissionError(f"Outside the allowed ingest folders: {path}")
+    return resolved
+
+
+class DocumentIngestor:
+    """
+    Chunks local files and adds the chunks to the RAG store. Each chunk
+    carries ``source`` (the file path) and ``chunk`` (its position) in its
+    metadata, on top of the caller's metadata.
+    """
+
+    def __init__(self, chunker: Optional[TextChunker] = None, batch_size: int = 64):
+        self.chunker = chunker or TextChunker(
+            max_tokens=settings.RAG_CHUNK_TOKENS,
+            overlap_tokens=settings.RAG_CHUNK_OVERLAP
+        )
+        self.batch_size = max(1, batch_size)
+
+    def ingest_file(self, path, metadata: Optional[Dict] = None) -> Dict:
+        path = Path(path)
+        base = dict(metadata or {})
+        base.setdefault("kind", "document")
+        base["source"] = str(path)
+
+        ids: List[str] = []
+        texts: List[str] = []
+        metadatas: List[Dict] = []
+        for index, chunk in enumerate(self.chunker.chunk_paragraphs(iter_paragraphs(path))):
+            texts.append(chunk)
+            metadatas.append(dict(base, chunk=index))
+            if len(texts) >= self.batch_size:
+                ids.extend(retriever.add_texts(texts, metadatas))
+                texts, metadatas = [], []
+        if texts:
+            ids.extend(retriever.add_texts(texts, metadatas))
+
+        return {"source": str(path), "chunks": len(ids), "ids": ids}
+
+    def ingest_paths(
+        self,
+        paths: List,
+        metadata: Optional[Dict] = None,
+        roots: Optional[List[Path]] = None
+    ) -> List[Dict]:
+        """
+        Ingest files and every supported file under directories. Failures
+        are reported per file instead of aborting the whole run. With
+        ``roots``, files that resolve outside them (e.g. symlinks found in
+        a directory) are refused.
+        """
+        files: List[Path] = []
+        for path in map(Path, paths):
+            if path.is_dir():
+                files.extend(sorted(p for p in path.rglob("*") if p.is_file() and is_supported(p)))
+            else:
+                files.append(path)
+
+        results = []
+        for path in files:
+            try:
+                if roots is not None:
+                    resolve_ingest_path(path, roots)
+                results.append(self.ingest_file(path, metadata))
+            except Exception as e:
+                results.append({"source": str(path), "chunks": 0, "ids": [], "error": str(e)})
+        return results
+
+    def chunk_text(self, text: str) -> List[str]:
+        return self.chunker.chunk(text)
+
+
+document_ingestor = DocumentIngestor()
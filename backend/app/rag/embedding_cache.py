@@ -0,0 +1,74 @@
+"""
+Persistent, content-addressed cache of remote embeddings.
+
+Rows are keyed by SHA-256 of the provider version and the text, so
+re-indexing unchanged texts costs a lookup instead of a model call, and
+a model change never serves stale vectors. SQLite in WAL mode lets
+several worker processes share the file.
+"""
+
+import hashlib
+import sqlite3
+import threading
+from typing import Dict, Sequence
+
+import numpy as np
+
+from app.rag.segments import VECTOR_DTYPE
+
+
+# SQLite's default limit on bound parameters is 999.
+_LOOKUP_CHUNK = 500
+
+
+def cache_key(version: str, text: str) -> bytes:
+    return hashlib.sha256(version.encode("utf-8") + b"\0" + text.encode("utf-8")).digest()
+
+
+class EmbeddingCache:
+    """
+    ``text -> embedding`` per provider version, stored in one SQLite file.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        with self._lock:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings (key BLOB PRIMARY KEY, vector BLOB NOT NULL)"
+            )
+            self._connection.commit()
+
+    def get_many(self, version: str, texts: Sequence[str]) -> Dict[str, np.ndarray]:
+        keys = {cache_key(version, text): text for text in texts}
+        found: Dict[str, np.ndarray] = {}
+        key_list = list(keys)
+        with self._lock:
+            for start in range(0, len(key_list), _LOOKUP_CHUNK):
+                chunk = key_list[start:start + _LOOKUP_CHUNK]
+                rows = self._connection.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(chunk))})",
+                    chunk
+                ).fetchall()
+                for key, vector in rows:
+                    found[keys[key]] = np.frombuffer(vector, dtype=VECTOR_DTYPE).astype(np.float32)
+        return found
+
+    def put_many(self, version: str, texts: Sequence[str], matrix: np.ndarray):
+        rows = [
+            (cache_key(version, text), np.asarray(vector, dtype=VECTOR_DTYPE).tobytes())
+            for text, vector in zip(texts, matrix)
+        ]
+        with self._lock:
+            self._connection.executemany("INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)", rows)
+            self._connection.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
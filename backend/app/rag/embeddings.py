@@ -1,39 +1,118 @@
-import hashlib
-import math
-import re
-from typing import List
+"""
+The embedder the RAG code uses, over a pluggable embedding provider.
 
+``EMBEDDING_PROVIDER`` picks the provider (see
+``app.ai.embedding_provider_factory``). The local hash embedder is called
+inline. Remote providers are async: their calls run on a private event
+loop thread, so the synchronous callers (search threads, the ingest
+writer) can share one pooled HTTP client, and their results go through a
+persistent ``EmbeddingCache``.
+"""
 
-class LocalHashEmbedder:
+import asyncio
+import threading
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+from app.ai.base_embedding_provider import BaseEmbeddingProvider
+from app.ai.embedding_provider_factory import embedding_provider_factory
+from app.ai.http_client import http_client
+from app.ai.local_embedding_provider import LocalHashEmbedder
+from app.config.paths import EMBEDDING_CACHE_FILE
+from app.config.settings import settings
+from app.rag.embedding_cache import EmbeddingCache
+
+
+# Stores written before embeddings were versioned used the hash embedder.
+LEGACY_EMBEDDING_VERSION = LocalHashEmbedder().version
+
+
+class Embedder:
     """
-    Lightweight local embedding model using hashed token frequencies.
-    Avoids external embedding API dependencies.
+    Synchronous ``embed`` / ``embed_many`` over an embedding provider.
     """
 
-    def __init__(self, dimension: int = 256):
-        self.dimension = dimension
-        self._token_pattern = re.compile(r"[a-zA-Z0-9_]+")
+    def __init__(
+        self,
+        provider: BaseEmbeddingProvider,
+        cache: Optional[EmbeddingCache] = None,
+        timeout: float = 300.0
+    ):
+        self.provider = provider
+        self.cache = cache
+        self.timeout = timeout
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread: Optional[threading.Thread] = None
+        self._loop_lock = threading.Lock()
 
-    def _tokenize(self, text: str) -> List[str]:
-        return self._token_pattern.findall((text or "").lower())
+    @classmethod
+    def from_settings(cls) -> "Embedder":
+        provider = embedding_provider_factory.get_provider(settings.EMBEDDING_PROVIDER, settings.EMBEDDING_MODEL)
+        cache = None
+        if not provider.local and settings.EMBEDDING_CACHE:
+            EMBEDDING_CACHE_FILE.parent.mkdir(parents=True, exist_ok=True)
+            cache = EmbeddingCache(str(EMBEDDING_CACHE_FILE))
+        return cls(provider, cache)
 
-    def embed(self, text: str) -> List[float]:
-        vector = [0.0] * self.dimension
-        tokens = self._tokenize(text)
+    @property
+    def version(self) -> str:
+        return self.provider.version
+
+    def _run(self, coroutine):
+        with self._loop_lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._loop_thread = threading.Thread(
+                    target=self._loop.run_forever,
+                    name="embedding-loop",
+                    daemon=True
+                )
+                self._loop_thread.start()
+            loop = self._loop
+        return asyncio.run_coroutine_threadsafe(coroutine, loop).result(self.timeout)
 
-        if not tokens:
-            return vector
+    def embed_many(self, texts: Sequence[str]) -> np.ndarray:
+        """
+        Embed ``texts`` into a float32 ``(len(texts), dimension)`` array.
+        """
+        if self.provider.local:
+            return self.provider.embed_many(texts)
 
-        for token in tokens:
-            digest = hashlib.sha256(token.encode("utf-8")).digest()
-            bucket = int.from_bytes(digest[:4], "big") % self.dimension
-            vector[bucket] += 1.0
+        texts = [text or "" for text in texts]
+        unique = list(dict.fromkeys(texts))
+        vectors = self.cache.get_many(self.version, unique) if self.cache is not None else {}
+        missing = [text for text in unique if text not in vectors]
+        if missing:
+            computed = np.asarray(self._run(self.provider.embed_batch(missing)), dtype=np.float32)
+            if self.cache is not None:
+                self.cache.put_many(self.version, missing, computed)
+            vectors.update(zip(missing, computed))
 
-        norm = math.sqrt(sum(v * v for v in vector))
-        if norm == 0.0:
-            return vector
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+        return np.stack([vectors[text] for text in texts]).astype(np.float32, copy=False)
+
+    def embed(self, text: str) -> List[float]:
+        return self.embed_many([text])[0].tolist()
 
-        return [v / norm for v in vector]
+    def close(self):
+        """
+        Close the provider and the pooled HTTP client of the private loop,
+        and stop the event loop thread.
+        """
+        with self._loop_lock:
+            loop, thread = self._loop, self._loop_thread
+            self._loop = self._loop_thread = None
+        if loop is not None:
+            asyncio.run_coroutine_threadsafe(self.provider.close(), loop).result(self.timeout)
+            asyncio.run_coroutine_threadsafe(http_client.close(), loop).result(self.timeout)
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join(self.timeout)
+            loop.close()
+        if self.cache is not None:
+            self.cache.close()
+            self.cache = None
 
 
-embedder = LocalHashEmbedder()
+embedder = Embedder.from_settings()
@@ -0,0 +1,206 @@
+"""
+Compact, streamable export format for RAG documents.
+
+A stream is a header line, then batches, then an end line::
+
+    {"format": "ai-life-rag-export", "version": 1}\\n
+    {"rows": n, "dimension": d, "embedding_version": "..."}\\n
+    n lines of {"id": ..., "text": ..., "metadata": {...}}\\n
+    n * d little-endian float32 embeddings
+    ...
+    {"end": true, "rows": total}\\n
+
+Exports read one shard snapshot at a time and a batch of rows at a time,
+and imports parse the stream incrementally, so neither side holds the
+store in memory. Deleted rows are not exported. Imports re-embed the
+texts when the batch came from another embedding model.
+"""
+
+import json
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from app.rag.embeddings import Embedder, embedder as default_embedder
+from app.rag.segments import VECTOR_DTYPE
+from app.rag.vector_store import ShardedVectorStore
+
+
+EXPORT_FORMAT = "ai-life-rag-export"
+EXPORT_VERSION = 1
+EXPORT_BATCH_SIZE = 1024
+
+# Guards the reader against absurd batch headers.
+MAX_BATCH_ROWS = 65536
+MAX_DIMENSION = 65536
+
+
+def _line(payload: Dict) -> bytes:
+    return (json.dumps(payload, ensure_ascii=False) + "\n").encode("utf-8")
+
+
+def export_stream(
+    store: ShardedVectorStore,
+    user_id: Optional[str] = None,
+    batch_size: int = EXPORT_BATCH_SIZE
+) -> Iterator[bytes]:
+    """
+    Yield the export of one user's shard, or of every shard when
+    ``user_id`` is None. Each shard is read from one snapshot.
+    """
+    yield _line({"format": EXPORT_FORMAT, "version": EXPORT_VERSION})
+    total = 0
+    for snapshot in store.snapshots(user_id):
+        for block, offset in zip(snapshot.blocks, snapshot.offsets.tolist()):
+            rows = np.arange(len(block))
+            if snapshot.dead is not None:
+                rows = rows[~snapshot.dead[offset:offset + len(block)]]
+            for start in range(0, rows.shape[0], batch_size):
+                chunk = rows[start:start + batch_size]
+                yield _line({
+                    "rows": int(chunk.shape[0]),
+                    "dimension": int(block.embeddings.shape[1]),
+                    "embedding_version": snapshot.embedding_version,
+                })
+                yield b"".join(
+                    _line({"id": block.ids[row], "text": block.texts[row], "metadata": block.metadatas[row]})
+                    for row in chunk.tolist()
+                )
+                yield np.ascontiguousarray(block.embeddings[chunk], dtype=VECTOR_DTYPE).tobytes()
+                total += int(chunk.shape[0])
+    yield _line({"end": True, "rows": total})
+
+
+class ExportBatch:
+    """
+    One batch of an export: documents plus their embedding matrix.
+    """
+
+    def __init__(self, documents: List[Dict], embeddings: np.ndarray, embedding_version: Optional[str]):
+        self.documents = documents
+        self.embeddings = embeddings
+        self.embedding_version = embedding_version
+
+
+class ExportReader:
+    """
+    Incremental parser: ``feed`` it chunks of any size and it returns the
+    batches completed so far. ``close`` checks the stream was complete.
+    """
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._header_seen = False
+        self._batch: Optional[Dict] = None
+        self._documents: List[Dict] = []
+        self.rows = 0
+        self.finished = False
+
+    def _take_line(self) -> Optional[bytes]:
+        end = self._buffer.find(b"\n")
+        if end < 0:
+            return None
+        line = bytes(self._buffer[:end])
+        del self._buffer[:end + 1]
+        return line
+
+    def _start_batch(self, line: bytes):
+        payload = json.loads(line)
+        if payload.get("end"):
+            if payload.get("rows") != self.rows:
+                raise ValueError(f"Export ended after {self.rows} rows, expected {payload.get('rows')}")
+            self.finished = True
+            return
+        rows, dimension = int(payload.get("rows", 0)), int(payload.get("dimension", 0))
+        if not 0 < rows <= MAX_BATCH_ROWS or not 0 < dimension <= MAX_DIMENSION:
+            raise ValueError(f"Invalid export batch: {rows} rows of dimension {dimension}")
+        self._batch = payload
+
+    def feed(self, data: bytes) -> List[ExportBatch]:
+        self._buffer += data
+        batches = []
+        while not self.finished:
+            if not self._header_seen:
+                line = self._take_line()
+                if line is None:
+                    break
+                header = json.loads(line)
+                if header.get("format") != EXPORT_FORMAT or header.get("version") != EXPORT_VERSION:
+                    raise ValueError("Not a RAG export (or an unsupported version)")
+                self._header_seen = True
+            elif self._batch is None:
+                line = self._take_line()
+                if line is None:
+                    break
+                self._start_batch(line)
+            elif len(self._documents) < self._batch["rows"]:
+                line = self._take_line()
+                if line is None:
+                    break
+                self._documents.append(json.loads(line))
+            else:
+                size = self._batch["rows"] * self._batch["dimension"] * VECTOR_DTYPE.itemsize
+                if len(self._buffer) < size:
+                    break
+                embeddings = np.frombuffer(bytes(self._buffer[:size]), dtype=VECTOR_DTYPE)
+                del self._buffer[:size]
+                batches.append(ExportBatch(
+                    self._documents,
+                    embeddings.reshape(self._batch["rows"], self._batch["dimension"]).astype(np.float32),
+                    self._batch.get("embedding_version")
+                ))
+                self.rows += self._batch["rows"]
+                self._batch = None
+                self._documents = []
+        if self.finished and bytes(self._buffer).strip():
+            raise ValueError("Data after the end of the export")
+        return batches
+
+    def close(self):
+        if not self.finished:
+            raise ValueError("Export stream ended early")
+
+
+def import_batch(
+    store: ShardedVectorStore,
+    batch: ExportBatch,
+    user_id: Optional[str] = None,
+    embedder: Optional[Embedder] = None
+) -> Tuple[List[str], bool]:
+    """
+    Add one batch to ``store``; with ``user_id`` every document is filed
+    under that user. Returns the new ids and whether the texts had to be
+    re-embedded for the current model.
+    """
+    embedder = embedder or default_embedder
+    texts = [document.get("text", "") for document in batch.documents]
+    metadatas = []
+    for document in batch.documents:
+        metadata = dict(document.get("metadata") or {})
+        if user_id is not None:
+            metadata["user_id"] = user_id
+        metadatas.append(metadata)
+
+    reembed = batch.embedding_version not in (None, embedder.version)
+    embeddings = embedder.embed_many(texts) if reembed else batch.embeddings
+    return store.add_documents(texts, embeddings, metadatas), reembed
+
+
+def import_stream(
+    store: ShardedVectorStore,
+    chunks: Iterable[bytes],
+    user_id: Optional[str] = None,
+    embedder: Optional[Embedder] = None
+) -> Dict:
+    """
+    Import an export read from ``chunks`` batch by batch.
+    """
+    reader = ExportReader()
+    imported = reembedded = 0
+    for chunk in chunks:
+        for batch in reader.feed(chunk):
+            ids, reembed = import_batch(store, batch, user_id, embedder)
+            imported += len(ids)
+            reembedded += len(ids) if reembed else 0
+    reader.close()
+    return {"rows": reader.rows, "imported": imported, "reembedded": reembedded}
@@ -0,0 +1,179 @@
+"""
+Background RAG ingestion for request handlers.
+
+Handlers enqueue texts and return without waiting for embedding or the
+store write. A single writer thread drains the queue and coalesces
+whatever is waiting into one ``add_texts`` batch. The queue is bounded:
+when it is full, ``enqueue`` waits without blocking the event loop until
+the writer catches up, so bursts slow producers down instead of growing
+memory.
+"""
+
+import asyncio
+import logging
+import queue
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Sequence
+
+from app.config.settings import settings
+from app.rag.retriever import retriever
+
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class IngestQueue:
+    """
+    Bounded queue of ``(texts, metadatas)`` batches written by one thread.
+    Writes are fire-and-forget: failures are logged and counted in
+    ``stats()``, never raised to the producer. A producer that needs to
+    know when its batch is written passes a ``done`` callback.
+    """
+
+    def __init__(self, maxsize: Optional[int] = None, batch_size: int = 256):
+        self.maxsize = max(1, maxsize or settings.RAG_INGEST_QUEUE_SIZE)
+        self.batch_size = max(1, batch_size)
+        self._queue: "queue.Queue" = queue.Queue(self.maxsize)
+        self._thread: Optional[threading.Thread] = None
+        self._thread_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stats = {"enqueued": 0, "written": 0, "failed": 0, "batches": 0, "waits": 0, "max_depth": 0}
+
+    def _ensure_writer(self):
+        with self._thread_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="rag-ingest", daemon=True)
+                self._thread.start()
+
+    def _item(self, texts: Sequence[str], metadatas: Optional[Sequence[Optional[Dict]]], done=None):
+        texts = list(texts)
+        metadatas = list(metadatas) if metadatas is not None else [None] * len(texts)
+        if len(metadatas) != len(texts):
+            raise ValueError("texts and metadatas must have the same length")
+        return texts, metadatas, done
+
+    def _count(self, **increments):
+        with self._stats_lock:
+            for key, value in increments.items():
+                self._stats[key] += value
+
+    def _accepted(self, rows: int):
+        with self._stats_lock:
+            self._stats["enqueued"] += rows
+            self._stats["max_depth"] = max(self._stats["max_depth"], self._queue.qsize())
+
+    async def enqueue(self, texts: Sequence[str], metadatas: Optional[Sequence[Optional[Dict]]] = None):
+        """
+        Queue texts for ingestion; waits only while the queue is full.
+        """
+        item = self._item(texts, metadatas)
+        if not item[0]:
+            return
+        self._ensure_writer()
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            self._count(waits=1)
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(None, self._queue.put, item)
+        self._accepted(len(item[0]))
+
+    def submit(
+        self,
+        texts: Sequence[str],
+        metadatas: Optional[Sequence[Optional[Dict]]] = None,
+        timeout: Optional[float] = None,
+        done: Optional[Callable[[bool], None]] = None
+    ):
+        """
+        Blocking ``enqueue`` for threads; raises ``queue.Full`` on timeout.
+        ``done(ok)`` is called from the writer once the texts are written
+        (``ok``) or have failed.
+        """
+        item = self._item(texts, metadatas, done)
+        if not item[0]:
+            if done is not None:
+                done(True)
+            return
+        self._ensure_writer()
+        self._queue.put(item, timeout=timeout)
+        self._accepted(len(item[0]))
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            items = [self._queue.get()]
+            if items[0] is _STOP:
+                self._queue.task_done()
+                break
+
+            rows = len(items[0][0])
+            while rows < self.batch_size:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    self._queue.task_done()
+                    stopping = True
+                    break
+                items.append(item)
+                rows += len(item[0])
+
+            texts: List[str] = []
+            metadatas: List[Optional[Dict]] = []
+            for item_texts, item_metadatas, _ in items:
+                texts.extend(item_texts)
+                metadatas.extend(item_metadatas)
+            ok = False
+            try:
+                retriever.add_texts(texts, metadatas)
+                self._count(written=len(texts), batches=1)
+                ok = True
+            except Exception as e:
+                self._count(failed=len(texts), batches=1)
+                logger.warning(f"RAG background ingest of {len(texts)} texts failed: {e}")
+            finally:
+                for _, _, done in items:
+                    if done is not None:
+                        try:
+                            done(ok)
+                        except Exception as e:
+                            logger.warning(f"RAG ingest callback failed: {e}")
+                    self._queue.task_done()
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """
+        Wait until everything queued so far is written (or has failed).
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._queue.all_tasks_done:
+            while self._queue.unfinished_tasks:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._queue.all_tasks_done.wait(remaining)
+        return True
+
+    def close(self, timeout: Optional[float] = None) -> bool:
+        """
+        Write what is queued and stop the writer thread.
+        """
+        with self._thread_lock:
+            thread = self._thread
+            self._thread = None
+        if thread is None or not thread.is_alive():
+            return True
+        self._queue.put(_STOP)
+        thread.join(timeout)
+        return not thread.is_alive()
+
+    def stats(self) -> Dict:
+        with self._stats_lock:
+            return dict(self._stats, depth=self._queue.qsize(), maxsize=self.maxsize)
+
+
+ingest_queue = IngestQueue()
@@ -0,0 +1,107 @@
+"""
+Cross-process coordination for RAG stores shared by several workers.
+
+With ``uvicorn --workers N`` every worker opens the same store
+directories. Writers serialize on an exclusive ``StoreFileLock`` and bump
+the store's ``GenerationCounter`` after each change; a worker compares
+the counter with the generation it last loaded and catches up only when
+it moved.
+"""
+
+import mmap
+import os
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+_COUNTER_BYTES = 8
+
+
+class StoreFileLock:
+    """
+    Exclusive advisory lock on ``path``, held by one open handle at a time,
+    so it also excludes other stores on the same directory in this
+    process. Not reentrant; callers serialize their own threads first.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._handle = None
+
+    def acquire(self, blocking: bool = True) -> bool:
+        """
+        Take the lock; with ``blocking=False`` return False instead of
+        waiting when another handle holds it.
+        """
+        handle = open(self.path, "a+b")
+        try:
+            if fcntl is not None:
+                try:
+                    fcntl.flock(handle.fileno(), fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+                except BlockingIOError:
+                    handle.close()
+                    return False
+            else:
+                handle.seek(0)
+                while True:
+                    try:
+                        msvcrt.locking(handle.fileno(), msvcrt.LK_LOCK if blocking else msvcrt.LK_NBLCK, 1)
+                        break
+                    except OSError:
+                        if not blocking:
+                            handle.close()
+                            return False
+                        # LK_LOCK gives up after about ten seconds.
+                        continue
+        except BaseException:
+            handle.close()
+            raise
+        self._handle = handle
+        return True
+
+    def release(self):
+        handle, self._handle = self._handle, None
+        if handle is None:
+            return
+        try:
+            if fcntl is not None:
+                fcntl.flock(handle.fileno(), fcntl.LOCK_UN)
+            else:
+                handle.seek(0)
+                msvcrt.locking(handle.fileno(), msvcrt.LK_UNLCK, 1)
+        finally:
+            handle.close()
+
+    def __enter__(self) -> "StoreFileLock":
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+
+class GenerationCounter:
+    """
+    Change counter in a small file, memory-mapped so that checking it on
+    every search costs no system call. Only bump it while holding the
+    store's ``StoreFileLock``.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "a+b") as f:
+            if os.fstat(f.fileno()).st_size < _COUNTER_BYTES:
+                f.truncate(_COUNTER_BYTES)
+            self._map = mmap.mmap(f.fileno(), _COUNTER_BYTES)
+
+    def read(self) -> int:
+        return int.from_bytes(self._map[:_COUNTER_BYTES], "little")
+
+    def bump(self) -> int:
+        value = self.read() + 1
+        self._map[:_COUNTER_BYTES] = value.to_bytes(_COUNTER_BYTES, "little")
+        return value
@@ -0,0 +1,149 @@
+"""
+Inverted index over chunk metadata for filtered RAG search.
+
+Every scalar metadata value is indexed as a ``(key, value)`` posting list
+of row ordinals (the same ordinals the vector index uses). Postings only
+grow at the end, so a reader can take a posting and cut it at its
+snapshot's row count while a writer keeps appending.
+"""
+
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+
+# Postings stay Python lists until they reach this size; most values of
+# high-cardinality keys (ids, timestamps) never get there.
+_ARRAY_THRESHOLD = 32
+
+# Per-row timestamps the store stamps on every chunk; indexing them would
+# cost one posting per row for filters nobody runs. Filters on these keys
+# are checked row by row.
+UNINDEXED_KEYS = frozenset({"created_at", "expires_at"})
+
+
+def is_indexed_value(value: Any) -> bool:
+    """
+    Values with an exact posting list. ``None`` also matches rows that do
+    not have the key at all, so it is left to the per-row check.
+    """
+    return isinstance(value, (str, int, float, bool))
+
+
+class _Posting:
+    __slots__ = ("_rows", "_size")
+
+    def __init__(self):
+        self._rows = []
+        self._size = 0
+
+    def append(self, ordinal: int):
+        rows = self._rows
+        size = self._size
+        if isinstance(rows, list):
+            rows.append(ordinal)
+            if len(rows) >= _ARRAY_THRESHOLD:
+                grown = np.empty(_ARRAY_THRESHOLD * 2, dtype=np.int64)
+                grown[:len(rows)] = rows
+                self._rows = grown
+        else:
+            if size == rows.shape[0]:
+                # Readers may hold the old array, so grow into a new one.
+                grown = np.empty(size * 2, dtype=np.int64)
+                grown[:size] = rows
+                rows = grown
+            rows[size] = ordinal
+            self._rows = rows
+        self._size = size + 1
+
+    def view(self, count: int) -> np.ndarray:
+        """
+        Sorted ordinals below ``count``.
+        """
+        # Read the size first: every array the writer installs afterwards
+        # still holds those rows.
+        size = self._size
+        rows = self._rows
+        if isinstance(rows, list):
+            rows = np.asarray(rows[:size], dtype=np.int64)
+        else:
+            rows = rows[:size]
+        return rows[:int(np.searchsorted(rows, count))]
+
+
+class MetadataIndex:
+    """
+    ``(key, value) -> ordinals`` for every scalar value in the rows'
+    metadata, fed in ordinal order alongside the vector index.
+    """
+
+    def __init__(self):
+        self._postings: Dict[Tuple[str, Any], _Posting] = {}
+        self._count = 0
+
+    def __len__(self) -> int:
+        return self._count
+
+    def add(self, metadatas: Iterable[Dict]):
+        """
+        Append rows; they receive ordinals ``len(self)`` onwards.
+        """
+        for metadata in metadatas:
+            for key, value in metadata.items():
+                if key in UNINDEXED_KEYS or not is_indexed_value(value):
+                    continue
+                posting = self._postings.get((key, value))
+                if posting is None:
+                    posting = self._postings[(key, value)] = _Posting()
+                posting.append(self._count)
+            self._count += 1
+
+    def lookup(self, key: str, value: Any, count: int) -> Optional[np.ndarray]:
+        """
+        Sorted ordinals below ``count`` whose ``metadata[key] == value``,
+        or None when ``value`` is not indexed.
+        """
+        if key in UNINDEXED_KEYS or not is_indexed_value(value):
+            return None
+        posting = self._postings.get((key, value))
+        if posting is None:
+            return np.zeros(0, dtype=np.int64)
+        return posting.view(count)
+
+    def resolve(self, filters: Dict, count: int) -> Tuple[List[np.ndarray], Dict]:
+        """
+        Split equality ``filters`` into posting lists (smallest first) and
+        the filters that still have to be checked row by row.
+        """
+        postings = []
+        residual = {}
+        for key, value in filters.items():
+            posting = self.lookup(key, value, count)
+            if posting is None:
+                residual[key] = value
+            else:
+                postings.append(posting)
+        postings.sort(key=len)
+        return postings, residual
+
+
+def intersect(postings: List[np.ndarray]) -> np.ndarray:
+    """
+    Ordinals present in every posting; expects them smallest first.
+    """
+    result = postings[0]
+    for posting in postings[1:]:
+        if not result.shape[0]:
+            break
+        result = np.intersect1d(result, posting, assume_unique=True)
+    return result
+
+
+def contains(posting: np.ndarray, ordinals: np.ndarray) -> np.ndarray:
+    """
+    Boolean mask of ``ordinals`` found in the sorted ``posting``.
+    """
+    if not posting.shape[0]:
+        return np.zeros(ordinals.shape[0], dtype=bool)
+    positions = np.minimum(np.searchsorted(posting, ordinals), posting.shape[0] - 1)
+    return posting[positions] == ordinals
@@ -0,0 +1,192 @@
+"""
+One-shot migrations of older RAG store layouts into per-user shards.
+
+Two layouts are handled:
+  - the legacy single ``rag_store.json`` file
+  - an unpartitioned segment store (manifest, WAL and segments directly
+    under the store root)
+
+Usage:
+    python -m app.rag.migrate
+    python -m app.rag.migrate --source old/rag_store.json --target data/rag_store
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import uuid
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from app.config.paths import RAG_STORE_DIR, RAG_STORE_FILE
+from app.rag.segments import (
+    INDEX_NAME,
+    MANIFEST_NAME,
+    SEGMENT_PREFIX,
+    SHARDS_DIR,
+    WAL_NAME,
+    Manifest,
+    Segment,
+    VectorBlock,
+    WriteAheadLog,
+    normalize_rows,
+    shard_dir_name,
+)
+
+
+MIGRATED_SUFFIX = ".migrated"
+
+
+class _ShardRows:
+    def __init__(self):
+        self.ids: List[str] = []
+        self.texts: List[str] = []
+        self.metadatas: List[Dict] = []
+        self.embeddings: List[np.ndarray] = []
+
+    def append(self, doc_id: str, text: str, metadata: Dict, embedding):
+        self.ids.append(doc_id)
+        self.texts.append(text)
+        self.metadatas.append(metadata)
+        self.embeddings.append(np.asarray(embedding, dtype=np.float32))
+
+    def block(self) -> VectorBlock:
+        return VectorBlock(self.ids, self.texts, self.metadatas, normalize_rows(np.stack(self.embeddings)))
+
+
+def _write_shards(target_root: str, rows_by_user: Dict[Optional[str], _ShardRows], dimension: Optional[int]):
+    """
+    Build every shard in a staging directory, then move it into place in
+    one rename so an interrupted migration leaves no partial shards.
+    """
+    staging = os.path.join(target_root, SHARDS_DIR + ".tmp")
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+
+    for user_id, rows in rows_by_user.items():
+        shard_path = os.path.join(staging, shard_dir_name(user_id))
+        os.makedirs(shard_path)
+        manifest = Manifest(dimension=dimension)
+        segment = Segment.write(shard_path, manifest.allocate_name(), [rows.block()])
+        manifest.segments.append({"name": segment.name, "count": segment.count})
+        manifest.save(os.path.join(shard_path, MANIFEST_NAME))
+
+    os.replace(staging, os.path.join(target_root, SHARDS_DIR))
+
+
+def _check_target(target_root: str):
+    if os.path.exists(os.path.join(target_root, SHARDS_DIR)):
+        raise ValueError(f"Target store already exists: {target_root}")
+
+
+def migrate_json_store(source_path: str, target_root: str) -> int:
+    """
+    Split ``source_path`` into one sealed segment per user under
+    ``target_root``. The source file is renamed to ``<name>.migrated``
+    afterwards so the migration never runs twice. Returns the number of
+    migrated documents.
+    """
+    _check_target(target_root)
+
+    with open(source_path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+
+    rows_by_user: Dict[Optional[str], _ShardRows] = {}
+    dimension: Optional[int] = None
+    count = 0
+    for doc in data.get("documents", []):
+        embedding = doc.get("embedding") or []
+        if not embedding:
+            continue
+        if dimension is None:
+            dimension = len(embedding)
+        if len(embedding) != dimension:
+            print(f"Skipping document {doc.get('id')}: embedding dimension {len(embedding)} != {dimension}")
+            continue
+        metadata = doc.get("metadata") or {}
+        rows = rows_by_user.setdefault(metadata.get("user_id"), _ShardRows())
+        rows.append(doc.get("id") or str(uuid.uuid4()), doc.get("text", ""), metadata, embedding)
+        count += 1
+
+    os.makedirs(target_root, exist_ok=True)
+    _write_shards(target_root, rows_by_user, dimension)
+    os.replace(source_path, source_path + MIGRATED_SUFFIX)
+    return count
+
+
+def _remove_flat_files(root: str):
+    for entry in os.listdir(root):
+        if entry in (MANIFEST_NAME, WAL_NAME, INDEX_NAME) or entry.startswith(SEGMENT_PREFIX):
+            os.remove(os.path.join(root, entry))
+
+
+def migrate_flat_store(root: str) -> int:
+    """
+    Partition an unsharded segment store in ``root`` by user id.
+    """
+    _check_target(root)
+
+    manifest = Manifest.load(os.path.join(root, MANIFEST_NAME))
+    rows_by_user: Dict[Optional[str], _ShardRows] = {}
+    seen = set()
+
+    def _collect(doc_id, text, metadata, embedding):
+        seen.add(doc_id)
+        rows_by_user.setdefault(metadata.get("user_id"), _ShardRows()).append(doc_id, text, metadata, embedding)
+
+    for entry in manifest.segments:
+        block = Segment(root, entry["name"], entry["count"]).load(manifest.dimension)
+        for row in range(len(block)):
+            _collect(block.ids[row], block.texts[row], block.metadatas[row], block.embeddings[row])
+
+    for record in WriteAheadLog(os.path.join(root, WAL_NAME)).replay():
+        if record["id"] not in seen:
+            _collect(record["id"], record["text"], record["metadata"], record["embedding"])
+
+    dimension = manifest.dimension
+    if dimension is None and rows_by_user:
+        dimension = len(next(iter(rows_by_user.values())).embeddings[0])
+
+    _write_shards(root, rows_by_user, dimension)
+    _remove_flat_files(root)
+    return len(seen)
+
+
+def migrate_store_root(root: str, legacy_path: Optional[str] = None) -> int:
+    """
+    Bring ``root`` to the sharded layout, finishing an interrupted
+    migration if needed. Returns the number of migrated documents.
+    """
+    os.makedirs(root, exist_ok=True)
+
+    if os.path.isdir(os.path.join(root, SHARDS_DIR)):
+        _remove_flat_files(root)
+        return 0
+    if os.path.exists(os.path.join(root, MANIFEST_NAME)):
+        return migrate_flat_store(root)
+    if legacy_path and os.path.exists(legacy_path):
+        return migrate_json_store(legacy_path, root)
+    return 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Migrate older RAG stores to per-user shards")
+    parser.add_argument("--source", default=str(RAG_STORE_FILE), help="Legacy rag_store.json path")
+    parser.add_argument("--target", default=str(RAG_STORE_DIR), help="RAG store root directory")
+    args = parser.parse_args()
+
+    try:
+        count = migrate_store_root(args.target, legacy_path=args.source)
+    except ValueError as exc:
+        print(f"Migration failed: {exc}")
+        return 1
+
+    print(f"Migrated {count} documents into {args.target}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
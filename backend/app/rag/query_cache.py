@@ -0,0 +1,94 @@
+"""
+LRU cache of ``Retriever.search`` results.
+
+Entries are keyed by the user, the normalized query and every search
+option, and remember the generations of the shard snapshots they were
+computed from. Every write to a shard (add, delete, clear, compaction,
+another worker's commit) publishes a snapshot with a new generation, so
+an entry is only served while the rows it ranked are unchanged; a
+mismatch counts as a stale miss and drops the entry.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Hashable, List, Optional, Tuple
+
+
+def normalize_query(query: str) -> str:
+    """
+    Case- and whitespace-insensitive form of ``query`` for cache keys.
+    """
+    return " ".join((query or "").lower().split())
+
+
+class QueryResultCache:
+    """
+    Thread-safe LRU of search results with hit-rate counters.
+    """
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max(0, max_entries)
+        self._entries: "OrderedDict[Hashable, Tuple[Tuple[int, ...], Optional[float], List[Dict]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def get(self, key: Hashable, generation: Tuple[int, ...], now: Optional[float] = None) -> Optional[List[Dict]]:
+        """
+        Copies of the cached hits, or None if missing, expired or computed
+        from other snapshots.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            cached_generation, expires_at, results = entry
+            if cached_generation != generation or (expires_at is not None and (now or time.time()) >= expires_at):
+                del self._entries[key]
+                self.misses += 1
+                self.stale += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return [dict(hit) for hit in results]
+
+    def put(
+        self,
+        key: Hashable,
+        generation: Tuple[int, ...],
+        results: List[Dict],
+        expires_at: Optional[float] = None
+    ):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._entries[key] = (generation, expires_at, [dict(hit) for hit in results])
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "stale": self.stale,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
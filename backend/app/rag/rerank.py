@@ -0,0 +1,176 @@
+"""
+Re-ranking of RAG search candidates before they reach a prompt.
+
+The retriever hands over a candidate pool deeper than ``top_k`` with the
+candidates' scores, embeddings and metadata. Each score is scaled by:
+  - recency: ``0.5 ** (age / half_life)`` from the ``created_at`` stamp,
+    never below ``RECENCY_FLOOR`` so old but relevant chunks survive
+  - role: ``role_weights[metadata["role"]]`` (1.0 for unlisted roles)
+Candidates under ``min_score`` are dropped, and the rest are picked by
+maximal marginal relevance (MMR) so near-identical chunks don't fill
+the context. ``mmr_lambda=1`` is plain score order.
+
+``min_score`` is on the cosine-similarity scale whatever produced the
+ranking: with hybrid search it is compared with each candidate's
+(weighted) vector similarity, not with the fused RRF score, which never
+gets past about 0.033.
+"""
+
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.config.settings import settings
+
+
+# Share of its score a chunk keeps however old it is.
+RECENCY_FLOOR = 0.5
+
+
+def _is_timestamp(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+class RerankOptions:
+    """
+    Re-ranking knobs; None (or an empty dict) turns a stage off.
+    """
+
+    def __init__(
+        self,
+        mmr_lambda: Optional[float] = None,
+        recency_half_life_days: Optional[float] = None,
+        role_weights: Optional[Dict[str, float]] = None,
+        min_score: Optional[float] = None,
+    ):
+        if mmr_lambda is not None and not 0.0 <= mmr_lambda <= 1.0:
+            raise ValueError("mmr_lambda must be between 0 and 1")
+        if recency_half_life_days is not None and recency_half_life_days <= 0:
+            raise ValueError("recency_half_life_days must be positive")
+        if any(weight < 0 for weight in (role_weights or {}).values()):
+            raise ValueError("role weights must not be negative")
+        self.mmr_lambda = mmr_lambda
+        self.recency_half_life_days = recency_half_life_days
+        self.role_weights = dict(role_weights or {})
+        self.min_score = min_score
+
+    @classmethod
+    def from_settings(cls) -> "RerankOptions":
+        return cls(
+            mmr_lambda=settings.RAG_RERANK_MMR_LAMBDA,
+            recency_half_life_days=settings.RAG_RERANK_HALF_LIFE_DAYS,
+            role_weights=settings.RAG_RERANK_ROLE_WEIGHTS,
+            min_score=settings.RAG_RERANK_MIN_SCORE,
+        )
+
+    @property
+    def cache_key(self) -> Tuple:
+        return (
+            self.mmr_lambda,
+            self.recency_half_life_days,
+            tuple(sorted(self.role_weights.items())),
+            self.min_score,
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return (
+            self.mmr_lambda is not None
+            or self.recency_half_life_days is not None
+            or bool(self.role_weights)
+            or self.min_score is not None
+        )
+
+
+def weighted_scores(
+    scores: np.ndarray,
+    metadatas: List[Dict],
+    options: RerankOptions,
+    now: Optional[float] = None
+) -> np.ndarray:
+    """
+    ``scores`` scaled by the recency and role weights.
+    """
+    weighted = np.asarray(scores, dtype=np.float64).copy()
+    if options.recency_half_life_days is not None and weighted.shape[0]:
+        now = time.time() if now is None else now
+        created = np.array(
+            [
+                metadata.get("created_at") if _is_timestamp(metadata.get("created_at")) else np.nan
+                for metadata in metadatas
+            ],
+            dtype=np.float64
+        )
+        age_days = np.clip(now - created, 0.0, None) / 86400.0
+        decay = np.power(0.5, age_days / options.recency_half_life_days)
+        # Chunks without a stamp are treated as new.
+        decay = np.where(np.isnan(decay), 1.0, decay)
+        weighted *= RECENCY_FLOOR + (1.0 - RECENCY_FLOOR) * decay
+    if options.role_weights and weighted.shape[0]:
+        weighted *= np.array(
+            [options.role_weights.get(metadata.get("role"), 1.0) for metadata in metadatas],
+            dtype=np.float64
+        )
+    return weighted
+
+
+def mmr_order(relevance: np.ndarray, embeddings: np.ndarray, top_k: int, mmr_lambda: float) -> np.ndarray:
+    """
+    Positions of up to ``top_k`` candidates picked greedily by
+    ``lambda * relevance - (1 - lambda) * max similarity to those picked``.
+    ``relevance`` is rescaled to [0, 1] so it is comparable to cosine
+    similarity whatever the ranker's score scale.
+    """
+    count = relevance.shape[0]
+    k = min(top_k, count)
+    if not k:
+        return np.zeros(0, dtype=np.int64)
+    peak = relevance.max()
+    relevance = relevance / peak if peak > 0 else relevance
+    similarity = embeddings @ embeddings.T
+
+    picked = np.zeros(k, dtype=np.int64)
+    available = np.ones(count, dtype=bool)
+    redundancy = np.full(count, -np.inf)
+    for step in range(k):
+        if step:
+            marginal = mmr_lambda * relevance - (1.0 - mmr_lambda) * redundancy
+        else:
+            marginal = relevance.copy()
+        marginal[~available] = -np.inf
+        best = int(np.argmax(marginal))
+        picked[step] = best
+        available[best] = False
+        redundancy = np.maximum(redundancy, similarity[best])
+    return picked
+
+
+def rerank(
+    scores: np.ndarray,
+    embeddings: np.ndarray,
+    metadatas: List[Dict],
+    top_k: int,
+    options: RerankOptions,
+    now: Optional[float] = None,
+    similarities: Optional[np.ndarray] = None
+):
+    """
+    Re-rank a candidate pool. Returns ``(positions, scores)``: positions
+    into the pool in final order, and their weighted scores.
+
+    ``min_score`` cuts on ``similarities`` (the candidates' cosine
+    similarity to the query, weighted like the scores) when they are
+    given, else on the scores. A NaN similarity is never cut.
+    """
+    weighted = weighted_scores(scores, metadatas, options, now)
+    positions = np.arange(weighted.shape[0])
+    if options.min_score is not None:
+        floor = weighted if similarities is None else weighted_scores(similarities, metadatas, options, now)
+        positions = positions[~(floor < options.min_score)]
+
+    if options.mmr_lambda is None or options.mmr_lambda >= 1.0:
+        order = positions[np.argsort(-weighted[positions], kind="stable")][:top_k]
+    else:
+        order = positions[mmr_order(weighted[positions], embeddings[positions], top_k, options.mmr_lambda)]
+    return order, weighted[order]
@@ -0,0 +1,125 @@
+"""
+Retention rules for the local RAG store.
+
+A chunk expires once its ``expires_at`` metadata (epoch seconds, set from
+an ingest TTL) has passed, or when the policy for its ``kind`` says so:
+``max_age_days`` ages chunks out by their ``created_at`` stamp and
+``max_chunks`` keeps only that many of the newest chunks of the kind in
+each user's shard. The ``"*"`` policy covers kinds without their own.
+
+Ingesting content that is already stored renews the stored chunk: it
+keeps the later ``created_at`` and the later ``expires_at`` of the two,
+and an ingest without a TTL removes the expiry. Renewals are kept apart
+from the immutable segments and passed in as ``lifetimes``.
+"""
+
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from app.rag.segments import VectorBlock
+
+
+DEFAULT_KIND = "*"
+
+
+class RetentionPolicy:
+    """
+    Limits for the chunks of one kind within one shard; None is unlimited.
+    """
+
+    def __init__(self, max_age_days: Optional[float] = None, max_chunks: Optional[int] = None):
+        if max_age_days is not None and max_age_days <= 0:
+            raise ValueError("max_age_days must be positive")
+        if max_chunks is not None and max_chunks < 0:
+            raise ValueError("max_chunks must not be negative")
+        self.max_age_days = max_age_days
+        self.max_chunks = max_chunks
+
+    @property
+    def max_age_seconds(self) -> Optional[float]:
+        return None if self.max_age_days is None else self.max_age_days * 86400
+
+
+def parse_policies(spec: Optional[Dict[str, Dict]]) -> Dict[str, RetentionPolicy]:
+    """
+    Build policies from ``{"chat": {"max_age_days": 90}, "*": {...}}``.
+    """
+    policies: Dict[str, RetentionPolicy] = {}
+    for kind, options in (spec or {}).items():
+        if isinstance(options, RetentionPolicy):
+            policies[kind] = options
+            continue
+        unknown = set(options or {}) - {"max_age_days", "max_chunks"}
+        if unknown:
+            raise ValueError(f"Unknown retention option(s) for {kind}: {', '.join(sorted(unknown))}")
+        policies[kind] = RetentionPolicy(**(options or {}))
+    return policies
+
+
+def _is_timestamp(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def renewed_lifetime(stored: Dict, ingest: Dict) -> Dict[str, Optional[float]]:
+    """
+    ``created_at`` and ``expires_at`` of a stored chunk that ``ingest``
+    matched: the later of each, where no expiry outlasts any.
+    """
+    created = [value for value in (stored.get("created_at"), ingest.get("created_at")) if _is_timestamp(value)]
+    expires = [stored.get("expires_at"), ingest.get("expires_at")]
+    return {
+        "created_at": max(created) if created else None,
+        "expires_at": max(expires) if all(_is_timestamp(value) for value in expires) else None,
+    }
+
+
+def expired_ordinals(
+    blocks: List[VectorBlock],
+    policies: Dict[str, RetentionPolicy],
+    now: Optional[float] = None,
+    dead: Optional[np.ndarray] = None,
+    lifetimes: Optional[Dict[str, Dict]] = None
+) -> np.ndarray:
+    """
+    Ordinals of the live rows of ``blocks`` that have expired, with the
+    renewed ``lifetimes`` of ids taking precedence over their metadata.
+    Rows without ``created_at`` (stored before it was stamped) never age
+    out, but still count towards ``max_chunks``; rows are oldest first in
+    ordinal order.
+    """
+    now = time.time() if now is None else now
+    expired: List[int] = []
+    capped: Dict[str, List[int]] = {}
+
+    ordinal = 0
+    for block in blocks:
+        for doc_id, metadata in zip(block.ids, block.metadatas):
+            if dead is not None and dead[ordinal]:
+                ordinal += 1
+                continue
+            if lifetimes and doc_id in lifetimes:
+                metadata = dict(metadata, **lifetimes[doc_id])
+
+            expires_at = metadata.get("expires_at")
+            kind = metadata.get("kind")
+            group = kind if kind in policies else DEFAULT_KIND
+            policy = policies.get(group)
+            if _is_timestamp(expires_at) and expires_at <= now:
+                expired.append(ordinal)
+            elif policy is not None:
+                created_at = metadata.get("created_at")
+                max_age = policy.max_age_seconds
+                if max_age is not None and _is_timestamp(created_at) and created_at < now - max_age:
+                    expired.append(ordinal)
+                elif policy.max_chunks is not None:
+                    capped.setdefault(group, []).append(ordinal)
+            ordinal += 1
+
+    for group, ordinals in capped.items():
+        excess = len(ordinals) - policies[group].max_chunks
+        if excess > 0:
+            expired.extend(ordinals[:excess])
+
+    return np.unique(np.asarray(expired, dtype=np.int64))
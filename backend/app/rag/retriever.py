@@ -1,38 +1,95 @@
-import math
+import asyncio
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from typing import Dict, List, Optional
 
+import numpy as np
+
+from app.config.settings import settings
+from app.rag.dedup import collapse
 from app.rag.embeddings import embedder
-from app.rag.vector_store import vector_store
+from app.rag.metadata_index import contains, intersect
+from app.rag.query_cache import QueryResultCache, normalize_query
+from app.rag.rerank import RerankOptions, rerank as rerank_pool
+from app.rag.segments import normalize_rows
+from app.rag.vector_store import StoreSnapshot, vector_store
+
 
+# Filters matching at most this share of a shard are resolved first and
+# only their rows are scored; broader filters are applied to the vector
+# search results instead.
+PREFILTER_SELECTIVITY = 0.05
 
-def _cosine_similarity(a: List[float], b: List[float]) -> float:
-    if len(a) != len(b):
-        return 0.0
+# Quantized scans keep this many times ``top_k`` rows for the exact re-rank.
+RERANK_FACTOR = 8
+RERANK_MIN = 64
 
-    dot = 0.0
-    norm_a = 0.0
-    norm_b = 0.0
+# Reciprocal-rank fusion constant; 60 is the value from the original RRF paper.
+RRF_K = 60
+# Hybrid search fuses this many times ``top_k`` hits from each ranker.
+HYBRID_DEPTH_FACTOR = 4
+HYBRID_MIN_DEPTH = 20
 
-    for i in range(len(a)):
-        dot += a[i] * b[i]
-        norm_a += a[i] * a[i]
-        norm_b += b[i] * b[i]
+# Collapsing near duplicates ranks this many times ``top_k`` hits first.
+COLLAPSE_FACTOR = 3
 
-    if norm_a == 0.0 or norm_b == 0.0:
-        return 0.0
+# Re-ranking picks from this many times ``top_k`` candidates per shard.
+RERANK_POOL_FACTOR = 4
+RERANK_POOL_MIN = 20
 
-    return dot / (math.sqrt(norm_a) * math.sqrt(norm_b))
+# Recency weights drift with the clock, so cached results re-ranked by
+# recency are reused for at most this long.
+RECENCY_CACHE_SECONDS = 60
 
 
 class Retriever:
     """
     RAG retriever that embeds query and ranks stored chunks.
+
+    ``asearch`` runs ``search`` on a dedicated thread pool so async
+    handlers never score on the event loop; numpy releases the GIL while
+    scoring, so concurrent searches overlap.
+
+    Results are kept in a ``QueryResultCache`` of ``cache_size`` entries
+    (0 disables it) and served again until the searched shards change.
     """
 
+    def __init__(self, search_workers: Optional[int] = None, cache_size: Optional[int] = None):
+        self.search_workers = max(1, search_workers or settings.RAG_SEARCH_WORKERS)
+        self.cache = QueryResultCache(settings.RAG_QUERY_CACHE_SIZE if cache_size is None else cache_size)
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._executor_lock = threading.Lock()
+
+    def _search_executor(self) -> ThreadPoolExecutor:
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.search_workers,
+                    thread_name_prefix="rag-search"
+                )
+            return self._executor
+
+    def close(self):
+        with self._executor_lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+                self._executor = None
+
     def add_text(self, text: str, metadata: Optional[Dict] = None) -> str:
         embedding = embedder.embed(text)
         return vector_store.add_document(text=text, embedding=embedding, metadata=metadata)
 
+    def add_texts(self, texts: List[str], metadatas: Optional[List[Optional[Dict]]] = None) -> List[str]:
+        """
+        Embed ``texts`` in one pass and commit them to the store in one write.
+        """
+        if not texts:
+            return []
+        return vector_store.add_documents(texts, embedder.embed_many(texts), metadatas)
+
     def _matches_filters(self, metadata: Dict, filters: Optional[Dict]) -> bool:
         if not filters:
             return True
@@ -43,33 +100,333 @@ class Retriever:
 
         return True
 
-    def search(self, query: str, top_k: int = 5, filters: Optional[Dict] = None) -> List[Dict]:
-        query_embedding = embedder.embed(query)
-        docs = vector_store.all_documents()
-        filter_user_id = (filters or {}).get("user_id")
-
-        scored = []
-        for doc in docs:
-            metadata = doc.get("metadata", {})
-            if filter_user_id and metadata.get("user_id") != filter_user_id:
-                # Hard guard: user-scoped search never returns docs without matching user_id.
-                continue
-            if not self._matches_filters(metadata, filters):
-                continue
-
-            score = _cosine_similarity(query_embedding, doc.get("embedding", []))
-            if score > 0:
-                scored.append(
-                    {
-                        "id": doc.get("id"),
-                        "text": doc.get("text", ""),
-                        "metadata": metadata,
-                        "score": score,
-                    }
-                )
+    def _filter_rows(
+        self,
+        snapshot: StoreSnapshot,
+        ordinals: np.ndarray,
+        postings: List[np.ndarray],
+        residual: Dict,
+        full_scan: bool
+    ) -> np.ndarray:
+        """
+        Mask of ``ordinals`` that satisfy the filters.
+        """
+        if full_scan:
+            keep = np.ones(snapshot.count, dtype=bool)
+            for posting in postings:
+                member = np.zeros(snapshot.count, dtype=bool)
+                member[posting] = True
+                keep &= member
+        else:
+            keep = np.ones(ordinals.shape[0], dtype=bool)
+            for posting in postings:
+                keep &= contains(posting, ordinals)
+
+        if residual and keep.any():
+            positions = np.flatnonzero(keep)
+            keep[positions] = np.fromiter(
+                (self._matches_filters(metadata, residual) for metadata in snapshot.iter_metadata(ordinals[positions])),
+                dtype=bool,
+                count=positions.shape[0]
+            )
+        return keep
+
+    def _shard_filters(self, snapshot: StoreSnapshot, filters: Optional[Dict]) -> Dict:
+        filters = dict(filters or {})
+        if filters and snapshot.user_id is not None and filters.get("user_id") == snapshot.user_id:
+            # Every row of a user's shard already matches the user filter.
+            del filters["user_id"]
+        return filters
+
+    def _resolve_filters(self, snapshot: StoreSnapshot, filters: Dict):
+        """
+        Posting lists (smallest first) and row-checked filters for a shard;
+        None when some posting is empty and nothing can match.
+        """
+        if not filters or snapshot.metadata_index is None:
+            return [], filters
+        postings, residual = snapshot.metadata_index.resolve(filters, snapshot.count)
+        if postings and not postings[0].shape[0]:
+            return None
+        return postings, residual
+
+    def _top(self, ordinals: np.ndarray, scores: np.ndarray, top_k: int):
+        """
+        The ``top_k`` best positive scores, best first.
+        """
+        if not scores.shape[0]:
+            return ordinals[:0], scores[:0]
+        k = min(top_k, scores.shape[0])
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        top = top[scores[top] > 0]
+        return ordinals[top], scores[top]
+
+    def _vector_ranking(
+        self,
+        snapshot: StoreSnapshot,
+        query_embedding: np.ndarray,
+        top_k: int,
+        filters: Dict,
+        nprobe: Optional[int],
+        exact: bool,
+    ):
+        resolved = self._resolve_filters(snapshot, filters)
+        if resolved is None or snapshot.stale:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        postings, residual = resolved
+
+        # Stored rows are unit length, so the dot product is the cosine similarity.
+        if postings and postings[0].shape[0] <= PREFILTER_SELECTIVITY * snapshot.count:
+            # Selective filter: score only the matching rows, exactly.
+            ordinals = intersect(postings)
+            ordinals = ordinals[snapshot.alive(ordinals)]
+            if residual and ordinals.shape[0]:
+                ordinals = ordinals[self._filter_rows(snapshot, ordinals, [], residual, False)]
+            scores = snapshot.gather(ordinals) @ query_embedding
+        else:
+            candidates = None
+            if not exact and snapshot.index is not None:
+                candidates = snapshot.index.candidates(query_embedding, snapshot.count, nprobe=nprobe)
+
+            approximate = snapshot.quantized
+            if candidates is None:
+                ordinals = np.arange(snapshot.count)
+                scores = snapshot.scores(query_embedding, approximate=approximate)
+                if snapshot.dead is not None:
+                    scores[snapshot.dead[:snapshot.count]] = -np.inf
+            else:
+                ordinals = candidates
+                scores = snapshot.score_rows(candidates, query_embedding, approximate=approximate)
+
+            if postings or residual:
+                keep = self._filter_rows(snapshot, ordinals, postings, residual, candidates is None)
+                if candidates is not None and np.count_nonzero(keep) < top_k:
+                    # The probed lists hold too few matching rows; the
+                    # filter, not the index, is what narrows this query.
+                    return self._vector_ranking(snapshot, query_embedding, top_k, filters, nprobe, True)
+                scores = np.where(keep, scores, -np.inf)
+
+            if approximate:
+                # int8 scores only shortlist; the shortlist is re-scored exactly.
+                ordinals, _ = self._top(ordinals, scores, max(top_k * RERANK_FACTOR, RERANK_MIN))
+                scores = snapshot.gather(ordinals) @ query_embedding
+
+        return self._top(ordinals, scores, top_k)
+
+    def _keyword_ranking(self, snapshot: StoreSnapshot, query: str, top_k: int, filters: Dict):
+        if snapshot.keyword_index is None:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        resolved = self._resolve_filters(snapshot, filters)
+        if resolved is None:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        postings, residual = resolved
+
+        ordinals, scores = snapshot.keyword_index.scores(query, snapshot.count)
+        if ordinals.shape[0] and (postings or residual):
+            keep = self._filter_rows(snapshot, ordinals, postings, residual, False)
+            ordinals, scores = ordinals[keep], scores[keep]
+        return self._top(ordinals, scores, top_k)
+
+    def _rank_snapshot(
+        self,
+        snapshot: StoreSnapshot,
+        query: str,
+        query_embedding: np.ndarray,
+        top_k: int,
+        filters: Optional[Dict],
+        nprobe: Optional[int],
+        exact: bool,
+        hybrid: bool,
+        collapse_duplicates: bool = False,
+    ):
+        """
+        ``(ordinals, scores)`` of the shard's best ``top_k`` rows, best first.
+        """
+        if not snapshot.count:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        filters = self._shard_filters(snapshot, filters)
+        collapse_duplicates = collapse_duplicates and snapshot.dedup_index is not None
+        limit = top_k * COLLAPSE_FACTOR if collapse_duplicates else top_k
+        # Vectors from the previous embedder are not comparable to the
+        # query; until the shard is re-embedded only keywords rank it.
+        hybrid = hybrid or snapshot.stale
+
+        if not hybrid:
+            ordinals, scores = self._vector_ranking(snapshot, query_embedding, limit, filters, nprobe, exact)
+            if collapse_duplicates:
+                keep = collapse(snapshot.dedup_index.groups(ordinals).tolist(), top_k)
+                ordinals, scores = ordinals[keep], scores[keep]
+            return ordinals, scores
+
+        # Reciprocal-rank fusion over deeper lists from both rankers.
+        depth = max(limit * HYBRID_DEPTH_FACTOR, HYBRID_MIN_DEPTH)
+        fused: Dict[int, float] = {}
+        for ordinals, _ in (
+            self._vector_ranking(snapshot, query_embedding, depth, filters, nprobe, exact),
+            self._keyword_ranking(snapshot, query, depth, filters),
+        ):
+            for rank, ordinal in enumerate(ordinals.tolist(), start=1):
+                fused[ordinal] = fused.get(ordinal, 0.0) + 1.0 / (RRF_K + rank)
+
+        best = sorted(fused.items(), key=lambda item: item[1], reverse=True)
+        if collapse_duplicates:
+            groups = snapshot.dedup_index.groups(np.array([ordinal for ordinal, _ in best], dtype=np.int64))
+            best = [best[position] for position in collapse(groups.tolist(), top_k)]
+        best = best[:top_k]
+        return (
+            np.array([ordinal for ordinal, _ in best], dtype=np.int64),
+            np.array([score for _, score in best], dtype=np.float64),
+        )
+
+    def _rerank(self, rankings, top_k: int, options: RerankOptions, query_embedding: np.ndarray) -> List[Dict]:
+        """
+        Re-rank the candidates of every shard together (see ``app.rag.rerank``).
+        """
+        dimension = query_embedding.shape[0]
+        rankings = [ranking for ranking in rankings if ranking[1].shape[0]]
+        if not rankings:
+            return []
+        scores = np.concatenate([scores for _, _, scores in rankings])
+        # Stale shards' vectors count as unrelated to everything for diversity.
+        embeddings = np.concatenate([
+            np.zeros((len(ordinals), dimension), dtype=np.float32) if snapshot.stale else snapshot.gather(ordinals)
+            for snapshot, ordinals, _ in rankings
+        ])
+        metadatas = [
+            metadata
+            for snapshot, ordinals, _ in rankings
+            for metadata in snapshot.iter_metadata(ordinals)
+        ]
+        owners = [(snapshot, ordinal) for snapshot, ordinals, _ in rankings for ordinal in ordinals.tolist()]
+
+        # min_score applies to cosine similarity even when the ranking
+        # scores are fused RRF scores. Stale shards have no comparable
+        # vectors, so their keyword hits are not cut (NaN).
+        similarities = embeddings.astype(np.float64) @ query_embedding.astype(np.float64)
+        stale = np.concatenate([np.full(len(ordinals), snapshot.stale) for snapshot, ordinals, _ in rankings])
+        similarities[stale] = np.nan
+        positions, weighted = rerank_pool(scores, embeddings, metadatas, top_k, options, similarities=similarities)
+        return [
+            owners[position][0].hit(owners[position][1], float(score))
+            for position, score in zip(positions.tolist(), weighted.tolist())
+        ]
+
+    def search(
+        self,
+        query: str,
+        top_k: int = 5,
+        filters: Optional[Dict] = None,
+        nprobe: Optional[int] = None,
+        exact: bool = False,
+        hybrid: bool = False,
+        collapse_duplicates: bool = True,
+        rerank: Optional[RerankOptions] = None,
+    ) -> List[Dict]:
+        """
+        Rank stored chunks by cosine similarity to ``query``.
+
+        A ``user_id`` filter restricts the search to that user's shard.
+        Hard guard: user-scoped search never returns docs without a
+        matching user_id. The store's vector index narrows the rows to
+        score unless ``exact`` is set; ``nprobe`` trades latency for
+        recall on IVF indexes. Selective metadata filters are resolved
+        through the shard's metadata index before any scoring.
+
+        With ``hybrid`` the vector ranking is fused with a BM25 keyword
+        ranking by reciprocal rank, and ``score`` is the fused score.
+
+        With ``collapse_duplicates`` near-duplicate chunks (see
+        ``app.rag.dedup``) count once: only the best of a group is returned.
+
+        ``rerank`` re-orders a deeper candidate pool by recency, role and
+        diversity and drops weak hits (see ``app.rag.rerank``); ``score``
+        is then the weighted score, and results are in re-ranked order.
+
+        Shards still waiting to be re-embedded after an embedding model
+        change are ranked by keywords only, and the rerank ``min_score``
+        (a cosine cutoff) does not apply to their hits.
+
+        Repeated searches (same user, query up to case and whitespace, and
+        options) are answered from the result cache while the searched
+        shards are unchanged.
+        """
+        top_k = max(1, top_k)
+        reranking = rerank is not None and rerank.enabled
+        snapshots = vector_store.snapshots((filters or {}).get("user_id"))
+        if not self.cache.enabled:
+            return self._search(query, snapshots, top_k, filters, nprobe, exact, hybrid, collapse_duplicates, rerank)
+
+        key = (
+            (filters or {}).get("user_id"),
+            normalize_query(query),
+            top_k,
+            json.dumps(filters or {}, sort_keys=True, default=str),
+            nprobe,
+            exact,
+            hybrid,
+            collapse_duplicates,
+            rerank.cache_key if reranking else None,
+        )
+        generation = tuple(snapshot.generation for snapshot in snapshots)
+        results = self.cache.get(key, generation)
+        if results is None:
+            results = self._search(query, snapshots, top_k, filters, nprobe, exact, hybrid, collapse_duplicates, rerank)
+            recency = reranking and rerank.recency_half_life_days is not None
+            self.cache.put(key, generation, results, time.time() + RECENCY_CACHE_SECONDS if recency else None)
+        return results
+
+    def _search(
+        self,
+        query: str,
+        snapshots: List[StoreSnapshot],
+        top_k: int,
+        filters: Optional[Dict],
+        nprobe: Optional[int],
+        exact: bool,
+        hybrid: bool,
+        collapse_duplicates: bool,
+        rerank: Optional[RerankOptions],
+    ) -> List[Dict]:
+        query_embedding = normalize_rows(np.asarray(embedder.embed(query), dtype=np.float32))
+        reranking = rerank is not None and rerank.enabled
+        depth = max(top_k * RERANK_POOL_FACTOR, RERANK_POOL_MIN) if reranking else top_k
+
+        rankings = []
+        for snapshot in snapshots:
+            ordinals, scores = self._rank_snapshot(
+                snapshot,
+                query,
+                query_embedding,
+                depth,
+                filters,
+                nprobe,
+                exact,
+                hybrid,
+                collapse_duplicates
+            )
+            rankings.append((snapshot, ordinals, scores))
+
+        if reranking:
+            return self._rerank(rankings, top_k, rerank, query_embedding)
+
+        results = [
+            snapshot.hit(ordinal, score)
+            for snapshot, ordinals, scores in rankings
+            for ordinal, score in zip(ordinals.tolist(), scores.tolist())
+        ]
+        results.sort(key=lambda x: x["score"], reverse=True)
+        return results[:top_k]
+
+    async def asearch(self, query: str, **options) -> List[Dict]:
+        """
+        ``search`` without blocking the event loop; takes the same options.
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._search_executor(), partial(self.search, query, **options))
 
-        scored.sort(key=lambda x: x["score"], reverse=True)
-        return scored[: max(1, top_k)]
+    def cache_stats(self) -> Dict:
+        return self.cache.stats()
 
 
 retriever = Retriever()
@@ -0,0 +1,585 @@
+"""
+On-disk segment format for the local RAG vector store.
+
+The RAG store root holds one store directory per user under ``shards/``
+(see ``shard_dir_name``). A store directory looks like this:
+
+    manifest.json            list of sealed segments, replaced atomically
+    wal.log                  append-only log of documents not yet sealed
+    index.npz                vector index state (see app.rag.ann)
+    bm25.npz                 keyword index state (see app.rag.bm25)
+    dedup.npz                duplicate fingerprints (see app.rag.dedup)
+    refs.jsonl               reference counts of deduplicated documents
+    tombstones.jsonl         ids of deleted documents not yet compacted away
+    store.lock, generation   cross-process lock and change counter, only
+                             with RAG_MULTIPROCESS (see app.rag.locking)
+    seg-000001.vec           float32 embeddings, one contiguous row-major block
+    seg-000001.meta.jsonl    id / text / metadata sidecar, one line per row
+
+Sealed segments are immutable. A segment only becomes visible once the
+manifest that lists it has been written, so any segment file that is not
+in the manifest is left over from an interrupted seal or compaction and
+can be deleted on load.
+"""
+
+import base64
+import json
+import os
+import tempfile
+from typing import Dict, Iterable, Iterator, List, Optional
+
+import numpy as np
+
+
+MANIFEST_NAME = "manifest.json"
+WAL_NAME = "wal.log"
+INDEX_NAME = "index.npz"
+KEYWORD_INDEX_NAME = "bm25.npz"
+DEDUP_INDEX_NAME = "dedup.npz"
+REFS_NAME = "refs.jsonl"
+RENEWALS_NAME = "renewals.jsonl"
+TOMBSTONES_NAME = "tombstones.jsonl"
+LOCK_NAME = "store.lock"
+GENERATION_NAME = "generation"
+SEGMENT_PREFIX = "seg-"
+VECTORS_SUFFIX = ".vec"
+META_SUFFIX = ".meta.jsonl"
+CODES_SUFFIX = ".q8"
+FORMAT_VERSION = 1
+SHARDS_DIR = "shards"
+CHECKPOINTS_DIR = "checkpoints"
+SHARED_SHARD = "_shared"
+USER_SHARD_PREFIX = "u-"
+VECTOR_DTYPE = np.dtype("<f4")
+
+
+def _fsync(handle):
+    handle.flush()
+    os.fsync(handle.fileno())
+
+
+def write_json_atomic(path: str, payload: Dict):
+    directory = os.path.dirname(path)
+    with tempfile.NamedTemporaryFile(
+        "w",
+        encoding="utf-8",
+        dir=directory,
+        suffix=".tmp",
+        delete=False
+    ) as temp_file:
+        json.dump(payload, temp_file, ensure_ascii=False)
+        _fsync(temp_file)
+        temp_name = temp_file.name
+
+    os.replace(temp_name, path)
+
+
+def pack_embedding(embedding) -> str:
+    """
+    Encode an embedding as base64 little-endian float32.
+    """
+    return base64.b64encode(np.asarray(embedding, dtype=VECTOR_DTYPE).tobytes()).decode("ascii")
+
+
+def unpack_embedding(encoded: str) -> np.ndarray:
+    return np.frombuffer(base64.b64decode(encoded), dtype=VECTOR_DTYPE).astype(np.float32)
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    """
+    L2-normalize each row so a dot product is a cosine similarity.
+    All-zero rows are left as zeros.
+    """
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return np.divide(matrix, norms, out=np.zeros_like(matrix), where=norms > 0)
+
+
+def quantize_rows(matrix: np.ndarray):
+    """
+    Symmetric int8 scalar quantization with one scale per row:
+    ``row ~= codes * scale``. Returns ``(codes, scales)``.
+    """
+    matrix = np.asarray(matrix, dtype=np.float32)
+    peaks = np.abs(matrix).max(axis=1) if matrix.shape[1] else np.zeros(matrix.shape[0], dtype=np.float32)
+    scales = (peaks / 127.0).astype(np.float32)
+    safe = np.where(scales > 0, scales, 1.0)[:, np.newaxis]
+    codes = np.clip(np.rint(matrix / safe), -127, 127).astype(np.int8)
+    return codes, scales
+
+
+def shard_dir_name(user_id: Optional[str]) -> str:
+    """
+    Directory name for a user's shard. User ids are hex-encoded so any id
+    is a valid, case-insensitive-safe file name and can be decoded back.
+    Documents without a user id live in the shared shard.
+    """
+    if not user_id:
+        return SHARED_SHARD
+    return USER_SHARD_PREFIX + str(user_id).encode("utf-8").hex()
+
+
+def shard_user_id(dir_name: str) -> Optional[str]:
+    if dir_name == SHARED_SHARD:
+        return None
+    if not dir_name.startswith(USER_SHARD_PREFIX):
+        raise ValueError(f"Not a shard directory: {dir_name}")
+    return bytes.fromhex(dir_name[len(USER_SHARD_PREFIX):]).decode("utf-8")
+
+
+class Manifest:
+    """
+    Ordered list of sealed segments plus store-wide format info.
+    """
+
+    def __init__(
+        self,
+        dimension: Optional[int] = None,
+        segments: Optional[List[Dict]] = None,
+        next_segment: int = 1,
+        embedding_version: Optional[str] = None
+    ):
+        self.dimension = dimension
+        self.segments = segments or []
+        self.next_segment = next_segment
+        # Embedder that produced the vectors; None for stores written
+        # before embeddings were versioned.
+        self.embedding_version = embedding_version
+
+    @classmethod
+    def load(cls, path: str) -> Optional["Manifest"]:
+        if not os.path.exists(path):
+            return None
+
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+
+        return cls(
+            dimension=data.get("dimension"),
+            segments=list(data.get("segments", [])),
+            next_segment=int(data.get("next_segment", 1)),
+            embedding_version=data.get("embedding_version"),
+        )
+
+    def save(self, path: str):
+        write_json_atomic(
+            path,
+            {
+                "format": FORMAT_VERSION,
+                "dimension": self.dimension,
+                "next_segment": self.next_segment,
+                "embedding_version": self.embedding_version,
+                "segments": self.segments,
+            }
+        )
+
+    def allocate_name(self) -> str:
+        name = f"{SEGMENT_PREFIX}{self.next_segment:06d}"
+        self.next_segment += 1
+        return name
+
+    def segment_names(self) -> List[str]:
+        return [segment["name"] for segment in self.segments]
+
+
+class VectorBlock:
+    """
+    Rows of one sealed segment (or of the unsealed tail) in search order.
+
+    ``embeddings`` is an ``(n, dimension)`` float32 matrix; for sealed
+    segments it is a read-only memory map of the ``.vec`` file. Quantized
+    segments also map int8 ``codes`` with per-row ``scales``.
+    """
+
+    __slots__ = ("ids", "texts", "metadatas", "embeddings", "codes", "scales")
+
+    def __init__(
+        self,
+        ids: List[str],
+        texts: List[str],
+        metadatas: List[Dict],
+        embeddings: np.ndarray,
+        codes: Optional[np.ndarray] = None,
+        scales: Optional[np.ndarray] = None
+    ):
+        self.ids = ids
+        self.texts = texts
+        self.metadatas = metadatas
+        self.embeddings = embeddings
+        self.codes = codes
+        self.scales = scales
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def select(self, rows: np.ndarray) -> "VectorBlock":
+        """
+        A block holding only ``rows`` (sorted positions), without codes.
+        """
+        positions = rows.tolist()
+        return VectorBlock(
+            [self.ids[row] for row in positions],
+            [self.texts[row] for row in positions],
+            [self.metadatas[row] for row in positions],
+            self.embeddings[rows]
+        )
+
+    def document(self, row: int) -> Dict:
+        return {
+            "id": self.ids[row],
+            "text": self.texts[row],
+            "embedding": self.embeddings[row].tolist(),
+            "metadata": self.metadatas[row],
+        }
+
+
+class Segment:
+    """
+    Immutable sealed segment: a float32 embedding block plus its sidecar,
+    and optionally an int8 copy of the block for approximate scoring.
+    """
+
+    def __init__(self, directory: str, name: str, count: int):
+        self.directory = directory
+        self.name = name
+        self.count = count
+
+    @property
+    def vectors_path(self) -> str:
+        return os.path.join(self.directory, self.name + VECTORS_SUFFIX)
+
+    @property
+    def meta_path(self) -> str:
+        return os.path.join(self.directory, self.name + META_SUFFIX)
+
+    @property
+    def codes_path(self) -> str:
+        return os.path.join(self.directory, self.name + CODES_SUFFIX)
+
+    def files(self) -> List[str]:
+        return [path for path in (self.vectors_path, self.meta_path, self.codes_path) if os.path.exists(path)]
+
+    def write_codes(self, blocks: List[VectorBlock], chunk: int = 65536):
+        """
+        Write the int8 codes (rows in order, then one float32 scale per
+        row) for ``blocks``, which must hold this segment's rows.
+        """
+        codes_temp = self.codes_path + ".tmp"
+        scales = []
+        with open(codes_temp, "wb") as f:
+            for block in blocks:
+                for start in range(0, len(block), chunk):
+                    codes, block_scales = quantize_rows(block.embeddings[start:start + chunk])
+                    f.write(codes.tobytes())
+                    scales.append(block_scales)
+            if scales:
+                f.write(np.concatenate(scales).astype(VECTOR_DTYPE).tobytes())
+            _fsync(f)
+        os.replace(codes_temp, self.codes_path)
+
+    @classmethod
+    def write(cls, directory: str, name: str, blocks: List[VectorBlock], quantize: bool = False) -> "Segment":
+        """
+        Stream blocks into temp files, fsync them and move them into place.
+        """
+        segment = cls(directory, name, sum(len(block) for block in blocks))
+        vectors_temp = segment.vectors_path + ".tmp"
+        meta_temp = segment.meta_path + ".tmp"
+
+        with open(vectors_temp, "wb") as f:
+            for block in blocks:
+                f.write(np.ascontiguousarray(block.embeddings, dtype=VECTOR_DTYPE).tobytes())
+            _fsync(f)
+
+        with open(meta_temp, "w", encoding="utf-8") as f:
+            for block in blocks:
+                for doc_id, text, metadata in zip(block.ids, block.texts, block.metadatas):
+                    f.write(
+                        json.dumps(
+                            {"id": doc_id, "text": text, "metadata": metadata or {}},
+                            ensure_ascii=False
+                        )
+                    )
+                    f.write("\n")
+            _fsync(f)
+
+        if quantize:
+            segment.write_codes(blocks)
+        os.replace(vectors_temp, segment.vectors_path)
+        os.replace(meta_temp, segment.meta_path)
+        return segment
+
+    def load(self, dimension: int) -> VectorBlock:
+        """
+        Memory-map the embeddings (and codes, if written) and read the
+        sidecar into memory.
+        """
+        codes = scales = None
+        if self.count == 0:
+            embeddings = np.zeros((0, dimension), dtype=np.float32)
+        else:
+            embeddings = np.memmap(
+                self.vectors_path,
+                dtype=VECTOR_DTYPE,
+                mode="r",
+                shape=(self.count, dimension)
+            )
+            if os.path.exists(self.codes_path):
+                codes = np.memmap(self.codes_path, dtype=np.int8, mode="r", shape=(self.count, dimension))
+                scales = np.memmap(
+                    self.codes_path,
+                    dtype=VECTOR_DTYPE,
+                    mode="r",
+                    offset=self.count * dimension,
+                    shape=(self.count,)
+                )
+
+        ids, texts, metadatas = [], [], []
+        with open(self.meta_path, "r", encoding="utf-8") as f:
+            for line in f:
+                if len(ids) >= self.count:
+                    break
+                entry = json.loads(line)
+                ids.append(entry["id"])
+                texts.append(entry.get("text", ""))
+                metadatas.append(entry.get("metadata") or {})
+
+        if len(ids) != self.count:
+            raise ValueError(f"Segment {self.name} is truncated")
+
+        return VectorBlock(ids, texts, metadatas, embeddings, codes, scales)
+
+    def remove(self):
+        for path in (self.vectors_path, self.meta_path, self.codes_path):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            except PermissionError:
+                # Windows refuses to delete a file that is still memory-mapped;
+                # the next load removes it as an orphan.
+                pass
+
+
+class WriteAheadLog:
+    """
+    Append-only JSON-lines log of documents that are not yet sealed.
+    """
+
+    def __init__(self, path: str, fsync: bool = False):
+        self.path = path
+        self.fsync = fsync
+        self._handle = None
+
+    def replay(self, start: int = 0) -> List[Dict]:
+        """
+        Read every complete record from byte offset ``start`` on. A torn
+        trailing write from a crash is cut off so later appends start on a
+        clean line.
+        """
+        if not os.path.exists(self.path):
+            return []
+
+        records = []
+        valid_bytes = start
+        with open(self.path, "rb") as f:
+            f.seek(start)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    entry = json.loads(line)
+                    records.append(
+                        {
+                            "id": entry["id"],
+                            "text": entry.get("text", ""),
+                            "embedding": unpack_embedding(entry["embedding"]),
+                            "metadata": entry.get("metadata") or {},
+                        }
+                    )
+                except (ValueError, KeyError, TypeError):
+                    break
+                valid_bytes += len(line)
+
+        if valid_bytes != os.path.getsize(self.path):
+            with open(self.path, "r+b") as f:
+                f.truncate(valid_bytes)
+
+        return records
+
+    def size(self) -> int:
+        return os.path.getsize(self.path) if os.path.exists(self.path) else 0
+
+    def _open(self):
+        if self._handle is None:
+            self._handle = open(self.path, "a", encoding="utf-8")
+        return self._handle
+
+    def append(self, records: Iterable[Dict]):
+        handle = self._open()
+        for record in records:
+            handle.write(
+                json.dumps(
+                    {
+                        "id": record["id"],
+                        "text": record["text"],
+                        "embedding": pack_embedding(record["embedding"]),
+                        "metadata": record.get("metadata") or {},
+                    },
+                    ensure_ascii=False
+                )
+            )
+            handle.write("\n")
+
+        if self.fsync:
+            _fsync(handle)
+        else:
+            handle.flush()
+
+    def rewrite(self, records: List[Dict]):
+        """
+        Replace the log contents, e.g. after a seal or recovery.
+        """
+        self.close()
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8"):
+            pass
+        os.replace(temp_path, self.path)
+        if records:
+            self.append(records)
+
+    def close(self):
+        if self._handle is not None:
+            self._handle.close()
+            self._handle = None
+
+
+class _JsonLinesLog:
+    """
+    Append-only JSON-lines file; a torn last line is ignored on read.
+    """
+
+    def __init__(self, path: str, fsync: bool = False):
+        self.path = path
+        self.fsync = fsync
+        self._handle = None
+
+    def _entries(self) -> Iterator[Dict]:
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "rb") as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    break
+
+    def _append(self, entries: Iterable[Dict]):
+        if self._handle is None:
+            self._handle = open(self.path, "a", encoding="utf-8")
+        for entry in entries:
+            self._handle.write(json.dumps(entry) + "\n")
+        if self.fsync:
+            _fsync(self._handle)
+        else:
+            self._handle.flush()
+
+    def _rewrite(self, entries: Iterable[Dict]):
+        self.close()
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            for entry in entries:
+                f.write(json.dumps(entry) + "\n")
+            _fsync(f)
+        os.replace(temp_path, self.path)
+
+    def close(self):
+        if self._handle is not None:
+            self._handle.close()
+            self._handle = None
+
+
+class RefCountLog(_JsonLinesLog):
+    """
+    Reference counts for documents that deduplicated ingests point at.
+    The last line for an id wins.
+    """
+
+    def load(self) -> Dict[str, int]:
+        counts: Dict[str, int] = {}
+        for entry in self._entries():
+            try:
+                counts[entry["id"]] = int(entry["refs"])
+            except (KeyError, TypeError, ValueError):
+                break
+        return {doc_id: refs for doc_id, refs in counts.items() if refs > 1}
+
+    def append(self, counts: Dict[str, int]):
+        self._append({"id": doc_id, "refs": refs} for doc_id, refs in counts.items())
+
+    def rewrite(self, counts: Dict[str, int]):
+        """
+        Replace the log with one line per id.
+        """
+        self._rewrite({"id": doc_id, "refs": refs} for doc_id, refs in counts.items())
+
+
+class RenewalLog(_JsonLinesLog):
+    """
+    ``created_at`` and ``expires_at`` of documents that a later identical
+    ingest renewed; they override the segment metadata for retention.
+    The last line for an id wins.
+    """
+
+    def load(self) -> Dict[str, Dict]:
+        lifetimes: Dict[str, Dict] = {}
+        for entry in self._entries():
+            try:
+                lifetimes[entry["id"]] = {"created_at": entry["created_at"], "expires_at": entry["expires_at"]}
+            except (KeyError, TypeError):
+                break
+        return lifetimes
+
+    def append(self, lifetimes: Dict[str, Dict]):
+        self._append(dict(lifetime, id=doc_id) for doc_id, lifetime in lifetimes.items())
+
+    def rewrite(self, lifetimes: Dict[str, Dict]):
+        """
+        Replace the log with one line per id.
+        """
+        self._rewrite(dict(lifetime, id=doc_id) for doc_id, lifetime in lifetimes.items())
+
+
+class TombstoneLog(_JsonLinesLog):
+    """
+    Ids of deleted documents whose rows are still in a segment or the WAL.
+    Compaction rewrites it once the rows are gone.
+    """
+
+    def load(self) -> List[str]:
+        return [entry["id"] for entry in self._entries() if isinstance(entry, dict) and "id" in entry]
+
+    def append(self, doc_ids: Iterable[str]):
+        self._append({"id": doc_id} for doc_id in doc_ids)
+
+    def rewrite(self, doc_ids: Iterable[str]):
+        self._rewrite({"id": doc_id} for doc_id in doc_ids)
+
+
+def remove_orphans(directory: str, live_names: Iterable[str]):
+    """
+    Delete segment and temp files that no manifest refers to.
+    """
+    live = set(live_names)
+    for entry in os.listdir(directory):
+        path = os.path.join(directory, entry)
+        if entry.endswith(".tmp"):
+            os.remove(path)
+            continue
+        if not entry.startswith(SEGMENT_PREFIX):
+            continue
+        name = entry.split(".", 1)[0]
+        if name not in live:
+            os.remove(path)
@@ -1,52 +1,591 @@
-import json
+import itertools
 import os
-import tempfile
+import shutil
 import threading
+import time
 import uuid
-from typing import Dict, List, Optional
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence
 
-from app.config.settings import DATA_DIR
+import numpy as np
+
+from app.config.paths import RAG_STORE_DIR, RAG_STORE_FILE
+from app.config.settings import settings
+from app.rag.arrays import grow
+from app.rag.ann import IVFIndex, VectorIndex, create_index
+from app.rag.bm25 import BM25Index
+from app.rag.dedup import POLICIES, DedupIndex, content_key
+from app.rag.embeddings import LEGACY_EMBEDDING_VERSION, Embedder, embedder
+from app.rag.locking import GenerationCounter, StoreFileLock
+from app.rag.metadata_index import MetadataIndex
+from app.rag.migrate import migrate_store_root
+from app.rag.retention import RetentionPolicy, expired_ordinals, renewed_lifetime
+from app.rag.segments import (
+    DEDUP_INDEX_NAME,
+    CHECKPOINTS_DIR,
+    GENERATION_NAME,
+    INDEX_NAME,
+    KEYWORD_INDEX_NAME,
+    LOCK_NAME,
+    MANIFEST_NAME,
+    REFS_NAME,
+    RENEWALS_NAME,
+    SHARDS_DIR,
+    TOMBSTONES_NAME,
+    WAL_NAME,
+    Manifest,
+    RefCountLog,
+    RenewalLog,
+    Segment,
+    TombstoneLog,
+    VectorBlock,
+    WriteAheadLog,
+    normalize_rows,
+    remove_orphans,
+    shard_dir_name,
+    shard_user_id,
+)
+
+
+# Numbers every snapshot of every shard in this process.
+_SNAPSHOT_GENERATIONS = itertools.count(1)
+
+# Sealed segments a store keeps before maintenance merges them.
+MAX_SEGMENTS = 8
+
+
+def _file_stamp(path: str) -> Optional[tuple]:
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+
+def _link_or_copy(source: str, target: str):
+    # Sealed files never change, so a hard link is as good as a copy.
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copy2(source, target)
+
+
+class _TailBuffer:
+    """
+    Growable float32 matrix holding the rows that are only in the WAL.
+    """
+
+    def __init__(self, dimension: int, capacity: int = 64):
+        self.ids: List[str] = []
+        self.texts: List[str] = []
+        self.metadatas: List[Dict] = []
+        self._matrix = np.zeros((capacity, dimension), dtype=np.float32)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def append(self, doc_id: str, text: str, metadata: Dict, embedding: np.ndarray):
+        row = len(self.ids)
+        if row == self._matrix.shape[0]:
+            # Readers may still hold a view of the old matrix, so grow into a
+            # new array instead of resizing in place.
+            grown = np.zeros((row * 2, self._matrix.shape[1]), dtype=np.float32)
+            grown[:row] = self._matrix[:row]
+            self._matrix = grown
+
+        self._matrix[row] = embedding
+        self.ids.append(doc_id)
+        self.texts.append(text)
+        self.metadatas.append(metadata)
+
+    def block(self) -> VectorBlock:
+        count = len(self.ids)
+        return VectorBlock(
+            self.ids[:count],
+            self.texts[:count],
+            self.metadatas[:count],
+            self._matrix[:count]
+        )
+
+
+class StoreSnapshot:
+    """
+    Rows of the store at one point in time, addressed by ordinal
+    (position across ``blocks`` in order), plus the indexes to search them.
+    """
+
+    def __init__(
+        self,
+        blocks: List[VectorBlock],
+        index: Optional[VectorIndex],
+        user_id: Optional[str] = None,
+        metadata_index: Optional[MetadataIndex] = None,
+        keyword_index: Optional[BM25Index] = None,
+        dedup_index: Optional[DedupIndex] = None,
+        dead: Optional[np.ndarray] = None,
+        stale: bool = False,
+        embedding_version: Optional[str] = None
+    ):
+        self.blocks = blocks
+        self.index = index
+        self.metadata_index = metadata_index
+        self.keyword_index = keyword_index
+        self.dedup_index = dedup_index
+        # Set when every row belongs to this user (a per-user shard).
+        self.user_id = user_id
+        self.offsets = np.cumsum([0] + [len(block) for block in blocks])
+        self.count = int(self.offsets[-1])
+        # Tombstone mask over the ordinals, or None when nothing is deleted.
+        self.dead = dead
+        # Set while the rows are from another embedder than the queries;
+        # vector scores are meaningless until the store is re-embedded.
+        self.stale = stale
+        self.embedding_version = embedding_version
+        # Unique per snapshot, so results cached against it go stale with
+        # any later write (see ``app.rag.query_cache``).
+        self.generation = next(_SNAPSHOT_GENERATIONS)
+
+    @property
+    def live_count(self) -> int:
+        if self.dead is None:
+            return self.count
+        return self.count - int(np.count_nonzero(self.dead[:self.count]))
+
+    def alive(self, ordinals: np.ndarray) -> np.ndarray:
+        """
+        Mask of ``ordinals`` that are not deleted.
+        """
+        if self.dead is None:
+            return np.ones(ordinals.shape[0], dtype=bool)
+        return ~self.dead[ordinals]
+
+    def locate(self, ordinal: int):
+        block_index = int(np.searchsorted(self.offsets, ordinal, side="right")) - 1
+        return self.blocks[block_index], int(ordinal - self.offsets[block_index])
+
+    @property
+    def quantized(self) -> bool:
+        return any(block.codes is not None for block in self.blocks)
+
+    def scores(self, query: np.ndarray, approximate: bool = False, chunk: int = 65536) -> np.ndarray:
+        """
+        Dot product of ``query`` with every row. With ``approximate``, rows
+        of quantized blocks are scored from their int8 codes instead.
+        """
+        if not self.count:
+            return np.zeros(0, dtype=np.float32)
+        parts = []
+        for block in self.blocks:
+            if not approximate or block.codes is None:
+                parts.append(block.embeddings @ query)
+                continue
+            for start in range(0, len(block), chunk):
+                stop = start + chunk
+                # einsum avoids the slow mixed int8/float32 matmul path.
+                parts.append(np.einsum("ij,j->i", block.codes[start:stop], query) * block.scales[start:stop])
+        return np.concatenate(parts).astype(np.float32, copy=False)
+
+    def score_rows(self, ordinals: np.ndarray, query: np.ndarray, approximate: bool = False) -> np.ndarray:
+        """
+        Dot product of ``query`` with the rows at ``ordinals``.
+        """
+        if not approximate:
+            return self.gather(ordinals) @ query
+        scores = np.empty(len(ordinals), dtype=np.float32)
+        block_ids = np.searchsorted(self.offsets, ordinals, side="right") - 1
+        for block_index in np.unique(block_ids):
+            positions = np.flatnonzero(block_ids == block_index)
+            local = ordinals[positions] - self.offsets[block_index]
+            block = self.blocks[block_index]
+            if block.codes is None:
+                scores[positions] = block.embeddings[local] @ query
+            else:
+                scores[positions] = np.einsum("ij,j->i", block.codes[local], query) * block.scales[local]
+        return scores
+
+    def gather(self, ordinals: np.ndarray) -> np.ndarray:
+        """
+        Embedding rows for ``ordinals``, in the given order.
+        """
+        dimension = self.blocks[0].embeddings.shape[1] if self.blocks else 0
+        rows = np.empty((len(ordinals), dimension), dtype=np.float32)
+        block_ids = np.searchsorted(self.offsets, ordinals, side="right") - 1
+        for block_index in np.unique(block_ids):
+            positions = np.flatnonzero(block_ids == block_index)
+            local = ordinals[positions] - self.offsets[block_index]
+            rows[positions] = self.blocks[block_index].embeddings[local]
+        return rows
+
+    def iter_metadata(self, ordinals: np.ndarray):
+        offsets = self.offsets.tolist()
+        block_ids = (np.searchsorted(self.offsets, ordinals, side="right") - 1).tolist()
+        for ordinal, block_index in zip(ordinals.tolist(), block_ids):
+            yield self.blocks[block_index].metadatas[ordinal - offsets[block_index]]
+
+    def hit(self, ordinal: int, score: float) -> Dict:
+        block, row = self.locate(ordinal)
+        return {
+            "id": block.ids[row],
+            "text": block.texts[row],
+            "metadata": block.metadatas[row],
+            "score": score,
+        }
 
 
 class LocalVectorStore:
     """
-    File-backed vector store for local RAG.
+    Segment-backed vector store for local RAG; one per user shard.
+
+    New documents are appended to a write-ahead log. Once the log holds
+    ``seal_threshold`` documents it is sealed into an immutable segment,
+    and sealed segments are merged in the background once there are more
+    than ``max_segments`` of them.
+
+    Embeddings are L2-normalized on insert, so a dot product against the
+    matrices returned by ``blocks()`` is a cosine similarity.
+
+    With ``quantization="int8"`` sealed segments also carry int8 codes;
+    searches scan those and re-rank the best rows at full precision, so
+    mostly the quarter-size codes stay resident.
+
+    Ingests whose content matches a stored chunk are not stored again:
+    with ``dedup="refcount"`` the stored chunk's reference count goes up,
+    with ``"drop"`` the ingest is ignored; either way the existing id is
+    returned and the chunk's lifetime is renewed for retention. Deleting a
+    refcounted chunk drops one reference. Near duplicates are stored but
+    grouped for search.
+
+    Readers never lock: every write publishes a new immutable
+    ``StoreSnapshot`` with one reference assignment, and ``snapshot()``
+    just returns the current one. Superseded snapshots are freed once the
+    last search holding them drops its reference.
+
+    With ``multiprocess`` several worker processes can open the same
+    directory: writes hold a cross-process file lock and bump a shared
+    generation counter, and a worker that sees the counter move loads only
+    the new segments and log records (everything, after another worker's
+    compaction). Sealed segments are memory-mapped, so the workers share
+    one copy of them in the page cache.
+
+    ``delete`` and ``apply_retention`` only tombstone rows: they vanish
+    from searches at once, and compaction rewrites the segments without
+    them later.
+
+    Rows are also fed to a pluggable ``VectorIndex`` (IVF by default) that
+    is persisted next to the segments and (re)trained in the background,
+    to a persisted ``BM25Index`` over the texts, and to an in-memory
+    ``MetadataIndex`` rebuilt from the sidecars on load.
+
+    With an ``embedder`` the manifest records which embedding version
+    wrote the vectors. After a model change the store is stale: searches
+    fall back to keywords, and ``maintain`` re-embeds every live text
+    with the new model (ids are kept) in the background.
     """
 
-    def __init__(self, store_path: Optional[str] = None):
-        self.store_path = store_path or os.path.join(DATA_DIR, "rag_store.json")
-        self._lock = threading.Lock()
-        self._data = {"documents": []}
-        self._load()
+    def __init__(
+        self,
+        store_path: str,
+        user_id: Optional[str] = None,
+        seal_threshold: int = 1024,
+        max_segments: int = MAX_SEGMENTS,
+        fsync: bool = False,
+        index_kind: Optional[str] = None,
+        index_options: Optional[Dict] = None,
+        quantization: Optional[str] = None,
+        dedup: Optional[str] = None,
+        near_duplicate_bits: Optional[int] = None,
+        multiprocess: Optional[bool] = None,
+        embedder: Optional[Embedder] = None,
+    ):
+        self.store_path = store_path
+        self.user_id = user_id
+        self.embedder = embedder
+        self.seal_threshold = max(1, seal_threshold)
+        self.max_segments = max(1, max_segments)
+        self.index_kind = index_kind or settings.RAG_INDEX
+        if index_options is None and self.index_kind == IVFIndex.kind:
+            index_options = {
+                "nprobe": settings.RAG_IVF_NPROBE,
+                "min_train_size": settings.RAG_IVF_MIN_TRAIN_SIZE,
+            }
+        self.index_options = index_options or {}
+        quantization = (quantization or settings.RAG_QUANTIZATION).lower()
+        if quantization not in ("none", "int8"):
+            raise ValueError(f"Unsupported quantization: {quantization}")
+        self.quantize = quantization == "int8"
+        self.dedup = (dedup or settings.RAG_DEDUP).lower()
+        if self.dedup not in POLICIES:
+            raise ValueError(f"Unsupported dedup policy: {self.dedup}")
+        self.near_duplicate_bits = (
+            settings.RAG_NEAR_DUP_BITS if near_duplicate_bits is None else near_duplicate_bits
+        )
 
-    def _load(self):
-        os.makedirs(os.path.dirname(self.store_path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._compaction_lock = threading.Lock()
+        self._maintenance_thread: Optional[threading.Thread] = None
+        self._closed = False
+        self._epoch = 0
+        self._manifest = Manifest()
+        self._sealed: List[VectorBlock] = []
+        self._tail: Optional[_TailBuffer] = None
+        self._index: Optional[VectorIndex] = None
+        self._metadata_index = MetadataIndex()
+        self._keywords = BM25Index()
+        self._dedup_index = DedupIndex(self.near_duplicate_bits)
+        self._refs: Dict[str, int] = {}
+        self._lifetimes: Dict[str, Dict] = {}
+        self._dead = np.zeros(0, dtype=bool)
+        self._deleted = 0
+        self._text_bytes = 0
+        self._published = StoreSnapshot([], None, user_id)
+        self._wal = WriteAheadLog(os.path.join(self.store_path, WAL_NAME), fsync=fsync)
+        self._refs_log = RefCountLog(os.path.join(self.store_path, REFS_NAME), fsync=fsync)
+        self._renewals = RenewalLog(os.path.join(self.store_path, RENEWALS_NAME), fsync=fsync)
+        self._tombstones = TombstoneLog(os.path.join(self.store_path, TOMBSTONES_NAME), fsync=fsync)
 
-        if not os.path.exists(self.store_path):
-            self._flush()
+        self.multiprocess = settings.RAG_MULTIPROCESS if multiprocess is None else multiprocess
+        self._file_lock: Optional[StoreFileLock] = None
+        self._generation_counter: Optional[GenerationCounter] = None
+        self._generation = 0
+        self._wal_bytes = 0
+        self._log_stamps: Dict[str, Optional[tuple]] = {}
+        if not self.multiprocess:
+            self._load()
             return
 
-        with open(self.store_path, "r", encoding="utf-8") as f:
-            self._data = json.load(f)
+        os.makedirs(self.store_path, exist_ok=True)
+        self._file_lock = StoreFileLock(os.path.join(self.store_path, LOCK_NAME))
+        with self._file_lock:
+            self._generation_counter = GenerationCounter(os.path.join(self.store_path, GENERATION_NAME))
+            self._load()
+            self._generation = self._generation_counter.read()
+            self._record_files()
 
-        if "documents" not in self._data:
-            self._data = {"documents": []}
-            self._flush()
+    @property
+    def _manifest_path(self) -> str:
+        return os.path.join(self.store_path, MANIFEST_NAME)
 
-    def _flush(self):
-        directory = os.path.dirname(self.store_path)
-        os.makedirs(directory, exist_ok=True)
+    @property
+    def _index_path(self) -> str:
+        return os.path.join(self.store_path, INDEX_NAME)
+
+    @property
+    def _keywords_path(self) -> str:
+        return os.path.join(self.store_path, KEYWORD_INDEX_NAME)
+
+    @property
+    def _dedup_path(self) -> str:
+        return os.path.join(self.store_path, DEDUP_INDEX_NAME)
+
+    @property
+    def dimension(self) -> Optional[int]:
+        return self._manifest.dimension
+
+    @property
+    def embedding_version(self) -> Optional[str]:
+        return self.embedder.version if self.embedder is not None else None
+
+    @property
+    def stale(self) -> bool:
+        """
+        Whether the stored vectors come from another embedder than the
+        current one and need ``reembed``.
+        """
+        return self.embedder is not None and self._vectors_version(self._manifest) != self.embedding_version
+
+    @staticmethod
+    def _vectors_version(manifest: Manifest) -> Optional[str]:
+        if manifest.embedding_version is None and manifest.dimension is not None:
+            # Written before embedding versions were recorded.
+            return LEGACY_EMBEDDING_VERSION
+        return manifest.embedding_version
+
+    def _segment(self, entry: Dict) -> Segment:
+        return Segment(self.store_path, entry["name"], entry["count"])
 
-        with tempfile.NamedTemporaryFile(
-            "w",
-            encoding="utf-8",
-            dir=directory,
-            delete=False
-        ) as temp_file:
-            json.dump(self._data, temp_file, ensure_ascii=False, indent=2)
-            temp_name = temp_file.name
+    def _load(self, remove_stale: bool = True):
+        os.makedirs(self.store_path, exist_ok=True)
 
-        os.replace(temp_name, self.store_path)
+        manifest = Manifest.load(self._manifest_path)
+        if manifest is None:
+            manifest = Manifest(embedding_version=self.embedding_version)
+            manifest.save(self._manifest_path)
+        elif (
+            self.embedder is not None
+            and self._vectors_version(manifest) != self.embedding_version
+            and not manifest.segments
+            and not self._wal.size()
+        ):
+            # Nothing to re-embed: the next rows set the dimension.
+            manifest.dimension = None
+            manifest.embedding_version = self.embedding_version
+            manifest.save(self._manifest_path)
+
+        self._manifest = manifest
+        if remove_stale:
+            remove_orphans(self.store_path, manifest.segment_names())
+
+        self._sealed = []
+        for entry in manifest.segments:
+            segment = self._segment(entry)
+            block = segment.load(manifest.dimension)
+            if self.quantize and block.codes is None and len(block):
+                # Segments sealed before quantization was enabled.
+                segment.write_codes([block])
+                block = segment.load(manifest.dimension)
+            self._sealed.append(block)
+
+        # A crash between writing the manifest and truncating the log
+        # leaves already-sealed documents in the log; drop them here.
+        sealed_ids = {doc_id for block in self._sealed for doc_id in block.ids}
+        replayed = self._wal.replay()
+        pending = [record for record in replayed if record["id"] not in sealed_ids]
+        if len(pending) != len(replayed):
+            self._wal.rewrite(pending)
+
+        if pending and self._manifest.dimension is None:
+            self._manifest.dimension = len(pending[0]["embedding"])
+            self._manifest.save(self._manifest_path)
+
+        self._tail = _TailBuffer(self._manifest.dimension) if self._manifest.dimension else None
+        for record in pending:
+            self._tail.append(record["id"], record["text"], record["metadata"], record["embedding"])
+
+        blocks = self._snapshot_locked().blocks
+        self._text_bytes = sum(len(text) for block in blocks for text in block.texts)
+        for block in blocks:
+            self._metadata_index.add(block.metadatas)
+        self._keywords = self._load_row_index(
+            BM25Index,
+            self._keywords_path,
+            blocks,
+            lambda index, block, start: index.add(block.texts[start:])
+        )
+        self._dedup_index = self._load_row_index(
+            lambda: DedupIndex(self.near_duplicate_bits),
+            self._dedup_path,
+            blocks,
+            lambda index, block, start: index.add(block.texts[start:], block.metadatas[start:])
+        )
+        self._refs = self._refs_log.load()
+        self._lifetimes = self._renewals.load()
+        if self._manifest.dimension:
+            self._load_index()
+
+        count = sum(len(block) for block in blocks)
+        self._dead = np.zeros(count, dtype=bool)
+        self._deleted = 0
+        tombstoned = set(self._tombstones.load())
+        if tombstoned:
+            self._remove_rows_locked(self._ordinals_of(blocks, tombstoned))
+        self._publish_locked()
+
+    @staticmethod
+    def _ordinals_of(blocks: List[VectorBlock], doc_ids) -> np.ndarray:
+        ids = (doc_id for block in blocks for doc_id in block.ids)
+        return np.fromiter((ordinal for ordinal, doc_id in enumerate(ids) if doc_id in doc_ids), dtype=np.int64)
+
+    def _load_row_index(self, factory, path: str, blocks: List[VectorBlock], feed):
+        """
+        Restore a persisted per-row index and feed it the rows written after
+        it was saved. A missing, foreign or stale file is rebuilt.
+        """
+        index = factory()
+        count = sum(len(block) for block in blocks)
+        loaded = False
+        if os.path.exists(path):
+            try:
+                loaded = index.load(path) and len(index) <= count
+            except (OSError, ValueError, KeyError):
+                loaded = False
+        if not loaded:
+            index = factory()
+
+        skip = len(index)
+        for block in blocks:
+            if skip >= len(block):
+                skip -= len(block)
+                continue
+            feed(index, block, skip)
+            skip = 0
+        return index
+
+    def _new_index(self) -> VectorIndex:
+        return create_index(self.index_kind, self._manifest.dimension, **self.index_options)
+
+    def _load_index(self):
+        """
+        Restore the persisted index and catch it up with rows written after
+        it was saved. A missing, foreign or stale index file is rebuilt.
+        """
+        index = self._new_index()
+        snapshot = self._snapshot_locked()
+        loaded = False
+        if os.path.exists(self._index_path):
+            try:
+                loaded = index.load(self._index_path) and len(index) <= snapshot.count
+            except (OSError, ValueError, KeyError):
+                loaded = False
+
+        if not loaded:
+            index = self._new_index()
+
+        if len(index) < snapshot.count:
+            index.add(snapshot.gather(np.arange(len(index), snapshot.count)))
+
+        self._index = index
+        if self._index.needs_training():
+            self._start_maintenance()
+
+    def _prepare_embeddings(self, embeddings) -> np.ndarray:
+        matrix = normalize_rows(np.asarray(embeddings, dtype=np.float32))
+        if matrix.ndim != 2:
+            raise ValueError("Embeddings must be a sequence of vectors")
+        dimension = matrix.shape[1]
+        if self.stale and self._manifest.dimension not in (None, dimension):
+            # Written from the new model before the store was re-embedded;
+            # placeholders until ``reembed`` computes the real vectors.
+            matrix = np.zeros((matrix.shape[0], self._manifest.dimension), dtype=np.float32)
+            dimension = self._manifest.dimension
+        if self._manifest.dimension is None:
+            self._manifest.dimension = dimension
+            self._manifest.save(self._manifest_path)
+        elif dimension != self._manifest.dimension:
+            raise ValueError(
+                f"Embedding dimension {dimension} does not match store dimension "
+                f"{self._manifest.dimension}"
+            )
+
+        if self._tail is None:
+            self._tail = _TailBuffer(self._manifest.dimension)
+        if self._index is None:
+            self._index = self._new_index()
+        return matrix
+
+    def _seal(self):
+        """
+        Move the write-ahead log into a new immutable segment.
+        """
+        segment = Segment.write(
+            self.store_path,
+            self._manifest.allocate_name(),
+            [self._tail.block()],
+            quantize=self.quantize
+        )
+        self._manifest.segments.append({"name": segment.name, "count": segment.count})
+        self._manifest.save(self._manifest_path)
+        self._wal.rewrite([])
+        self._sealed.append(segment.load(self._manifest.dimension))
+        self._tail = _TailBuffer(self._manifest.dimension)
+        self._index.save(self._index_path)
+        self._keywords.save(self._keywords_path)
+        self._dedup_index.save(self._dedup_path)
+        self._refs_log.rewrite(self._refs)
+        self._renewals.rewrite(self._lifetimes)
+
+        if len(self._manifest.segments) > self.max_segments or self._index.needs_training():
+            self._start_maintenance()
 
     def add_document(
         self,
@@ -54,27 +593,1115 @@ class LocalVectorStore:
         embedding: List[float],
         metadata: Optional[Dict] = None
     ) -> str:
-        with self._lock:
-            doc_id = str(uuid.uuid4())
-            self._data["documents"].append(
-                {
-                    "id": doc_id,
-                    "text": text,
-                    "embedding": embedding,
-                    "metadata": metadata or {},
-                }
+        return self.add_documents([text], [embedding], [metadata])[0]
+
+    def add_documents(
+        self,
+        texts: Sequence[str],
+        embeddings,
+        metadatas: Optional[Sequence[Optional[Dict]]] = None
+    ) -> List[str]:
+        """
+        Add a batch under one lock hold and one write-ahead log append
+        (and fsync). Returns the new ids in input order.
+        """
+        if not len(texts):
+            return []
+        if metadatas is None:
+            metadatas = [None] * len(texts)
+        if len(embeddings) != len(texts) or len(metadatas) != len(texts):
+            raise ValueError("texts, embeddings and metadatas must have the same length")
+
+        with self._writing():
+            matrix = self._prepare_embeddings(embeddings)
+            created_at = int(time.time())
+            metadatas = [dict(metadata or {}) for metadata in metadatas]
+            for metadata in metadatas:
+                metadata.setdefault("created_at", created_at)
+            doc_ids, rows = self._deduplicate(texts, metadatas)
+            if not rows:
+                return doc_ids
+
+            matrix = matrix[rows]
+            new_ids = [doc_ids[row] for row in rows]
+            texts = [texts[row] for row in rows]
+            metadatas = [metadatas[row] for row in rows]
+
+            self._wal.append(
+                {"id": doc_id, "text": text, "embedding": vector, "metadata": metadata}
+                for doc_id, text, vector, metadata in zip(new_ids, texts, matrix, metadatas)
             )
-            self._flush()
-            return doc_id
+            for doc_id, text, vector, metadata in zip(new_ids, texts, matrix, metadatas):
+                self._tail.append(doc_id, text, metadata, vector)
+                self._text_bytes += len(text)
+            self._index.add(matrix)
+            self._metadata_index.add(metadatas)
+            self._keywords.add(texts)
+            self._dedup_index.add(texts, metadatas)
+            self._dead = grow(self._dead, len(self._metadata_index), False)
+
+            if len(self._tail) >= self.seal_threshold:
+                self._seal()
+            self._publish_locked()
+
+            return doc_ids
+
+    def _deduplicate(self, texts: Sequence[str], metadatas: List[Dict]):
+        """
+        Assign an id to every input row and pick the rows to store. Rows
+        matching a stored chunk (or an earlier row of the batch) get that
+        chunk's id instead.
+        """
+        doc_ids: List[str] = []
+        rows: List[int] = []
+        if self.dedup == "off":
+            doc_ids = [str(uuid.uuid4()) for _ in texts]
+            return doc_ids, list(range(len(texts)))
+
+        batch: Dict[int, int] = {}
+        bumped: Dict[str, int] = {}
+        renewed: Dict[str, Dict] = {}
+        for row, (text, metadata) in enumerate(zip(texts, metadatas)):
+            key = content_key(text, metadata)
+            first = batch.get(key)
+            if first is not None:
+                # Not stored yet: renew the row that will be.
+                doc_id = doc_ids[first]
+                metadatas[first].update(renewed_lifetime(metadatas[first], metadata))
+            else:
+                doc_id = None
+                ordinal = self._dedup_index.find(key)
+                if ordinal is not None:
+                    block, local = self._published.locate(ordinal)
+                    doc_id = block.ids[local]
+                    stored = renewed.get(doc_id) or self._lifetimes.get(doc_id) or block.metadatas[local]
+                    lifetime = renewed_lifetime(stored, metadata)
+                    if lifetime != {name: stored.get(name) for name in lifetime}:
+                        renewed[doc_id] = lifetime
+
+            if doc_id is None:
+                doc_id = str(uuid.uuid4())
+                batch[key] = row
+                rows.append(row)
+            elif self.dedup == "refcount":
+                bumped[doc_id] = bumped.get(doc_id, self._refs.get(doc_id, 1)) + 1
+            doc_ids.append(doc_id)
+
+        if bumped:
+            self._refs_log.append(bumped)
+            self._refs.update(bumped)
+        if renewed:
+            self._renewals.append(renewed)
+            self._lifetimes.update(renewed)
+        return doc_ids, rows
+
+    def reference_count(self, doc_id: str) -> int:
+        """
+        How many ingests point at ``doc_id`` (1 unless deduplicated into).
+        """
+        self._refresh()
+        return self._refs.get(doc_id, 1)
+
+    # -------------------------
+    # Multi-process sharing
+    # -------------------------
+    @contextmanager
+    def _writing(self, changed: bool = True):
+        """
+        Hold the store lock for a write. With ``multiprocess`` also hold the
+        file lock, catch up with other workers first and, if ``changed``,
+        bump the shared generation afterwards.
+        """
+        with self._lock:
+            if self._file_lock is None:
+                yield
+                return
+            with self._file_lock:
+                self._refresh_locked()
+                try:
+                    yield
+                finally:
+                    if changed:
+                        self._generation = self._generation_counter.bump()
+                    self._record_files()
+
+    def _record_files(self):
+        self._wal_bytes = self._wal.size()
+        self._log_stamps = {
+            path: _file_stamp(path) for path in (self._refs_log.path, self._renewals.path, self._tombstones.path)
+        }
+
+    def _refresh(self):
+        counter = self._generation_counter
+        if counter is not None and counter.read() != self._generation:
+            with self._lock, self._file_lock:
+                self._refresh_locked()
+
+    def _refresh_locked(self):
+        """
+        Catch up with what other workers committed since this one last
+        looked. Needs the file lock.
+        """
+        generation = self._generation_counter.read()
+        if generation == self._generation:
+            return
+        # Other workers may have replaced these files; reopen before appending.
+        self._wal.close()
+        self._refs_log.close()
+        self._renewals.close()
+        self._tombstones.close()
+
+        manifest = Manifest.load(self._manifest_path) or Manifest()
+        known = self._manifest.segments
+        if (
+            manifest.segments[:len(known)] != known
+            or manifest.embedding_version != self._manifest.embedding_version
+            or not self._catch_up_locked(manifest)
+        ):
+            # Compacted or cleared elsewhere, so ordinals moved: start over.
+            # Orphans are left alone, they may be another worker's merge.
+            self._epoch += 1
+            self._index = None
+            self._metadata_index = MetadataIndex()
+            self._load(remove_stale=False)
+        self._generation = generation
+        self._record_files()
+        self._publish_locked()
+
+    def _catch_up_locked(self, manifest: Manifest) -> bool:
+        """
+        Load the segments and log records other workers appended since the
+        last refresh and feed their rows to the indexes. Returns False if
+        the rows on disk no longer extend the rows in memory.
+        """
+        new_entries = manifest.segments[len(self._manifest.segments):]
+        if not new_entries and self._wal.size() < self._wal_bytes:
+            return False
+
+        dimension = manifest.dimension
+        new_blocks = [self._segment(entry).load(dimension) for entry in new_entries]
+        if new_blocks:
+            # The sealed log rows we held must lead the new segments.
+            sealed_ids = [doc_id for block in new_blocks for doc_id in block.ids]
+            sealed = set(sealed_ids)
+            records = [record for record in self._wal.replay() if record["id"] not in sealed]
+            tail_ids = self._tail.ids if self._tail is not None else []
+            if (sealed_ids + [record["id"] for record in records])[:len(tail_ids)] != tail_ids:
+                return False
+        else:
+            records = self._wal.replay(self._wal_bytes)
+
+        previous = self._snapshot_locked().count
+        self._manifest = manifest
+        if dimension and self._index is None:
+            self._index = self._new_index()
+        if new_blocks or (dimension and self._tail is None):
+            self._sealed = self._sealed + new_blocks
+            self._tail = _TailBuffer(dimension)
+        for record in records:
+            self._tail.append(record["id"], record["text"], record["metadata"], record["embedding"])
+
+        snapshot = self._snapshot_locked()
+        fresh = []
+        for block, offset in zip(snapshot.blocks, snapshot.offsets.tolist()):
+            start = max(0, previous - offset)
+            if start < len(block):
+                fresh.append(VectorBlock(
+                    block.ids[start:],
+                    block.texts[start:],
+                    block.metadatas[start:],
+                    block.embeddings[start:]
+                ))
+        if fresh:
+            self._feed_indexes((self._index, self._metadata_index, self._keywords, self._dedup_index), fresh)
+            self._text_bytes += sum(len(text) for block in fresh for text in block.texts)
+            self._dead = grow(self._dead, snapshot.count, False)
+            if self._index.needs_training():
+                self._start_maintenance()
+
+        if _file_stamp(self._tombstones.path) != self._log_stamps.get(self._tombstones.path):
+            tombstoned = set(self._tombstones.load())
+            if tombstoned:
+                self._remove_rows_locked(self._ordinals_of(snapshot.blocks, tombstoned))
+        if _file_stamp(self._refs_log.path) != self._log_stamps.get(self._refs_log.path):
+            self._refs = self._refs_log.load()
+        if _file_stamp(self._renewals.path) != self._log_stamps.get(self._renewals.path):
+            self._lifetimes = self._renewals.load()
+        return True
+
+    def _snapshot_locked(self) -> StoreSnapshot:
+        blocks = list(self._sealed)
+        if self._tail is not None and len(self._tail):
+            blocks.append(self._tail.block())
+        return StoreSnapshot(
+            blocks,
+            self._index,
+            self.user_id,
+            self._metadata_index,
+            self._keywords,
+            self._dedup_index,
+            self._dead if self._deleted else None,
+            self.stale,
+            self._vectors_version(self._manifest)
+        )
+
+    def _publish_locked(self):
+        # A single reference store, so readers see the old or the new
+        # snapshot, never a mix.
+        self._published = self._snapshot_locked()
+
+    def snapshot(self) -> StoreSnapshot:
+        """
+        Current rows, oldest first, without taking the lock (unless another
+        worker wrote since the last look). The snapshot stays valid after
+        later writes.
+        """
+        self._refresh()
+        return self._published
+
+    def snapshots(self, user_id: Optional[str] = None) -> List[StoreSnapshot]:
+        return [self.snapshot()]
+
+    def resident_bytes(self) -> int:
+        """
+        Rough memory cost of keeping this store open: the matrices that
+        searches scan (codes for quantized blocks) plus texts.
+        """
+        snapshot = self._published
+        return self._text_bytes + sum(
+            block.embeddings.nbytes if block.codes is None else block.codes.nbytes + block.scales.nbytes
+            for block in snapshot.blocks
+        )
+
+    def blocks(self) -> List[VectorBlock]:
+        return self.snapshot().blocks
+
+    def count(self) -> int:
+        return self.snapshot().live_count
 
     def all_documents(self) -> List[Dict]:
+        snapshot = self.snapshot()
+        return [
+            block.document(row)
+            for block, offset in zip(snapshot.blocks, snapshot.offsets.tolist())
+            for row in range(len(block))
+            if snapshot.dead is None or not snapshot.dead[offset + row]
+        ]
+
+    def disk_bytes(self) -> int:
+        total = 0
+        for entry in os.scandir(self.store_path):
+            if entry.is_file():
+                total += entry.stat().st_size
+        return total
+
+    def stats(self) -> Dict:
+        self._refresh()
+        with self._lock:
+            snapshot = self._snapshot_locked()
+            segments = len(self._manifest.segments)
+        return {
+            "user_id": self.user_id,
+            "rows": snapshot.count,
+            "deleted": snapshot.count - snapshot.live_count,
+            "segments": segments,
+            "disk_bytes": self.disk_bytes(),
+        }
+
+    # -------------------------
+    # Deletes and retention
+    # -------------------------
+    def _remove_rows_locked(self, ordinals: np.ndarray) -> np.ndarray:
+        """
+        Tombstone rows in the mask and in every index that can skip rows.
+        The metadata index keeps them; searches mask them out instead.
+        """
+        ordinals = np.unique(np.asarray(ordinals, dtype=np.int64))
+        ordinals = ordinals[~self._dead[ordinals]]
+        if not ordinals.shape[0]:
+            return ordinals
+        # Published snapshots keep the old mask.
+        dead = self._dead.copy()
+        dead[ordinals] = True
+        self._dead = dead
+        self._deleted += ordinals.shape[0]
+        if self._index is not None:
+            self._index.remove(ordinals)
+        self._keywords.remove(ordinals)
+        self._dedup_index.remove(ordinals)
+        return ordinals
+
+    def _delete_locked(self, snapshot: StoreSnapshot, ordinals: np.ndarray) -> int:
+        removed = self._remove_rows_locked(ordinals)
+        if not removed.shape[0]:
+            return 0
+        doc_ids = []
+        for ordinal in removed.tolist():
+            block, row = snapshot.locate(ordinal)
+            doc_ids.append(block.ids[row])
+            self._refs.pop(block.ids[row], None)
+        self._tombstones.append(doc_ids)
+        self._publish_locked()
+        return len(doc_ids)
+
+    def delete(self, doc_ids: Iterable[str]) -> int:
+        """
+        Delete documents by id. Returns how many were found and deleted.
+        A document that several ingests point at (``dedup="refcount"``)
+        only loses one reference; its row goes with the last one.
+        """
+        wanted = set(doc_ids)
+        if not wanted:
+            return 0
+        with self._writing():
+            shared = {doc_id: self._refs[doc_id] - 1 for doc_id in wanted if self._refs.get(doc_id, 1) > 1}
+            if shared:
+                self._refs_log.append(shared)
+                for doc_id, refs in shared.items():
+                    if refs > 1:
+                        self._refs[doc_id] = refs
+                    else:
+                        del self._refs[doc_id]
+            snapshot = self._published
+            ordinals = self._ordinals_of(snapshot.blocks, wanted.difference(shared))
+            return len(shared) + self._delete_locked(snapshot, ordinals)
+
+    def apply_retention(self, policies: Dict[str, RetentionPolicy], now: Optional[float] = None) -> int:
+        """
+        Delete expired chunks (see ``app.rag.retention``). The rows are
+        picked without holding the lock. Returns how many were deleted.
+        """
+        self._refresh()
+        with self._lock:
+            epoch = self._epoch
+            snapshot = self._published
+            lifetimes = dict(self._lifetimes)
+
+        ordinals = expired_ordinals(snapshot.blocks, policies, now, snapshot.dead, lifetimes)
+        if not ordinals.shape[0]:
+            return 0
+
+        with self._writing():
+            if self._epoch != epoch:
+                # Cleared or compacted meanwhile; the ordinals are stale.
+                return 0
+            return self._delete_locked(snapshot, ordinals)
+
+    def maintain(
+        self,
+        policies: Optional[Dict[str, RetentionPolicy]] = None,
+        min_dead_ratio: float = 0.2
+    ) -> Dict:
+        """
+        Apply retention, then compact once deleted rows make up
+        ``min_dead_ratio`` of the sealed rows or there are too many
+        segments. Returns what was done, for compaction stats.
+        """
+        started = time.perf_counter()
+        expired = self.apply_retention(policies) if policies else 0
+
+        self._refresh()
         with self._lock:
-            return list(self._data.get("documents", []))
+            sealed = sum(len(block) for block in self._sealed)
+            dead = int(np.count_nonzero(self._dead[:sealed]))
+            segments = len(self._manifest.segments)
+
+        bytes_before = self.disk_bytes()
+        compacted = reembedded = False
+        if self.stale:
+            # Re-embedding rewrites every row into one segment anyway.
+            reembedded = compacted = self.reembed()
+        elif (dead and dead >= min_dead_ratio * sealed) or segments > self.max_segments:
+            compacted = self.compact()
+
+        return {
+            "user_id": self.user_id,
+            "expired": expired,
+            "reembedded": reembedded,
+            "compacted": compacted,
+            "purged": dead if compacted else 0,
+            "bytes_reclaimed": max(0, bytes_before - self.disk_bytes()) if compacted else 0,
+            "duration_ms": round((time.perf_counter() - started) * 1000, 3),
+        }
+
+    # -------------------------
+    # Background maintenance
+    # -------------------------
+    def _start_maintenance(self):
+        if self._closed or self.maintaining():
+            return
+
+        self._maintenance_thread = threading.Thread(target=self._run_maintenance, daemon=True)
+        self._maintenance_thread.start()
+
+    def maintaining(self) -> bool:
+        """
+        Whether background compaction or index training is running.
+        """
+        return self._maintenance_thread is not None and self._maintenance_thread.is_alive()
+
+    def _run_maintenance(self):
+        if len(self._manifest.segments) > self.max_segments:
+            self.compact()
+        if self._index is not None and self._index.needs_training():
+            self.train_index()
+
+    def train_index(self, sample_size: int = 65536) -> bool:
+        """
+        Train a fresh index on a sample of the current rows and swap it in.
+        Searches keep using the old index until the swap.
+        """
+        self._refresh()
+        with self._lock:
+            if self._index is None:
+                return False
+            epoch = self._epoch
+            snapshot = self._snapshot_locked()
+            index = self._index.spawn()
+
+        if not snapshot.count:
+            return False
+
+        rng = np.random.default_rng(0)
+        sample_ordinals = np.sort(
+            rng.choice(snapshot.count, size=min(sample_size, snapshot.count), replace=False)
+        )
+        index.train(snapshot.gather(sample_ordinals), rows=snapshot.count)
+        for start in range(0, snapshot.count, 65536):
+            stop = min(start + 65536, snapshot.count)
+            index.add(snapshot.gather(np.arange(start, stop)))
+
+        with self._writing(changed=False):
+            if self._epoch != epoch:
+                return False
+            current = self._snapshot_locked()
+            if current.count > snapshot.count:
+                index.add(current.gather(np.arange(snapshot.count, current.count)))
+            index.remove(np.flatnonzero(~self._index.alive_mask(current.count)))
+            self._index = index
+            self._index.save(self._index_path)
+            self._publish_locked()
+
+        return True
+
+    def _feed_indexes(self, indexes, blocks: List[VectorBlock], chunk: int = 65536):
+        index, metadata_index, keywords, dedup_index = indexes
+        for block in blocks:
+            for start in range(0, len(block), chunk):
+                index.add(np.asarray(block.embeddings[start:start + chunk], dtype=np.float32))
+            metadata_index.add(block.metadatas)
+            keywords.add(block.texts)
+            dedup_index.add(block.texts, block.metadatas)
+
+    def compact(self) -> bool:
+        """
+        Merge every sealed segment into one, leaving deleted rows out.
+        Readers and writers are only blocked while the result is swapped
+        in, not while data is copied or indexes are rebuilt.
+        """
+        with self._compaction_lock:
+            return self._compact()
+
+    def _compact(self) -> bool:
+        with self._writing():
+            entries = list(self._manifest.segments)
+            inputs = list(self._sealed)
+            sealed = sum(len(block) for block in inputs)
+            keep = ~self._dead[:sealed]
+            purge = not keep.all()
+            if len(entries) < 2 and not purge:
+                return False
+            epoch = self._epoch
+            merged_name = self._manifest.allocate_name()
+            self._manifest.save(self._manifest_path)
+            template = self._index
+
+        blocks = inputs
+        if purge:
+            blocks = []
+            offset = 0
+            for block in inputs:
+                rows = np.flatnonzero(keep[offset:offset + len(block)])
+                offset += len(block)
+                if rows.shape[0] == len(block):
+                    blocks.append(block)
+                elif rows.shape[0]:
+                    blocks.append(block.select(rows))
+
+        try:
+            merged = Segment.write(self.store_path, merged_name, blocks, quantize=self.quantize)
+            merged_block = merged.load(self._manifest.dimension)
+        except OSError:
+            Segment(self.store_path, merged_name, 0).remove()
+            return False
+
+        if purge:
+            # Ordinals shift once rows are dropped, so every per-row index
+            # is rebuilt for the new layout; IVF keeps its centroids.
+            indexes = (
+                template.spawn(keep_training=True),
+                MetadataIndex(),
+                BM25Index(),
+                DedupIndex(self.near_duplicate_bits),
+            )
+            self._feed_indexes(indexes, [merged_block])
+
+        with self._writing():
+            # Segments are only ever appended, so the merged ones are still
+            # a prefix of the manifest unless the store was cleared meanwhile.
+            # Another worker reloading meanwhile may have removed the merged
+            # files as orphans.
+            if (
+                self._epoch != epoch
+                or self._manifest.segments[:len(entries)] != entries
+                or not os.path.exists(merged.meta_path)
+            ):
+                merged.remove()
+                return False
+
+            head = [merged_block] if len(merged_block) else []
+            head_entries = [{"name": merged.name, "count": merged.count}] if len(merged_block) else []
+            if not purge:
+                self._manifest.segments = head_entries + self._manifest.segments[len(entries):]
+                self._manifest.save(self._manifest_path)
+                self._sealed = head + self._sealed[len(entries):]
+            else:
+                self._swap_compacted(indexes, head, head_entries, entries, inputs, keep)
+            self._publish_locked()
+
+        if not len(merged_block):
+            merged.remove()
+        for entry in entries:
+            self._segment(entry).remove()
+
+        return True
+
+    def _swap_compacted(self, indexes, head, head_entries, entries, inputs, keep):
+        """
+        Install a purged prefix of segments and the indexes rebuilt for it.
+        Rows written or deleted since the rebuild started are carried over.
+        """
+        sealed = keep.shape[0]
+        current = self._snapshot_locked()
+        self._feed_indexes(indexes, current.blocks[len(entries):])
+
+        kept = int(np.count_nonzero(keep))
+        new_positions = np.cumsum(keep) - 1
+        deleted_meanwhile = np.flatnonzero(self._dead[:sealed] & keep)
+        dead_rows = np.concatenate([
+            new_positions[deleted_meanwhile],
+            kept + np.flatnonzero(self._dead[sealed:current.count]),
+        ]).astype(np.int64)
+
+        index, metadata_index, keywords, dedup_index = indexes
+        index.remove(dead_rows)
+        keywords.remove(dead_rows)
+        dedup_index.remove(dead_rows)
+
+        purged_ids = [
+            doc_id
+            for block, offset in zip(inputs, np.cumsum([0] + [len(block) for block in inputs]).tolist())
+            for row, doc_id in enumerate(block.ids)
+            if not keep[offset + row]
+        ]
+        purged_bytes = sum(
+            len(block.texts[row])
+            for block, offset in zip(inputs, np.cumsum([0] + [len(block) for block in inputs]).tolist())
+            for row in range(len(block))
+            if not keep[offset + row]
+        )
+
+        # The persisted indexes describe the old layout; drop them before
+        # the manifest changes so a crash in between rebuilds them on load.
+        for path in (self._index_path, self._keywords_path, self._dedup_path):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+        self._manifest.segments = head_entries + self._manifest.segments[len(entries):]
+        self._manifest.save(self._manifest_path)
+        self._sealed = head + self._sealed[len(entries):]
+
+        dead = np.zeros(kept + current.count - sealed, dtype=bool)
+        dead[dead_rows] = True
+        self._dead = dead
+        self._deleted = int(dead_rows.shape[0])
+        self._index, self._metadata_index, self._keywords, self._dedup_index = indexes
+        self._text_bytes -= purged_bytes
+        self._epoch += 1
+
+        snapshot = self._snapshot_locked()
+        self._tombstones.rewrite(snapshot.hit(int(ordinal), 0.0)["id"] for ordinal in dead_rows)
+        for doc_id in purged_ids:
+            self._refs.pop(doc_id, None)
+            self._lifetimes.pop(doc_id, None)
+        self._refs_log.rewrite(self._refs)
+        self._renewals.rewrite(self._lifetimes)
+        self._index.save(self._index_path)
+        self._keywords.save(self._keywords_path)
+        self._dedup_index.save(self._dedup_path)
+
+    def reembed(self, batch_size: int = 256) -> bool:
+        """
+        Recompute every live row's vector with the current embedder and
+        rewrite the store as one segment stamped with its version. Ids,
+        texts and metadata are kept; deleted rows are dropped. The model is
+        called without holding the lock, except for rows written meanwhile.
+        """
+        with self._compaction_lock:
+            return self._reembed(max(1, batch_size))
+
+    def _embed_rows(self, snapshot: StoreSnapshot, ordinals: np.ndarray, batch_size: int) -> List[np.ndarray]:
+        texts = [snapshot.hit(ordinal, 0.0)["text"] for ordinal in ordinals.tolist()]
+        return [
+            normalize_rows(self.embedder.embed_many(texts[start:start + batch_size]))
+            for start in range(0, len(texts), batch_size)
+        ]
+
+    def _reembed(self, batch_size: int) -> bool:
+        with self._writing(changed=False):
+            if not self.stale:
+                return False
+            epoch = self._epoch
+            snapshot = self._snapshot_locked()
+            live = np.flatnonzero(~self._dead[:snapshot.count])
+
+        vectors = self._embed_rows(snapshot, live, batch_size)
+
+        with self._writing():
+            if self._epoch != epoch or not self.stale:
+                # Compacted, cleared or re-embedded meanwhile.
+                return False
+            current = self._snapshot_locked()
+            added = np.arange(snapshot.count, current.count)
+            added = added[~self._dead[added]]
+            vectors += self._embed_rows(current, added, batch_size)
+            ordinals = np.concatenate([live, added])
+            # Rows deleted while the snapshot was being embedded are dropped.
+            keep = ~self._dead[ordinals]
+            matrix = np.concatenate(vectors)[keep] if ordinals[keep].shape[0] else None
+            self._install_reembedded(current, ordinals[keep], matrix)
+            self._publish_locked()
+        return True
+
+    def _install_reembedded(self, current: StoreSnapshot, ordinals: np.ndarray, matrix: Optional[np.ndarray]):
+        """
+        Replace every segment, log and index with the re-embedded rows.
+        """
+        entries = list(self._manifest.segments)
+        blocks = []
+        if matrix is not None:
+            hits = [current.hit(ordinal, 0.0) for ordinal in ordinals.tolist()]
+            blocks.append(VectorBlock(
+                [hit["id"] for hit in hits],
+                [hit["text"] for hit in hits],
+                [hit["metadata"] for hit in hits],
+                matrix
+            ))
+
+        # The persisted indexes describe the old vectors; drop them before
+        # the manifest changes so a crash in between rebuilds them on load.
+        for path in (self._index_path, self._keywords_path, self._dedup_path):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+        manifest = Manifest(
+            dimension=matrix.shape[1] if matrix is not None else None,
+            next_segment=self._manifest.next_segment,
+            embedding_version=self.embedding_version
+        )
+        self._sealed = []
+        if blocks:
+            segment = Segment.write(self.store_path, manifest.allocate_name(), blocks, quantize=self.quantize)
+            manifest.segments.append({"name": segment.name, "count": segment.count})
+            self._sealed = [segment.load(manifest.dimension)]
+        manifest.save(self._manifest_path)
+        self._manifest = manifest
+        self._wal.rewrite([])
+        self._tombstones.rewrite([])
+        kept_ids = set(blocks[0].ids) if blocks else set()
+        self._refs = {doc_id: refs for doc_id, refs in self._refs.items() if doc_id in kept_ids}
+        self._refs_log.rewrite(self._refs)
+        self._lifetimes = {doc_id: lifetime for doc_id, lifetime in self._lifetimes.items() if doc_id in kept_ids}
+        self._renewals.rewrite(self._lifetimes)
+
+        self._epoch += 1
+        self._tail = _TailBuffer(manifest.dimension) if manifest.dimension else None
+        self._dead = np.zeros(ordinals.shape[0], dtype=bool)
+        self._deleted = 0
+        self._text_bytes = sum(len(text) for block in self._sealed for text in block.texts)
+        self._index = self._new_index() if manifest.dimension else None
+        self._metadata_index = MetadataIndex()
+        self._keywords = BM25Index()
+        self._dedup_index = DedupIndex(self.near_duplicate_bits)
+        if self._index is not None:
+            self._feed_indexes((self._index, self._metadata_index, self._keywords, self._dedup_index), self._sealed)
+        self._save_indexes()
+
+        for entry in entries:
+            self._segment(entry).remove()
+        if self._index is not None and self._index.needs_training():
+            self._start_maintenance()
 
     def clear(self):
+        with self._writing():
+            self._epoch += 1
+            for entry in self._manifest.segments:
+                self._segment(entry).remove()
+            self._manifest.segments = []
+            if self.stale:
+                # Nothing left to re-embed: the next rows set the dimension.
+                self._manifest.embedding_version = self.embedding_version
+                self._manifest.dimension = None
+                self._tail = self._index = None
+                if os.path.exists(self._index_path):
+                    os.remove(self._index_path)
+            self._manifest.save(self._manifest_path)
+            self._wal.rewrite([])
+            self._sealed = []
+            self._text_bytes = 0
+            self._metadata_index = MetadataIndex()
+            self._keywords = BM25Index()
+            self._keywords.save(self._keywords_path)
+            self._dedup_index = DedupIndex(self.near_duplicate_bits)
+            self._dedup_index.save(self._dedup_path)
+            self._refs = {}
+            self._refs_log.rewrite({})
+            self._lifetimes = {}
+            self._renewals.rewrite({})
+            self._dead = np.zeros(0, dtype=bool)
+            self._deleted = 0
+            self._tombstones.rewrite([])
+            if self._tail is not None:
+                self._tail = _TailBuffer(self._manifest.dimension)
+            if self._index is not None:
+                self._index = self._new_index()
+                self._index.save(self._index_path)
+            self._publish_locked()
+
+    def checkpoint(self, directory: str) -> Dict:
+        """
+        Capture a consistent copy of the shard's durable files in
+        ``directory`` (on the same filesystem, ideally): sealed segments
+        are hard-linked, the manifest and logs copied, all while writes
+        and compaction are held off. Indexes are left out; a store opened
+        on the copy rebuilds them. Returns the manifest as saved.
+        """
+        os.makedirs(directory, exist_ok=True)
+        with self._compaction_lock, self._writing(changed=False):
+            for entry in self._manifest.segments:
+                for path in self._segment(entry).files():
+                    _link_or_copy(path, os.path.join(directory, os.path.basename(path)))
+            for path in (self._wal.path, self._tombstones.path, self._refs_log.path, self._renewals.path):
+                if os.path.exists(path):
+                    shutil.copyfile(path, os.path.join(directory, os.path.basename(path)))
+            self._manifest.save(os.path.join(directory, MANIFEST_NAME))
+            return {
+                "dimension": self._manifest.dimension,
+                "embedding_version": self._manifest.embedding_version,
+                "segments": list(self._manifest.segments),
+            }
+
+    def _save_indexes(self):
+        if self._index is not None:
+            self._index.save(self._index_path)
+        self._keywords.save(self._keywords_path)
+        self._dedup_index.save(self._dedup_path)
+
+    def close(self):
+        """
+        Wait for background maintenance, save the indexes and close the
+        log files. A closed store starts no more maintenance.
+        """
+        with self._lock:
+            self._closed = True
+            thread = self._maintenance_thread
+        if thread is not None:
+            thread.join()
+        with self._lock:
+            if self._file_lock is None:
+                self._save_indexes()
+            else:
+                with self._file_lock:
+                    # Indexes of a worker that is behind would overwrite
+                    # newer ones; the next load catches them up instead.
+                    if self._generation_counter.read() == self._generation:
+                        self._save_indexes()
+            self._refs_log.close()
+            self._renewals.close()
+            self._tombstones.close()
+            self._wal.close()
+
+
+
+class ShardedVectorStore:
+    """
+    RAG store partitioned by ``user_id``: one ``LocalVectorStore`` per user
+    under ``<root>/shards/``, opened lazily. Open shards are kept in an LRU
+    bounded by ``max_resident`` and a memory budget; a shard in use by a
+    writer is pinned, and neither it nor one running background
+    maintenance is evicted.
+    """
+
+    def __init__(
+        self,
+        root: Optional[str] = None,
+        legacy_path: Optional[str] = None,
+        max_resident: Optional[int] = None,
+        memory_budget_mb: Optional[int] = None,
+        **shard_options
+    ):
+        self.root = root or str(RAG_STORE_DIR)
+        if legacy_path is None and root is None:
+            legacy_path = str(RAG_STORE_FILE)
+        self.max_resident = max(1, max_resident or settings.RAG_SHARD_CACHE_SIZE)
+        self.memory_budget = (memory_budget_mb or settings.RAG_SHARD_MEMORY_MB) * 1024 * 1024
+        self.shard_options = shard_options
+
+        self._lock = threading.Lock()
+        self._resident: "OrderedDict[str, LocalVectorStore]" = OrderedDict()
+        self._pins: Dict[str, int] = {}
+
+        if shard_options.get("multiprocess", settings.RAG_MULTIPROCESS):
+            # Workers start together; only one may migrate the old layout.
+            os.makedirs(self.root, exist_ok=True)
+            with StoreFileLock(os.path.join(self.root, LOCK_NAME)):
+                migrate_store_root(self.root, legacy_path=legacy_path)
+        else:
+            migrate_store_root(self.root, legacy_path=legacy_path)
+        os.makedirs(self._shards_path, exist_ok=True)
+
+    @property
+    def _shards_path(self) -> str:
+        return os.path.join(self.root, SHARDS_DIR)
+
+    def user_ids(self) -> List[Optional[str]]:
+        """
+        Owners of every shard on disk; None is the shared shard.
+        """
+        owners = []
+        for entry in sorted(os.listdir(self._shards_path)):
+            try:
+                owners.append(shard_user_id(entry))
+            except ValueError:
+                continue
+        return owners
+
+    def _evict_locked(self):
+        resident_bytes = sum(shard.resident_bytes() for shard in self._resident.values())
+        for key in list(self._resident.keys()):
+            if len(self._resident) <= 1:
+                break
+            if len(self._resident) <= self.max_resident and resident_bytes <= self.memory_budget:
+                break
+            if self._pins.get(key) or self._resident[key].maintaining():
+                continue
+            shard = self._resident.pop(key)
+            resident_bytes -= shard.resident_bytes()
+            shard.close()
+
+    @contextmanager
+    def _pinned(self, user_id: Optional[str]) -> Iterator[LocalVectorStore]:
+        key = shard_dir_name(user_id)
+        with self._lock:
+            shard = self._resident.get(key)
+            if shard is None:
+                shard = LocalVectorStore(
+                    store_path=os.path.join(self._shards_path, key),
+                    user_id=user_id,
+                    **self.shard_options
+                )
+                self._resident[key] = shard
+            self._resident.move_to_end(key)
+            self._pins[key] = self._pins.get(key, 0) + 1
+
+        try:
+            yield shard
+        finally:
+            with self._lock:
+                self._pins[key] -= 1
+                if not self._pins[key]:
+                    del self._pins[key]
+                self._evict_locked()
+
+    def add_document(
+        self,
+        text: str,
+        embedding: List[float],
+        metadata: Optional[Dict] = None
+    ) -> str:
+        return self.add_documents([text], [embedding], [metadata])[0]
+
+    def add_documents(
+        self,
+        texts: Sequence[str],
+        embeddings,
+        metadatas: Optional[Sequence[Optional[Dict]]] = None
+    ) -> List[str]:
+        """
+        Route a batch to the shards of its users; each shard commits its
+        part in one write. Returns the new ids in input order.
+        """
+        if metadatas is None:
+            metadatas = [None] * len(texts)
+        if len(embeddings) != len(texts) or len(metadatas) != len(texts):
+            raise ValueError("texts, embeddings and metadatas must have the same length")
+
+        rows_by_user: Dict[Optional[str], List[int]] = {}
+        for row, metadata in enumerate(metadatas):
+            rows_by_user.setdefault((metadata or {}).get("user_id"), []).append(row)
+
+        doc_ids: List[Optional[str]] = [None] * len(texts)
+        for user_id, rows in rows_by_user.items():
+            with self._pinned(user_id) as shard:
+                ids = shard.add_documents(
+                    [texts[row] for row in rows],
+                    [embeddings[row] for row in rows],
+                    [metadatas[row] for row in rows]
+                )
+            for row, doc_id in zip(rows, ids):
+                doc_ids[row] = doc_id
+        return doc_ids
+
+    def _exists(self, user_id: Optional[str]) -> bool:
+        key = shard_dir_name(user_id)
+        return key in self._resident or os.path.isdir(os.path.join(self._shards_path, key))
+
+    def snapshot(self, user_id: Optional[str] = None) -> StoreSnapshot:
+        key = shard_dir_name(user_id)
+        shard = self._resident.get(key)
+        if shard is not None:
+            # Resident shard: no pin needed, a snapshot outlives eviction.
+            # Recency is refreshed only if the lock is free right now.
+            if self._lock.acquire(blocking=False):
+                try:
+                    if key in self._resident:
+                        self._resident.move_to_end(key)
+                finally:
+                    self._lock.release()
+            return shard.snapshot()
+        if not self._exists(user_id):
+            return StoreSnapshot([], None, user_id)
+        with self._pinned(user_id) as shard:
+            return shard.snapshot()
+
+    def snapshots(self, user_id: Optional[str] = None) -> List[StoreSnapshot]:
+        """
+        The caller's shard only, or every shard when ``user_id`` is None.
+        """
+        if user_id:
+            return [self.snapshot(user_id)]
+        return [self.snapshot(owner) for owner in self.user_ids()]
+
+    def count(self, user_id: Optional[str] = None) -> int:
+        return sum(snapshot.live_count for snapshot in self.snapshots(user_id))
+
+    def all_documents(self, user_id: Optional[str] = None) -> List[Dict]:
+        return [
+            block.document(row)
+            for snapshot in self.snapshots(user_id)
+            for block, offset in zip(snapshot.blocks, snapshot.offsets.tolist())
+            for row in range(len(block))
+            if snapshot.dead is None or not snapshot.dead[offset + row]
+        ]
+
+    def _owners(self, user_id: Optional[str]) -> List[Optional[str]]:
+        owners = [user_id] if user_id else self.user_ids()
+        return [owner for owner in owners if self._exists(owner)]
+
+    def delete(self, doc_ids: Sequence[str], user_id: Optional[str] = None) -> int:
+        """
+        Delete documents by id from one user's shard, or from every shard
+        when ``user_id`` is None.
+        """
+        deleted = 0
+        for owner in self._owners(user_id):
+            with self._pinned(owner) as shard:
+                deleted += shard.delete(doc_ids)
+        return deleted
+
+    def needs_maintenance(self, user_id: Optional[str], min_dead_ratio: float = 0.2) -> bool:
+        """
+        Whether compaction or re-embedding may be due for a shard, judged
+        from its manifest and tombstone log without opening it. Open shards
+        are always worth a check.
+        """
+        key = shard_dir_name(user_id)
+        if key in self._resident:
+            return True
+        path = os.path.join(self._shards_path, key)
+        manifest = Manifest.load(os.path.join(path, MANIFEST_NAME))
+        if manifest is None or manifest.dimension is None:
+            return False
+
+        shard_embedder = self.shard_options.get("embedder")
+        if shard_embedder is not None and LocalVectorStore._vectors_version(manifest) != shard_embedder.version:
+            return True
+        if len(manifest.segments) > self.shard_options.get("max_segments", MAX_SEGMENTS):
+            return True
+        try:
+            with open(os.path.join(path, TOMBSTONES_NAME), "rb") as f:
+                dead = f.read().count(b"\n")
+        except FileNotFoundError:
+            return False
+        sealed = sum(int(entry.get("count", 0)) for entry in manifest.segments)
+        return dead > 0 and dead >= min_dead_ratio * sealed
+
+    def maintain(
+        self,
+        user_id: Optional[str],
+        policies: Optional[Dict[str, RetentionPolicy]] = None,
+        min_dead_ratio: float = 0.2
+    ) -> Optional[Dict]:
+        """
+        Run retention and compaction on one shard; None if it does not exist.
+        """
+        if not self._exists(user_id):
+            return None
+        with self._pinned(user_id) as shard:
+            return shard.maintain(policies, min_dead_ratio)
+
+    @property
+    def checkpoints_path(self) -> str:
+        # Under the root, so checkpoints can hard-link the segments.
+        return os.path.join(self.root, CHECKPOINTS_DIR)
+
+    def checkpoint(self, directory: str) -> Dict[str, Dict]:
+        """
+        ``LocalVectorStore.checkpoint`` of every shard into
+        ``<directory>/shards/<shard>``. Returns each shard's manifest.
+        """
+        manifests = {}
+        for owner in self.user_ids():
+            key = shard_dir_name(owner)
+            with self._pinned(owner) as shard:
+                manifests[key] = shard.checkpoint(os.path.join(directory, SHARDS_DIR, key))
+        return manifests
+
+    def stats(self, user_id: Optional[str] = None) -> List[Dict]:
+        stats = []
+        for owner in self._owners(user_id):
+            with self._pinned(owner) as shard:
+                stats.append(shard.stats())
+        return stats
+
+    def clear(self, user_id: Optional[str] = None):
+        """
+        Clear one user's shard, or every shard when ``user_id`` is None.
+        Other users' files are never touched by a per-user clear.
+        """
+        for owner in self._owners(user_id):
+            with self._pinned(owner) as shard:
+                shard.clear()
+
+    def close(self):
         with self._lock:
-            self._data = {"documents": []}
-            self._flush()
+            for shard in self._resident.values():
+                shard.close()
+            self._resident.clear()
 
 
-vector_store = LocalVectorStore()
+vector_store = ShardedVectorStore(embedder=embedder)
@@ -0,0 +1,105 @@
+import logging
+import threading
+import time
+from typing import Dict, Optional
+
+from app.config.settings import settings
+from app.rag.retention import parse_policies
+from app.rag.vector_store import vector_store
+
+
+logger = logging.getLogger(__name__)
+
+
+class CompactionScheduler:
+    """
+    Background job that applies RAG retention and compacts shards.
+
+    With retention policies each run visits every shard: expired chunks
+    are tombstoned, and a shard is rewritten once enough of its rows are
+    dead. Without policies only open shards and those whose files show
+    enough deleted rows, too many segments or another embedder's vectors
+    are opened. Searches keep running against the old segments while a
+    shard is rewritten.
+    """
+
+    def __init__(self, interval: Optional[int] = None):
+        self.interval = interval or settings.RAG_COMPACTION_INTERVAL
+        self.running = False
+        self.runs = 0
+        self.last_run: Optional[Dict] = None
+        self.totals = {"expired": 0, "purged": 0, "bytes_reclaimed": 0}
+        self._run_lock = threading.Lock()
+        self._wake = threading.Event()
+
+    def start(self):
+        self.running = True
+        logger.info("RAG compaction scheduler started")
+
+        while self.running:
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.warning(f"RAG compaction run failed: {e}")
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+    def stop(self):
+        self.running = False
+        self._wake.set()
+
+    def run_once(self) -> Dict:
+        """
+        Maintain the shards that may need it now; runs never overlap.
+        """
+        policies = parse_policies(settings.RAG_RETENTION)
+        with self._run_lock:
+            started_at = time.time()
+            started = time.perf_counter()
+            checked = 0
+            shards = []
+            for user_id in vector_store.user_ids():
+                if not policies and not vector_store.needs_maintenance(user_id, settings.RAG_COMPACTION_DEAD_RATIO):
+                    continue
+                result = vector_store.maintain(user_id, policies, settings.RAG_COMPACTION_DEAD_RATIO)
+                if result is None:
+                    continue
+                checked += 1
+                if result["expired"] or result["compacted"] or result["reembedded"]:
+                    shards.append(result)
+
+            run = {
+                "started_at": started_at,
+                "duration_ms": round((time.perf_counter() - started) * 1000, 3),
+                "shards_checked": checked,
+                "expired": sum(shard["expired"] for shard in shards),
+                "compacted": sum(1 for shard in shards if shard["compacted"]),
+                "reembedded": sum(1 for shard in shards if shard["reembedded"]),
+                "purged": sum(shard["purged"] for shard in shards),
+                "bytes_reclaimed": sum(shard["bytes_reclaimed"] for shard in shards),
+                "shards": shards,
+            }
+            self.runs += 1
+            self.last_run = run
+            for key in self.totals:
+                self.totals[key] += run[key]
+
+        if run["expired"] or run["compacted"]:
+            logger.info(
+                f"RAG compaction: expired {run['expired']}, purged {run['purged']} rows, "
+                f"re-embedded {run['reembedded']} shards, "
+                f"reclaimed {run['bytes_reclaimed']} bytes in {run['duration_ms']} ms"
+            )
+        return run
+
+    def stats(self) -> Dict:
+        return {
+            "running": self.running,
+            "interval_seconds": self.interval,
+            "runs": self.runs,
+            "totals": dict(self.totals),
+            "last_run": self.last_run,
+        }
+
+
+compaction_scheduler = CompactionScheduler()
@@ -53,6 +53,17 @@ class KeyManager:
         data = self._load_storage()
         return data.get(provider)
 
+    def version(self) -> Optional[tuple]:
+        """
+        Cheap fingerprint of the key file (no decryption): changes
+        whenever a key is saved or deleted, by this or another process.
+        """
+        try:
+            stat = self.file_path.stat()
+        except FileNotFoundError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
     def delete_key(self, provider: str):
         """
         Remove stored key.
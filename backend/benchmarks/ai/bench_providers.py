@@ -0,0 +1,139 @@
+"""
+Per-request overhead of chat providers against a local stub Ollama
+server: a provider and HTTP client built for every request (the old
+behaviour) vs the cached provider from ``provider_factory`` on the
+shared keep-alive pool.
+
+Reports latency percentiles and how many TCP connections the server
+accepted, so the cost of connection setup shows up directly.
+
+Usage (from backend/):
+    python -m benchmarks.ai.bench_providers
+    python -m benchmarks.ai.bench_providers --requests 2000 --concurrency 8 --json
+"""
+
+import argparse
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List
+
+from app.ai.http_client import SharedHTTPClient
+from app.ai.ollama_provider import OllamaProvider
+from app.ai.provider_factory import provider_factory
+from app.config.settings import settings
+from benchmarks.rag.common import latency_summary
+
+
+MESSAGES = [{"role": "user", "content": "what is on my calendar today?"}]
+REPLY = json.dumps({"message": {"role": "assistant", "content": "Nothing until 3pm."}, "done": True}).encode("utf-8")
+
+
+class _StubOllama(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out in two writes; without this, delayed ACKs
+    # add ~40ms to every kept-alive request.
+    disable_nagle_algorithm = True
+    connections = 0
+    lock = threading.Lock()
+
+    def setup(self):
+        super().setup()
+        with self.lock:
+            type(self).connections += 1
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(REPLY)))
+        self.end_headers()
+        self.wfile.write(REPLY)
+
+
+async def _per_request() -> None:
+    pool = SharedHTTPClient()
+    try:
+        await OllamaProvider(model="llama3", http=pool).generate_response(MESSAGES)
+    finally:
+        await pool.close()
+
+
+async def _pooled() -> None:
+    await provider_factory.get_provider("ollama", "llama3").generate_response(MESSAGES)
+
+
+async def _measure(call, requests: int, concurrency: int) -> List[float]:
+    samples: List[float] = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def timed():
+        async with semaphore:
+            started = time.perf_counter()
+            await call()
+            samples.append(time.perf_counter() - started)
+
+    await asyncio.gather(*[timed() for _ in range(requests)])
+    return samples
+
+
+async def _run_modes(requests: int, concurrency: int, handler) -> Dict[str, Dict]:
+    results = {}
+    for mode, call in (("per_request", _per_request), ("pooled", _pooled)):
+        await _measure(call, min(requests, 20), concurrency)  # warm-up
+        handler.connections = 0
+        started = time.perf_counter()
+        samples = await _measure(call, requests, concurrency)
+        row = latency_summary(samples)
+        row["seconds"] = round(time.perf_counter() - started, 3)
+        row["connections_opened"] = handler.connections
+        results[mode] = row
+    await provider_factory.close()
+    return results
+
+
+def run(requests: int, concurrency: int) -> Dict:
+    handler = type("Handler", (_StubOllama,), {"connections": 0})
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    original_url = settings.OLLAMA_BASE_URL
+    settings.OLLAMA_BASE_URL = f"http://127.0.0.1:{server.server_port}"
+    try:
+        modes = asyncio.run(_run_modes(requests, concurrency, handler))
+    finally:
+        settings.OLLAMA_BASE_URL = original_url
+        server.shutdown()
+        server.server_close()
+
+    return {"requests": requests, "concurrency": concurrency, "modes": modes}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark per-request chat provider overhead")
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--json", action="store_true", help="Print machine-readable JSON")
+    args = parser.parse_args()
+
+    report = run(args.requests, args.concurrency)
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+
+    print(f"{report['requests']} requests, concurrency {report['concurrency']}")
+    for mode, row in report["modes"].items():
+        print(
+            f"  {mode:<12} p50 {row['p50_ms']:.2f}ms  p95 {row['p95_ms']:.2f}ms  "
+            f"{row['qps']} req/s  {row['connections_opened']} connections"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+Recall@k vs latency of the IVF index compared with exact search.
+
+Usage (from backend/):
+    python -m benchmarks.rag.bench_ann
+    python -m benchmarks.rag.bench_ann --sizes 100000 --nprobe 4 16 64
+    python -m benchmarks.rag.bench_ann --store data/rag_store   # a real chat store, read-only copy
+"""
+
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+from typing import Dict, List
+
+import numpy as np
+
+from app.rag import retriever as retriever_module
+from app.rag.retriever import Retriever
+from app.rag.vector_store import LocalVectorStore
+from benchmarks.rag.common import synthetic_texts, time_calls, write_synthetic_store
+
+
+def _evaluate(store: LocalVectorStore, queries: List[str], nprobes: List[int], k: int) -> Dict:
+    retriever_module.vector_store = store
+    retriever = Retriever(cache_size=0)
+
+    start = time.perf_counter()
+    store.train_index()
+    train_seconds = time.perf_counter() - start
+
+    # Hashed embeddings produce many tied scores, so an approximate hit
+    # counts if it scores at least as well as the k-th exact hit.
+    exact_floor = []
+    for q in queries:
+        hits = retriever.search(q, top_k=k, exact=True)
+        exact_floor.append((len(hits), hits[-1]["score"] - 1e-6 if hits else 0.0))
+    report = {
+        "chunks": store.count(),
+        "train_seconds": round(train_seconds, 3),
+        "exact": time_calls(lambda q: retriever.search(q, top_k=k, exact=True), [(q,) for q in queries]),
+        "ivf": [],
+    }
+
+    for nprobe in nprobes:
+        found = 0
+        expected = 0
+        for q, (size, floor) in zip(queries, exact_floor):
+            approx = retriever.search(q, top_k=k, nprobe=nprobe)
+            found += sum(1 for hit in approx if hit["score"] >= floor)
+            expected += size
+        timing = time_calls(lambda q: retriever.search(q, top_k=k, nprobe=nprobe), [(q,) for q in queries])
+        timing["nprobe"] = nprobe
+        timing[f"recall@{k}"] = found / expected if expected else 1.0
+        report["ivf"].append(timing)
+
+    return report
+
+
+def run(sizes: List[int], store_path: str, nprobes: List[int], queries: int, k: int) -> List[Dict]:
+    results = []
+
+    for size in sizes:
+        with tempfile.TemporaryDirectory() as directory:
+            write_synthetic_store(directory, size)
+            store = LocalVectorStore(store_path=directory, index_kind="ivf")
+            report = _evaluate(store, synthetic_texts(queries, seed=1, words_per_text=4), nprobes, k)
+            report["corpus"] = "synthetic"
+            store.close()
+            results.append(report)
+
+    if store_path:
+        with tempfile.TemporaryDirectory() as directory:
+            copy_path = os.path.join(directory, "store")
+            shutil.copytree(store_path, copy_path)
+            store = LocalVectorStore(store_path=copy_path, index_kind="ivf")
+            snapshot = store.snapshot()
+            rng = np.random.default_rng(2)
+            picks = rng.choice(snapshot.count, size=min(queries, snapshot.count), replace=False)
+            chat_queries = [snapshot.hit(int(ordinal), 0.0)["text"] for ordinal in picks]
+            report = _evaluate(store, chat_queries, nprobes, k)
+            report["corpus"] = "chat"
+            store.close()
+            results.append(report)
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark IVF recall and latency against exact search")
+    parser.add_argument("--sizes", type=int, nargs="*", default=[10_000, 100_000])
+    parser.add_argument("--store", default="", help="Existing RAG store directory to use as a real chat corpus")
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 16, 64])
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--json", action="store_true", help="Print machine-readable JSON")
+    args = parser.parse_args()
+
+    original_store = retriever_module.vector_store
+    try:
+        results = run(args.sizes, args.store, args.nprobe, args.queries, args.k)
+    finally:
+        retriever_module.vector_store = original_store
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    for report in results:
+        exact = report["exact"]
+        print(
+            f"{report['corpus']} corpus, {report['chunks']} chunks "
+            f"(train {report['train_seconds']}s, exact p50 {exact['p50_ms']:.2f}ms p99 {exact['p99_ms']:.2f}ms)"
+        )
+        for row in report["ivf"]:
+            print(
+                f"  nprobe {row['nprobe']:>4}: recall@{args.k} {row[f'recall@{args.k}']:.3f}  "
+                f"p50 {row['p50_ms']:.2f}ms  p99 {row['p99_ms']:.2f}ms"
+            )
+
+
+if __name__ == "__main__":
+    main()
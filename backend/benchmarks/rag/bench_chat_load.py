@@ -0,0 +1,139 @@
+"""
+Concurrent-chat throughput with blocking vs async RAG calls.
+
+Drives the chat hot path (RAG search, a simulated LLM call, RAG ingest of
+both turns) from many concurrent clients on one event loop, first with
+the synchronous retriever calls the chat endpoint used to make and then
+with ``Retriever.asearch`` plus the background ``IngestQueue``. A probe
+task measures how late the event loop wakes up, which is what every
+other request on the server feels.
+
+Usage (from backend/):
+    python -m benchmarks.rag.bench_chat_load
+    python -m benchmarks.rag.bench_chat_load --chunks 200000 --clients 64 --json
+"""
+
+import argparse
+import asyncio
+import json
+import tempfile
+import time
+from typing import Dict, List
+
+from app.rag import retriever as retriever_module
+from app.rag.ingest_queue import IngestQueue
+from app.rag.retriever import Retriever
+from app.rag.vector_store import LocalVectorStore
+from benchmarks.rag.common import percentile_ms, synthetic_texts, write_synthetic_store
+
+
+async def _blocking_turn(retriever: Retriever, queue: IngestQueue, text: str, llm_seconds: float):
+    retriever.search(text, top_k=3, filters={"user_id": "user-0"})
+    await asyncio.sleep(llm_seconds)
+    retriever.add_text(text, {"user_id": "user-0", "role": "user", "kind": "chat"})
+    retriever.add_text("ok: " + text, {"user_id": "user-0", "role": "assistant", "kind": "chat"})
+
+
+async def _async_turn(retriever: Retriever, queue: IngestQueue, text: str, llm_seconds: float):
+    await retriever.asearch(text, top_k=3, filters={"user_id": "user-0"})
+    await asyncio.sleep(llm_seconds)
+    await queue.enqueue(
+        [text, "ok: " + text],
+        [{"user_id": "user-0", "role": "user", "kind": "chat"}, {"user_id": "user-0", "role": "assistant", "kind": "chat"}]
+    )
+
+
+async def _load(turn, retriever, queue, texts: List[str], clients: int, llm_seconds: float) -> Dict:
+    pending = list(reversed(texts))
+    latencies: List[float] = []
+    lags: List[float] = []
+    done = asyncio.Event()
+
+    async def probe():
+        while not done.is_set():
+            start = time.perf_counter()
+            await asyncio.sleep(0.001)
+            lags.append(time.perf_counter() - start - 0.001)
+
+    async def client():
+        while pending:
+            text = pending.pop()
+            start = time.perf_counter()
+            await turn(retriever, queue, text, llm_seconds)
+            latencies.append(time.perf_counter() - start)
+
+    probe_task = asyncio.create_task(probe())
+    started = time.perf_counter()
+    await asyncio.gather(*[client() for _ in range(clients)])
+    elapsed = time.perf_counter() - started
+    done.set()
+    await probe_task
+
+    return {
+        "requests": len(latencies),
+        "throughput_rps": round(len(latencies) / elapsed, 1),
+        "latency_p50_ms": round(percentile_ms(latencies, 50), 2),
+        "latency_p99_ms": round(percentile_ms(latencies, 99), 2),
+        "loop_lag_p99_ms": round(percentile_ms(lags, 99), 2),
+        "loop_lag_max_ms": round(max(lags) * 1000.0, 2) if lags else 0.0,
+    }
+
+
+def run(chunks: int, requests: int, clients: int, llm_ms: float, workers: int) -> Dict:
+    texts = synthetic_texts(requests, seed=3, words_per_text=8)
+    results = {"chunks": chunks, "requests": requests, "clients": clients, "llm_ms": llm_ms}
+
+    for mode, turn in (("blocking", _blocking_turn), ("async", _async_turn)):
+        with tempfile.TemporaryDirectory() as directory:
+            write_synthetic_store(directory, chunks)
+            store = LocalVectorStore(store_path=directory, index_kind="flat", seal_threshold=4096)
+            retriever_module.vector_store = store
+            retriever = Retriever(search_workers=workers, cache_size=0)
+            queue = IngestQueue()
+
+            report = asyncio.run(_load(turn, retriever, queue, texts, clients, llm_ms / 1000.0))
+            queue.close(timeout=60)
+            report["rows_written"] = store.count() - chunks
+            results[mode] = report
+
+            retriever.close()
+            store.close()
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark concurrent chat with blocking vs async RAG calls")
+    parser.add_argument("--chunks", type=int, default=50_000)
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--clients", type=int, default=32)
+    parser.add_argument("--llm-ms", type=float, default=50.0, help="Simulated model latency per turn")
+    parser.add_argument("--workers", type=int, default=4, help="Search threads for the async run")
+    parser.add_argument("--json", action="store_true", help="Print machine-readable JSON")
+    args = parser.parse_args()
+
+    original_store = retriever_module.vector_store
+    try:
+        results = run(args.chunks, args.requests, args.clients, args.llm_ms, args.workers)
+    finally:
+        retriever_module.vector_store = original_store
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(
+        f"{results['chunks']} chunks, {results['requests']} turns, {results['clients']} clients, "
+        f"{results['llm_ms']:.0f}ms simulated LLM"
+    )
+    for mode in ("blocking", "async"):
+        row = results[mode]
+        print(
+            f"  {mode:<9} {row['throughput_rps']:>7} req/s  "
+            f"p50 {row['latency_p50_ms']:.1f}ms  p99 {row['latency_p99_ms']:.1f}ms  "
+            f"loop lag p99 {row['loop_lag_p99_ms']:.1f}ms  max {row['loop_lag_max_ms']:.1f}ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""
+Mixed reader/writer throughput of one RAG shard.
+
+Reader threads search continuously while writer threads add documents
+(and a deleter tombstones some of them), with sealing and background
+compaction running as they normally would. Reports searches and writes
+per second, search latency percentiles, and how long taking a snapshot
+took, which is where readers used to queue behind writers.
+
+Usage (from backend/):
+    python -m benchmarks.rag.bench_concurrency
+    python -m benchmarks.rag.bench_concurrency --readers 8 --writers 2 --seconds 10 --json
+"""
+
+import argparse
+import json
+import random
+import tempfile
+import threading
+import time
+from typing import Dict, List
+
+from app.rag import retriever as retriever_module
+from app.rag.embeddings import embedder
+from app.rag.retriever import Retriever
+from app.rag.vector_store import LocalVectorStore
+from benchmarks.rag.common import percentile_ms, synthetic_texts, write_synthetic_store
+
+
+def run_mixed(
+    store: LocalVectorStore,
+    readers: int,
+    writers: int,
+    seconds: float,
+    batch: int = 8,
+    delete_every: int = 4
+) -> Dict:
+    """
+    Hammer ``store`` from reader and writer threads for ``seconds``. Any
+    exception in a thread is collected in ``errors`` instead of raised.
+    """
+    original_store = retriever_module.vector_store
+    retriever_module.vector_store = store
+    retriever = Retriever(cache_size=0)
+    stop = threading.Event()
+    errors: List[str] = []
+    latencies: List[List[float]] = [[] for _ in range(readers)]
+    waits: List[List[float]] = [[] for _ in range(readers)]
+    written = [0] * writers
+    deleted = [0]
+    inconsistent = [0]
+    queries = synthetic_texts(64, seed=7, words_per_text=4)
+
+    def reader(slot: int):
+        rng = random.Random(slot)
+        try:
+            while not stop.is_set():
+                start = time.perf_counter()
+                snapshot = store.snapshot()
+                waits[slot].append(time.perf_counter() - start)
+                if snapshot.count != sum(len(block) for block in snapshot.blocks):
+                    inconsistent[0] += 1
+                start = time.perf_counter()
+                retriever.search(rng.choice(queries), top_k=5, collapse_duplicates=False)
+                latencies[slot].append(time.perf_counter() - start)
+        except Exception as e:
+            errors.append(f"reader: {e!r}")
+
+    def writer(slot: int):
+        count = 0
+        try:
+            while not stop.is_set():
+                texts = [f"writer {slot} note {count + i} " + queries[(count + i) % len(queries)] for i in range(batch)]
+                ids = store.add_documents(texts, embedder.embed_many(texts))
+                count += batch
+                written[slot] = count
+                if slot == 0 and count % (batch * delete_every) == 0:
+                    deleted[0] += store.delete(ids[:1])
+        except Exception as e:
+            errors.append(f"writer: {e!r}")
+
+    threads = [threading.Thread(target=reader, args=(i,)) for i in range(readers)]
+    threads += [threading.Thread(target=writer, args=(i,)) for i in range(writers)]
+    started = time.perf_counter()
+    try:
+        for thread in threads:
+            thread.start()
+        time.sleep(seconds)
+        stop.set()
+        for thread in threads:
+            thread.join()
+    finally:
+        retriever_module.vector_store = original_store
+    elapsed = time.perf_counter() - started
+
+    samples = [sample for slot in latencies for sample in slot]
+    snapshot_waits = [sample for slot in waits for sample in slot]
+    return {
+        "readers": readers,
+        "writers": writers,
+        "seconds": round(elapsed, 2),
+        "searches": len(samples),
+        "searches_per_s": round(len(samples) / elapsed, 1),
+        "writes": sum(written),
+        "writes_per_s": round(sum(written) / elapsed, 1),
+        "deleted": deleted[0],
+        "search_p50_ms": round(percentile_ms(samples, 50), 3),
+        "search_p99_ms": round(percentile_ms(samples, 99), 3),
+        "snapshot_p99_ms": round(percentile_ms(snapshot_waits, 99), 4),
+        "snapshot_max_ms": round(max(snapshot_waits, default=0.0) * 1000.0, 4),
+        "inconsistent_snapshots": inconsistent[0],
+        "errors": errors,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark concurrent RAG searches and writes on one shard")
+    parser.add_argument("--chunks", type=int, default=50_000, help="Rows in the shard before the run")
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--writers", type=int, default=2)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--json", action="store_true", help="Print machine-readable JSON")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        write_synthetic_store(directory, args.chunks)
+        store = LocalVectorStore(store_path=directory, index_kind="flat", seal_threshold=1024)
+        result = run_mixed(store, args.readers, args.writers, args.seconds)
+        store.close()
+
+    if args.json:
+        print(json.dumps(result, indent=2))
+        return
+
+    print(f"{args.chunks} chunks, {result['readers']} readers, {result['writers']} writers, {result['seconds']}s")
+    print(
+        f"  searches {result['searches_per_s']:>8}/s  p50 {result['search_p50_ms']:.2f}ms  "
+        f"p99 {result['search_p99_ms']:.2f}ms"
+    )
+    print(f"  writes   {result['writes_per_s']:>8}/s  deleted {result['deleted']}")
+    print(f"  snapshot p99 {result['snapshot_p99_ms']:.4f}ms  max {result['snapshot_max_ms']:.4f}ms")
+    if result["errors"] or result["inconsistent_snapshots"]:
+        print(f"  errors: {result['errors']}  inconsistent snapshots: {result['inconsistent_snapshots']}")
+
+
+if __name__ == "__main__":
+    main()
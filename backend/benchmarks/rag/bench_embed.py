@@ -0,0 +1,105 @@
+"""
+Embedding throughput: LocalHashEmbedder.embed_many vs the original
+per-text, per-token SHA-256 loop.
+
+Usage (from backend/):
+    python -m benchmarks.rag.bench_embed
+    python -m benchmarks.rag.bench_embed --texts 50000 --batch 256 --json
+"""
+
+import argparse
+import hashlib
+import json
+import math
+import re
+import time
+from typing import Dict, List
+
+import numpy as np
+
+from app.rag.embeddings import LocalHashEmbedder
+from benchmarks.rag.common import synthetic_texts
+
+
+_TOKEN_PATTERN = re.compile(r"[a-zA-Z0-9_]+")
+CHAT_FILLERS = ["ok", "thanks", "thank you", "yes", "no", "sure", "got it", "ok thanks"]
+
+
+def _legacy_embed(text: str, dimension: int = 256) -> List[float]:
+    vector = [0.0] * dimension
+    tokens = _TOKEN_PATTERN.findall((text or "").lower())
+    if not tokens:
+        return vector
+
+    for token in tokens:
+        digest = hashlib.sha256(token.encode("utf-8")).digest()
+        bucket = int.from_bytes(digest[:4], "big") % dimension
+        vector[bucket] += 1.0
+
+    norm = math.sqrt(sum(v * v for v in vector))
+    if norm == 0.0:
+        return vector
+    return [v / norm for v in vector]
+
+
+def _chat_like(count: int, seed: int = 0) -> List[str]:
+    """
+    Mostly unique texts with a share of short repeated replies.
+    """
+    rng = np.random.default_rng(seed)
+    texts = synthetic_texts(count, seed=seed)
+    for i in np.flatnonzero(rng.random(count) < 0.3):
+        texts[i] = CHAT_FILLERS[int(rng.integers(0, len(CHAT_FILLERS)))]
+    return texts
+
+
+def _throughput(fn, texts: List[str], batch: int) -> float:
+    start = time.perf_counter()
+    for i in range(0, len(texts), batch):
+        fn(texts[i:i + batch])
+    elapsed = time.perf_counter() - start
+    return len(texts) / elapsed if elapsed else 0.0
+
+
+def run(count: int, batch: int) -> List[Dict]:
+    results = []
+    corpora = {"unique": synthetic_texts(count, seed=3), "chat": _chat_like(count, seed=4)}
+
+    for name, texts in corpora.items():
+        legacy = _throughput(lambda chunk: [_legacy_embed(text) for text in chunk], texts, batch)
+        cold = _throughput(LocalHashEmbedder(cache_size=0).embed_many, texts, batch)
+        cached = _throughput(LocalHashEmbedder().embed_many, texts, batch)
+        results.append({
+            "corpus": name,
+            "texts": count,
+            "batch": batch,
+            "legacy_texts_per_sec": round(legacy),
+            "embed_many_texts_per_sec": round(cold),
+            "embed_many_cached_texts_per_sec": round(cached),
+        })
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark embedding throughput")
+    parser.add_argument("--texts", type=int, default=20_000)
+    parser.add_argument("--batch", type=int, default=128)
+    parser.add_argument("--json", action="store_true", help="Print machine-readable JSON")
+    args = parser.parse_args()
+
+    results = run(args.texts, args.batch)
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{'corpus':>8} | {'legacy':>12} | {'embed_many':>12} | {'+ cache':>12}  (texts/sec)")
+    for row in results:
+        print(
+            f"{row['corpus']:>8} | {row['legacy_texts_per_sec']:>12} | "
+            f"{row['embed_many_texts_per_sec']:>12} | {row['embed_many_cached_texts_per_sec']:>12}"
+        )
+
+
+if __name__ == "__main__":
+    main()
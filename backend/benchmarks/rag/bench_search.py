@@ -0,0 +1,112 @@
+"""
+Search latency: vectorized Retriever.search vs the original per-document loop.
+
+Usage (from backend/):
+    python -m benchmarks.rag.bench_search
+    python -m benchmarks.rag.bench_search --sizes 10000 100000 --queries 100 --json
+"""
+
+import argparse
+import json
+import math
+import tempfile
+from typing import Dict, List
+
+from app.rag import retriever as retriever_module
+from app.rag.embeddings import embedder
+from app.rag.retriever import Retriever
+from app.rag.vector_store import LocalVectorStore
+from benchmarks.rag.common import synthetic_texts, time_calls, write_synthetic_store
+
+
+def _legacy_cosine_similarity(a: List[float], b: List[float]) -> float:
+    if len(a) != len(b):
+        return 0.0
+
+    dot = 0.0
+    norm_a = 0.0
+    norm_b = 0.0
+
+    for i in range(len(a)):
+        dot += a[i] * b[i]
+        norm_a += a[i] * a[i]
+        norm_b += b[i] * b[i]
+
+    if norm_a == 0.0 or norm_b == 0.0:
+        return 0.0
+
+    return dot / (math.sqrt(norm_a) * math.sqrt(norm_b))
+
+
+def _legacy_search(docs: List[Dict], query: str, top_k: int = 5) -> List[Dict]:
+    query_embedding = embedder.embed(query)
+    scored = []
+    for doc in docs:
+        score = _legacy_cosine_similarity(query_embedding, doc["embedding"])
+        if score > 0:
+            scored.append({"id": doc["id"], "score": score})
+    scored.sort(key=lambda x: x["score"], reverse=True)
+    return scored[:top_k]
+
+
+def run(sizes: List[int], queries: int, legacy_queries: int, legacy_max: int) -> List[Dict]:
+    query_texts = synthetic_texts(queries, seed=1, words_per_text=4)
+    results = []
+
+    for size in sizes:
+        with tempfile.TemporaryDirectory() as directory:
+            write_synthetic_store(directory, size)
+            store = LocalVectorStore(store_path=directory)
+            retriever_module.vector_store = store
+            retriever = Retriever(cache_size=0)
+
+            row = {
+                "chunks": size,
+                "vectorized": time_calls(lambda q: retriever.search(q, top_k=5), [(q,) for q in query_texts]),
+            }
+
+            if size <= legacy_max:
+                docs = store.all_documents()
+                row["legacy_loop"] = time_calls(
+                    lambda q: _legacy_search(docs, q),
+                    [(q,) for q in query_texts[:legacy_queries]]
+                )
+                del docs
+
+            store.close()
+            results.append(row)
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark RAG search latency")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--legacy-queries", type=int, default=5, help="The loop is slow; sample fewer queries")
+    parser.add_argument("--legacy-max", type=int, default=100_000, help="Skip the loop above this many chunks")
+    parser.add_argument("--json", action="store_true", help="Print machine-readable JSON")
+    args = parser.parse_args()
+
+    original_store = retriever_module.vector_store
+    try:
+        results = run(args.sizes, args.queries, args.legacy_queries, args.legacy_max)
+    finally:
+        retriever_module.vector_store = original_store
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{'chunks':>10} | {'vectorized p50':>14} | {'p99':>8} | {'loop p50':>10} | {'p99':>8}")
+    for row in results:
+        legacy = row.get("legacy_loop")
+        loop_cols = (
+            f"{legacy['p50_ms']:>8.1f}ms | {legacy['p99_ms']:>6.1f}ms" if legacy else f"{'skipped':>10} | {'':>8}"
+        )
+        vec = row["vectorized"]
+        print(f"{row['chunks']:>10} | {vec['p50_ms']:>12.2f}ms | {vec['p99_ms']:>6.2f}ms | {loop_cols}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+"""
+Shared helpers for the RAG benchmarks.
+"""
+
+import os
+import sys
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from app.rag.segments import MANIFEST_NAME, Manifest, Segment, VectorBlock, normalize_rows
+
+
+WORDS = (
+    "meeting calendar email report project budget invoice flight hotel reminder "
+    "doctor gym dinner weather music movie deadline review draft slides client "
+    "launch release bug deploy server backup invoice payment salary tax school "
+    "birthday gift grocery recipe coffee travel train ticket visa passport phone"
+).split()
+
+
+def synthetic_texts(count: int, seed: int = 0, words_per_text: int = 12) -> List[str]:
+    rng = np.random.default_rng(seed)
+    picks = rng.integers(0, len(WORDS), size=(count, words_per_text))
+    return [" ".join(WORDS[i] for i in row) for row in picks]
+
+
+CHAT_TEMPLATES = (
+    ("user", "remind me about the {0} {1} on friday"),
+    ("user", "can you find the {0} for the {1} {2}"),
+    ("user", "what did we decide about the {0} and the {1}"),
+    ("assistant", "sure, I added the {0} {1} to your list"),
+    ("assistant", "the {0} is due before the {1} {2}"),
+    ("assistant", "I found two notes about the {0} {1}"),
+)
+
+QUERY_TEMPLATES = (
+    "what did I say about the {0} {1}",
+    "find my notes on the {0}",
+    "when is the {0} {1} {2}",
+    "{0} {1}",
+)
+
+
+def chat_corpus(users: int, per_user: int, seed: int = 0) -> Tuple[List[str], List[Dict]]:
+    """
+    Chat turns for ``users`` users, alternating templates per role, with
+    ``created_at`` spread over the last 90 days.
+    """
+    rng = np.random.default_rng(seed)
+    now = int(time.time())
+    texts: List[str] = []
+    metadatas: List[Dict] = []
+    for turn in range(per_user):
+        for user in range(users):
+            role, template = CHAT_TEMPLATES[int(rng.integers(len(CHAT_TEMPLATES)))]
+            texts.append(template.format(*(WORDS[i] for i in rng.integers(0, len(WORDS), size=3))))
+            metadatas.append({
+                "user_id": f"user-{user}",
+                "role": role,
+                "kind": "chat",
+                "created_at": now - int(rng.integers(0, 90 * 86400)),
+                "turn": turn,
+            })
+    return texts, metadatas
+
+
+def chat_queries(count: int, users: int, seed: int = 1) -> List[Tuple[str, str]]:
+    """
+    ``(user_id, query)`` pairs phrased like questions asked in chat.
+    """
+    rng = np.random.default_rng(seed)
+    queries = []
+    for _ in range(count):
+        template = QUERY_TEMPLATES[int(rng.integers(len(QUERY_TEMPLATES)))]
+        words = (WORDS[i] for i in rng.integers(0, len(WORDS), size=3))
+        queries.append((f"user-{int(rng.integers(users))}", template.format(*words)))
+    return queries
+
+
+def synthetic_embeddings(count: int, dimension: int = 256, nnz: int = 12, seed: int = 0) -> np.ndarray:
+    """
+    Sparse non-negative unit vectors shaped like LocalHashEmbedder output.
+    """
+    rng = np.random.default_rng(seed)
+    matrix = np.zeros((count, dimension), dtype=np.float32)
+    rows = np.repeat(np.arange(count), nnz)
+    cols = rng.integers(0, dimension, size=count * nnz)
+    np.add.at(matrix, (rows, cols), 1.0)
+    return normalize_rows(matrix)
+
+
+def write_synthetic_store(
+    directory: str,
+    count: int,
+    dimension: int = 256,
+    users: int = 1,
+    seed: int = 0,
+    chunk: int = 100_000
+):
+    """
+    Write ``count`` synthetic rows straight into sealed segments, without
+    going through the WAL, so million-row stores build in seconds.
+    """
+    os.makedirs(directory, exist_ok=True)
+    manifest = Manifest(dimension=dimension)
+    for start in range(0, count, chunk):
+        size = min(chunk, count - start)
+        block = VectorBlock(
+            [f"doc-{start + i}" for i in range(size)],
+            [f"synthetic document {start + i}" for i in range(size)],
+            [{"user_id": f"user-{(start + i) % users}", "kind": "chat"} for i in range(size)],
+            synthetic_embeddings(size, dimension, seed=seed + start),
+        )
+        segment = Segment.write(directory, manifest.allocate_name(), [block])
+        manifest.segments.append({"name": segment.name, "count": segment.count})
+    manifest.save(os.path.join(directory, MANIFEST_NAME))
+
+
+def percentile_ms(samples: List[float], q: float) -> float:
+    return float(np.percentile(np.asarray(samples) * 1000.0, q)) if samples else 0.0
+
+
+def latency_summary(samples: List[float]) -> Dict[str, float]:
+    total = float(np.sum(samples)) if samples else 0.0
+    return {
+        "runs": len(samples),
+        "p50_ms": round(percentile_ms(samples, 50), 3),
+        "p95_ms": round(percentile_ms(samples, 95), 3),
+        "p99_ms": round(percentile_ms(samples, 99), 3),
+        "max_ms": round(max(samples) * 1000.0, 3) if samples else 0.0,
+        "qps": round(len(samples) / total, 1) if total else 0.0,
+    }
+
+
+def peak_rss_mb() -> Optional[float]:
+    """
+    Peak resident set size of this process, or None where unsupported.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Bytes on macOS, kilobytes elsewhere.
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def directory_bytes(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            total += os.path.getsize(os.path.join(root, name))
+    return total
+
+
+def time_calls(fn: Callable, args_list: List) -> Dict[str, float]:
+    samples = []
+    for args in args_list:
+        start = time.perf_counter()
+        fn(*args)
+        samples.append(time.perf_counter() - start)
+
+    return {
+        "runs": len(samples),
+        "p50_ms": percentile_ms(samples, 50),
+        "p99_ms": percentile_ms(samples, 99),
+        "mean_ms": float(np.mean(samples) * 1000.0) if samples else 0.0,
+    }
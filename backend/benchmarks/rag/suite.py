@@ -0,0 +1,292 @@
+"""
+End-to-end RAG benchmark and recall evaluation.
+
+Builds a synthetic multi-user chat corpus through the real ingest path
+(embedder, sharded store, indexes), replays chat-style questions against
+it and reports:
+
+- ingest throughput (chunks/s, embedding included),
+- search latency percentiles per search mode, and for repeated
+  questions served by the result cache,
+- recall@k of vector search against exact brute force over the user's shard,
+- peak RSS of the process and the store's size on disk.
+
+The report is JSON, stamped with the git commit, so runs can be diffed
+across commits to catch regressions.
+
+Usage (from backend/):
+    python -m benchmarks.rag.suite
+    python -m benchmarks.rag.suite --preset medium --json --output bench.json
+    python -m benchmarks.rag.suite --users 50 --chunks-per-user 4000 --queries 500
+    python run_tests.py --bench
+"""
+
+import argparse
+import json
+import platform
+import subprocess
+import tempfile
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.config.settings import settings
+from app.rag import retriever as retriever_module
+from app.rag.embeddings import embedder
+from app.rag.retriever import Retriever
+from app.rag.segments import normalize_rows
+from app.rag.vector_store import ShardedVectorStore
+from benchmarks.rag.common import (
+    chat_corpus,
+    chat_queries,
+    directory_bytes,
+    latency_summary,
+    peak_rss_mb,
+)
+
+
+PRESETS = {
+    "small": {"users": 4, "chunks_per_user": 500, "queries": 100},
+    "medium": {"users": 20, "chunks_per_user": 5_000, "queries": 300},
+    "large": {"users": 100, "chunks_per_user": 10_000, "queries": 1_000},
+}
+
+# Search options per reported mode.
+MODES = {
+    "vector": {},
+    "hybrid": {"hybrid": True},
+}
+
+# Scores within this of the k-th exact score count as ties.
+TIE_TOLERANCE = 1e-5
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        result = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, timeout=10)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return result.stdout.strip() or None
+
+
+def _ingest(retriever: Retriever, texts: List[str], metadatas: List[Dict], batch_size: int) -> Dict:
+    started = time.perf_counter()
+    for start in range(0, len(texts), batch_size):
+        retriever.add_texts(texts[start:start + batch_size], metadatas[start:start + batch_size])
+    elapsed = time.perf_counter() - started
+    return {
+        "chunks": len(texts),
+        "batch_size": batch_size,
+        "seconds": round(elapsed, 3),
+        "chunks_per_second": round(len(texts) / elapsed, 1) if elapsed else 0.0,
+    }
+
+
+def _train_indexes(store: ShardedVectorStore, users: int) -> float:
+    """
+    Finish the index training the ingest started, so searches do not race
+    it; shards too small to train stay on exact search, as in production.
+    """
+    started = time.perf_counter()
+    for user in range(users):
+        with store._pinned(f"user-{user}") as shard:
+            if shard._maintenance_thread is not None:
+                shard._maintenance_thread.join()
+            if shard._index is not None and shard._index.needs_training():
+                shard.train_index()
+    return round(time.perf_counter() - started, 3)
+
+
+def _exact_cutoff(store: ShardedVectorStore, user_id: str, query: str, top_k: int) -> Tuple[float, int]:
+    """
+    Score of the k-th best live row of the user's shard by brute force,
+    and how many rows can match at all.
+    """
+    snapshot = store.snapshot(user_id)
+    if not snapshot.count:
+        return 0.0, 0
+    query_embedding = normalize_rows(np.asarray(embedder.embed(query), dtype=np.float32))
+    scores = snapshot.gather(np.arange(snapshot.count)) @ query_embedding
+    if snapshot.dead is not None:
+        scores[snapshot.dead[:snapshot.count]] = -np.inf
+    scores = scores[scores > 0]
+    if not scores.shape[0]:
+        return 0.0, 0
+    expected = min(top_k, scores.shape[0])
+    return float(np.partition(-scores, expected - 1)[expected - 1] * -1), expected
+
+
+def _recall(hits: List[Dict], cutoff: float, expected: int) -> float:
+    """
+    Share of the exact top-k found, counting ties with the k-th exact
+    score as correct (hashed embeddings tie often).
+    """
+    if not expected:
+        return 1.0
+    found = sum(1 for hit in hits if hit["score"] >= cutoff - TIE_TOLERANCE)
+    return min(found, expected) / expected
+
+
+def _cached_repeat(query_pairs: List[Tuple[str, str]], top_k: int) -> Dict:
+    """
+    Latency of asking every question a second time with the result cache on.
+    """
+    retriever = Retriever(cache_size=len(query_pairs))
+    samples = []
+    for _ in range(2):
+        samples = []
+        for user_id, query in query_pairs:
+            started = time.perf_counter()
+            retriever.search(query, top_k=top_k, filters={"user_id": user_id}, collapse_duplicates=False)
+            samples.append(time.perf_counter() - started)
+    row = latency_summary(samples)
+    row["hit_rate"] = retriever.cache_stats()["hit_rate"]
+    return row
+
+
+def run(
+    users: int,
+    chunks_per_user: int,
+    queries: int,
+    top_k: int = 10,
+    batch_size: int = 64,
+    seed: int = 0,
+    modes: Optional[List[str]] = None,
+    index_kind: Optional[str] = None,
+    quantization: Optional[str] = None,
+) -> Dict:
+    modes = modes or list(MODES)
+    texts, metadatas = chat_corpus(users, chunks_per_user, seed=seed)
+    query_pairs = chat_queries(queries, users, seed=seed + 1)
+
+    report = {
+        "config": {
+            "users": users,
+            "chunks_per_user": chunks_per_user,
+            "queries": queries,
+            "top_k": top_k,
+            "seed": seed,
+            "embedding": embedder.version,
+            "index": index_kind or settings.RAG_INDEX,
+            "quantization": quantization or settings.RAG_QUANTIZATION,
+        },
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "started_at": time.time(),
+    }
+
+    original_store = retriever_module.vector_store
+    with tempfile.TemporaryDirectory() as directory:
+        store = ShardedVectorStore(
+            root=directory,
+            embedder=embedder,
+            index_kind=index_kind,
+            quantization=quantization
+        )
+        retriever_module.vector_store = store
+        # Modes time the scoring itself; the cache gets its own row.
+        retriever = Retriever(cache_size=0)
+        try:
+            report["ingest"] = _ingest(retriever, texts, metadatas, batch_size)
+            report["ingest"]["index_train_seconds"] = _train_indexes(store, users)
+
+            cutoffs = [_exact_cutoff(store, user_id, query, top_k) for user_id, query in query_pairs]
+            report["search"] = {}
+            for mode in modes:
+                samples, recalls = [], []
+                for (user_id, query), (cutoff, expected) in zip(query_pairs, cutoffs):
+                    started = time.perf_counter()
+                    hits = retriever.search(
+                        query,
+                        top_k=top_k,
+                        filters={"user_id": user_id},
+                        collapse_duplicates=False,
+                        **MODES[mode]
+                    )
+                    samples.append(time.perf_counter() - started)
+                    recalls.append(_recall(hits, cutoff, expected))
+                row = latency_summary(samples)
+                # Hybrid ranks by fused rank, not cosine; recall is vector-only.
+                if not MODES[mode].get("hybrid"):
+                    row[f"recall_at_{top_k}"] = round(float(np.mean(recalls)), 4) if recalls else 1.0
+                report["search"][mode] = row
+            report["search"]["cached_repeat"] = _cached_repeat(query_pairs, top_k)
+
+            store.close()
+            report["disk_bytes"] = directory_bytes(directory)
+        finally:
+            retriever.close()
+            store.close()
+            retriever_module.vector_store = original_store
+
+    report["peak_rss_mb"] = peak_rss_mb()
+    return report
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Benchmark RAG ingest, search latency and recall")
+    parser.add_argument("--preset", choices=sorted(PRESETS), default="small")
+    parser.add_argument("--users", type=int, help="Overrides the preset")
+    parser.add_argument("--chunks-per-user", type=int, help="Overrides the preset")
+    parser.add_argument("--queries", type=int, help="Overrides the preset")
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--batch-size", type=int, default=64, help="Chunks per ingest call")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--modes", nargs="+", choices=sorted(MODES), help="Search modes to time")
+    parser.add_argument("--index", choices=["flat", "ivf"], help="Vector index (default: RAG_INDEX)")
+    parser.add_argument("--quantization", choices=["none", "int8"], help="Default: RAG_QUANTIZATION")
+    parser.add_argument("--json", action="store_true", help="Print machine-readable JSON")
+    parser.add_argument("--output", help="Also write the JSON report to this file")
+    args = parser.parse_args(argv)
+
+    scale = dict(PRESETS[args.preset])
+    for key in scale:
+        if getattr(args, key) is not None:
+            scale[key] = getattr(args, key)
+
+    report = run(
+        scale["users"],
+        scale["chunks_per_user"],
+        scale["queries"],
+        top_k=args.top_k,
+        batch_size=args.batch_size,
+        seed=args.seed,
+        modes=args.modes,
+        index_kind=args.index,
+        quantization=args.quantization,
+    )
+    report["config"]["preset"] = args.preset
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+
+    config, ingest = report["config"], report["ingest"]
+    print(
+        f"{config['users']} users x {config['chunks_per_user']} chunks, "
+        f"{config['queries']} queries, top {config['top_k']} "
+        f"({config['embedding']}, {config['index']} index, quantization {config['quantization']})"
+    )
+    print(
+        f"  ingest        {ingest['chunks_per_second']:>9} chunks/s  ({ingest['seconds']}s, "
+        f"index training {ingest['index_train_seconds']}s)"
+    )
+    for mode, row in report["search"].items():
+        recall = row.get(f"recall_at_{config['top_k']}")
+        print(
+            f"  {mode:<13} p50 {row['p50_ms']:.2f}ms  p95 {row['p95_ms']:.2f}ms  "
+            f"p99 {row['p99_ms']:.2f}ms  {row['qps']} q/s"
+            + (f"  recall@{config['top_k']} {recall:.3f}" if recall is not None else "")
+        )
+    print(f"  disk          {report['disk_bytes'] / (1024 * 1024):.1f} MB")
+    if report["peak_rss_mb"] is not None:
+        print(f"  peak RSS      {report['peak_rss_mb']:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
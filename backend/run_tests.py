@@ -6,6 +6,8 @@ Usage:
     python run_tests.py                    # Run all tests with verbose output
     python run_tests.py --coverage         # Run with coverage report
     python run_tests.py --specific test_command_schema.py
+    python run_tests.py --bench            # Run the RAG benchmark suite (JSON report)
+    python run_tests.py --bench --bench-preset medium --bench-output bench.json
 """
 
 import sys
@@ -21,6 +23,9 @@ def main():
     parser.add_argument('--specific', type=str, help='Run specific test file')
     parser.add_argument('--quick', action='store_true', help='Run only quick tests (skip integration tests)')
     parser.add_argument('--verbose', '-v', action='store_true', help='Verbose output (default: True)')
+    parser.add_argument('--bench', action='store_true', help='Run the RAG benchmark suite instead of the tests')
+    parser.add_argument('--bench-preset', default='small', help='Benchmark scale: small, medium or large')
+    parser.add_argument('--bench-output', type=str, help='Write the benchmark JSON report to this file')
     
     args = parser.parse_args()
     
@@ -33,6 +38,9 @@ def main():
     print(f"Test directory: {backend_dir}/tests")
     print("-" * 80)
     
+    if args.bench:
+        return run_benchmarks(args)
+    
     # Build pytest command
     cmd = [sys.executable, "-m", "pytest"]
     
@@ -75,5 +83,25 @@ def main():
     return 0
 
 
+def run_benchmarks(args):
+    cmd = [sys.executable, "-m", "benchmarks.rag.suite", "--preset", args.bench_preset, "--json"]
+    if args.bench_output:
+        cmd.extend(["--output", args.bench_output])
+    
+    print(f"Running: {' '.join(cmd)}")
+    print("-" * 80)
+    
+    result = subprocess.run(cmd)
+    if result.returncode != 0:
+        print("-" * 80)
+        print("❌ Benchmark suite failed")
+        return 1
+    
+    if args.bench_output:
+        print("-" * 80)
+        print(f"📊 Benchmark report written to {args.bench_output}")
+    return 0
+
+
 if __name__ == "__main__":
     sys.exit(main())
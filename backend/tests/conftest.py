@@ -0,0 +1,15 @@
+"""
+Helpers shared by the RAG tests.
+"""
+
+from app.rag.embeddings import embedder
+
+
+def add_text(store, text, metadata=None, **fields):
+    """
+    Add ``text`` to ``store``, embedded by the default embedder. Metadata
+    may be passed as a dict, as keyword arguments or both.
+    """
+    if fields:
+        metadata = dict(metadata or {}, **fields)
+    return store.add_document(text, embedder.embed(text), metadata)
@@ -0,0 +1,55 @@
+import asyncio
+import time
+
+import app.memory.chat_context as chat_context
+from app.memory.chat_context import gather_context, server_timing
+
+
+class _SlowRetriever:
+    def __init__(self, delay):
+        self.delay = delay
+
+    async def asearch(self, query, **options):
+        await asyncio.sleep(self.delay)
+        return [{"text": f"note about {query}"}]
+
+
+def _slow(value, delay):
+    def load(user_id):
+        time.sleep(delay)
+        return value
+    return load
+
+
+def test_lookups_run_concurrently(monkeypatch):
+    monkeypatch.setattr(chat_context, "retriever", _SlowRetriever(0.2))
+    monkeypatch.setattr(chat_context, "load_history", _slow([{"role": "user", "content": "hi"}], 0.2))
+    monkeypatch.setattr(chat_context, "load_profile", _slow({"name": "sam"}, 0.2))
+
+    started = time.perf_counter()
+    history, hits, profile, timings = asyncio.run(gather_context("alice", "dentist"))
+
+    assert time.perf_counter() - started < 0.5
+    assert history == [{"role": "user", "content": "hi"}]
+    assert hits == [{"text": "note about dentist"}]
+    assert profile == {"name": "sam"}
+    assert {timing["status"] for timing in timings.values()} == {"ok"}
+
+
+def test_slow_or_failing_stages_are_skipped(monkeypatch):
+    def broken(user_id):
+        raise RuntimeError("database is locked")
+
+    monkeypatch.setattr(chat_context, "retriever", _SlowRetriever(5.0))
+    monkeypatch.setattr(chat_context, "load_history", _slow([], 0.0))
+    monkeypatch.setattr(chat_context, "load_profile", broken)
+    monkeypatch.setattr(chat_context.settings, "CHAT_RAG_TIMEOUT_MS", 50)
+
+    started = time.perf_counter()
+    history, hits, profile, timings = asyncio.run(gather_context("alice", "dentist"))
+
+    assert time.perf_counter() - started < 1.0
+    assert (history, hits, profile) == ([], [], {})
+    assert timings["rag"]["status"] == "timeout" and timings["profile"]["status"] == "error"
+    header = server_timing(timings)
+    assert 'rag;dur=' in header and 'desc="timeout"' in header and "context;dur=" in header
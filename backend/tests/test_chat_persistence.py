@@ -0,0 +1,193 @@
+import json
+import os
+import threading
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.database.db import Base
+from app.memory.memory_service import MemoryService
+from app.memory.personalization import PersonalizationEngine
+import app.memory.persistence_queue as persistence_module
+from app.memory.persistence_queue import ChatPersistenceQueue
+
+
+class _RagQueue:
+    def __init__(self, hold=False):
+        self.batches = []
+        self.hold = hold
+        self.held = []
+
+    def submit(self, texts, metadatas=None, timeout=None, done=None):
+        self.batches.append((list(texts), list(metadatas)))
+        if self.hold:
+            self.held.append(done)
+        else:
+            done(True)
+
+    def release(self):
+        for done in self.held:
+            done(True)
+        self.held = []
+
+
+@pytest.fixture
+def database(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'chat.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    yield sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    engine.dispose()
+
+
+def _history(session_factory, user_id):
+    db = session_factory()
+    try:
+        return MemoryService(db).get_recent_messages(user_id, limit=50)
+    finally:
+        db.close()
+
+
+def test_turns_are_stored_in_batches_behind_the_caller(database, tmp_path):
+    session_factory = database
+    rag = _RagQueue()
+    gate = threading.Event()
+
+    def gated_session():
+        gate.wait(5)
+        return session_factory()
+
+    persistence = ChatPersistenceQueue(str(tmp_path / "journal"), session_factory=gated_session, rag_queue=rag)
+    persistence.record("alice", "my name is sam", "Nice to meet you, Sam!")
+    for i in range(5):
+        persistence.record("alice", f"question {i}", f"answer {i}", personalize=False)
+
+    # Not stored yet, but already part of the user's history.
+    assert _history(session_factory, "alice") == []
+    merged = persistence.merged_history("alice", lambda: _history(session_factory, "alice"), limit=4)
+    assert merged[-1] == {"role": "assistant", "content": "answer 4"} and len(merged) == 4
+
+    gate.set()
+    assert persistence.flush(timeout=10)
+    stored = _history(session_factory, "alice")
+    assert [message["content"] for message in stored[:2]] == ["my name is sam", "Nice to meet you, Sam!"]
+    assert len([message for message in stored if message["role"] != "system"]) == 12
+    db = session_factory()
+    assert PersonalizationEngine(db).get_profile("alice") == {"name": "sam"}
+    db.close()
+
+    stats = persistence.stats()
+    assert stats["stored"] == 6 and stats["backlog_bytes"] == 0 and stats["pending_turns"] == 0
+    # Far fewer transactions and RAG batches than turns.
+    assert stats["batches"] <= 2 and len(rag.batches) == stats["batches"]
+    assert sum(len(texts) for texts, _ in rag.batches) == 12
+    assert os.path.getsize(persistence.journal_path) == 0
+
+    assert persistence.close(timeout=10)
+    assert os.listdir(tmp_path / "journal") == []
+
+
+def test_journals_left_by_a_crash_are_replayed(database, tmp_path):
+    session_factory = database
+    directory = tmp_path / "journal"
+    directory.mkdir()
+    lines = [
+        json.dumps({"user_id": "bob", "user_text": f"turn {i}", "reply": f"reply {i}", "personalize": False, "at": 0})
+        for i in range(3)
+    ]
+    journal = directory / "4242-deadbeef.jsonl"
+    # Turn 0 was stored before the crash; the last write was torn.
+    journal.write_text("\n".join(lines) + "\n" + '{"user_id": "bob", "user_te')
+    (directory / "4242-deadbeef.jsonl.offset").write_text(json.dumps({"offset": len(lines[0]) + 1}))
+
+    rag = _RagQueue()
+    persistence = ChatPersistenceQueue(str(directory), session_factory=session_factory, rag_queue=rag)
+    persistence.start()
+    assert persistence.close(timeout=10)
+
+    assert [message["content"] for message in _history(session_factory, "bob")] == [
+        "turn 1", "reply 1", "turn 2", "reply 2"
+    ]
+    assert persistence.stats()["recovered"] == 2
+    assert os.listdir(directory) == []
+
+
+def test_failed_batches_stay_journaled_until_stored(database, tmp_path, monkeypatch):
+    monkeypatch.setattr(persistence_module, "RETRY_SECONDS", 0.01)
+    session_factory = database
+    directory = tmp_path / "journal"
+    failures = [7]
+
+    def failing_session():
+        if failures[0]:
+            failures[0] -= 1
+            raise RuntimeError("database is locked")
+        return session_factory()
+
+    persistence = ChatPersistenceQueue(str(directory), session_factory=failing_session, rag_queue=_RagQueue())
+    persistence.record("carol", "first", "one", personalize=False)
+    # More failures than the old attempt limit: nothing is dropped.
+    assert persistence.flush(timeout=10)
+    assert [message["content"] for message in _history(session_factory, "carol")] == ["first", "one"]
+    assert persistence.stats()["retries"] == 7
+    assert persistence.close(timeout=10)
+
+    # A database that keeps failing until shutdown leaves the journal behind.
+    failures[0] = 10 ** 6
+    persistence = ChatPersistenceQueue(str(directory), session_factory=failing_session, rag_queue=_RagQueue())
+    persistence.record("carol", "second", "two", personalize=False)
+    merged = persistence.merged_history("carol", lambda: _history(session_factory, "carol"))
+    assert merged[-1] == {"role": "assistant", "content": "two"}
+    assert not persistence.close(timeout=10)
+    assert any(name.endswith(".jsonl") for name in os.listdir(directory))
+
+    replay = ChatPersistenceQueue(str(directory), session_factory=session_factory, rag_queue=_RagQueue())
+    replay.start()
+    assert replay.close(timeout=10)
+    assert [message["content"] for message in _history(session_factory, "carol")] == ["first", "one", "second", "two"]
+    assert replay.stats()["recovered"] == 1
+    assert os.listdir(directory) == []
+
+
+def test_turns_are_checkpointed_only_once_their_rag_ingest_is_written(database, tmp_path):
+    session_factory = database
+    rag = _RagQueue(hold=True)
+    persistence = ChatPersistenceQueue(str(tmp_path / "journal"), session_factory=session_factory, rag_queue=rag)
+    persistence.record("dana", "hello", "hi", personalize=False)
+
+    # The rows are stored but the ingest queue has not written the texts.
+    assert not persistence.flush(timeout=0.5)
+    assert [message["content"] for message in _history(session_factory, "dana")] == ["hello", "hi"]
+    stats = persistence.stats()
+    assert stats["backlog_bytes"] == 0 and stats["ingest_backlog_bytes"] > 0
+    with open(persistence.journal_path + ".offset", encoding="utf-8") as f:
+        checkpoint = json.load(f)
+    assert checkpoint["ingested"] == 0 and checkpoint["offset"] == os.path.getsize(persistence.journal_path)
+
+    rag.release()
+    assert persistence.flush(timeout=10)
+    assert os.path.getsize(persistence.journal_path) == 0
+    assert persistence.close(timeout=10)
+
+
+def test_a_crash_before_the_rag_ingest_replays_only_the_rag_texts(database, tmp_path):
+    session_factory = database
+    directory = tmp_path / "journal"
+    directory.mkdir()
+    lines = [
+        json.dumps({"user_id": "erin", "user_text": f"turn {i}", "reply": f"reply {i}", "personalize": False, "at": 0})
+        for i in range(2)
+    ]
+    journal = directory / "4243-deadbeef.jsonl"
+    journal.write_text("\n".join(lines) + "\n")
+    # Turn 0 was stored, but neither turn reached the RAG store.
+    (directory / "4243-deadbeef.jsonl.offset").write_text(json.dumps({"offset": len(lines[0]) + 1, "ingested": 0}))
+
+    rag = _RagQueue()
+    persistence = ChatPersistenceQueue(str(directory), session_factory=session_factory, rag_queue=rag)
+    persistence.start()
+    assert persistence.close(timeout=10)
+
+    assert [message["content"] for message in _history(session_factory, "erin")] == ["turn 1", "reply 1"]
+    assert [texts for texts, _ in rag.batches] == [["turn 0", "reply 0"], ["turn 1", "reply 1"]]
+    assert os.listdir(directory) == []
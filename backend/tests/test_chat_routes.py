@@ -0,0 +1,155 @@
+import json
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+
+from app.ai.base_provider import BaseAIProvider
+from app.ai.chat_metrics import ChatMetrics
+from app.database.db import get_db
+
+# The chat routes import the desktop automation agents, which need Windows.
+routes_ai = pytest.importorskip("app.api.routes_ai")
+
+
+TIMINGS = {
+    "history": {"ms": 1.5, "status": "ok"},
+    "rag": {"ms": 40.0, "status": "timeout"},
+    "profile": {"ms": 0.8, "status": "ok"},
+    "context": {"ms": 41.2, "status": "ok"},
+}
+QUESTION = {"provider": "ollama", "user_id": "sam", "messages": [{"role": "user", "content": "What should I pack for Lisbon?"}]}
+
+
+class Stub(BaseAIProvider):
+    model = "llama3"
+
+    async def generate_response(self, messages, **kwargs):
+        return "Bring good shoes."
+
+    async def stream_response(self, messages, **kwargs):
+        for piece in ("Bring ", "good ", "shoes."):
+            yield piece
+
+    async def health_check(self):
+        return True
+
+    async def list_models(self):
+        return ["llama3"]
+
+
+class Sessions:
+    def __init__(self):
+        self.opened = 0
+        self.closed = 0
+
+    def __call__(self):
+        self.opened += 1
+        return self
+
+    def close(self):
+        self.closed += 1
+
+
+class Recorder:
+    def __init__(self):
+        self.saved = []
+
+    def record(self, user_id, user_text, reply, personalize=True):
+        self.saved.append((user_id, user_text, reply))
+
+
+@pytest.fixture
+def client(monkeypatch):
+    async def gather_context(user_id, user_text):
+        hits = [{"text": "Lisbon is hilly."}]
+        return [], hits, {"city": "Porto"}, {name: dict(timing) for name, timing in TIMINGS.items()}
+
+    recorder = Recorder()
+    metrics = ChatMetrics()
+    sessions = Sessions()
+    monkeypatch.setattr(routes_ai.provider_factory, "get_provider", lambda **kwargs: Stub())
+    monkeypatch.setattr(routes_ai, "gather_context", gather_context)
+    monkeypatch.setattr(routes_ai, "chat_persistence", recorder)
+    monkeypatch.setattr(routes_ai, "chat_metrics", metrics)
+    monkeypatch.setattr(routes_ai, "SessionLocal", sessions)
+
+    app = FastAPI()
+    app.include_router(routes_ai.router, prefix="/api/ai")
+    # Anonymous requests and rejected tokens never reach the database.
+    app.dependency_overrides[get_db] = lambda: None
+    yield TestClient(app), recorder, metrics, sessions
+
+
+def _sse(body):
+    events = []
+    for block in body.strip().split("\n\n"):
+        name, data = block.split("\n")
+        assert name.startswith("event: ") and data.startswith("data: ")
+        event = json.loads(data[len("data: "):])
+        assert event["type"] == name[len("event: "):]
+        events.append(event)
+    return events
+
+
+def test_chat_reports_context_timings_and_prompt_tokens(client):
+    client, recorder, metrics, _ = client
+
+    response = client.post("/api/ai/chat", json=QUESTION)
+
+    assert response.status_code == 200
+    assert response.json() == {"response": "Bring good shoes."}
+    assert response.headers["Server-Timing"] == (
+        'history;dur=1.5, rag;dur=40.0;desc="timeout", profile;dur=0.8, context;dur=41.2'
+    )
+    prompt_tokens = int(response.headers["X-Prompt-Tokens"])
+    assert prompt_tokens > 0
+    assert metrics.stats()["ollama"]["complete"]["prompt_tokens"] == prompt_tokens
+    assert recorder.saved == [("sam", "What should I pack for Lisbon?", "Bring good shoes.")]
+
+
+def test_chat_stream_sends_server_sent_events(client):
+    client, recorder, _, _ = client
+
+    response = client.post("/api/ai/chat/stream", json=QUESTION)
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    assert "rag;dur=40.0" in response.headers["Server-Timing"]
+    events = _sse(response.text)
+    assert [event["token"] for event in events[:-1]] == ["Bring ", "good ", "shoes."]
+    done = events[-1]
+    assert done["type"] == "done" and done["response"] == "Bring good shoes."
+    assert done["context"]["rag"]["status"] == "timeout"
+    assert done["prompt"]["prompt_tokens"] == int(response.headers["X-Prompt-Tokens"])
+    assert recorder.saved == [("sam", "What should I pack for Lisbon?", "Bring good shoes.")]
+
+
+def test_chat_websocket_streams_replies_on_one_connection(client):
+    client, recorder, _, sessions = client
+
+    with client.websocket_connect("/api/ai/chat/ws") as websocket:
+        websocket.send_json({"messages": []})
+        assert websocket.receive_json() == {"type": "error", "detail": "messages cannot be empty"}
+
+        websocket.send_json(QUESTION)
+        events = [websocket.receive_json() for _ in range(4)]
+
+    assert [event["type"] for event in events] == ["token", "token", "token", "done"]
+    assert events[-1]["response"] == "Bring good shoes." and "prompt" in events[-1]
+    assert recorder.saved == [("sam", "What should I pack for Lisbon?", "Bring good shoes.")]
+    # One short session for the token check and one per message.
+    assert sessions.opened == sessions.closed == 3
+
+
+def test_chat_websocket_rejects_a_bad_token(client):
+    client, recorder, _, _ = client
+
+    with pytest.raises(WebSocketDisconnect) as closed:
+        with client.websocket_connect("/api/ai/chat/ws?token=not-a-jwt") as websocket:
+            websocket.send_json(QUESTION)
+            websocket.receive_json()
+
+    assert closed.value.code == 1008
+    assert recorder.saved == []
@@ -0,0 +1,88 @@
+import asyncio
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from app.ai.base_provider import BaseAIProvider
+from app.ai.chat_metrics import ChatMetrics
+from app.ai.ollama_provider import OllamaProvider
+
+
+class _OllamaChatStub(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    requests = []
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        self.requests.append(body)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        lines = [{"message": {"role": "assistant", "content": piece}, "done": False} for piece in ("Hel", "lo", "!")]
+        lines.append({"message": {"role": "assistant", "content": ""}, "done": True})
+        for line in lines:
+            data = (json.dumps(line) + "\n").encode("utf-8")
+            self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+            self.wfile.flush()
+        self.wfile.write(b"0\r\n\r\n")
+
+
+@pytest.fixture
+def ollama():
+    handler = type("Handler", (_OllamaChatStub,), {"requests": []})
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield handler, f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+    server.server_close()
+
+
+async def _collect(stream):
+    return [piece async for piece in stream]
+
+
+def test_ollama_streams_ndjson_pieces(ollama):
+    handler, base_url = ollama
+    provider = OllamaProvider(model="llama3")
+    provider.base_url = base_url
+    messages = [{"role": "user", "content": "hi"}]
+
+    assert asyncio.run(_collect(provider.stream_response(messages))) == ["Hel", "lo", "!"]
+    assert handler.requests[0]["stream"] is True
+
+
+def test_providers_without_streaming_yield_the_whole_reply():
+    class Whole(BaseAIProvider):
+        async def generate_response(self, messages, **kwargs):
+            return "whole reply"
+
+        async def health_check(self):
+            return True
+
+        async def list_models(self):
+            return []
+
+    assert asyncio.run(_collect(Whole().stream_response([]))) == ["whole reply"]
+
+
+def test_chat_metrics_report_ttft_per_provider_and_mode():
+    metrics = ChatMetrics(window=3)
+    for ttft in (0.4, 0.1, 0.2, 0.3):
+        metrics.record("ollama", "stream", ttft, 1.0, chunks=4)
+    metrics.record("ollama", "complete", None, 2.0)
+    metrics.record_failure("openai", "stream")
+
+    stats = metrics.stats()
+    stream = stats["ollama"]["stream"]
+    assert (stream["completed"], stream["samples"]) == (4, 3)
+    assert (stream["ttft_p50_ms"], stream["ttft_p95_ms"]) == (200.0, 300.0)
+    assert stream["chunks_per_reply"] == 4.0
+    # Without streaming the first token comes with the whole reply.
+    assert stats["ollama"]["complete"]["ttft_p50_ms"] == 2000.0
+    assert stats["openai"]["stream"] == {"completed": 0, "failed": 1}
@@ -5,6 +5,7 @@ from app.database.db import Base
 from app.memory.memory_service import MemoryService
 from app.rag.retriever import Retriever
 from app.rag.embeddings import embedder
+from app.rag.vector_store import LocalVectorStore
 
 
 def test_memory_service_isolates_users():
@@ -27,7 +28,7 @@ def test_memory_service_isolates_users():
     assert user_b_messages[0]["content"] == "beta private context"
 
 
-def test_retriever_user_filter_prevents_cross_recall(monkeypatch):
+def test_retriever_user_filter_prevents_cross_recall(monkeypatch, tmp_path):
     query = "project phoenix update"
 
     docs = [
@@ -51,14 +52,13 @@ def test_retriever_user_filter_prevents_cross_recall(monkeypatch):
         },
     ]
 
-    class FakeStore:
-        @staticmethod
-        def all_documents():
-            return docs
+    store = LocalVectorStore(store_path=str(tmp_path / "rag_store"))
+    for doc in docs:
+        store.add_document(doc["text"], doc["embedding"], doc["metadata"])
 
     import app.rag.retriever as retriever_module
 
-    monkeypatch.setattr(retriever_module, "vector_store", FakeStore())
+    monkeypatch.setattr(retriever_module, "vector_store", store)
 
     retriever = Retriever()
     alice_results = retriever.search(query=query, top_k=5, filters={"user_id": "alice"})
@@ -0,0 +1,96 @@
+import pytest
+
+from app.ai.chat_metrics import ChatMetrics
+from app.ai.prompt_packer import PromptPacker, PromptTooLong, TokenCounter
+
+
+SYSTEM = {"role": "system", "content": "You are Jarvis, a helpful assistant."}
+QUESTION = [{"role": "user", "content": "What should I pack for the trip?"}]
+
+
+def _history(turns):
+    messages = []
+    for i in range(turns):
+        messages.append({"role": "user", "content": f"Question {i} about the trip to Lisbon. " + "detail " * 20})
+        messages.append({"role": "assistant", "content": f"Answer {i}. " + "words " * 30})
+    return messages
+
+
+def _packer(**options):
+    options.setdefault("limits", {"*": 4096, "ollama": 2048, "ollama:llama3.1": 8192})
+    options.setdefault("reply_tokens", 512)
+    options.setdefault("prompt_tokens", 0)
+    options.setdefault("shares", {"profile": 0.2, "rag": 0.3, "history": 0.5})
+    return PromptPacker(counter=TokenCounter(), **options)
+
+
+def test_limits_are_looked_up_per_model_then_provider():
+    packer = _packer(prompt_tokens=3000)
+
+    assert packer.budget("Ollama", "llama3.1") == (8192, 3000)
+    assert packer.budget("ollama", "llama3") == (2048, 1536)
+    assert packer.budget("openai", "gpt-4o-mini") == (4096, 3000)
+
+
+def test_context_is_packed_into_the_budget_by_priority():
+    packer = _packer(prompt_tokens=400)
+    hits = [{"text": f"Note {i}: " + "Lisbon is hilly, bring good shoes. " * 6} for i in range(5)]
+    history = _history(8)
+
+    prompt, report = packer.pack(
+        "ollama", "llama3", SYSTEM, QUESTION, profile={"name": "sam", "city": "Porto"}, hits=hits, history=history
+    )
+
+    counter = TokenCounter()
+    assert report["prompt_tokens"] == sum(counter.message_tokens(message) for message in prompt)
+    assert report["prompt_tokens"] <= report["budget"] == 400
+    assert prompt[0] == SYSTEM and prompt[-1] == QUESTION[0]
+    assert "name: sam" in prompt[1]["content"] and report["dropped"]["profile"] == 0
+    # Lower-ranked hits and older messages were left out, the latest kept.
+    assert "1. Note 0" in prompt[2]["content"] and report["dropped"]["rag"] > 0
+    assert prompt[-2] == history[-1] and report["dropped"]["history"] > 0
+    assert any(message["content"].startswith("Summary of the earlier conversation") for message in prompt)
+
+
+def test_unused_shares_go_to_the_other_sections():
+    packer = _packer(prompt_tokens=600)
+    history = _history(6)
+
+    prompt, report = packer.pack("ollama", None, SYSTEM, QUESTION, history=history)
+
+    # No profile or RAG context, so history gets nearly the whole budget.
+    assert report["sections"]["profile"] == report["sections"]["rag"] == 0
+    assert report["sections"]["history"] > 0.5 * (600 - report["sections"]["system"] - report["sections"]["messages"])
+    assert report["prompt_tokens"] <= 600
+
+
+def test_requests_larger_than_the_window_are_rejected():
+    packer = _packer(limits={"*": 600}, reply_tokens=512)
+
+    with pytest.raises(PromptTooLong):
+        packer.pack("ollama", None, SYSTEM, [{"role": "user", "content": "word " * 200}])
+
+
+def test_counts_are_cached_per_message_and_recorded():
+    counter = TokenCounter(cache_size=2)
+    message = {"role": "user", "content": "Hello there, how are you?"}
+
+    assert counter.message_tokens(message) == counter.message_tokens(dict(message)) == 4 + 7
+    assert counter.stats() == {"cached": 1, "hits": 1, "misses": 1}
+
+    metrics = ChatMetrics()
+    metrics.record("ollama", "complete", None, 0.5, prompt_tokens=300)
+    metrics.record("ollama", "complete", None, 0.5, prompt_tokens=900)
+    row = metrics.stats()["ollama"]["complete"]
+    assert row["prompt_tokens"] == 1200 and row["prompt_tokens_max"] == 900
+
+
+def test_long_messages_fit_large_context_models_by_default():
+    packer = PromptPacker(counter=TokenCounter())
+    long_message = [{"role": "user", "content": "word " * 3500}]
+
+    assert packer.budget("openai", "gpt-4o") == (128000, 128000 - 1024)
+    prompt, report = packer.pack("openai", "gpt-4o", SYSTEM, long_message, history=_history(4))
+
+    assert prompt[-1] == long_message[0]
+    assert report["prompt_tokens"] > 3500 and report["dropped"]["history"] == 0
@@ -0,0 +1,120 @@
+import asyncio
+
+import app.ai.provider_factory as provider_factory_module
+from app.ai.http_client import SharedHTTPClient
+from app.ai.ollama_provider import OllamaProvider
+from app.ai.provider_factory import ProviderFactory
+
+
+def test_providers_are_cached_per_name_and_model():
+    factory = ProviderFactory()
+
+    first = factory.get_provider("Ollama", "llama3")
+    assert factory.get_provider("ollama", "llama3") is first
+    assert factory.get_provider("ollama", "mistral") is not first
+    assert factory.stats() == {"cached": ["ollama:llama3", "ollama:mistral"], "created": 2}
+
+    asyncio.run(factory.close())
+    assert factory.get_provider("ollama", "llama3") is not first
+
+
+def test_a_new_api_key_builds_a_new_provider(monkeypatch):
+    factory = ProviderFactory()
+    monkeypatch.setattr(factory, "_create", lambda name, model: object())
+    version = [(1, 10)]
+    monkeypatch.setattr(provider_factory_module.key_manager, "version", lambda: version[0])
+
+    first = factory.get_provider("openai")
+    assert factory.get_provider("openai") is first
+    version[0] = (2, 12)
+    second = factory.get_provider("openai")
+
+    assert second is not first
+    assert factory.stats()["cached"] == ["openai:default"]
+
+
+def test_shared_client_is_reused_within_a_loop_and_closed():
+    pool = SharedHTTPClient(max_connections=4, max_keepalive=2, keepalive_expiry=5)
+
+    async def use():
+        client = pool.get()
+        assert pool.get() is client
+        await pool.close()
+        assert client.is_closed
+        return client
+
+    first = asyncio.run(use())
+    # Another loop gets its own client.
+    assert asyncio.run(use()) is not first
+    assert OllamaProvider(http=pool).http is pool
+
+
+def test_providers_built_with_an_old_key_are_closed(monkeypatch):
+    class Provider:
+        def __init__(self):
+            self.closed = False
+
+        async def close(self):
+            self.closed = True
+
+    factory = ProviderFactory()
+    monkeypatch.setattr(factory, "_create", lambda name, model: Provider())
+    version = [(1, 10)]
+    monkeypatch.setattr(provider_factory_module.key_manager, "version", lambda: version[0])
+
+    first = factory.get_provider("gemini")
+    version[0] = (2, 12)
+    second = factory.get_provider("gemini")
+    assert first.closed and not second.closed
+
+    async def rotate_in_a_request():
+        version[0] = (3, 14)
+        third = factory.get_provider("gemini")
+        # Closed in the background, not while get_provider runs.
+        assert not second.closed
+        await factory.close()
+        return third
+
+    third = asyncio.run(rotate_in_a_request())
+    assert second.closed and third.closed
+
+
+def test_the_least_recently_used_provider_is_closed_beyond_the_cache_size(monkeypatch):
+    class Provider:
+        def __init__(self, model):
+            self.model = model
+            self.closed = False
+
+        async def close(self):
+            self.closed = True
+
+    factory = ProviderFactory(max_size=2)
+    monkeypatch.setattr(factory, "_create", lambda name, model: Provider(model))
+
+    first = factory.get_provider("ollama", "a")
+    second = factory.get_provider("ollama", "b")
+    assert factory.get_provider("ollama", "a") is first
+    third = factory.get_provider("ollama", "c")
+
+    assert second.closed and not first.closed and not third.closed
+    assert factory.stats()["cached"] == ["ollama:a", "ollama:c"]
+
+
+def test_cached_api_providers_follow_the_running_loop_and_close(monkeypatch):
+    from app.ai import gemini_provider, openai_provider
+
+    monkeypatch.setattr(openai_provider.key_manager, "get_key", lambda name: "test-key")
+    openai = openai_provider.OpenAIProvider()
+    gemini = gemini_provider.GeminiProvider()
+
+    async def clients():
+        return openai.client._client, gemini._async_model()._async_client
+
+    first = asyncio.run(clients())
+    second = asyncio.run(clients())
+    # Built on one loop, usable from the next.
+    assert second[0] is not first[0] and second[1] is not first[1]
+
+    asyncio.run(openai.close())
+    asyncio.run(gemini.close())
+    assert openai._client is None and gemini.client._async_client is None
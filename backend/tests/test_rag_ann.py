@@ -0,0 +1,107 @@
+import numpy as np
+
+from app.rag.ann import FlatIndex, IVFIndex, create_index
+from app.rag.segments import normalize_rows
+from app.rag.vector_store import LocalVectorStore
+
+
+def _clustered(count, dimension=32, clusters=16, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = normalize_rows(rng.normal(size=(clusters, dimension)))
+    labels = rng.integers(0, clusters, size=count)
+    return normalize_rows(centers[labels] + 0.1 * rng.normal(size=(count, dimension)))
+
+
+def _recall(index, vectors, queries, k=10, **knobs):
+    hits = 0
+    for query in queries:
+        exact = set(np.argsort(-(vectors @ query))[:k].tolist())
+        candidates = index.candidates(query, len(vectors), **knobs)
+        scores = vectors[candidates] @ query
+        approx = set(candidates[np.argsort(-scores)[:k]].tolist())
+        hits += len(exact & approx)
+    return hits / (k * len(queries))
+
+
+def test_ivf_recall_improves_with_nprobe():
+    vectors = _clustered(4000)
+    queries = _clustered(50, seed=1)
+    untrained = IVFIndex(32, n_lists=32, min_train_size=1000)
+    untrained.add(vectors)
+    assert untrained.needs_training()
+    assert untrained.candidates(queries[0], len(vectors)) is None
+
+    index = IVFIndex(32, n_lists=32)
+    index.train(vectors[:2000], rows=len(vectors))
+    index.add(vectors)
+
+    low = _recall(index, vectors, queries, nprobe=1)
+    high = _recall(index, vectors, queries, nprobe=8)
+    assert high >= low
+    assert high > 0.9
+    assert len(index.candidates(queries[0], len(vectors), nprobe=1)) < len(vectors)
+
+
+def test_small_trained_index_groups_its_rows():
+    # Fewer rows than one regroup batch are added after training.
+    vectors = _clustered(300)
+    index = IVFIndex(32, n_lists=8, min_train_size=100)
+    index.train(vectors, rows=len(vectors))
+    index.add(vectors)
+
+    assert sorted(index.candidates(vectors[0], len(vectors), nprobe=8).tolist()) == list(range(300))
+
+
+def test_tombstoned_rows_are_never_candidates(tmp_path):
+    vectors = _clustered(2000)
+    index = IVFIndex(32, n_lists=8, min_train_size=100)
+    index.train(vectors, rows=len(vectors))
+    index.add(vectors)
+    index.remove([0, 1, 2])
+
+    candidates = index.candidates(vectors[0], len(vectors), nprobe=8)
+    assert not {0, 1, 2} & set(candidates.tolist())
+
+    flat = FlatIndex(32)
+    flat.add(vectors)
+    assert flat.candidates(vectors[0], len(vectors)) is None
+    flat.remove([5])
+    assert 5 not in flat.candidates(vectors[0], len(vectors))
+
+
+def test_index_save_and_load_round_trip(tmp_path):
+    vectors = _clustered(1500)
+    index = IVFIndex(32, n_lists=8, min_train_size=100)
+    index.train(vectors, rows=len(vectors))
+    index.add(vectors)
+    index.remove([7])
+    path = str(tmp_path / "index.npz")
+    index.save(path)
+
+    restored = IVFIndex(32, n_lists=8)
+    assert restored.load(path)
+    assert len(restored) == len(index)
+    np.testing.assert_array_equal(
+        np.sort(restored.candidates(vectors[3], len(vectors), nprobe=2)),
+        np.sort(index.candidates(vectors[3], len(vectors), nprobe=2)),
+    )
+    assert not create_index("flat", 32).load(path)
+
+
+def test_store_trains_and_persists_index(tmp_path):
+    store_path = str(tmp_path / "rag_store")
+    options = {"n_lists": 8, "nprobe": 8, "min_train_size": 50}
+    store = LocalVectorStore(store_path=store_path, seal_threshold=40, index_options=options)
+    vectors = _clustered(120)
+    for i, vector in enumerate(vectors):
+        store.add_document(f"doc {i}", vector.tolist())
+
+    assert store.train_index()
+    assert store.snapshot().index.trained
+    store.close()
+
+    reloaded = LocalVectorStore(store_path=store_path, seal_threshold=40, index_options=options)
+    index = reloaded.snapshot().index
+    assert index.trained
+    assert len(index) == 120
+    assert len(index.candidates(vectors[0], 120, nprobe=8)) == 120
@@ -0,0 +1,110 @@
+import asyncio
+import threading
+
+import pytest
+
+import app.rag.ingest_queue as ingest_module
+import app.rag.retriever as retriever_module
+from app.rag.embeddings import embedder
+from app.rag.ingest_queue import IngestQueue
+from app.rag.retriever import Retriever
+from app.rag.vector_store import ShardedVectorStore
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    store = ShardedVectorStore(root=str(tmp_path / "rag_store"), seal_threshold=8)
+    monkeypatch.setattr(retriever_module, "vector_store", store)
+    yield store
+    store.close()
+
+
+@pytest.mark.asyncio
+async def test_asearch_matches_search_off_the_event_loop(store, monkeypatch):
+    for text in ["dentist appointment on friday", "gym session tomorrow", "call the bank"]:
+        store.add_document(text, embedder.embed(text), {"user_id": "alice"})
+    retriever = Retriever(search_workers=2)
+    threads = []
+    search = retriever.search
+
+    def recording_search(*args, **kwargs):
+        threads.append(threading.current_thread().name)
+        return search(*args, **kwargs)
+
+    monkeypatch.setattr(retriever, "search", recording_search)
+    results = await asyncio.gather(*[
+        retriever.asearch("when is the dentist", top_k=2, filters={"user_id": "alice"}) for _ in range(4)
+    ])
+
+    expected = search("when is the dentist", top_k=2, filters={"user_id": "alice"})
+    assert all(result == expected for result in results)
+    assert all(name.startswith("rag-search") for name in threads)
+    retriever.close()
+
+
+@pytest.mark.asyncio
+async def test_ingest_queue_coalesces_writes_and_flushes(store):
+    queue = IngestQueue(maxsize=64, batch_size=100)
+    for i in range(20):
+        await queue.enqueue([f"user says {i}", f"assistant answers {i}"], [{"user_id": "bob"}] * 2)
+
+    assert queue.flush(timeout=10)
+    stats = queue.stats()
+    assert stats["enqueued"] == stats["written"] == 40
+    assert stats["batches"] < 20
+    assert store.count("bob") == 40
+    assert queue.close(timeout=10)
+
+
+@pytest.mark.asyncio
+async def test_full_queue_applies_backpressure_without_blocking_the_loop(store, monkeypatch):
+    release = threading.Event()
+    written = []
+
+    def slow_add_texts(texts, metadatas):
+        release.wait(10)
+        written.extend(texts)
+        return []
+
+    monkeypatch.setattr(ingest_module.retriever, "add_texts", slow_add_texts)
+    queue = IngestQueue(maxsize=1, batch_size=1)
+    await queue.enqueue(["first"])
+    await asyncio.sleep(0.05)  # the writer takes "first" and blocks
+    await queue.enqueue(["second"])
+
+    waiting = asyncio.create_task(queue.enqueue(["third"]))
+    ticks = 0
+    for _ in range(5):
+        await asyncio.sleep(0.01)
+        ticks += 1
+    assert not waiting.done() and ticks == 5
+
+    release.set()
+    await asyncio.wait_for(waiting, 5)
+    assert queue.flush(timeout=5)
+    assert written == ["first", "second", "third"]
+    assert queue.stats()["waits"] == 1
+    queue.close(timeout=5)
+
+
+def test_failed_batches_are_counted_and_writer_keeps_going(store, monkeypatch):
+    calls = []
+
+    def flaky_add_texts(texts, metadatas):
+        calls.append(list(texts))
+        if len(calls) == 1:
+            raise ValueError("disk full")
+        return []
+
+    monkeypatch.setattr(ingest_module.retriever, "add_texts", flaky_add_texts)
+    queue = IngestQueue(maxsize=4, batch_size=1)
+    queue.submit(["lost"])
+    assert queue.flush(timeout=5)
+    queue.submit(["kept"])
+    assert queue.flush(timeout=5)
+
+    assert queue.stats()["failed"] == 1 and queue.stats()["written"] == 1
+    assert calls == [["lost"], ["kept"]]
+    with pytest.raises(ValueError):
+        queue.submit(["a", "b"], [None])
+    queue.close(timeout=5)
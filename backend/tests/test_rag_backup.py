@@ -0,0 +1,110 @@
+import os
+
+import numpy as np
+import pytest
+
+from app.rag.backup import create_backup, list_backups, restore_backup
+from app.rag.embeddings import embedder
+from app.rag.export import ExportReader, export_stream, import_batch, import_stream
+from app.rag.vector_store import ShardedVectorStore
+from conftest import add_text
+
+
+def _documents(store, user_id):
+    return sorted((document["id"], document["text"]) for document in store.all_documents(user_id))
+
+
+def _embeddings(stream):
+    return np.concatenate([batch.embeddings for batch in ExportReader().feed(stream)])
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = ShardedVectorStore(root=str(tmp_path / "rag_store"), index_kind="flat", seal_threshold=4)
+    yield store
+    store.close()
+
+
+def test_incremental_backup_copies_only_new_segments_and_restores(store, tmp_path):
+    destination = str(tmp_path / "backups")
+    ids = [add_text(store, f"journal entry {i}", user_id="alice") for i in range(4)]
+    add_text(store, "gym schedule", user_id="bob")
+
+    full = create_backup(store, destination)
+    assert full["parent"] is None and full["segments_copied"] == 1
+
+    ids += [add_text(store, f"journal entry {i}", user_id="alice") for i in range(4, 9)]
+    store.delete([ids[0], ids[8]], user_id="alice")
+    incremental = create_backup(store, destination, incremental=True)
+
+    assert incremental["parent"] == full["id"]
+    assert (incremental["segments_copied"], incremental["segments_reused"]) == (1, 1)
+    assert [backup["id"] for backup in list_backups(destination)] == [full["id"], incremental["id"]]
+    # Nothing staged is left behind in the live store.
+    assert not os.listdir(store.checkpoints_path)
+
+    target = str(tmp_path / "restored")
+    result = restore_backup(os.path.join(destination, incremental["id"]), target)
+    assert result["rows"] == 8
+    restored = ShardedVectorStore(root=target, index_kind="flat")
+    try:
+        for user_id in ("alice", "bob"):
+            assert _documents(restored, user_id) == _documents(store, user_id)
+        assert ids[0] not in {doc_id for doc_id, _ in _documents(restored, "alice")}
+    finally:
+        restored.close()
+
+    with pytest.raises(ValueError):
+        restore_backup(os.path.join(destination, full["id"]), target)
+
+
+def test_export_import_round_trip_in_small_chunks(store, tmp_path):
+    ids = [add_text(store, f"budget note {i}", user_id="alice", kind="note") for i in range(6)]
+    store.delete([ids[2]], user_id="alice")
+    add_text(store, "bob's secret", user_id="bob")
+
+    stream = b"".join(export_stream(store, "alice", batch_size=2))
+    chunks = [stream[start:start + 7] for start in range(0, len(stream), 7)]
+
+    target = ShardedVectorStore(root=str(tmp_path / "imported"), index_kind="flat")
+    try:
+        result = import_stream(target, chunks, user_id="carol")
+        assert result == {"rows": 5, "imported": 5, "reembedded": 0}
+        documents = target.all_documents("carol")
+        assert [document["text"] for document in documents] == [f"budget note {i}" for i in (0, 1, 3, 4, 5)]
+        assert all(
+            (document["metadata"]["user_id"], document["metadata"]["kind"]) == ("carol", "note")
+            for document in documents
+        )
+        assert target.count("alice") == 0
+        np.testing.assert_allclose(_embeddings(b"".join(export_stream(target, "carol"))), _embeddings(stream), atol=1e-6)
+    finally:
+        target.close()
+
+    reader = ExportReader()
+    reader.feed(stream[:-10])
+    with pytest.raises(ValueError):
+        reader.close()
+    with pytest.raises(ValueError):
+        ExportReader().feed(b'{"format": "other"}\n')
+
+
+def test_import_reembeds_vectors_from_another_model(store, tmp_path):
+    add_text(store, "water the plants", user_id="alice")
+    stream = b"".join(export_stream(store, "alice"))
+
+    class OtherModel:
+        version = "other-model"
+
+        def embed_many(self, texts):
+            return np.ones((len(texts), 8), dtype=np.float32)
+
+    reader = ExportReader()
+    (batch,) = reader.feed(stream)
+    target = ShardedVectorStore(root=str(tmp_path / "imported"), index_kind="flat")
+    try:
+        ids, reembedded = import_batch(target, batch, embedder=OtherModel())
+        assert reembedded
+        assert len(ids) == 1 and target.snapshot("alice").gather(np.asarray([0])).shape == (1, 8)
+    finally:
+        target.close()
@@ -0,0 +1,84 @@
+import numpy as np
+import pytest
+
+import app.rag.retriever as retriever_module
+from app.rag.bm25 import BM25Index
+from app.rag.embeddings import embedder
+from app.rag.retriever import Retriever
+from app.rag.vector_store import LocalVectorStore
+
+
+def test_rare_terms_outweigh_common_ones():
+    index = BM25Index()
+    index.add(["the cat sat on the mat", "the dog ate the bone", "the the the the"])
+
+    ordinals, scores = index.scores("the dog", 3)
+    ranked = ordinals[np.argsort(-scores)].tolist()
+    assert ranked[0] == 1
+    assert dict(zip(ordinals.tolist(), scores.tolist()))[2] < scores.max()
+    assert index.scores("unknown words", 3)[0].shape == (0,)
+
+
+def test_remove_updates_statistics_and_hides_rows():
+    index = BM25Index()
+    index.add(["budget review", "budget plan", "holiday plan"])
+    before = dict(zip(*[a.tolist() for a in index.scores("plan", 3)]))
+
+    index.remove([1])
+
+    ordinals, scores = index.scores("budget plan", 3)
+    assert 1 not in ordinals.tolist()
+    assert dict(zip(ordinals.tolist(), scores.tolist()))[2] != before[2]
+    assert index.scores("plan", 2)[0].tolist() == []
+
+
+def test_regrouped_and_recent_postings_score_alike(tmp_path):
+    texts = [f"note {i} topic{i % 50}" for i in range(6000)]
+    index = BM25Index()
+    index.add(texts[:5000])
+    index.add(texts[5000:])
+    assert 0 < index._groups[2] < index._postings
+
+    ordinals, _ = index.scores("topic7", 6000)
+    assert ordinals.tolist() == list(range(7, 6000, 50))
+    assert index.scores("topic7", 100)[0].tolist() == [7, 57]
+
+    path = str(tmp_path / "bm25.npz")
+    index.save(path)
+    restored = BM25Index()
+    assert restored.load(path)
+    np.testing.assert_allclose(restored.scores("topic7 note", 6000)[1], index.scores("topic7 note", 6000)[1])
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    store = LocalVectorStore(store_path=str(tmp_path / "rag_store"), seal_threshold=4)
+    monkeypatch.setattr(retriever_module, "vector_store", store)
+    yield store
+    store.close()
+
+
+def test_hybrid_search_promotes_rare_keyword(store):
+    texts = [f"what is the plan for the {word} and the rest of it" for word in ("week", "team", "trip", "launch")]
+    texts.append("kubernetes")
+    for text in texts:
+        store.add_document(text, embedder.embed(text), {"kind": "chat"})
+
+    query = "what is the plan for kubernetes"
+    vector_only = [hit["text"] for hit in Retriever().search(query, top_k=5, collapse_duplicates=False)]
+    hybrid = [hit["text"] for hit in Retriever().search(query, top_k=5, hybrid=True, collapse_duplicates=False)]
+
+    assert vector_only[-1] == "kubernetes"
+    assert hybrid.index("kubernetes") < vector_only.index("kubernetes")
+    assert Retriever().search(query, top_k=2, hybrid=True, filters={"kind": "other"}) == []
+
+
+def test_keyword_index_survives_reload(store, tmp_path):
+    for text in ["alpha report", "beta report", "gamma notes", "delta notes", "epsilon report"]:
+        store.add_document(text, embedder.embed(text))
+    store.close()
+
+    reloaded = LocalVectorStore(store_path=store.store_path, seal_threshold=4)
+    ordinals, _ = reloaded.snapshot().keyword_index.scores("report", 5)
+    assert ordinals.tolist() == [0, 1, 4]
+    reloaded.close()
@@ -0,0 +1,92 @@
+import pytest
+from docx import Document
+
+import app.rag.retriever as retriever_module
+from app.rag.chunking import TextChunker, estimate_tokens, split_sentences
+from app.rag.documents import DocumentIngestor
+from app.rag.loaders import iter_paragraphs
+from app.rag.vector_store import LocalVectorStore
+
+
+def test_split_sentences_keeps_punctuation():
+    assert split_sentences("First one.  Second one!\nThird?") == ["First one.", "Second one!", "Third?"]
+    assert split_sentences("  ") == []
+
+
+def test_chunks_respect_budget_and_overlap():
+    chunker = TextChunker(max_tokens=30, overlap_tokens=10)
+    sentences = [f"Fact {i} is here." for i in range(12)]
+
+    chunks = chunker.chunk(" ".join(sentences))
+
+    assert len(chunks) > 1
+    assert all(estimate_tokens(chunk) <= 30 for chunk in chunks)
+    for previous, current in zip(chunks, chunks[1:]):
+        last_sentence = previous.split(". ")[-1]
+        assert last_sentence in current and not current.startswith(previous)
+    assert all(any(sentence in chunk for chunk in chunks) for sentence in sentences)
+
+
+def test_oversized_sentence_is_split_at_words():
+    chunks = TextChunker(max_tokens=10, overlap_tokens=0).chunk("word " * 25)
+    assert [estimate_tokens(chunk) for chunk in chunks] == [10, 10, 5]
+
+
+def test_text_and_docx_loaders_stream_paragraphs(tmp_path):
+    markdown = tmp_path / "report.md"
+    markdown.write_text("# Summary\nShort intro.\n\nSecond paragraph\ncontinues here.\n## Details\nMore.\n")
+    assert [p.strip() for p in iter_paragraphs(markdown)] == [
+        "# Summary\nShort intro.",
+        "Second paragraph\ncontinues here.",
+        "## Details\nMore.",
+    ]
+
+    document = Document()
+    document.add_paragraph("Quarterly revenue grew.")
+    document.add_paragraph("")
+    document.add_paragraph("Costs were flat.")
+    docx_path = tmp_path / "report.docx"
+    document.save(docx_path)
+    assert list(iter_paragraphs(docx_path)) == ["Quarterly revenue grew.", "Costs were flat."]
+
+    with pytest.raises(ValueError):
+        list(iter_paragraphs(tmp_path / "image.png"))
+
+
+def test_pdf_loader_reads_pages(tmp_path):
+    pytest.importorskip("pypdf")
+    from reportlab.pdfgen import canvas
+
+    pdf_path = tmp_path / "report.pdf"
+    pdf = canvas.Canvas(str(pdf_path))
+    pdf.drawString(72, 720, "Page one talks about invoices.")
+    pdf.showPage()
+    pdf.drawString(72, 720, "Page two talks about travel.")
+    pdf.save()
+
+    text = " ".join(iter_paragraphs(pdf_path))
+    assert "invoices" in text and "travel" in text
+
+
+def test_ingestor_stores_chunks_with_source_metadata(tmp_path, monkeypatch):
+    store = LocalVectorStore(store_path=str(tmp_path / "rag_store"))
+    monkeypatch.setattr(retriever_module, "vector_store", store)
+    reports = tmp_path / "Reports"
+    reports.mkdir()
+    (reports / "a.txt").write_text(" ".join(f"Budget line {i} was approved." for i in range(40)))
+    (reports / "b.md").write_text("Travel plans for the offsite.")
+    (reports / "skip.png").write_bytes(b"\x89PNG")
+
+    ingestor = DocumentIngestor(TextChunker(max_tokens=40, overlap_tokens=8), batch_size=2)
+    results = ingestor.ingest_paths([str(reports), str(tmp_path / "missing.txt")], {"user_id": "alice"})
+
+    assert [result["source"] for result in results[:2]] == [str(reports / "a.txt"), str(reports / "b.md")]
+    assert results[0]["chunks"] > 1 and results[1]["chunks"] == 1
+    assert "error" in results[2]
+
+    docs = store.all_documents()
+    assert len(docs) == results[0]["chunks"] + 1
+    metadata = dict(docs[0]["metadata"])
+    assert isinstance(metadata.pop("created_at"), int)
+    assert metadata == {"user_id": "alice", "kind": "document", "source": str(reports / "a.txt"), "chunk": 0}
+    store.close()
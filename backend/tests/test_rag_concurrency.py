@@ -0,0 +1,67 @@
+import threading
+
+from app.rag.vector_store import LocalVectorStore, ShardedVectorStore
+from benchmarks.rag.bench_concurrency import run_mixed
+from conftest import add_text
+
+
+def test_snapshot_does_not_wait_for_the_writer_lock(tmp_path):
+    store = LocalVectorStore(store_path=str(tmp_path / "rag_store"), seal_threshold=4)
+    add_text(store, "pay the electricity bill")
+    taken = []
+
+    with store._lock:
+        reader = threading.Thread(target=lambda: taken.append(store.snapshot()))
+        reader.start()
+        reader.join(timeout=2)
+        assert not reader.is_alive()
+
+    assert taken[0].count == 1
+    store.close()
+
+
+def test_old_snapshot_is_unchanged_by_later_writes_and_deletes(tmp_path):
+    store = LocalVectorStore(store_path=str(tmp_path / "rag_store"), seal_threshold=4)
+    ids = [add_text(store, f"weekly plan item {i}") for i in range(3)]
+    before = store.snapshot()
+
+    store.delete([ids[0]])
+    for i in range(3, 9):
+        add_text(store, f"weekly plan item {i}")
+    store.compact()
+
+    assert before.count == 3 and before.live_count == 3
+    assert [block.document(row)["id"] for block in before.blocks for row in range(len(block))] == ids
+    assert before.alive(before.offsets[:1]).tolist() == [True]
+    after = store.snapshot()
+    assert after is not before and after.live_count == 8
+    store.close()
+
+
+def test_mixed_readers_and_writers_see_consistent_snapshots(tmp_path):
+    store = LocalVectorStore(store_path=str(tmp_path / "rag_store"), index_kind="flat", seal_threshold=16)
+    for i in range(64):
+        add_text(store, f"seed note {i} about topic{i % 7}")
+
+    result = run_mixed(store, readers=3, writers=2, seconds=0.5, batch=4, delete_every=2)
+
+    assert result["errors"] == []
+    assert result["inconsistent_snapshots"] == 0
+    assert result["searches"] > 0 and result["writes"] > 0 and result["deleted"] > 0
+    assert store.count() == 64 + result["writes"] - result["deleted"]
+    store.close()
+
+
+def test_sharded_snapshot_of_resident_shard_skips_the_registry_lock(tmp_path):
+    sharded = ShardedVectorStore(root=str(tmp_path / "rag_store"), seal_threshold=4)
+    add_text(sharded, "call mum on sunday", {"user_id": "alice"})
+    taken = []
+
+    with sharded._lock:
+        reader = threading.Thread(target=lambda: taken.append(sharded.snapshot("alice")))
+        reader.start()
+        reader.join(timeout=2)
+        assert not reader.is_alive()
+
+    assert taken[0].count == 1 and taken[0].user_id == "alice"
+    sharded.close()
@@ -0,0 +1,192 @@
+import numpy as np
+import pytest
+
+import app.rag.dedup as dedup_module
+import app.rag.retriever as retriever_module
+from app.rag.dedup import DedupIndex, collapse, content_key, simhash
+from app.rag.embeddings import embedder
+from app.rag.retention import parse_policies
+from app.rag.retriever import Retriever
+from app.rag.segments import REFS_NAME
+from app.rag.vector_store import LocalVectorStore
+from conftest import add_text
+
+
+def test_content_key_normalizes_text_and_keeps_roles_apart():
+    assert content_key("Buy  milk\n", {"role": "user"}) == content_key("buy milk", {"role": "user"})
+    assert content_key("buy milk", {"role": "user"}) != content_key("buy milk", {"role": "assistant"})
+    assert content_key("buy milk", {"role": "user", "ts": 1}) == content_key("buy milk", {"role": "user", "ts": 2})
+
+
+def test_simhash_separates_near_and_unrelated_texts():
+    base = simhash("The current time is 03:42 PM.")
+    near = simhash("The current time is 03:43 PM.")
+    far = simhash("Remind me to call the dentist about the appointment tomorrow")
+
+    assert bin(base ^ near).count("1") <= 10
+    assert bin(base ^ far).count("1") > 10
+    assert simhash("") == 0
+
+
+def test_index_groups_near_duplicates_and_survives_save(tmp_path):
+    index = DedupIndex(max_distance=10)
+    index.add(
+        ["The current time is 03:42 PM.", "Remind me to water the plants", "The current time is 03:43 PM."],
+        [{}, {}, {}]
+    )
+
+    assert index.groups(np.arange(3)).tolist() == [0, 1, 0]
+    assert index.find(content_key("the current time is 03:42 pm.")) == 0
+
+    index.remove([0])
+    assert index.find(content_key("The current time is 03:42 PM.")) is None
+
+    path = str(tmp_path / "dedup.npz")
+    index.save(path)
+    restored = DedupIndex(max_distance=10)
+    assert restored.load(path)
+    assert restored.groups(np.arange(3)).tolist() == [0, 1, 0]
+    assert restored.find(content_key("Remind me to water the plants")) == 1
+    assert not DedupIndex(max_distance=4).load(path)
+
+
+def test_band_lookup_matches_a_full_scan(monkeypatch, tmp_path):
+    rng = np.random.default_rng(7)
+    fingerprints = [int(value) for value in rng.integers(1, 2**63, size=400, dtype=np.int64)]
+    # Plant near duplicates differing in up to 10 bits.
+    for i in range(0, 400, 20):
+        flips = rng.choice(64, size=int(rng.integers(1, 11)), replace=False)
+        fingerprints.append(fingerprints[i] ^ sum(1 << int(bit) for bit in flips))
+    monkeypatch.setattr(dedup_module, "simhash", lambda text: int(text))
+    monkeypatch.setattr(dedup_module, "INDEX_MIN_ROWS", 50)
+
+    index = DedupIndex(max_distance=10)
+    scan = DedupIndex(max_distance=10)
+    scan._masks = None
+    for target in (index, scan):
+        target.add([str(fingerprint) for fingerprint in fingerprints], [{}] * len(fingerprints))
+
+    everything = np.arange(len(fingerprints))
+    assert index.groups(everything).tolist() == scan.groups(everything).tolist()
+    assert (index.groups(everything[400:]) < 400).all()
+    # A lookup only compares a small share of the rows, also after a reload.
+    assert index._candidates(fingerprints[0]).size < 40
+    path = str(tmp_path / "dedup.npz")
+    index.save(path)
+    restored = DedupIndex(max_distance=10)
+    assert restored.load(path)
+    assert restored._candidates(fingerprints[0]).tolist() == index._candidates(fingerprints[0]).tolist()
+
+
+def test_collapse_keeps_first_of_each_group():
+    assert collapse([5, 5, 2, 5, 7, 2], 10) == [0, 2, 4]
+    assert collapse([5, 5, 2, 5, 7, 2], 2) == [0, 2]
+
+
+def test_refcount_policy_reuses_ids_and_persists_counts(tmp_path):
+    store = LocalVectorStore(store_path=str(tmp_path / "rag_store"), seal_threshold=3)
+    first = add_text(store, "Call mom on Sunday", {"role": "user"})
+    assert add_text(store, "call mom on sunday ", {"role": "user"}) == first
+    assert add_text(store, "Call mom on Sunday", {"role": "assistant"}) != first
+
+    ids = store.add_documents(["water plants", "Call mom on Sunday", "water plants"], embedder.embed_many(
+        ["water plants", "Call mom on Sunday", "water plants"]
+    ), [{"role": "user"}] * 3)
+    assert ids[1] == first and ids[0] == ids[2]
+    assert store.count() == 3
+    assert store.reference_count(first) == 3
+    assert store.reference_count(ids[0]) == 2
+    store.close()
+
+    reloaded = LocalVectorStore(store_path=str(tmp_path / "rag_store"), seal_threshold=3)
+    assert reloaded.count() == 3
+    assert reloaded.reference_count(first) == 3
+    assert add_text(reloaded, "Call mom on Sunday", {"role": "user"}) == first
+    assert reloaded.reference_count(first) == 4
+    reloaded.clear()
+    assert reloaded.reference_count(first) == 1
+    reloaded.close()
+
+
+def test_refcount_delete_drops_one_reference_at_a_time(tmp_path):
+    store = LocalVectorStore(store_path=str(tmp_path / "rag_store"), dedup="refcount")
+    doc_id = add_text(store, "Dentist on Friday")
+    assert add_text(store, "dentist on friday") == doc_id
+    assert add_text(store, "Dentist on Friday") == doc_id
+
+    assert store.delete([doc_id]) == 1
+    assert store.count() == 1 and store.reference_count(doc_id) == 2
+    store.close()
+
+    reloaded = LocalVectorStore(store_path=str(tmp_path / "rag_store"), dedup="refcount")
+    assert reloaded.reference_count(doc_id) == 2
+    assert reloaded.delete([doc_id]) == 1
+    assert reloaded.count() == 1 and reloaded.reference_count(doc_id) == 1
+    assert reloaded.delete([doc_id]) == 1
+    assert reloaded.count() == 0
+    assert reloaded.delete([doc_id]) == 0
+    reloaded.close()
+
+
+def test_ingesting_stored_content_again_renews_it(tmp_path):
+    policies = parse_policies({"*": {"max_age_days": 1}})
+    now = 10_000_000
+    old = now - 5 * 86400
+    store = LocalVectorStore(store_path=str(tmp_path / "rag_store"), seal_threshold=2)
+    parking = add_text(store, "Parking code 4711", expires_at=now + 60, created_at=old)
+    gate = add_text(store, "Gate code 1234", created_at=old)
+    wifi = add_text(store, "Wifi password hunter2", expires_at=now + 60, created_at=old)
+    # Within one batch the stored row takes the longer lifetime too.
+    bike = store.add_documents(
+        ["Bike lock 9999", "Bike lock 9999"],
+        embedder.embed_many(["Bike lock 9999"] * 2),
+        [{"expires_at": now + 60, "created_at": now}, {"created_at": now}],
+    )[0]
+
+    # No TTL removes the expiry; of two TTLs the later one wins.
+    assert add_text(store, "Parking code 4711", created_at=now) == parking
+    assert add_text(store, "Gate code 1234", expires_at=now + 60, created_at=now) == gate
+    assert add_text(store, "Wifi password hunter2", expires_at=now + 3600, created_at=now) == wifi
+    store.close()
+
+    reloaded = LocalVectorStore(store_path=str(tmp_path / "rag_store"), seal_threshold=2)
+    # Without the renewals every one of them would have expired by now.
+    assert reloaded.apply_retention(policies, now=now + 120) == 0
+    assert reloaded.apply_retention(policies, now=now + 7200) == 1
+    assert [doc["id"] for doc in reloaded.all_documents()] == [parking, gate, bike]
+    reloaded.close()
+
+
+def test_drop_and_off_policies(tmp_path):
+    dropping = LocalVectorStore(store_path=str(tmp_path / "drop"), dedup="drop")
+    doc_id = add_text(dropping, "same text")
+    assert add_text(dropping, "same text") == doc_id
+    assert dropping.count() == 1
+    assert dropping.reference_count(doc_id) == 1
+    assert not (tmp_path / "drop" / REFS_NAME).exists()
+    dropping.close()
+
+    keeping = LocalVectorStore(store_path=str(tmp_path / "off"), dedup="off")
+    assert add_text(keeping, "same text") != add_text(keeping, "same text")
+    assert keeping.count() == 2
+    keeping.close()
+
+    with pytest.raises(ValueError):
+        LocalVectorStore(store_path=str(tmp_path / "bad"), dedup="sometimes")
+
+
+def test_search_collapses_near_duplicates(tmp_path, monkeypatch):
+    store = LocalVectorStore(store_path=str(tmp_path / "rag_store"), seal_threshold=2)
+    monkeypatch.setattr(retriever_module, "vector_store", store)
+    for text in ["The current time is 03:42 PM.", "The current time is 03:43 PM.", "Lunch is at noon today"]:
+        add_text(store, text, {"kind": "chat"})
+
+    query = "what is the current time"
+    collapsed = [hit["text"] for hit in Retriever().search(query, top_k=2)]
+    expanded = [hit["text"] for hit in Retriever().search(query, top_k=2, collapse_duplicates=False)]
+    hybrid = [hit["text"] for hit in Retriever().search(query, top_k=2, hybrid=True)]
+
+    assert collapsed[1] == "Lunch is at noon today"
+    assert all("current time" in text for text in expanded)
+    assert sum("current time" in text for text in hybrid) == 1
+    store.close()
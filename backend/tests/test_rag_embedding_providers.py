@@ -0,0 +1,211 @@
+import hashlib
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+import numpy as np
+import pytest
+
+import app.rag.retriever as retriever_module
+from app.ai.base_embedding_provider import BaseEmbeddingProvider
+from app.ai.http_client import http_client
+from app.ai.ollama_embedding_provider import OllamaEmbeddingProvider
+from app.rag.embedding_cache import EmbeddingCache
+from app.rag.embeddings import Embedder, LocalHashEmbedder
+from app.rag.rerank import RerankOptions
+from app.rag.retriever import Retriever
+from app.rag.vector_store import LocalVectorStore
+
+
+def _vector(text, dimension=8):
+    digest = hashlib.sha256(text.encode("utf-8")).digest()
+    return [float(byte) + 1.0 for byte in digest[:dimension]]
+
+
+class _OllamaStub(BaseHTTPRequestHandler):
+    requests = []
+    legacy = False
+
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, status, body):
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        self._reply(200, {"models": []})
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        self.requests.append((self.path, body))
+        if body["model"] == "missing":
+            self._reply(404, {"error": 'model "missing" not found, try pulling it first'})
+        elif self.path == "/api/embed" and not self.legacy:
+            self._reply(200, {"embeddings": [_vector(text) for text in body["input"]]})
+        elif self.path == "/api/embeddings":
+            self._reply(200, {"embedding": _vector(body["prompt"])})
+        else:
+            # What Go's router answers for an unknown route.
+            payload = b"404 page not found"
+            self.send_response(404)
+            self.send_header("Content-Type", "text/plain")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+
+@pytest.fixture
+def ollama():
+    handler = type("Handler", (_OllamaStub,), {"requests": [], "legacy": False})
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield handler, f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+    server.server_close()
+
+
+class _StubProvider(BaseEmbeddingProvider):
+    name = "stub"
+    local = True
+
+    def embed_many(self, texts):
+        return np.asarray([_vector(text) for text in texts], dtype=np.float32)
+
+    async def embed_batch(self, texts):
+        return self.embed_many(texts)
+
+    async def health_check(self):
+        return True
+
+
+def test_ollama_texts_are_batched_and_cached(ollama, tmp_path):
+    handler, base_url = ollama
+    provider = OllamaEmbeddingProvider(model="nomic-embed-text", base_url=base_url, batch_size=2)
+    embedder = Embedder(provider, EmbeddingCache(str(tmp_path / "cache.sqlite3")))
+    texts = ["buy milk", "call mom", "buy milk", "gym at 6", "pay rent"]
+
+    matrix = embedder.embed_many(texts)
+
+    assert matrix.shape == (5, 8) and matrix.dtype == np.float32
+    np.testing.assert_allclose(matrix[3], _vector("gym at 6"))
+    assert [body["input"] for _, body in handler.requests] == [["buy milk", "call mom"], ["gym at 6", "pay rent"]]
+
+    # Cached per model version: a repeat costs no request, a new text one.
+    np.testing.assert_array_equal(embedder.embed_many(texts[::-1]), matrix[::-1])
+    embedder.embed_many(["buy milk", "water plants"])
+    assert handler.requests[-1][1]["input"] == ["water plants"]
+    assert len(embedder.cache) == 5
+    assert embedder.version == "ollama:nomic-embed-text"
+    assert embedder._run(provider.health_check())
+
+    async def pooled_client():
+        return http_client.get()
+
+    # The shared pool's client of the embedder's loop, closed with it.
+    client = embedder._run(pooled_client())
+    embedder.close()
+    assert client.is_closed
+
+
+def test_ollama_without_batch_endpoint_falls_back_per_text(ollama):
+    handler, base_url = ollama
+    handler.legacy = True
+    embedder = Embedder(OllamaEmbeddingProvider(base_url=base_url))
+
+    matrix = embedder.embed_many(["one", "two", "three"])
+    embedder.embed_many(["four"])
+
+    np.testing.assert_allclose(matrix[1], _vector("two"))
+    paths = [path for path, _ in handler.requests]
+    assert paths[0] == "/api/embed"
+    assert paths[1:] == ["/api/embeddings"] * 4
+    embedder.close()
+
+
+def test_missing_model_does_not_switch_to_the_legacy_endpoint(ollama):
+    handler, base_url = ollama
+    provider = OllamaEmbeddingProvider(model="missing", base_url=base_url)
+    embedder = Embedder(provider)
+
+    with pytest.raises(httpx.HTTPStatusError):
+        embedder.embed_many(["one"])
+    assert not provider._legacy
+
+    provider.model = "nomic-embed-text"
+    embedder.embed_many(["two", "three"])
+    assert [path for path, _ in handler.requests] == ["/api/embed", "/api/embed"]
+    embedder.close()
+
+
+def test_model_change_reembeds_the_store_keeping_ids(tmp_path):
+    old = Embedder(LocalHashEmbedder())
+    store = LocalVectorStore(str(tmp_path), seal_threshold=2, index_kind="flat", embedder=old)
+    texts = ["dentist appointment friday", "renew passport", "book flights", "call plumber"]
+    ids = store.add_documents(texts, old.embed_many(texts))
+    store.delete([ids[1]])
+    store.close()
+
+    new = Embedder(_StubProvider(model="v2"))
+    store = LocalVectorStore(str(tmp_path), seal_threshold=2, index_kind="flat", embedder=new)
+    assert store.stale and store.snapshot().stale
+
+    # Written before the re-embed: stored with a placeholder vector.
+    late = store.add_document("water the plants", new.embed("water the plants"))
+    assert store.dimension == 256
+
+    result = store.maintain()
+
+    assert result["reembedded"] and not store.stale and not store.snapshot().stale
+    assert store.dimension == 8
+    assert [doc["id"] for doc in store.all_documents()] == [ids[0], ids[2], ids[3], late]
+    snapshot = store.snapshot()
+    query = new.embed_many(["book flights"])[0]
+    query /= np.linalg.norm(query)
+    assert snapshot.hit(int(np.argmax(snapshot.scores(query))), 0.0)["id"] == ids[2]
+    store.close()
+
+    reopened = LocalVectorStore(str(tmp_path), seal_threshold=2, index_kind="flat", embedder=new)
+    assert not reopened.stale and reopened.count() == 4
+    assert reopened.maintain()["reembedded"] is False
+    reopened.close()
+
+
+def test_empty_store_adopts_the_new_model_without_reembedding(tmp_path):
+    store = LocalVectorStore(str(tmp_path), index_kind="flat", embedder=Embedder(LocalHashEmbedder()))
+    store.add_document("temporary", LocalHashEmbedder().embed("temporary"))
+    store.clear()
+    store.close()
+
+    new = Embedder(_StubProvider(model="v2"))
+    store = LocalVectorStore(str(tmp_path), index_kind="flat", embedder=new)
+    assert not store.stale and store.dimension is None
+    store.add_document("fresh start", new.embed("fresh start"))
+    assert store.dimension == 8
+    store.close()
+
+
+def test_stale_shards_still_give_chat_context(tmp_path, monkeypatch):
+    old = Embedder(LocalHashEmbedder(dimension=256))
+    store = LocalVectorStore(str(tmp_path), index_kind="flat", embedder=old)
+    texts = ["dentist appointment friday", "renew passport", "book flights to lisbon"]
+    store.add_documents(texts, old.embed_many(texts))
+    store.close()
+
+    new = Embedder(LocalHashEmbedder(dimension=128))
+    store = LocalVectorStore(str(tmp_path), index_kind="flat", embedder=new)
+    assert store.stale
+    monkeypatch.setattr(retriever_module, "vector_store", store)
+    monkeypatch.setattr(retriever_module, "embedder", new)
+
+    # Keyword-only fused scores are far below RAG_RERANK_MIN_SCORE, which
+    # is a cosine cutoff and must not empty the chat context.
+    hits = Retriever().search("book flights", top_k=3, rerank=RerankOptions.from_settings())
+    assert [hit["text"] for hit in hits][:1] == ["book flights to lisbon"]
+    assert hits[0]["score"] < RerankOptions.from_settings().min_score
+    store.close()
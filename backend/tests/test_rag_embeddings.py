@@ -0,0 +1,40 @@
+import hashlib
+
+import numpy as np
+
+from app.rag.embeddings import LocalHashEmbedder
+
+
+def _reference(text, dimension=256):
+    vector = np.zeros(dimension)
+    for token in text.lower().split():
+        digest = hashlib.sha256(token.encode("utf-8")).digest()
+        vector[int.from_bytes(digest[:4], "big") % dimension] += 1.0
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def test_embed_many_matches_per_token_sha256_buckets():
+    embedder = LocalHashEmbedder()
+    texts = ["budget review budget", "", "ok", "flight to berlin", "budget review budget"]
+
+    matrix = embedder.embed_many(texts)
+
+    assert matrix.shape == (5, 256)
+    assert matrix.dtype == np.float32
+    for text, row in zip(texts, matrix):
+        np.testing.assert_allclose(row, _reference(text), atol=1e-6)
+    assert embedder.embed("flight to berlin") == matrix[3].tolist()
+
+
+def test_short_texts_are_served_from_a_bounded_cache():
+    embedder = LocalHashEmbedder(cache_size=2)
+    embedder.embed_many(["ok", "thanks", "ok"])
+    assert list(embedder._cache) == ["ok", "thanks"]
+
+    embedder.embed_many(["sure", "ok"])
+    assert list(embedder._cache) == ["ok", "sure"]
+
+    embedder.embed_many(["word " * 40])
+    assert "word " * 40 not in embedder._cache
+    np.testing.assert_allclose(embedder.embed_many(["ok"])[0], _reference("ok"), atol=1e-6)
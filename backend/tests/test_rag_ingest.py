@@ -0,0 +1,114 @@
+import json
+from pathlib import Path
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import app.api.routes_rag as routes_rag
+import app.rag.retriever as retriever_module
+from app.config.settings import settings
+from app.rag.vector_store import ShardedVectorStore
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    store = ShardedVectorStore(root=str(tmp_path / "rag_store"), seal_threshold=50)
+    monkeypatch.setattr(retriever_module, "vector_store", store)
+    monkeypatch.setattr(routes_rag, "vector_store", store)
+    monkeypatch.setattr(routes_rag, "STREAM_BATCH_SIZE", 16)
+    app = FastAPI()
+    app.include_router(routes_rag.router, prefix="/api/rag")
+    yield TestClient(app), store
+    store.close()
+
+
+def test_bulk_ingest_commits_every_item(client):
+    http, store = client
+    items = [{"text": f"note {i} about budgets"} for i in range(120)]
+
+    response = http.post("/api/rag/ingest", json={"user_id": "alice", "items": items})
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["count"] == 120
+    assert [doc["id"] for doc in store.all_documents("alice")] == body["ids"]
+
+
+def test_stream_ingest_reports_ids_errors_and_progress(client):
+    http, store = client
+    lines = [json.dumps({"text": f"streamed note {i}", "metadata": {"kind": "upload"}}) for i in range(40)]
+    lines.insert(5, "{not json")
+    lines.insert(9, json.dumps({"text": ""}))
+
+    response = http.post(
+        "/api/rag/ingest/stream?user_id=bob&upload_id=up-1",
+        content="\n".join(lines).encode("utf-8"),
+        headers={"content-type": "application/x-ndjson"},
+    )
+
+    assert response.status_code == 200
+    records = [json.loads(line) for line in response.text.splitlines()]
+    summary = records.pop()
+    assert summary == {"status": "ok", "upload_id": "up-1", "lines": 42, "count": 40, "errors": 2}
+    assert [record["line"] for record in records if "error" in record] == [6, 10]
+
+    ids = [record["id"] for record in records if "id" in record]
+    docs = store.all_documents("bob")
+    assert [doc["id"] for doc in docs] == ids
+    metadata = dict(docs[0]["metadata"])
+    assert isinstance(metadata.pop("created_at"), int)
+    assert metadata == {"kind": "upload", "user_id": "bob"}
+
+    progress = http.get("/api/rag/ingest/stream/up-1").json()
+    assert progress["status"] == "done" and progress["ingested"] == 40
+    assert http.get("/api/rag/ingest/stream/unknown").status_code == 404
+
+
+def test_stream_ingest_rejects_overlong_lines(client, monkeypatch):
+    http, store = client
+    monkeypatch.setattr(routes_rag, "STREAM_MAX_LINE_BYTES", 64)
+    short = json.dumps({"text": "fits"})
+
+    for body in (short + "\n" + "x" * 200 + "\n" + short, short + "\n" + "x" * 200):
+        response = http.post(
+            "/api/rag/ingest/stream?user_id=cat&upload_id=up-long",
+            content=body.encode("utf-8"),
+            headers={"content-type": "application/x-ndjson"},
+        )
+        assert response.status_code == 413
+        assert http.get("/api/rag/ingest/stream/up-long").json()["status"] == "failed"
+
+
+def test_ingest_can_chunk_long_texts(client):
+    http, store = client
+    long_text = " ".join(f"Paragraph sentence number {i} mentions budgets." for i in range(120))
+
+    response = http.post("/api/rag/ingest", json={"user_id": "alice", "chunk": True, "items": [{"text": long_text}]})
+
+    assert response.status_code == 200
+    docs = store.all_documents("alice")
+    assert len(docs) == response.json()["count"] > 1
+    assert [doc["metadata"]["chunk"] for doc in docs] == list(range(len(docs)))
+
+
+def test_file_ingest_is_limited_to_the_allowed_folders(client, tmp_path, monkeypatch):
+    http, store = client
+    allowed = tmp_path / "notes"
+    allowed.mkdir()
+    (allowed / "plan.txt").write_text("The budget review is on Friday.")
+    secret = tmp_path / "secret.txt"
+    secret.write_text("root password hunter2")
+    (allowed / "link.txt").symlink_to(secret)
+    monkeypatch.setattr(settings, "RAG_INGEST_ROOTS", [str(allowed)])
+
+    for paths in ([str(secret)], ["../secret.txt"], ["/etc"]):
+        response = http.post("/api/rag/ingest/files", json={"user_id": "alice", "paths": paths})
+        assert response.status_code == 403
+
+    response = http.post("/api/rag/ingest/files", json={"user_id": "alice", "paths": [str(allowed)]})
+    assert response.status_code == 200
+    results = {Path(result["source"]).name: result for result in response.json()["results"]}
+    assert results["plan.txt"]["chunks"] == 1
+    assert results["link.txt"]["chunks"] == 0 and "Outside" in results["link.txt"]["error"]
+    assert [doc["text"] for doc in store.all_documents("alice")] == ["The budget review is on Friday."]
@@ -0,0 +1,38 @@
+import numpy as np
+
+from app.rag.metadata_index import MetadataIndex, contains, intersect
+
+
+def test_postings_follow_row_ordinals():
+    index = MetadataIndex()
+    index.add([{"role": "user", "kind": "chat"} if i % 3 else {"role": "assistant", "kind": "chat"} for i in range(100)])
+
+    assistant = index.lookup("role", "assistant", 100)
+    assert assistant.tolist() == list(range(0, 100, 3))
+    assert index.lookup("role", "assistant", 10).tolist() == [0, 3, 6, 9]
+    assert index.lookup("role", "nobody", 100).shape == (0,)
+    assert index.lookup("tags", ["a"], 100) is None
+
+    postings, residual = index.resolve({"kind": "chat", "role": "assistant", "source": None}, 100)
+    assert [len(posting) for posting in postings] == [34, 100]
+    assert residual == {"source": None}
+    assert intersect(postings).tolist() == assistant.tolist()
+
+
+def test_snapshot_view_ignores_later_rows():
+    index = MetadataIndex()
+    index.add([{"kind": "upload"}] * 40)
+    view = index.lookup("kind", "upload", 40)
+
+    index.add([{"kind": "upload"}] * 100)
+
+    assert view.tolist() == list(range(40))
+    assert len(index.lookup("kind", "upload", 40)) == 40
+    assert len(index.lookup("kind", "upload", 140)) == 140
+
+
+def test_contains_checks_sorted_membership():
+    posting = np.array([2, 5, 9], dtype=np.int64)
+    mask = contains(posting, np.array([9, 0, 5, 10, 2]))
+    assert mask.tolist() == [True, False, True, False, True]
+    assert not contains(np.zeros(0, dtype=np.int64), np.array([1])).any()
@@ -0,0 +1,78 @@
+import multiprocessing
+
+import pytest
+
+from app.rag.dedup import content_key
+from app.rag.embeddings import embedder
+from app.rag.vector_store import LocalVectorStore
+from conftest import add_text
+
+
+def _open(path, **options):
+    return LocalVectorStore(store_path=str(path), seal_threshold=4, index_kind="flat", multiprocess=True, **options)
+
+
+def test_workers_catch_up_incrementally(tmp_path):
+    first, second = _open(tmp_path), _open(tmp_path)
+
+    ids = [add_text(first, f"grocery item {word}") for word in ("apples", "bread", "cheese")]
+    assert [doc["id"] for doc in second.all_documents()] == ids
+
+    # The second worker seals the first worker's log rows with its own.
+    ids += [add_text(second, f"grocery item {word}") for word in ("dates", "eggs", "figs")]
+    assert [len(block) for block in second.snapshot().blocks] == [4, 2]
+    assert [doc["id"] for doc in first.all_documents()] == ids
+    assert first.snapshot().keyword_index.scores("eggs", 6)[0].tolist() == [4]
+
+    assert first.delete([ids[4]]) == 1
+    assert second.count() == 5
+    assert add_text(second, "grocery item apples") == ids[0]
+    assert first.reference_count(ids[0]) == 2
+    assert first._epoch == second._epoch == 0
+
+    first.close()
+    second.close()
+
+
+def test_compaction_in_one_worker_reloads_the_others(tmp_path):
+    first, second = _open(tmp_path), _open(tmp_path)
+    ids = [add_text(first, f"travel plan {i} for city{i}") for i in range(10)]
+    second.delete(ids[:5])
+    assert second.compact()
+
+    assert [doc["id"] for doc in first.all_documents()] == ids[5:]
+    assert first._epoch == 1
+    late = add_text(first, "travel plan late addition")
+    assert [doc["id"] for doc in second.all_documents()] == ids[5:] + [late]
+    assert second.snapshot().dedup_index.find(content_key("travel plan 6 for city6")) == 1
+
+    first.close()
+    second.close()
+    reopened = _open(tmp_path)
+    assert reopened.count() == 6
+    reopened.close()
+
+
+def _write_from_process(path, worker, count):
+    store = _open(path)
+    for i in range(0, count, 5):
+        texts = [f"worker {worker} note {i + j}" for j in range(5)]
+        store.add_documents(texts, embedder.embed_many(texts), [{"kind": "note"}] * 5)
+    store.close()
+
+
+@pytest.mark.skipif("fork" not in multiprocessing.get_all_start_methods(), reason="needs fork")
+def test_concurrent_processes_do_not_lose_writes(tmp_path):
+    context = multiprocessing.get_context("fork")
+    workers = [context.Process(target=_write_from_process, args=(tmp_path, worker, 40)) for worker in range(3)]
+    for process in workers:
+        process.start()
+    for process in workers:
+        process.join(60)
+    assert [process.exitcode for process in workers] == [0, 0, 0]
+
+    store = _open(tmp_path)
+    texts = sorted(doc["text"] for doc in store.all_documents())
+    assert texts == sorted(f"worker {worker} note {i}" for worker in range(3) for i in range(40))
+    assert len({doc["id"] for doc in store.all_documents()}) == 120
+    store.close()
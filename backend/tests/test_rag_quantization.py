@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+
+import app.rag.retriever as retriever_module
+from app.rag.embeddings import embedder
+from app.rag.retriever import Retriever
+from app.rag.segments import normalize_rows, quantize_rows
+from app.rag.vector_store import LocalVectorStore
+
+
+def test_int8_codes_approximate_dot_products():
+    rng = np.random.default_rng(0)
+    rows = normalize_rows(rng.normal(size=(500, 64)))
+    query = normalize_rows(rng.normal(size=64))
+
+    codes, scales = quantize_rows(rows)
+
+    assert codes.dtype == np.int8 and np.abs(codes).max() == 127
+    approx = (codes @ query) * scales
+    assert np.abs(approx - rows @ query).max() < 0.02
+    assert quantize_rows(np.zeros((2, 4)))[1].tolist() == [0.0, 0.0]
+
+
+def test_segments_map_codes_and_quantize_old_segments_on_load(tmp_path):
+    texts = [f"chunk {i} about project {i % 4}" for i in range(30)]
+    store_path = str(tmp_path / "rag_store")
+    plain = LocalVectorStore(store_path=store_path, seal_threshold=10, quantization="none")
+    for text in texts:
+        plain.add_document(text, embedder.embed(text))
+    assert not plain.snapshot().quantized
+    plain.close()
+
+    store = LocalVectorStore(store_path=store_path, seal_threshold=10, quantization="int8")
+    snapshot = store.snapshot()
+    assert snapshot.quantized
+    assert all(isinstance(block.codes, np.memmap) for block in snapshot.blocks)
+    assert store.resident_bytes() < sum(block.embeddings.nbytes for block in snapshot.blocks)
+    store.close()
+
+    with pytest.raises(ValueError):
+        LocalVectorStore(store_path=store_path, quantization="pq")
+
+
+def test_quantized_search_returns_exact_scores(tmp_path, monkeypatch):
+    store = LocalVectorStore(store_path=str(tmp_path / "rag_store"), seal_threshold=25, quantization="int8")
+    monkeypatch.setattr(retriever_module, "vector_store", store)
+    texts = [f"note {i} about project {i % 3} and budget {i % 5}" for i in range(100)]
+    store.add_documents(texts[:50], embedder.embed_many(texts[:50]))
+    store.add_documents(texts[50:], embedder.embed_many(texts[50:]))
+
+    query = "project 1 budget 4"
+    q = np.asarray(embedder.embed(query))
+    expected = sorted((float(np.dot(q, embedder.embed(text))) for text in texts), reverse=True)[:5]
+
+    results = Retriever().search(query, top_k=5, collapse_duplicates=False)
+
+    assert [result["score"] for result in results] == pytest.approx(expected, abs=1e-5)
+    store.close()
@@ -0,0 +1,88 @@
+import pytest
+
+import app.rag.retriever as retriever_module
+from app.rag.query_cache import QueryResultCache
+from app.rag.rerank import RerankOptions
+from app.rag.retriever import Retriever
+from app.rag.vector_store import ShardedVectorStore
+from conftest import add_text
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    store = ShardedVectorStore(root=str(tmp_path / "rag_store"), index_kind="flat")
+    monkeypatch.setattr(retriever_module, "vector_store", store)
+    yield store
+    store.close()
+
+
+def test_repeated_queries_are_served_from_the_cache(store):
+    add_text(store, "dentist appointment on friday", user_id="alice")
+    add_text(store, "weekly budget review", user_id="alice")
+    retriever = Retriever(cache_size=8)
+
+    first = retriever.search("Dentist  appointment", top_k=2, filters={"user_id": "alice"})
+    second = retriever.search("dentist appointment ", top_k=2, filters={"user_id": "alice"})
+    assert second == first
+    assert retriever.cache_stats()["hits"] == 1
+
+    # Other options are other entries, and callers get their own copies.
+    retriever.search("dentist appointment", top_k=1, filters={"user_id": "alice"})
+    retriever.search("dentist appointment", top_k=2, filters={"user_id": "alice"}, hybrid=True)
+    second[0]["score"] = -1.0
+    third = retriever.search("dentist appointment", top_k=2, filters={"user_id": "alice"})
+    assert third == first
+
+    stats = retriever.cache_stats()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (2, 3, 3)
+    assert stats["hit_rate"] == 0.4
+
+
+def test_writes_invalidate_only_the_changed_users_entries(store):
+    dentist = add_text(store, "dentist appointment on friday", user_id="alice")
+    add_text(store, "dentist for the kids", user_id="bob")
+    retriever = Retriever(cache_size=8)
+    alice, bob = {"user_id": "alice"}, {"user_id": "bob"}
+
+    retriever.search("dentist", filters=alice)
+    retriever.search("dentist", filters=bob)
+    add_text(store, "dentist bill to pay", user_id="bob")
+
+    assert len(retriever.search("dentist", filters=alice)) == 1
+    assert len(retriever.search("dentist", filters=bob)) == 2
+    assert retriever.cache_stats()["hits"] == 1
+    assert retriever.cache_stats()["stale"] == 1
+
+    store.delete([dentist], user_id="alice")
+    assert retriever.search("dentist", filters=alice) == []
+    store.clear(user_id="bob")
+    assert retriever.search("dentist", filters=bob) == []
+    assert retriever.cache_stats()["stale"] == 3
+
+
+def test_recency_reranked_results_expire(store, monkeypatch):
+    add_text(store, "dentist appointment on friday", user_id="alice")
+    retriever = Retriever(cache_size=8)
+    options = RerankOptions(recency_half_life_days=30.0)
+
+    retriever.search("dentist", filters={"user_id": "alice"}, rerank=options)
+    retriever.search("dentist", filters={"user_id": "alice"}, rerank=options)
+    assert retriever.cache_stats()["hits"] == 1
+
+    later = retriever_module.time.time() + retriever_module.RECENCY_CACHE_SECONDS
+    monkeypatch.setattr(retriever_module.time, "time", lambda: later)
+    retriever.search("dentist", filters={"user_id": "alice"}, rerank=options)
+    assert retriever.cache_stats()["stale"] == 1
+
+
+def test_cache_evicts_least_recently_used():
+    cache = QueryResultCache(max_entries=2)
+    cache.put("a", (1,), [{"id": "a"}])
+    cache.put("b", (1,), [{"id": "b"}])
+    assert cache.get("a", (1,)) == [{"id": "a"}]
+    cache.put("c", (1,), [{"id": "c"}])
+
+    assert cache.get("b", (1,)) is None
+    assert cache.get("a", (2,)) is None
+    assert cache.stats()["evictions"] == 1
+    assert QueryResultCache(max_entries=0).enabled is False
@@ -0,0 +1,115 @@
+import numpy as np
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import app.api.routes_rag as routes_rag
+import app.rag.retriever as retriever_module
+from app.rag.rerank import RerankOptions, mmr_order, rerank, weighted_scores
+from app.rag.retriever import Retriever
+from app.rag.vector_store import LocalVectorStore
+from conftest import add_text
+
+
+DAY = 86400
+
+
+def test_weighted_scores_apply_recency_floor_and_role_weights():
+    now = 100 * DAY
+    metadatas = [
+        {"created_at": now, "role": "user"},
+        {"created_at": now - 30 * DAY, "role": "user"},
+        {"created_at": now - 3000 * DAY, "role": "assistant"},
+        {"role": "system"},
+    ]
+    options = RerankOptions(recency_half_life_days=30, role_weights={"assistant": 0.5})
+
+    weighted = weighted_scores(np.ones(4), metadatas, options, now=now)
+
+    assert weighted == pytest.approx([1.0, 0.75, 0.25, 1.0])
+    assert not RerankOptions().enabled
+    with pytest.raises(ValueError):
+        RerankOptions(mmr_lambda=1.5)
+    with pytest.raises(ValueError):
+        RerankOptions(role_weights={"user": -1})
+
+
+def test_mmr_skips_redundant_candidates_and_min_score_cuts():
+    embeddings = np.array([[1.0, 0.0], [1.0, 0.0], [0.6, 0.8]], dtype=np.float32)
+    relevance = np.array([0.9, 0.85, 0.6])
+
+    assert mmr_order(relevance, embeddings, 2, 1.0).tolist() == [0, 1]
+    assert mmr_order(relevance, embeddings, 2, 0.5).tolist() == [0, 2]
+
+    positions, scores = rerank(relevance, embeddings, [{}] * 3, 3, RerankOptions(mmr_lambda=0.5, min_score=0.7))
+    assert positions.tolist() == [0, 1]
+    assert scores.tolist() == pytest.approx([0.9, 0.85])
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    store = LocalVectorStore(store_path=str(tmp_path / "rag_store"), index_kind="flat", dedup="off")
+    monkeypatch.setattr(retriever_module, "vector_store", store)
+    monkeypatch.setattr(routes_rag, "retriever", Retriever())
+    yield store
+    store.close()
+
+
+def test_search_reranks_for_recency_and_diversity(store):
+    old = add_text(store, "dentist appointment moved to friday", {"created_at": 1, "role": "user"})
+    copy = add_text(store, "dentist appointment moved to friday morning", {"role": "user"})
+    fresh = add_text(store, "dentist appointment moved to friday", {"role": "user"})
+    other = add_text(store, "dentist said floss more", {"role": "assistant"})
+    query = "dentist appointment friday"
+
+    plain = [hit["id"] for hit in Retriever().search(query, top_k=3, collapse_duplicates=False)]
+    assert plain[:2] == [old, fresh]
+
+    recent = Retriever().search(
+        query,
+        top_k=3,
+        collapse_duplicates=False,
+        rerank=RerankOptions(recency_half_life_days=1)
+    )
+    assert [hit["id"] for hit in recent][:2] == [fresh, copy]
+
+    diverse = Retriever().search(
+        query,
+        top_k=2,
+        collapse_duplicates=False,
+        rerank=RerankOptions(recency_half_life_days=1, mmr_lambda=0.3)
+    )
+    assert [hit["id"] for hit in diverse] == [fresh, other]
+
+
+def test_search_endpoint_accepts_rerank_options(store):
+    add_text(store, "water the plants", {"role": "user"})
+    add_text(store, "water bill is due", {"role": "assistant"})
+    app = FastAPI()
+    app.include_router(routes_rag.router, prefix="/api/rag")
+    http = TestClient(app)
+
+    body = {"query": "water", "top_k": 5, "role_weights": {"assistant": 0.0}, "min_score": 0.01}
+    results = http.post("/api/rag/search", json=body).json()["results"]
+    assert [hit["text"] for hit in results] == ["water the plants"]
+
+    assert http.post("/api/rag/search", json={"query": "water", "mmr_lambda": 2}).status_code == 422
+    response = http.post("/api/rag/search", json={"query": "water", "role_weights": {"user": -1}})
+    assert response.status_code == 400
+
+
+def test_min_score_is_on_the_cosine_scale_with_hybrid_search(store):
+    add_text(store, "water the plants", {"role": "user"})
+    add_text(store, "water bill is due", {"role": "user"})
+    add_text(store, "renew the passport before the trip", {"role": "user"})
+    app = FastAPI()
+    app.include_router(routes_rag.router, prefix="/api/rag")
+    http = TestClient(app)
+
+    body = {"query": "water plants", "hybrid": True, "min_score": 0.1}
+    results = http.post("/api/rag/search", json=body).json()["results"]
+
+    # Fused scores stay far below 0.1, yet the similar notes are kept.
+    assert [hit["text"] for hit in results][:1] == ["water the plants"]
+    assert all(hit["score"] < 0.1 for hit in results)
+    assert "renew the passport before the trip" not in [hit["text"] for hit in results]
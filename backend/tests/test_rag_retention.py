@@ -0,0 +1,187 @@
+import numpy as np
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import app.api.routes_rag as routes_rag
+import app.rag.retriever as retriever_module
+import app.scheduler.compaction_scheduler as scheduler_module
+from app.core.auth import get_current_user
+from app.database.models import User
+from app.rag.dedup import content_key
+from app.rag.retention import expired_ordinals, parse_policies
+from app.rag.retriever import Retriever
+from app.rag.segments import TOMBSTONES_NAME, VectorBlock, shard_dir_name
+from app.rag.vector_store import LocalVectorStore, ShardedVectorStore
+from app.scheduler.compaction_scheduler import CompactionScheduler
+from conftest import add_text
+
+
+def _block(metadatas):
+    return VectorBlock([str(i) for i in range(len(metadatas))], [""] * len(metadatas), metadatas, np.zeros((0, 4)))
+
+
+def test_expired_ordinals_apply_ttl_age_and_caps():
+    now = 1_000_000
+    day = 86400
+    blocks = [
+        _block([
+            {"kind": "chat", "created_at": now - 10 * day},
+            {"kind": "chat", "created_at": now - day},
+            {"kind": "note", "created_at": now - 10 * day, "expires_at": now - 1},
+            {"kind": "note", "created_at": now - 10 * day},
+        ]),
+        _block([
+            {"kind": "chat", "created_at": now},
+            {"kind": "chat", "created_at": now},
+            {"kind": "email"},
+            {"kind": "email"},
+            {"kind": "email", "expires_at": now + 60},
+        ]),
+    ]
+    policies = parse_policies({"chat": {"max_age_days": 7, "max_chunks": 2}, "*": {"max_chunks": 2}})
+
+    assert expired_ordinals(blocks, policies, now).tolist() == [0, 1, 2, 3, 6]
+    dead = np.zeros(9, dtype=bool)
+    dead[3] = True
+    assert expired_ordinals(blocks, policies, now, dead).tolist() == [0, 1, 2, 6]
+    assert expired_ordinals(blocks, {}, now).tolist() == [2]
+
+    with pytest.raises(ValueError):
+        parse_policies({"chat": {"max_age": 7}})
+    with pytest.raises(ValueError):
+        parse_policies({"chat": {"max_age_days": 0}})
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    store = LocalVectorStore(store_path=str(tmp_path / "rag_store"), seal_threshold=4)
+    monkeypatch.setattr(retriever_module, "vector_store", store)
+    yield store
+    store.close()
+
+
+def test_delete_hides_rows_and_survives_reload(store):
+    ids = [add_text(store, f"grocery list item {word}") for word in ("apples", "bread", "cheese", "dates", "eggs")]
+
+    assert store.delete([ids[1], ids[4], "missing"]) == 2
+    assert store.delete([ids[1]]) == 0
+    assert store.count() == 3
+    hits = Retriever().search("grocery list item bread", top_k=5, collapse_duplicates=False)
+    hybrid = Retriever().search("bread eggs", top_k=5, hybrid=True, collapse_duplicates=False)
+    assert {ids[1], ids[4]}.isdisjoint(hit["id"] for hit in hits + hybrid)
+    assert len(hits) == 3
+    store.close()
+
+    reloaded = LocalVectorStore(store_path=store.store_path, seal_threshold=4)
+    assert [doc["id"] for doc in reloaded.all_documents()] == [ids[0], ids[2], ids[3]]
+    # A deleted chunk is not a dedup target any more.
+    assert add_text(reloaded, "grocery list item bread") != ids[1]
+    reloaded.close()
+
+
+def test_compaction_purges_deleted_rows_and_rebuilds_indexes(store, tmp_path):
+    ids = [add_text(store, f"travel plan {i} for city{i}") for i in range(10)]
+    store.delete(ids[:6] + [ids[9]])
+    bytes_before = store.disk_bytes()
+
+    result = store.maintain(min_dead_ratio=0.5)
+
+    assert result["compacted"] and result["purged"] == 6
+    assert result["bytes_reclaimed"] > 0 and store.disk_bytes() < bytes_before
+    snapshot = store.snapshot()
+    assert snapshot.count == 4
+    assert [doc["id"] for doc in store.all_documents()] == ids[6:9]
+    assert Retriever().search("travel plan for city7", top_k=1, hybrid=True)[0]["id"] == ids[7]
+    assert snapshot.dedup_index.find(content_key("travel plan 8 for city8")) == 2
+    tombstones = (tmp_path / "rag_store" / TOMBSTONES_NAME).read_text()
+    assert ids[9] in tombstones and ids[0] not in tombstones
+    store.close()
+
+    reloaded = LocalVectorStore(store_path=store.store_path, seal_threshold=4)
+    assert [doc["id"] for doc in reloaded.all_documents()] == ids[6:9]
+    assert reloaded.stats()["deleted"] == 1
+    reloaded.close()
+
+
+def test_compaction_carries_over_concurrent_writes_and_deletes(store, monkeypatch):
+    ids = [add_text(store, f"meeting note {i} topic{i}") for i in range(8)]
+    store.delete([ids[0]])
+    original_feed = LocalVectorStore._feed_indexes
+    calls = []
+
+    def feed(self, indexes, blocks, chunk=65536):
+        if not calls:
+            # Runs outside the store lock while the merged segment is indexed.
+            store.delete([ids[3]])
+            calls.append(add_text(store, "meeting note late arrival"))
+        original_feed(self, indexes, blocks, chunk)
+
+    monkeypatch.setattr(LocalVectorStore, "_feed_indexes", feed)
+    assert store.compact()
+
+    docs = [doc["id"] for doc in store.all_documents()]
+    assert docs == [ids[1], ids[2]] + ids[4:] + calls
+    hits = Retriever().search("meeting note topic3", top_k=10, exact=True, collapse_duplicates=False)
+    assert ids[3] not in [hit["id"] for hit in hits]
+    assert store.snapshot().keyword_index.scores("late arrival", store.snapshot().count)[0].tolist() == [7]
+
+
+def test_scheduler_and_admin_endpoints(tmp_path, monkeypatch):
+    sharded = ShardedVectorStore(root=str(tmp_path / "rag_store"), seal_threshold=2)
+    monkeypatch.setattr(scheduler_module, "vector_store", sharded)
+    monkeypatch.setattr(routes_rag, "vector_store", sharded)
+    monkeypatch.setattr(retriever_module, "vector_store", sharded)
+    monkeypatch.setattr(scheduler_module.settings, "RAG_RETENTION", {"chat": {"max_chunks": 1}})
+    scheduler = CompactionScheduler(interval=3600)
+    monkeypatch.setattr(routes_rag, "compaction_scheduler", scheduler)
+    app = FastAPI()
+    app.include_router(routes_rag.router, prefix="/api/rag")
+    http = TestClient(app)
+
+    items = [{"text": f"chat line {word}", "metadata": {"kind": "chat"}} for word in ("one", "two", "three", "four")]
+    items.append({"text": "short lived", "ttl_seconds": 1})
+    ids = http.post("/api/rag/ingest", json={"user_id": "alice", "items": items}).json()["ids"]
+    assert sharded.all_documents("alice")[-1]["metadata"]["expires_at"] > 0
+
+    response = http.request("DELETE", "/api/rag/documents", json={"ids": [ids[0]], "user_id": "alice"})
+    assert response.json()["deleted"] == 1
+
+    # Admin routes and the whole-store export need a signed-in user.
+    assert http.post("/api/rag/admin/compact").status_code == 401
+    assert http.get("/api/rag/admin/stats").status_code == 401
+    assert http.get("/api/rag/export").status_code == 401
+    app.dependency_overrides[get_current_user] = lambda: User(user_id="user:admin")
+
+    run = http.post("/api/rag/admin/compact").json()["run"]
+    assert run["shards_checked"] == 1
+    assert run["expired"] == 2 and run["compacted"] == 1 and run["bytes_reclaimed"] > 0
+    assert [doc["text"] for doc in sharded.all_documents("alice")] == ["chat line four", "short lived"]
+
+    stats = http.get("/api/rag/admin/stats").json()
+    assert stats["shards"][0]["user_id"] == "alice"
+    assert stats["compaction"]["runs"] == 1
+    assert stats["compaction"]["totals"]["expired"] == 2
+    sharded.close()
+
+
+def test_scheduler_without_policies_only_opens_shards_that_need_it(tmp_path, monkeypatch):
+    root = str(tmp_path / "rag_store")
+    sharded = ShardedVectorStore(root=root, seal_threshold=2)
+    for user_id in ("alice", "bob", "carol"):
+        for i in range(4):
+            add_text(sharded, f"{user_id} note {i}", user_id=user_id)
+    doomed = [doc["id"] for doc in sharded.all_documents("bob")[:2]]
+    sharded.delete(doomed, user_id="bob")
+    sharded.close()
+
+    sharded = ShardedVectorStore(root=root, seal_threshold=2)
+    monkeypatch.setattr(scheduler_module, "vector_store", sharded)
+    monkeypatch.setattr(scheduler_module.settings, "RAG_RETENTION", {})
+    run = CompactionScheduler(interval=3600).run_once()
+
+    # Only bob's shard has deleted rows; the others stay closed.
+    assert run["shards_checked"] == 1 and run["compacted"] == 1
+    assert list(sharded._resident) == [shard_dir_name("bob")]
+    assert [doc["text"] for doc in sharded.all_documents("bob")] == ["bob note 2", "bob note 3"]
+    sharded.close()
@@ -0,0 +1,102 @@
+import numpy as np
+import pytest
+
+import app.rag.retriever as retriever_module
+from app.rag.embeddings import embedder
+from app.rag.retriever import Retriever
+from app.rag.vector_store import LocalVectorStore
+from conftest import add_text
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    store = LocalVectorStore(store_path=str(tmp_path / "rag_store"), seal_threshold=3)
+    monkeypatch.setattr(retriever_module, "vector_store", store)
+    yield store
+    store.close()
+
+
+def test_search_ranks_across_sealed_segments_and_tail(store):
+    texts = [
+        "weekly budget review meeting",
+        "grocery list milk eggs",
+        "flight to berlin on monday",
+        "budget spreadsheet for the team",
+        "call the dentist",
+    ]
+    for text in texts:
+        add_text(store, text, user_id="alice")
+
+    blocks = store.blocks()
+    assert isinstance(blocks[0].embeddings, np.memmap)
+    assert [len(block) for block in blocks] == [3, 2]
+
+    results = Retriever().search("budget", top_k=2, filters={"user_id": "alice"})
+
+    assert {result["text"] for result in results} == {
+        "weekly budget review meeting",
+        "budget spreadsheet for the team",
+    }
+    assert results[0]["score"] >= results[1]["score"]
+
+
+def test_search_matches_bruteforce_cosine(store):
+    texts = [f"note {i} about project {i % 3} and budget {i % 5}" for i in range(10)]
+    for text in texts:
+        add_text(store, text)
+
+    query = "project 1 budget 4"
+    q = np.asarray(embedder.embed(query))
+    expected = sorted(
+        ((float(np.dot(q, embedder.embed(text))), text) for text in texts),
+        reverse=True
+    )[:4]
+
+    results = Retriever().search(query, top_k=4)
+
+    assert [result["score"] for result in results] == pytest.approx([score for score, _ in expected], abs=1e-5)
+
+
+def test_search_applies_metadata_filters(store):
+    add_text(store, "budget from user", user_id="alice", role="user")
+    add_text(store, "budget from assistant", user_id="alice", role="assistant")
+    add_text(store, "budget from bob", user_id="bob", role="user")
+
+    results = Retriever().search("budget", top_k=5, filters={"user_id": "alice", "role": "assistant"})
+
+    assert [result["text"] for result in results] == ["budget from assistant"]
+
+
+def test_search_empty_store_returns_nothing(store):
+    assert Retriever().search("anything") == []
+
+
+def test_selective_filter_is_exact_under_ivf(tmp_path, monkeypatch):
+    options = {"n_lists": 16, "nprobe": 1, "min_train_size": 50}
+    store = LocalVectorStore(store_path=str(tmp_path / "ivf_store"), seal_threshold=100, index_options=options)
+    monkeypatch.setattr(retriever_module, "vector_store", store)
+    for i in range(400):
+        kind = "upload" if i % 100 == 7 else "chat"
+        add_text(store, f"entry {i} topic {i % 13} detail {i % 7}", kind=kind)
+    assert store.train_index()
+
+    query = "topic 5 detail 2"
+    q = np.asarray(embedder.embed(query))
+    uploads = [doc for doc in store.all_documents() if doc["metadata"]["kind"] == "upload"]
+    expected = sorted((float(np.dot(q, doc["embedding"])) for doc in uploads), reverse=True)
+    expected = [score for score in expected if score > 0][:3]
+
+    results = Retriever().search(query, top_k=3, filters={"kind": "upload"})
+
+    assert all(result["metadata"]["kind"] == "upload" for result in results)
+    assert [result["score"] for result in results] == pytest.approx(expected, abs=1e-5)
+    store.close()
+
+
+def test_unindexed_filter_values_are_checked_per_row(store):
+    add_text(store, "budget with source", source="notes.txt")
+    add_text(store, "budget without source")
+
+    results = Retriever().search("budget", top_k=5, filters={"source": None})
+
+    assert [result["text"] for result in results] == ["budget without source"]
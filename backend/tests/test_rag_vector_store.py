@@ -0,0 +1,196 @@
+import json
+import os
+import threading
+
+import numpy as np
+import pytest
+
+from app.rag.embeddings import embedder
+from app.rag.migrate import migrate_json_store
+from app.rag.segments import WAL_NAME, shard_dir_name
+from app.rag.vector_store import LocalVectorStore, ShardedVectorStore
+
+
+def _store(tmp_path, **kwargs):
+    return LocalVectorStore(store_path=str(tmp_path / "rag_store"), **kwargs)
+
+
+def test_documents_survive_reload(tmp_path):
+    store = _store(tmp_path)
+    doc_id = store.add_document("hello world", embedder.embed("hello world"), {"user_id": "alice"})
+    store.close()
+
+    reloaded = _store(tmp_path)
+    docs = reloaded.all_documents()
+
+    assert [doc["id"] for doc in docs] == [doc_id]
+    metadata = dict(docs[0]["metadata"])
+    assert isinstance(metadata.pop("created_at"), int)
+    assert metadata == {"user_id": "alice"}
+    assert docs[0]["embedding"] == pytest.approx(embedder.embed("hello world"), abs=1e-6)
+
+
+def test_wal_is_sealed_into_segments_and_compacted(tmp_path):
+    store = _store(tmp_path, seal_threshold=2, max_segments=100)
+    texts = [f"note number {i}" for i in range(7)]
+    for text in texts:
+        store.add_document(text, embedder.embed(text))
+
+    assert len(store._manifest.segments) == 3
+    assert store.compact()
+    assert len(store._manifest.segments) == 1
+    store.close()
+
+    reloaded = _store(tmp_path, seal_threshold=2)
+    assert [doc["text"] for doc in reloaded.all_documents()] == texts
+    segment_files = sorted(name for name in os.listdir(tmp_path / "rag_store") if name.startswith("seg-"))
+    assert segment_files == ["seg-000004.meta.jsonl", "seg-000004.q8", "seg-000004.vec"]
+
+
+def test_torn_wal_tail_is_discarded(tmp_path):
+    store = _store(tmp_path)
+    store.add_document("kept", embedder.embed("kept"))
+    store.close()
+
+    with open(tmp_path / "rag_store" / WAL_NAME, "a", encoding="utf-8") as f:
+        f.write('{"id": "half-writ')
+
+    reloaded = _store(tmp_path)
+    assert [doc["text"] for doc in reloaded.all_documents()] == ["kept"]
+
+    reloaded.add_document("after crash", embedder.embed("after crash"))
+    reloaded.close()
+    assert [doc["text"] for doc in _store(tmp_path).all_documents()] == ["kept", "after crash"]
+
+
+def _legacy_file(tmp_path):
+    legacy_path = tmp_path / "rag_store.json"
+    legacy_path.write_text(
+        json.dumps(
+            {
+                "documents": [
+                    {
+                        "id": "legacy-1",
+                        "text": "old memory",
+                        "embedding": embedder.embed("old memory"),
+                        "metadata": {"user_id": "bob"},
+                    },
+                    {
+                        "id": "legacy-2",
+                        "text": "shared memory",
+                        "embedding": embedder.embed("shared memory"),
+                        "metadata": {},
+                    },
+                ]
+            }
+        ),
+        encoding="utf-8",
+    )
+    return legacy_path
+
+
+def test_legacy_json_store_is_migrated_into_user_shards(tmp_path):
+    legacy_path = _legacy_file(tmp_path)
+    store = ShardedVectorStore(root=str(tmp_path / "rag_store"), legacy_path=str(legacy_path))
+
+    assert set(store.user_ids()) == {None, "bob"}
+    assert [doc["id"] for doc in store.all_documents("bob")] == ["legacy-1"]
+    assert store.count() == 2
+    assert not legacy_path.exists()
+    assert (tmp_path / "rag_store.json.migrated").exists()
+
+
+def test_unsharded_store_is_partitioned(tmp_path):
+    root = tmp_path / "rag_store"
+    flat = LocalVectorStore(store_path=str(root), seal_threshold=2, dedup="off")
+    for user_id in ["alice", "bob", "alice"]:
+        flat.add_document(f"note for {user_id}", embedder.embed(f"note for {user_id}"), {"user_id": user_id})
+    flat.close()
+
+    store = ShardedVectorStore(root=str(root))
+
+    assert store.count("alice") == 2
+    assert store.count("bob") == 1
+    assert not (root / "manifest.json").exists()
+
+
+def test_migrator_refuses_existing_store(tmp_path):
+    legacy_path = _legacy_file(tmp_path)
+    ShardedVectorStore(root=str(tmp_path / "rag_store")).close()
+
+    with pytest.raises(ValueError):
+        migrate_json_store(str(legacy_path), str(tmp_path / "rag_store"))
+
+
+def test_shards_isolate_users_and_clear_per_user(tmp_path):
+    store = ShardedVectorStore(root=str(tmp_path / "rag_store"))
+    store.add_document("alpha", embedder.embed("alpha"), {"user_id": "user:alice"})
+    store.add_document("beta", embedder.embed("beta"), {"user_id": "google:bob"})
+
+    assert [doc["text"] for doc in store.all_documents("user:alice")] == ["alpha"]
+    bob_wal = tmp_path / "rag_store" / "shards" / shard_dir_name("google:bob") / WAL_NAME
+    wal_before = bob_wal.read_bytes()
+
+    store.clear("user:alice")
+
+    assert store.count("user:alice") == 0
+    assert [doc["text"] for doc in store.all_documents("google:bob")] == ["beta"]
+    assert bob_wal.read_bytes() == wal_before
+    assert store.snapshot("nobody").count == 0
+    assert shard_dir_name("nobody") not in os.listdir(store._shards_path)
+
+
+def test_lru_evicts_idle_shards(tmp_path):
+    store = ShardedVectorStore(root=str(tmp_path / "rag_store"), max_resident=2)
+    for user_id in ["a", "b", "c"]:
+        store.add_document(f"text {user_id}", embedder.embed(f"text {user_id}"), {"user_id": user_id})
+
+    assert len(store._resident) == 2
+    assert store.count("a") == 1
+
+
+def test_add_documents_commits_a_batch_in_one_write(tmp_path):
+    store_path = str(tmp_path / "rag_store")
+    store = LocalVectorStore(store_path=store_path, seal_threshold=100)
+    embeddings = np.eye(4, dtype=np.float32)[[0, 1, 2, 3, 0]]
+
+    ids = store.add_documents(["a", "b", "c", "d", "e"], embeddings, [{"n": i} for i in range(5)])
+    store.close()
+
+    reloaded = LocalVectorStore(store_path=store_path, seal_threshold=100)
+    assert [doc["id"] for doc in reloaded.all_documents()] == ids
+    assert [doc["metadata"]["n"] for doc in reloaded.all_documents()] == [0, 1, 2, 3, 4]
+    with pytest.raises(ValueError):
+        reloaded.add_documents(["x"], np.ones((1, 3)))
+    reloaded.close()
+
+
+def test_shards_are_not_evicted_during_background_compaction(tmp_path, monkeypatch):
+    gate = threading.Event()
+    run_maintenance = LocalVectorStore._run_maintenance
+
+    def gated_maintenance(self):
+        gate.wait(10)
+        run_maintenance(self)
+
+    monkeypatch.setattr(LocalVectorStore, "_run_maintenance", gated_maintenance)
+    store = ShardedVectorStore(root=str(tmp_path / "rag_store"), max_resident=1, seal_threshold=1, max_segments=2)
+    texts = [f"note number {i}" for i in range(4)]
+    for text in texts:
+        store.add_document(text, embedder.embed(text), {"user_id": "a"})
+    compacting = store._resident[shard_dir_name("a")]
+    assert compacting.maintaining()
+
+    store.add_document("other user", embedder.embed("other user"), {"user_id": "b"})
+    # The idle shard of "b" gives way; "a" stays open until compaction is done.
+    assert list(store._resident) == [shard_dir_name("a")]
+    assert store._resident[shard_dir_name("a")] is compacting
+
+    gate.set()
+    store.close()
+    assert not compacting.maintaining()
+    assert len(compacting._manifest.segments) == 1
+
+    reopened = ShardedVectorStore(root=str(tmp_path / "rag_store"), seal_threshold=1)
+    assert [doc["text"] for doc in reopened.all_documents("a")] == texts
+    reopened.close()